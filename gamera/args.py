@@ -218,7 +218,8 @@ class Class(Arg):
       return result
 
 class ImageType(Arg):
-   def __init__(self, pixel_types, name=None, list_of=False, default=None):
+   def __init__(self, pixel_types, name=None, list_of=False, default=None,
+                packed=False, tiled=False):
       import core
       Arg.__init__(self, name)
       if not util.is_sequence(pixel_types):
@@ -231,6 +232,13 @@ class ImageType(Arg):
          self.klass = None
       self.pixel_types = pixel_types
       self.list_of = bool(list_of)
+      # Most plugins are not instantiated for PACKED images, since
+      # accessing them pixel by pixel is slow.  Plugins with a special
+      # implementation for packed data opt in with packed=True.
+      self.packed = bool(packed)
+      # The same goes for TILED images, where each pixel is looked up
+      # in its tile (see tiled=True).
+      self.tiled = bool(tiled)
       if default is None:
          self.has_default = False
          self.default = None
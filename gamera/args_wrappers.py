@@ -170,6 +170,18 @@ class ImageType(Arg):
       else:
          phrase = "value is"
       acceptable_types = ", ".join(acceptable_types)
+      if ONEBIT in self.pixel_types and not self.packed:
+         result += ('if (get_storage_format(%s) == PACKED) {\n'
+                    'PyErr_SetString(PyExc_TypeError,'
+                    '"The \'%s\' argument of \'%s\' can not be a PACKED image. '
+                    'Convert it with image_copy(DENSE) first.");\nreturn 0;\n}\n' %
+                    (self.pysymbol, self.name, function.__name__))
+      if not self.tiled and [x for x in self.pixel_types if x in TILED_PIXEL_TYPES]:
+         result += ('if (get_storage_format(%s) == TILED) {\n'
+                    'PyErr_SetString(PyExc_TypeError,'
+                    '"The \'%s\' argument of \'%s\' can not be a TILED image. '
+                    'Convert it with image_copy(DENSE) first.");\nreturn 0;\n}\n' %
+                    (self.pysymbol, self.name, function.__name__))
       result += ('PyErr_Format(PyExc_TypeError,'
                  '"The \'%s\' argument of \'%s\' can not have pixel type \'%%s\'. '
                  'Acceptable %s %s."'
@@ -189,8 +201,12 @@ class ImageType(Arg):
    def _get_choices_for_pixel_type(self, pixel_type):
       if pixel_type == ONEBIT:
          result = ["OneBitImageView", "Cc", "OneBitRleImageView", "RleCc", "MlCc"]
+         if self.packed:
+            result.append("OneBitPackedImageView")
       else:
          result = [util.get_pixel_type_name(pixel_type) + "ImageView"]
+      if self.tiled and pixel_type in TILED_PIXEL_TYPES:
+         result.append(util.get_pixel_type_name(pixel_type) + "TiledImageView")
       return [(x, pixel_type) for x in result]
 
 class Rect(Arg):
@@ -246,7 +246,7 @@ page."""
       # Since we only have one glyph to classify, we can't do any grouping
       if (len(self.database) and
           glyph.classification_state in (core.UNCLASSIFIED, core.AUTOMATIC)):
-         self.generate_features(glyph)
+         self._generate_features_for_classification(glyph)
          removed = glyph.children_images
          (id, conf) = self._classify_automatic_impl(glyph)
          glyph.classify_automatic(id)
@@ -278,7 +278,7 @@ page."""
                   removed[child] = None
          for glyph in glyphs:
             if not removed.has_key(glyph):
-               self.generate_features(glyph)
+               self._generate_features_for_classification(glyph)
                if (glyph.classification_state in
                    (core.UNCLASSIFIED, core.AUTOMATIC)):
                   (id, conf) = self._classify_automatic_impl(glyph)
@@ -438,8 +438,17 @@ existing training data."""
 
    ##############################################
    # Features
-   def generate_features_on_glyphs(self, glyphs):
-      """Generates features for all the given glyphs."""
+   def _generate_features_for_classification(self, glyph):
+      # Generates the features of a glyph that is only classified
+      # automatically (and not added to the database).  Classifiers
+      # that do not use all of the features may compute less here.
+      self.generate_features(glyph)
+
+   def generate_features_on_glyphs(self, glyphs, num_threads=1):
+      """Generates features for all the given glyphs.
+
+Classifiers that generate their features with generate_features_list
+distribute the glyphs among *num_threads* threads."""
       progress = util.ProgressFactory("Generating features...",
                                       len(glyphs), numsteps=32)
       try:
@@ -585,7 +594,7 @@ map of the form `confidence`_ listing the confidences of the main id.
 
 .. _confidence: #confidence
 """
-      self.generate_features(glyph)
+      self._generate_features_for_classification(glyph)
       return self.classify(glyph)
 
    def _classify_automatic_impl(self, glyph):
@@ -676,15 +685,25 @@ Creates a new classifier instance.
       for child in glyph.children_images:
          if child in self.database:
             self.database.remove(child)
-      return self.classify_with_images(self.database, glyph)
+      return self._classify_with_database(glyph)
 
    def guess_glyph_automatic(self, glyph):
       if len(self.database):
-         self.generate_features(glyph)
-         return self.classify_with_images(self.database, glyph)
+         self._generate_features_for_classification(glyph)
+         return self._classify_with_database(glyph)
       else:
          return ([(0.0, 'unknown')], {})
 
+   def _classify_with_database(self, glyph):
+      # Concrete classifiers may keep their own copy of the database
+      # (see _database_glyphs_reclassified)
+      return self.classify_with_images(self.database, glyph)
+
+   def _database_glyphs_reclassified(self, glyphs):
+      # Called after the classification of the given glyphs has been
+      # changed (not all of them need to be in the database)
+      pass
+
    ########################################
    # MANUAL CLASSIFICATION
    def classify_glyph_manual(self, glyph, id):
@@ -717,6 +736,7 @@ end user definitively knows the identity of the glyph.
       glyph.classify_manual([(1.0, id)])
       self.generate_features(glyph)
       self.database.append(glyph)
+      self._database_glyphs_reclassified([glyph])
       return self._do_splits(self, glyph), removed.keys()
 
    def classify_list_manual(self, glyphs, id):
@@ -750,6 +770,7 @@ connnected components, such as the lower-case *i*.
                if glyph.nrows > 2 and glyph.ncols > 2:
                   glyph.classify_heuristic('_group._part.' + sub)
                   self.generate_features(glyph)
+            self._database_glyphs_reclassified(glyphs)
             added, removed = self.classify_glyph_manual(union, sub)
             #added.append(union) # this would lead to doublets
             return added, removed
@@ -773,6 +794,7 @@ connnected components, such as the lower-case *i*.
             glyph.classify_manual([(1.0, id)])
             added.extend(self._do_splits(self, glyph))
       self.database.extend(new_glyphs)
+      self._database_glyphs_reclassified(glyphs)
       return added, list(removed)
 
    def classify_and_update_list_manual(self, glyphs, *args, **kwargs):
@@ -74,10 +74,10 @@ def make_subtrees_stddev(graph, ratio, distance, relabel=1, lab="cluster."):
 
    return nodes
 
-def make_spanning_tree(glyphs, k=None):
+def make_spanning_tree(glyphs, k=None, num_threads=1):
    if k is None:
       k = knn.kNNInteractive()
-   uniq_dists = k.distance_matrix(glyphs, 0)
+   uniq_dists = k.condensed_distances(glyphs, 0, num_threads)
    g = graph.Undirected()
    g.create_minimum_spanning_tree(glyphs, uniq_dists)
    return g
@@ -55,7 +55,7 @@ except ImportError:
 from gameracore import ONEBIT, GREYSCALE, GREY16, RGB, FLOAT, COMPLEX
 from enums import ALL, NONIMAGE
 # import the storage types
-from gameracore import DENSE, RLE
+from gameracore import DENSE, RLE, PACKED, TILED
 # import some of the basic types
 from gameracore import ImageData, Size, Dim, Point, \
      FloatPoint, Rect, Region, RegionMap, ImageInfo, RGBPixel
@@ -69,6 +69,13 @@ from gamera.gui import has_gui
 import paths, util    # Gamera-specific
 from config import config
 
+config.add_option(
+   "", "--mmap-threshold", action="store", type="float",
+   help="[core] Keep the pixels of DENSE images larger than this many megabytes in memory-mapped temporary files (0 or unset keeps all images in memory)")
+config.add_option(
+   "", "--tile-cache", action="store", type="float",
+   help="[core] Keep at most this many megabytes of the tiles of each TILED image that are read from a file in memory (256 if unset)")
+
 class SegmentationError(Exception):
    pass
 
@@ -225,7 +232,9 @@ See `pixel types`_ for more information."""
    pixel_type_name = property(pixel_type_name, doc=pixel_type_name.__doc__)
 
    _storage_format_names = {DENSE:  "Dense",
-                            RLE:    "RLE"}
+                            RLE:    "RLE",
+                            PACKED: "Packed",
+                            TILED:  "Tiled"}
    
    def storage_format_name(self):
       """String **storage_format_name** ()
@@ -263,6 +272,32 @@ the same data."""
       return self.data.bytes
    memory_size = property(memory_size, doc=memory_size.__doc__)
 
+   def tiles(self):
+      """Iterator **tiles** ()
+
+Iterates over the parts of the image that lie in one tile of the
+underlying data each (row by row), as subimages.  Processing a TILED
+image this way only keeps the tiles in memory that are in use (see
+`tiled images`__).  For the other storage formats, the whole image is
+one tile.
+
+.. __: image_types.html#tiled-images"""
+      tile_dim = self.data.tile_dim
+      if tile_dim.ncols == 0 or tile_dim.nrows == 0:
+         return
+      page = self.data.page_offset_x, self.data.page_offset_y
+      y = self.ul_y
+      while y <= self.lr_y:
+         y_end = min(((y - page[1]) / tile_dim.nrows + 1) * tile_dim.nrows + page[1],
+                     self.lr_y + 1)
+         x = self.ul_x
+         while x <= self.lr_x:
+            x_end = min(((x - page[0]) / tile_dim.ncols + 1) * tile_dim.ncols + page[0],
+                        self.lr_x + 1)
+            yield self.subimage((x, y), Dim(x_end - x, y_end - y))
+            x = x_end
+         y = y_end
+
    def set_display(self, _display):
       self._display = _display
 
@@ -586,6 +621,20 @@ class Image(gameracore.Image, ImageBase):
       gameracore.Image.__init__(self, *args, **kwargs)
    __init__.__doc__ = gameracore.Image.__doc__
 
+   def from_mmap(cls, path, dim, pixel_type=ONEBIT):
+      image = super(Image, cls).from_mmap(path, dim, pixel_type)
+      ImageBase.__init__(image)
+      return image
+   from_mmap.__doc__ = gameracore.Image.from_mmap.__doc__
+   from_mmap = classmethod(from_mmap)
+
+   def from_buffer(cls, buffer, offset=(0, 0)):
+      image = super(Image, cls).from_buffer(buffer, offset)
+      ImageBase.__init__(image)
+      return image
+   from_buffer.__doc__ = gameracore.Image.from_buffer.__doc__
+   from_buffer = classmethod(from_buffer)
+
    def __del__(self):
       if self._display:
          self._display.close()
@@ -644,6 +693,127 @@ class MlCc(gameracore.MlCc, ImageBase):
       if self._display:
          self._display.close()
 
+class CcList(object):
+   """A list of the connected components of an image, as returned by
+``compact_cc_analysis``.
+
+Only the label, bounding box and number of pixels (``area``) of each
+component are kept, in one array per field (``labels``, ``ul_x``,
+``ul_y``, ``lr_x``, ``lr_y`` and ``areas``).  The ``Cc`` objects are
+created when they are first used (by indexing or iterating), and then
+kept, so that properties and classifications set on them are not
+lost.  Filtering and sorting work on the arrays, without creating any
+``Cc``.
+
+.. code:: Python
+
+  ccs = image.compact_cc_analysis()
+  ccs = ccs.filter(min_area=10)
+  ccs.sort("ul_y")
+  for cc in ccs:
+     ...
+"""
+   _fields = ("labels", "ul_x", "ul_y", "lr_x", "lr_y", "areas")
+   _keys = {"label": "labels", "area": "areas", "ul_x": "ul_x",
+            "ul_y": "ul_y", "lr_x": "lr_x", "lr_y": "lr_y"}
+
+   def __init__(self, image, labels, ul_x, ul_y, lr_x, lr_y, areas, ccs=None):
+      self.image = image
+      self.labels = labels
+      self.ul_x = ul_x
+      self.ul_y = ul_y
+      self.lr_x = lr_x
+      self.lr_y = lr_y
+      self.areas = areas
+      if ccs is None:
+         ccs = [None] * len(labels)
+      self._ccs = ccs
+
+   def from_boxes(cls, image, boxes):
+      """Creates the list from an array of six ints per component
+(label, ul_x, ul_y, lr_x, lr_y, area), as returned by ``_cc_boxes``."""
+      return cls(image, *[boxes[i::6] for i in range(6)])
+   from_boxes = classmethod(from_boxes)
+
+   def __len__(self):
+      return len(self.labels)
+
+   def __getitem__(self, index):
+      if isinstance(index, slice):
+         return self.select(xrange(*index.indices(len(self))))
+      cc = self._ccs[index]
+      if cc is None:
+         if index < 0:
+            index += len(self)
+         cc = Cc(self.image, self.labels[index],
+                 (self.ul_x[index], self.ul_y[index]),
+                 (self.lr_x[index], self.lr_y[index]))
+         self._ccs[index] = cc
+      return cc
+
+   def __iter__(self):
+      for i in xrange(len(self)):
+         yield self[i]
+
+   def to_list(self):
+      """Returns a plain list of the ``Cc`` objects, for functions that
+need one (such as the classifiers)."""
+      return list(self)
+
+   def nrows(self, index):
+      return self.lr_y[index] - self.ul_y[index] + 1
+
+   def ncols(self, index):
+      return self.lr_x[index] - self.ul_x[index] + 1
+
+   def select(self, indices):
+      """Returns a new ``CcList`` with the components at the given
+indices (in that order).  The ``Cc`` objects that have already been
+created are shared."""
+      indices = list(indices)
+      arrays = [array(getattr(self, field).typecode,
+                      [getattr(self, field)[i] for i in indices])
+                for field in self._fields]
+      ccs = [self._ccs[i] for i in indices]
+      return CcList(self.image, *arrays, **{"ccs": ccs})
+
+   def filter(self, min_area=0, max_area=None, min_nrows=0, max_nrows=None,
+              min_ncols=0, max_ncols=None):
+      """Returns a new ``CcList`` with only the components whose number of
+black pixels and bounding box size are within the given limits (which
+are inclusive; ``None`` is no limit)."""
+      if max_area is None:
+         max_area = sys.maxint
+      if max_nrows is None:
+         max_nrows = sys.maxint
+      if max_ncols is None:
+         max_ncols = sys.maxint
+      areas, ul_x, ul_y, lr_x, lr_y = \
+             self.areas, self.ul_x, self.ul_y, self.lr_x, self.lr_y
+      return self.select(
+         [i for i in xrange(len(self))
+          if min_area <= areas[i] <= max_area and
+          min_nrows <= lr_y[i] - ul_y[i] + 1 <= max_nrows and
+          min_ncols <= lr_x[i] - ul_x[i] + 1 <= max_ncols])
+
+   def sort(self, key="label", reverse=False):
+      """Sorts the components in place by *key*, which is one of
+``label``, ``ul_x``, ``ul_y``, ``lr_x``, ``lr_y``, ``area``, ``nrows``
+and ``ncols``.  Components with the same key keep their order."""
+      if key == "nrows":
+         values = [self.nrows(i) for i in xrange(len(self))]
+      elif key == "ncols":
+         values = [self.ncols(i) for i in xrange(len(self))]
+      elif key in self._keys:
+         values = getattr(self, self._keys[key])
+      else:
+         raise ValueError("Unknown sort key '%s'." % key)
+      order = sorted(xrange(len(self)), key=values.__getitem__, reverse=reverse)
+      sorted_list = self.select(order)
+      for field in self._fields:
+         setattr(self, field, getattr(sorted_list, field))
+      self._ccs = sorted_list._ccs
+
 # this is a convenience function for using in a console
 _gamera_initialised = False
 def _init_gamera():
@@ -651,7 +821,7 @@ def _init_gamera():
    if _gamera_initialised:
       return
    _gamera_initialised = True
-   import plugin, gamera_xml, sys
+   import plugin, gamera_xml, sys, os
    from gamera.args import NoneDefault
    # Create the default functions for the menupl
    for method in (
@@ -709,6 +879,14 @@ def _init_gamera():
       verbose = config.get("verbosity_level")
    except Exception:
       verbose = 0
+   # The image data in all plugin modules reads these settings from the
+   # environment
+   mmap_threshold = config.get("mmap_threshold")
+   if mmap_threshold is not None:
+      os.environ["GAMERA_MMAP_THRESHOLD"] = str(mmap_threshold)
+   tile_cache = config.get("tile_cache")
+   if tile_cache is not None:
+      os.environ["GAMERA_TILE_CACHE"] = str(tile_cache)
    paths.import_directory(paths.plugins, globals(), locals(), verbose)
    sys.path.append(".")
 
@@ -737,11 +915,11 @@ if __name__ == "__main__":
    init_gamera()
 
 __all__ = ("init_gamera UNCLASSIFIED AUTOMATIC HEURISTIC MANUAL "
-           "ONEBIT GREYSCALE GREY16 RGB FLOAT COMPLEX ALL DENSE RLE "
+           "ONEBIT GREYSCALE GREY16 RGB FLOAT COMPLEX ALL DENSE RLE PACKED TILED "
            "CONFIDENCE_DEFAULT CONFIDENCE_KNNFRACTION "
            "CONFIDENCE_LINEARWEIGHT CONFIDENCE_INVERSEWEIGHT "
            "CONFIDENCE_NUN CONFIDENCE_NNDISTANCE CONFIDENCE_AVGDISTANCE "
            "ImageData Size Dim Point FloatPoint Rect Region RegionMap "
-           "ImageInfo Image SubImage Cc MlCc load_image image_info "
+           "ImageInfo Image SubImage Cc MlCc CcList load_image image_info "
            "display_multi ImageBase nested_list_to_image RGBPixel "
            "save_image").split()
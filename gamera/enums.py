@@ -29,4 +29,8 @@ NONIMAGE = -1
 
 DENSE = 0
 RLE = 1
+PACKED = 2
+TILED = 3
+# the pixel types that can be stored TILED
+TILED_PIXEL_TYPES = [ONEBIT, GREYSCALE, GREY16, RGB]
 
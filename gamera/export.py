@@ -16,26 +16,22 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 #
 
-def glyphs_comma_delim(glyphs, filename):
-    """Export the id_name and features of a list of
-    glyphs to a comma delimited format"""
+def _glyphs_delim(glyphs, filename, separator):
     file = open(filename, "w")
     for x in glyphs:
-        file.write(x.id_name[0][1])
-        for f in x.features:
-            file.write(',')
-            file.write(str(f))
+        # tolist gives Python floats for arrays and for the rows of a
+        # feature matrix alike
+        file.write(separator.join([x.id_name[0][1]] +
+                                  [str(f) for f in x.features.tolist()]))
         file.write('\n')
     file.close()
 
+def glyphs_comma_delim(glyphs, filename):
+    """Export the id_name and features of a list of
+    glyphs to a comma delimited format"""
+    _glyphs_delim(glyphs, filename, ',')
+
 def glyphs_space_delim(glyphs, filename):
     """Export the id_name and features of a list of
     glyphs to a space delimited format"""
-    file = open(filename, "w")
-    for x in glyphs:
-        file.write(x.id_name[0][1])
-        for f in x.features:
-            file.write(' ')
-            file.write(str(f))
-        file.write('\n')
-    file.close()
+    _glyphs_delim(glyphs, filename, ' ')
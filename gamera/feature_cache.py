@@ -0,0 +1,233 @@
+#
+# A persistent cache of generated features
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+"""A persistent cache of generated features.
+
+The same glyph shapes occur again and again, so their feature vectors
+can be kept in a file and reused instead of being computed
+again.  The cache is opt-in:
+
+.. code:: Python
+
+   from gamera import feature_cache
+   feature_cache.set_feature_cache(feature_cache.FeatureCache("features.db"))
+
+Afterwards generate_features, generate_features_list and the
+classifiers look up the features of each glyph in the cache first.
+The entries are keyed by a hash of the pixels and the dimensions of
+the glyph together with the names of the feature functions and the
+Gamera version, so the feature functions must only depend on the
+pixels of a glyph (as all built-in ones do)."""
+
+import array
+import atexit
+try:
+   from hashlib import sha1
+except ImportError:
+   from sha import new as sha1
+from gamera import __version__
+
+# Changing this invalidates all existing cache files
+CACHE_FORMAT_VERSION = 1
+
+class FeatureCache(object):
+   """**FeatureCache** (FileName *filename*, int *max_size* = ``64*1024*1024``, String *version* = ``''``)
+
+A feature cache stored in the SQLite database *filename*, which is
+created if it does not exist.
+
+*max_size*
+  The maximum total size of the stored feature vectors in bytes.
+  When it is exceeded, the least recently used entries are removed.
+
+*version*
+  An additional version string for the keys.  Changing it
+  invalidates the entries of custom feature functions whose
+  implementation has changed.
+
+The number of lookups that found an entry and of those that did not
+are counted in ``hits`` and ``misses``."""
+   def __init__(self, filename, max_size=64*1024*1024, version=''):
+      try:
+         import sqlite3
+      except ImportError:
+         raise RuntimeError("The feature cache needs the sqlite3 module.")
+      self.filename = filename
+      self.max_size = max_size
+      self.version = version
+      self.hits = 0
+      self.misses = 0
+      self._pending = 0
+      self._db = sqlite3.connect(filename)
+      self._db.text_factory = str
+      self._db.execute("CREATE TABLE IF NOT EXISTS features "
+                       "(key TEXT PRIMARY KEY, data BLOB, used INTEGER)")
+      self._db.execute("CREATE INDEX IF NOT EXISTS features_used "
+                       "ON features (used)")
+      size, used = self._db.execute(
+         "SELECT TOTAL(LENGTH(data)), MAX(used) FROM features").fetchone()
+      self._size = int(size)
+      self._clock = used or 0
+      self._feature_keys = {}
+
+   def _features_key(self, features):
+      key = self._feature_keys.get(id(features))
+      if key is None or key[0] is not features:
+         names = ["%s.%s:%d" % (function.__module__, name,
+                                function.return_type.length)
+                  for name, function in features[0]]
+         key = (features, "%d;%s;%s;%s" % (CACHE_FORMAT_VERSION, __version__,
+                                          self.version, ",".join(names)))
+         self._feature_keys[id(features)] = key
+      return key[1]
+
+   def key(self, image, features):
+      """**key** (Image *image*, *features*)
+
+Returns the key of the features of *image* for the feature functions
+*features* (as returned by ``get_feature_functions``)."""
+      h = sha1(self._features_key(features))
+      h.update("%d %d;" % (image.ncols, image.nrows))
+      h.update(image.to_rle())
+      return h.hexdigest()
+
+   def load(self, image, features):
+      """**load** (Image *image*, *features*)
+
+Looks up the features of *image* for the feature functions *features*.
+When they are found, they are stored in double precision in the
+image's ``features`` and ``feature_functions`` and ``True`` is
+returned."""
+      key = self.key(image, features)
+      row = self._db.execute("SELECT data FROM features WHERE key = ?",
+                             (key,)).fetchone()
+      if row is None or len(row[0]) != features[1] * 8:
+         self.misses += 1
+         return False
+      values = array.array('d')
+      values.fromstring(str(row[0]))
+      image.features = values
+      image.feature_functions = features
+      self._clock += 1
+      self._db.execute("UPDATE features SET used = ? WHERE key = ?",
+                       (self._clock, key))
+      self._changed()
+      self.hits += 1
+      return True
+
+   def save(self, image, features):
+      """**save** (Image *image*, *features*)
+
+Stores the features of *image*, which have been generated by the
+feature functions *features*."""
+      import sqlite3
+      key = self.key(image, features)
+      data = array.array('d', image.features).tostring()
+      row = self._db.execute("SELECT LENGTH(data) FROM features WHERE key = ?",
+                             (key,)).fetchone()
+      if row is not None:
+         self._size -= row[0]
+      self._clock += 1
+      self._db.execute("INSERT OR REPLACE INTO features VALUES (?, ?, ?)",
+                       (key, sqlite3.Binary(data), self._clock))
+      self._size += len(data)
+      if self._size > self.max_size:
+         self._evict()
+      self._changed()
+
+   def _evict(self):
+      # removes the least recently used entries until the cache is 10%
+      # below its maximum size, so that this does not happen too often
+      target = self._size - int(self.max_size * 0.9)
+      freed = 0
+      last = None
+      for used, size in self._db.execute(
+         "SELECT used, LENGTH(data) FROM features ORDER BY used"):
+         if freed >= target:
+            break
+         freed += size
+         last = used
+      if last is not None:
+         self._db.execute("DELETE FROM features WHERE used <= ?", (last,))
+         self._size -= freed
+
+   def _changed(self):
+      self._pending += 1
+      if self._pending >= 1000:
+         self.flush()
+
+   def __len__(self):
+      return self._db.execute("SELECT COUNT(*) FROM features").fetchone()[0]
+
+   def size(self):
+      """**size** ()
+
+Returns the total size of the stored feature vectors in bytes."""
+      return self._size
+
+   def flush(self):
+      """**flush** ()
+
+Writes all changes to the file.  This is also done regularly while the
+cache is used and when it is closed."""
+      if self._db is not None:
+         self._db.commit()
+      self._pending = 0
+
+   def clear(self):
+      """**clear** ()
+
+Removes all entries and resets the counters."""
+      self._db.execute("DELETE FROM features")
+      self._db.commit()
+      self._size = 0
+      self._pending = 0
+      self.hits = 0
+      self.misses = 0
+
+   def close(self):
+      """**close** ()
+
+Writes all changes and closes the file."""
+      if self._db is not None:
+         self.flush()
+         self._db.close()
+         self._db = None
+
+_feature_cache = None
+
+def set_feature_cache(cache):
+   """**set_feature_cache** (FeatureCache *cache*)
+
+Makes *cache* the feature cache used by generate_features and
+generate_features_list.  Passing ``None`` disables the cache."""
+   global _feature_cache
+   _feature_cache = cache
+
+def get_feature_cache():
+   """**get_feature_cache** ()
+
+Returns the current feature cache, or ``None`` when no cache is used."""
+   return _feature_cache
+
+def _close_feature_cache():
+   if _feature_cache is not None:
+      _feature_cache.close()
+atexit.register(_close_feature_cache)
+
+__all__ = ["FeatureCache", "set_feature_cache", "get_feature_cache"]
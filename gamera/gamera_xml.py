@@ -164,15 +164,22 @@ class WriteXML:
                    '<features scaling="%s">' % str(glyph.scaling),
                    indent)
          indent += 1
+         # only some of the features may have been computed (see
+         # generate_selected_features)
+         computed = None
+         if len(glyph.feature_functions) > 2:
+            computed = glyph.feature_functions[2]
          feature_no = 0
          for name, function in feature_functions:
+            length = function.return_type.length
+            if computed is not None and name not in computed:
+               feature_no += length
+               continue
             word_wrap(stream,
                       '<feature name="%s">' % name,
                       indent)
-            length = function.return_type.length
             word_wrap(stream,
-                      [x for x in
-                       glyph.features[feature_no:feature_no+length]],
+                      glyph.features[feature_no:feature_no+length].tolist(),
                       indent + 1)
             feature_no += length
             word_wrap(stream,
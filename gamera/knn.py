@@ -24,6 +24,7 @@ from gamera import core, util, config, classify
 from gamera.plugins import features as features_module
 import gamera.knncore, gamera.gamera_xml
 import array
+import weakref
 
 from gamera.knncore import CITY_BLOCK
 from gamera.knncore import EUCLIDEAN
@@ -168,40 +169,81 @@ images at once."""
       self.generate_features(imageb)
       return self._distance_between_images(imagea, imageb)
 
-   def distance_matrix(self, images, normalize=True):
-      """**distance_matrix** (ImageList *images*, Bool *normalize* = ``True``)
+   def distance_matrix(self, images, normalize=True, num_threads=1):
+      """**distance_matrix** (ImageList *images*, Bool *normalize* = ``True``,
+int *num_threads* = 1)
 
 Create a symmetric FloatImage containing all of the
 distances between the images in the list passed in. This is useful
 because it allows you to find the distance between any two pairs
 of images regardless of the order of the pairs.
 
+Note that the matrix needs ``8*n*n`` bytes for *n* images. For large
+lists, condensed_distances_ needs only an eighth of that memory.
+
 *normalize*
   When true, the features are normalized before performing the distance
-  calculations."""
+  calculations.
+
+*num_threads*
+  The number of threads used for computing the distances (only effective
+  when Gamera has been compiled with OpenMP)."""
       self.generate_features_on_glyphs(images)
       l = len(images)
       progress = util.ProgressFactory("Generating unique distances...", l)
-      m = self._distance_matrix(images, progress.step, normalize)
-      #m = self._distance_matrix(images)
+      m = self._distance_matrix(images, progress.step, normalize, num_threads)
       progress.kill()
       return m
 
-   def unique_distances(self, images, normalize=True):
-      """**unique_distances** (ImageList *images*, Bool *normalize* = ``True``)
+   def unique_distances(self, images, normalize=True, num_threads=1):
+      """**unique_distances** (ImageList *images*, Bool *normalize* = ``True``,
+int *num_threads* = 1)
+
+Return a FloatImage with a single row containing the distances of all
+unique pairs of images in the passed in list, in the same order as
+condensed_distances_.
+
+*normalize*
+  When true, the features are normalized before performing the distance
+  calculations.
+
+*num_threads*
+  The number of threads used for computing the distances (only effective
+  when Gamera has been compiled with OpenMP)."""
+      self.generate_features_on_glyphs(images)
+      l = len(images)
+      progress = util.ProgressFactory("Generating unique distances...", l)
+      dists = self._unique_distances(images, progress.step, normalize, num_threads)
+      progress.kill()
+      return dists
+
+   def condensed_distances(self, images, normalize=True, num_threads=1):
+      """array **condensed_distances** (ImageList *images*, Bool *normalize* = ``True``,
+int *num_threads* = 1)
+
+Return the distances of all unique pairs of images in the passed in
+list as an ``array.array`` of single precision floats (typecode
+``'f'``). For *n* images, the distance between the images *i* < *j* is
+at the index ``i*n - i*(i+1)/2 + j - i - 1`` (the order of the upper
+triangle of the distance_matrix_, which is also used by
+``scipy.spatial.distance``).
 
-Return a list of the unique pairs of images in the passed in list
-and the distances between them. The return list is a list of tuples
-of (distance, imagea, imageb) so that it easy to sort.
+The array needs only ``2*n*(n-1)`` bytes and can be wrapped without
+copying, e.g. with ``numpy.frombuffer(distances, numpy.float32)``. It
+can be passed to ``Graph.create_minimum_spanning_tree`` instead of a
+distance_matrix_.
 
 *normalize*
   When true, the features are normalized before performing the distance
-  calculations."""
+  calculations.
+
+*num_threads*
+  The number of threads used for computing the distances (only effective
+  when Gamera has been compiled with OpenMP)."""
       self.generate_features_on_glyphs(images)
       l = len(images)
       progress = util.ProgressFactory("Generating unique distances...", l)
-      dists = self._unique_distances(images, progress.step, normalize)
-      #dists = self._unique_distances(images)
+      dists = self._condensed_distances(images, progress.step, normalize, num_threads)
       progress.kill()
       return dists
 
@@ -241,6 +283,29 @@ When *k* is zero, the property ``num_k`` of the knn classifier is used.
       progress.kill()
       return stats
 
+   def evaluation_session(self, k_max=0, num_threads=1):
+      """kNNEvaluationSession **evaluation_session** (Int *k_max* = 0, int *num_threads* = 1)
+
+Returns a kNNEvaluationSession_ for repeated leave-one-out evaluations
+with different values of ``num_k``. The *k_max* nearest neighbors of
+each training sample are computed only once here, so that each
+evaluation afterwards takes only linear time in the number of training
+samples.
+
+*k_max*
+  The largest *k* the session can evaluate. When zero, the property
+  ``num_k`` of the knn classifier is used.
+
+*num_threads*
+  The number of threads used for computing the neighbors (only effective
+  when Gamera has been compiled with OpenMP).
+
+The session is only valid as long as the training data, features,
+selections, weights and distance type of the classifier are unchanged.
+"""
+      self.instantiate_from_images(self.database, self.normalize)
+      return kNNEvaluationSession(self, k_max, num_threads)
+
    def settings_dialog(self, parent):
       """Display a settings dialog for k-NN settings"""
       from gamera import args
@@ -343,23 +408,36 @@ Load the kNN settings from an XML file.  See save_settings_."""
       """**serialize** (FileSave *filename*)
 
 Saves the classifier-specific settings *and* data in an optimized and
-classifer-specific format.  
+classifer-specific format.  The format is the same on all platforms and
+can be memory mapped by unserialize_.  An existing file is replaced
+only after the new file has been written completely, so that other
+processes that have memory mapped the old file are not affected.
+The training data is written in the precision of the classifier
+(see ``single_precision``).
 
 .. note:: 
    It is good practice to retain the XML
-   file, since it is portable across platforms and to future versions of
-   Gamera.  The binary format is not guaranteed to be portable."""
+   file, since it is portable to future versions of Gamera."""
       if self.features == 'all':
          gamera.knncore.kNN.serialize(self, filename,['all'])
       else:
          gamera.knncore.kNN.serialize(self, filename,self.features)
 
-   def unserialize(self, filename):
-      """**unserialize** (FileOpen *filename*)
+   def unserialize(self, filename, use_mmap=True):
+      """**unserialize** (FileOpen *filename*, bool *use_mmap* = ``True``)
 
 Opens the classifier-specific settings *and* data from an optimized and
-classifer-specific format."""
-      features = gamera.knncore.kNN.unserialize(self, filename)
+classifer-specific format.
+
+*use_mmap*
+  When ``True``, the training data is not read, but memory mapped
+  directly from the file (where supported), so that loading takes
+  almost no time and several processes using the same file share
+  its memory.  The file must not be modified in place while it is
+  mapped, but it may be replaced by serialize_.  If the file has been
+  written in a different precision than ``single_precision`` of this
+  classifier, the training data is converted (and not mapped)."""
+      features = gamera.knncore.kNN.unserialize(self, filename, use_mmap)
       if len(features) == 1 and features[0] == 'all':
          self.change_feature_set('all')
       else:
@@ -368,9 +446,64 @@ classifer-specific format."""
    def generate_features(self, glyph):
       """**generate_features** (Image *glyph*)
 
-Generates features for the given glyph.
+Generates features for the given glyph. The features are stored in
+single precision when the classifier's property ``single_precision``
+is set.
+"""
+      glyph.generate_features(self.feature_functions, False,
+                              self.single_precision)
+
+   def generate_features_on_glyphs(self, glyphs, num_threads=1):
+      """**generate_features_on_glyphs** (ImageList *glyphs*, int *num_threads* = 1)
+
+Generates features for all the given glyphs, in the precision given
+by ``single_precision``. The built-in feature functions are computed
+with the global interpreter lock released.
+
+*num_threads*
+  The number of threads among which the glyphs are distributed. This
+  only has an effect when Gamera has been compiled with OpenMP support.
+  The features do not depend on the number of threads.
+
+Subclasses that override generate_features_ get their features
+generated glyph by glyph instead.
 """
-      glyph.generate_features(self.feature_functions)
+      if self.generate_features.im_func is not _kNNBase.generate_features.im_func:
+         classify._Classifier.generate_features_on_glyphs(self, glyphs)
+         return
+      features_module.generate_features_list(glyphs, self.feature_functions,
+                                             num_threads,
+                                             self.single_precision)
+
+   def _get_selected_features(self):
+      # The names of the feature functions that have at least one
+      # selected component with a non-zero weight, or None when only
+      # generate_features can be used
+      if (self.generate_features.im_func is not _kNNBase.generate_features.im_func or
+          getattr(self, 'feature_functions', None) is None):
+         return None
+      selections = self.get_selections()
+      weights = self.get_weights()
+      selected = []
+      offset = 0
+      for name, function in self.feature_functions[0]:
+         end = offset + function.return_type.length
+         for i in xrange(offset, end):
+            if selections[i] and weights[i]:
+               selected.append(name)
+               break
+         offset = end
+      return selected
+
+   def _generate_features_for_classification(self, glyph):
+      # Only the features that are used for the distances are computed
+      # (the others are zero)
+      selected = self._get_selected_features()
+      if selected is None:
+         self.generate_features(glyph)
+      else:
+         features_module.generate_selected_features(
+            glyph, self.feature_functions, selected, self.single_precision)
 
    def __get_settings_by_features(self, function):
       result = {}
@@ -535,6 +668,41 @@ Set the weighting vector elements for one specific feature.
       weights[feature_name] = values
       self.set_weights_by_features(weights)
 
+class kNNEvaluationSession(object):
+   """Leave-one-out evaluations of a kNN classifier for any *k* up to
+*k_max*, based on the precomputed nearest neighbors of the training
+samples. Use evaluation_session_ of the classifier for creating a
+session."""
+   def __init__(self, classifier, k_max=0, num_threads=1):
+      if k_max <= 0:
+         k_max = classifier.num_k
+      self.classifier = classifier
+      self.k_max = k_max
+      self._indexes, self._distances = \
+                     classifier._leave_one_out_neighbors(k_max, num_threads)
+
+   def leave_one_out(self, k=0):
+      """(int, int) **leave_one_out** (Int *k* = 0)
+
+Returns the number of correctly classified training samples and the
+number of tested samples, as ``leave_one_out`` of the classifier would
+with ``num_k`` = *k*. Only neighbors at the same distance as the *k*-th
+nearest neighbor may be chosen differently.
+
+When *k* is zero, the property ``num_k`` of the knn classifier is used."""
+      if k <= 0:
+         k = self.classifier.num_k
+      return self.classifier._leave_one_out_from_neighbors(
+         self._indexes, self._distances, k)
+
+   def evaluate(self, k=0):
+      """Float **evaluate** (Int *k* = 0)
+
+Like evaluate_ of the classifier, but for the given *k* (see
+leave_one_out_)."""
+      ans = self.leave_one_out(k)
+      return float(ans[0]) / float(ans[1])
+
 class kNNInteractive(_kNNBase, classify.InteractiveClassifier):
    def __init__(self, database=[], features='all', perform_splits=1, num_k=1):
       """**kNNInteractive** (ImageList *database* = ``[]``, *features* = 'all', bool *perform_splits* = ``True``, int *num_k* = ``1``)
@@ -587,11 +755,53 @@ Creates a new kNN interactive classifier instance.
       num_features = features_module.get_features_length(features)
       _kNNBase.__init__(self, num_features=num_features, num_k=num_k)
       classify.InteractiveClassifier.__init__(self, database, perform_splits)
+      self._connect_store()
 
    def __del__(self):
       _kNNBase.__del__(self)
       classify.InteractiveClassifier.__del__(self)
 
+   def _connect_store(self):
+      # The features and id_names of the database are kept in a native
+      # store, which follows the changes of the database, so that a
+      # classification does not need to access every glyph. The callbacks
+      # only keep a weak reference to the classifier, because the
+      # database must not keep the classifier alive.
+      classifier_ref = weakref.ref(self)
+      def add(glyphs):
+         classifier = classifier_ref()
+         if classifier is not None:
+            classifier._update_store(list(glyphs))
+      def remove(glyphs):
+         classifier = classifier_ref()
+         if classifier is not None:
+            classifier._store_remove(list(glyphs))
+      self._store_clear()
+      self._store_is_valid = True
+      # this adds all glyphs already in the database
+      self.database.add_callback('add', add)
+      self.database.add_callback('remove', remove)
+
+   def _update_store(self, glyphs):
+      # Glyphs without (valid) features may be added to the database
+      # directly.  This must not break adding, so the store is rebuilt
+      # at the next classification instead.
+      if self._store_is_valid:
+         try:
+            self._store_add(glyphs)
+         except (TypeError, ValueError, RuntimeError):
+            self._store_is_valid = False
+
+   def _classify_with_database(self, glyph):
+      if not self._store_is_valid:
+         self._store_clear()
+         self._store_add(list(self.database))
+         self._store_is_valid = True
+      return self._classify_with_store(glyph)
+
+   def _database_glyphs_reclassified(self, glyphs):
+      self._update_store([glyph for glyph in glyphs if glyph in self.database])
+
    def noninteractive_copy(self):
       """**noninteractive_copy** ()
 
@@ -619,11 +829,15 @@ Changes the set of features used in the classifier to the given list of feature
       if len(self.database):
          self.is_dirty = True
          self.generate_features_on_glyphs(self.database)
+      self._store_clear()
+      self._store_is_valid = True
+      self._update_store(list(self.database))
 
 class kNNNonInteractive(_kNNBase, classify.NonInteractiveClassifier):
-   def __init__(self, database=[], features='all', perform_splits=True, num_k=1, normalize=False):
+   def __init__(self, database=[], features='all', perform_splits=True, num_k=1, normalize=False, use_index=False, single_precision=False):
       """**kNNNonInteractive** (ImageList *database* = ``[]``, *features* = ``'all'``,
-bool *perform_splits* = ``True``, int *num_k* = ``1``, bool *normalize* = ``False``)
+bool *perform_splits* = ``True``, int *num_k* = ``1``, bool *normalize* = ``False``,
+bool *use_index* = ``False``, bool *single_precision* = ``False``)
 
 Creates a new kNN classifier instance.
 
@@ -637,7 +851,7 @@ Creates a new kNN classifier instance.
 
            - For non-interactive classifiers, *database* may be a
              filename, in which case the classifier will be
-             "unserialized" from the given file.
+             "unserialized" (and memory mapped) from the given file.
 
         Any images in the list that were manually classified (have
 	classification_state == MANUAL) will be used as training data
@@ -678,11 +892,30 @@ Creates a new kNN classifier instance.
 *normalize*
     Normalize the feature vectors: x' = (x - mean_x)/stdev_x
 
+*use_index*
+    Find the nearest neighbors with a kd-tree instead of comparing the
+    unknown glyph with every training glyph. This gives the same results,
+    but is much faster for large training sets with a moderate number of
+    features. The index can also be switched on or off later by setting
+    the property ``use_index``.
+
+*single_precision*
+    Store the feature vectors of the training data, and of the glyphs
+    whose features are generated by the classifier, in single
+    precision. This halves the memory needed for the training data;
+    the distances are still accumulated in double precision, so the
+    classification results differ at most for nearly equidistant
+    neighbors. Classifier files are written in the precision of the
+    classifier. The precision can also be changed later by setting the
+    property ``single_precision``.
+
       """
       self.features = features
       self.feature_functions = core.ImageBase.get_feature_functions(features)
       num_features = features_module.get_features_length(features)
       _kNNBase.__init__(self, num_features=num_features, num_k=num_k, normalize=normalize)
+      self.use_index = use_index
+      self.single_precision = single_precision
       classify.NonInteractiveClassifier.__init__(self, database, perform_splits)
 
    def __del__(self):
@@ -707,6 +940,39 @@ Changes the set of features used in the classifier to the given list of feature
          self.generate_features_on_glyphs(self.database)
          self.instantiate_from_images(self.database, self.normalize)
 
+   def classify_list_batch(self, glyphs, num_threads=1):
+      """**classify_list_batch** (ImageList *glyphs*, int *num_threads* = 1)
+
+Classifies all glyphs in the list with a single call to the C++ kNN
+implementation, which avoids most of the Python overhead of
+classify_list_automatic_. The glyphs are not changed (apart from
+generating their features), and neither splitting nor grouping is
+done. As in the other automatic classification methods, only the
+features used by the classifier (those with a selected component of
+non-zero weight) are computed.
+
+The return value is a list of tuples ``(id_name,confidencemap)``, one
+for each glyph in the order of *glyphs*, as returned by
+guess_glyph_automatic_.
+
+*num_threads*
+  The number of threads among which the glyphs are distributed. This
+  only has an effect when Gamera has been compiled with OpenMP support.
+  The features are generated in parallel in any case, but the glyphs
+  are only classified in parallel when no kd-tree index (``use_index``)
+  is used.
+"""
+      selected = self._get_selected_features()
+      if selected is None:
+         self.generate_features_on_glyphs(glyphs, num_threads)
+      else:
+         features_module.generate_features_list(glyphs, self.feature_functions,
+                                                num_threads,
+                                                self.single_precision,
+                                                selected)
+      return self._classify_batch([glyph.features for glyph in glyphs],
+                                  num_threads)
+
    def set_normalization_state(self, flag):
       """**set_normalization_state** (bool *flag*)
 Set whether normalization is used or not for classification.
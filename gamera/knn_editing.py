@@ -159,29 +159,24 @@ Reference: D. Wilson: 'Asymptotic Properties of NN Rules Using Edited Data'.
                  rareThreshold = 3):
 
         editedClassifier = _copyClassifier(classifier, k)
-        toBeRemoved = set()
-        progress = ProgressFactory("Generating edited MNN classifier...",
-                                      len(classifier.get_glyphs()))
-
-        # classify each glyph with its leave-one-out classifier
-        for i, glyph in enumerate(classifier.get_glyphs()):
-            editedClassifier.get_glyphs().remove(glyph)
-            detectedClass = _getMainId(\
-                                editedClassifier.guess_glyph_automatic(glyph))
-            # check if recognized class complies with the true class
-            if glyph.get_main_id() != detectedClass:
-                toBeRemoved.add(glyph)
-            editedClassifier.get_glyphs().add(glyph)
-            progress.step()
-
-        rareClasses = self._getRareClasses(classifier.get_glyphs(),
-                                           protectRare, rareThreshold)
+        glyphs = list(editedClassifier.get_glyphs())
+        if not glyphs:
+            return editedClassifier
+        progress = ProgressFactory("Generating edited MNN classifier...", 1)
+
+        # classify each glyph with its leave-one-out classifier (natively
+        # on the feature vectors of the copy)
+        editedClassifier.instantiate_from_images(glyphs, False)
+        kept = editedClassifier._edit_mnn(editedClassifier.num_k)
+        toBeRemoved = set(glyphs).difference([glyphs[i] for i in kept])
+        progress.step()
+
+        rareClasses = self._getRareClasses(glyphs, protectRare, rareThreshold)
         
         # remove 'bad' glyphs, if they are not in a rare class
-        for glyph in toBeRemoved:
-            if glyph.get_main_id() in rareClasses:
-                continue
-            editedClassifier.get_glyphs().remove(glyph)
+        editedClassifier.get_glyphs().difference_update(
+            [glyph for glyph in toBeRemoved
+             if glyph.get_main_id() not in rareClasses])
             
         progress.kill()
         return editedClassifier
@@ -237,42 +232,25 @@ Reference: P.E. Hart: 'The Condensed Nearest Neighbor rule'. *IEEE Transactions
         if (not classifier.get_glyphs()):
             return _copyClassifier(classifier)
 
-        if k == 0:
-            k = classifier.num_k
-        
-        progress = ProgressFactory("Generating edited CNN classifier...",
-                                      len(classifier.get_glyphs()))
-
-        # initialize Store (a) with a single element
+        # initialize Store (a) with a single element, which is passed
+        # first to the native implementation
+        glyphs = list(classifier.get_glyphs())
         if randomize:
             elem = _randomSetElement(classifier.get_glyphs())
-        else:
-            elem = classifier.get_glyphs().__iter__().next()
+            glyphs.remove(elem)
+            glyphs.insert(0, elem)
         
-        aGlyphs = [elem]
-        a = kNNInteractive(aGlyphs, classifier.features, 
-                           classifier._perform_splits, k)
-        progress.step()
-        
-        # initialize Grabbag (b) with all other
-        b = classifier.get_glyphs().copy()
-        b.remove(aGlyphs[0]);
+        progress = ProgressFactory("Generating edited CNN classifier...", 1)
 
-        # Classify each glyph in b with a as the classifier
+        # Classify each glyph in the Grabbag (b) with a as the classifier
         # If glyph is misclassified, add it to a, repeat until no elements are 
         # added to a
-        changed = True
-        while changed == True:
-            changed = False
-            # copy needed because iteration through dict is not possible while 
-            # deleting items from it
-            copyOfB = b.copy()
-            for glyph in copyOfB:
-                if glyph.get_main_id() != _getMainId(a.guess_glyph_automatic(glyph)):
-                    b.remove(glyph)
-                    a.get_glyphs().add(glyph)
-                    progress.step()
-                    changed = True
+        a = _copyClassifier(classifier, k)
+        a.instantiate_from_images(glyphs, False)
+        kept = a._edit_cnn(range(len(glyphs)), a.num_k)
+        a.get_glyphs().difference_update(
+            set(glyphs).difference([glyphs[i] for i in kept]))
+        progress.step()
         progress.kill()
         a.num_k = 1
         return a
@@ -19,6 +19,8 @@
 
 import array
 from gamera.plugin import *
+from gamera.__compiletime_config__ import has_openmp
+from gamera.feature_cache import get_feature_cache
 import _features
 
 class Feature(PluginFunction):
@@ -264,6 +266,11 @@ class zernike_moments(Feature):
     The moments *A00* and *A11* are not computed because these are constant
     under the used normalization scheme.
 
+    The moments are computed from sums of powers of the pixel coordinates
+    relative to the centroid rather than by evaluating the Zernike
+    polynomials at each pixel.  The results differ from the direct
+    evaluation only by rounding errors below 1e-10.
+
     +---------------------------+
     | **Invariant to:**         |  
     +-------+----------+--------+
@@ -297,6 +304,10 @@ class zernike_moments_plugin(PluginFunction):
     *A20, A22, A31, A33, A40, A42, A44, A51, A53, A54, A60, A62, A64, A66*.
     The moments *A00* and *A11* are not computed because these are constant
     under the used normalization scheme.
+
+    The radial polynomials are evaluated with precomputed coefficients
+    and white pixels are skipped, which gives the same results as the
+    direct evaluation up to rounding errors below 1e-10.
     """
     category="Features"
     author = "Christoph Dalitz, Robert Butz, Fabian Schmitt"
@@ -366,6 +377,50 @@ class diagonal_projection(Feature):
     author = "Andrew Hankinson"
 
 
+class fused_features(PluginFunction):
+    """
+    Computes several of the built-in features at once and stores them
+    in the ``features`` array of *image*.  *features* are the indexes
+    of the feature functions in ``_fused_features``, *offsets* the
+    positions of their values in the ``features`` array.  The pixels
+    are only visited once for all of them.
+
+    This is only a helper for generate_features_.
+    """
+    # This is only for plugin generation, it will not be added to the image
+    # type (since self_type == None)
+    self_type = None
+    args = Args([ImageType([ONEBIT], 'image'), IntVector('features'),
+                 IntVector('offsets')])
+    return_type = None
+
+class fused_features_list(PluginFunction):
+    """
+    Computes the same features as fused_features for each image of
+    *images*, whose ``features`` arrays must already have the right
+    size.  The interpreter lock is released meanwhile, and when Gamera
+    has been compiled with OpenMP support, the images are distributed
+    among *num_threads* threads.
+
+    This is only a helper for generate_features_list_.
+    """
+    self_type = None
+    args = Args([ImageList('images'), IntVector('features'),
+                 IntVector('offsets'), Int('num_threads')])
+    return_type = None
+
+# The feature functions computed by fused_features, in the order of the
+# FusedFeature enumeration in features.hpp
+_fused_features = [area, aspect_ratio, black_area, compactness,
+                   diagonal_projection, moments, ncols_feature, nholes,
+                   nholes_extended, nrows_feature, skeleton_features,
+                   top_bottom, volume, volume16regions, volume64regions,
+                   zernike_moments]
+# This module may be imported twice (as a plugin and as a part of the
+# gamera package), so the feature functions are recognized by name
+_fused_feature_numbers = dict([(function.__name__, i) for i, function
+                               in enumerate(_fused_features)])
+
 class generate_features(PluginFunction):
     """
     Generates features for the image by calling a number of feature
@@ -379,6 +434,19 @@ class generate_features(PluginFunction):
       Using all feature functions can also be forced by passing
       ``'all'``.
 
+    *single_precision*
+      Optional.  When ``True``, the features are stored in single
+      precision (an ``array`` of typecode ``'f'``), which halves the
+      memory needed for large sets of glyphs.  The features are always
+      computed in double precision.  The kNN classifiers accept
+      features in either precision.
+
+    The built-in feature functions are computed together with a single
+    pass over the pixels.  When a feature cache has been set with
+    ``gamera.feature_cache.set_feature_cache``, the features are taken
+    from the cache if possible (unless *force* is given), and newly
+    generated ones are added to it.
+
     .. warning:: For efficiency, if the given feature functions match
        those that have been already generated for the image, the
        features are *not* recalculated.  If you want to force
@@ -387,34 +455,178 @@ class generate_features(PluginFunction):
     category = "Utility"
     pure_python = True
     self_type = ImageType([ONEBIT])
-    args = Args([Class('features', list), Check('force')])
+    args = Args([Class('features', list), Check('force'),
+                 Check('single_precision')])
     return_type = None
     cache = {}
-    def __call__(self, features=None, force=False):
+    def __call__(self, features=None, force=False, single_precision=False):
+      if single_precision:
+          typecode = 'f'
+      else:
+          typecode = 'd'
       if features is None:
          features = self.get_feature_functions()
-      if self.feature_functions == features and not force:
+      if (self.feature_functions == features and not force and
+          _precise_enough(self, single_precision)):
+         if _typecode(self.features) != typecode:
+            self.features = array.array(typecode, self.features)
          return
-      self.feature_functions = features
-      features, num_features = features
-      if len(self.features) != num_features:
-          if not generate_features.cache.has_key(num_features):
-              generate_features.cache[num_features] = [0] * num_features
-          self.features = array.array('d', generate_features.cache[num_features])
-      offset = 0
-      for name, function in features:
-          function.__call__(self, offset)
-          offset += function.return_type.length
+      cache = get_feature_cache()
+      if cache is not None and not force and cache.load(self, features):
+         if single_precision:
+            self.features = array.array('f', self.features)
+         return
+      fused, fused_offsets = _prepare_features(self, features)
+      if len(fused):
+          _features.fused_features(self, fused, fused_offsets)
+      if cache is not None:
+          cache.save(self, features)
+      if single_precision:
+          self.features = array.array('f', self.features)
     __call__ = staticmethod(__call__)
 
+def _split_features(features, selected=None):
+    """Returns the numbers and offsets of the feature functions that are
+    computed by fused_features, and the remaining (function, offset)
+    pairs.  Only the feature functions named in *selected* are
+    included if it is given."""
+    fused = []
+    fused_offsets = []
+    others = []
+    offset = 0
+    for name, function in features[0]:
+        if selected is not None and name not in selected:
+            pass
+        elif _fused_feature_numbers.has_key(function.__name__):
+            fused.append(_fused_feature_numbers[function.__name__])
+            fused_offsets.append(offset)
+        else:
+            others.append((function, offset))
+        offset += function.return_type.length
+    return fused, fused_offsets, others
+
+def _prepare_features(image, features, selected=None):
+    """Allocates the features of the image in double precision and
+    computes all of the features that are not computed by
+    fused_features.  With *selected*, only the feature functions named
+    in it are computed and the other values are zero.  Returns the
+    arguments for fused_features."""
+    num_features = features[1]
+    if selected is None:
+        image.feature_functions = features
+    else:
+        image.feature_functions = (features[0], num_features, selected)
+    if (selected is not None or len(image.features) != num_features or
+        _typecode(image.features) != 'd'):
+        if not generate_features.cache.has_key(num_features):
+            generate_features.cache[num_features] = [0] * num_features
+        image.features = array.array('d', generate_features.cache[num_features])
+    fused, fused_offsets, others = _split_features(features, selected)
+    for function, offset in others:
+        function.__call__(image, offset)
+    return fused, fused_offsets
+
+def _normalize_selected(features, selected):
+    """Returns the names in *selected* as a frozenset, or None when all
+    of the feature functions are selected."""
+    if selected is None:
+        return None
+    selected = frozenset(selected)
+    for name, function in features[0]:
+        if name not in selected:
+            return selected
+    return None
+
+def _has_features(image, features, selected=None, single_precision=False):
+    """Whether the features of the image include those of *features*
+    (only those named in *selected* if it is given) in at least the
+    requested precision."""
+    if not _precise_enough(image, single_precision):
+        return False
+    image_features = image.feature_functions
+    if image_features == features:
+        return True
+    return (selected is not None and len(image_features) == 3 and
+            selected <= image_features[2] and
+            image_features[1] == features[1] and
+            image_features[0] == features[0])
+
+def _typecode(features):
+    """The typecode of the features of an image, which may also be a
+    row of a feature_matrix_."""
+    try:
+        return features.typecode
+    except AttributeError:
+        return features.dtype.char
+
+def _precise_enough(image, single_precision):
+    """Whether the stored features of the image can be used for the
+    requested precision.  Single precision features are computed again
+    when double precision is asked for, since converting them would
+    keep their rounding."""
+    return single_precision or _typecode(image.features) != 'f'
+
+def _set_precision(image, single_precision):
+    if single_precision:
+        typecode = 'f'
+    else:
+        typecode = 'd'
+    if _typecode(image.features) != typecode:
+        image.features = array.array(typecode, image.features)
+
+def generate_selected_features(image, features, selected,
+                               single_precision=False):
+    """
+    Generates the features of only some of the feature functions for
+    *image*.  The features are stored at the same positions as by
+    generate_features_, and the values of the feature functions that
+    are not selected are zero.  This saves time when only some of the
+    features are used, for example by a classifier whose feature
+    selections have been optimized.
+
+    *features*
+      The feature functions, as for generate_features_.
+
+    *selected*
+      The names of the feature functions that are computed.
+
+    *single_precision*
+      Stores the features in single precision, as generate_features_
+      does.
+
+    The ``feature_functions`` of the image get the names of the
+    computed feature functions as a third element, so that a later
+    call of generate_features_ computes all of the features.  As long
+    as they include the selected ones, the features are not computed
+    again.
+    """
+    from gamera import core
+    ff = core.ImageBase.get_feature_functions(features)
+    selected = _normalize_selected(ff, selected)
+    if selected is None:
+        image.generate_features(ff, False, single_precision)
+        return
+    if not _has_features(image, ff, selected, single_precision):
+        cache = get_feature_cache()
+        if cache is None or not cache.load(image, ff):
+            fused, fused_offsets = _prepare_features(image, ff, selected)
+            if len(fused):
+                _features.fused_features(image, fused, fused_offsets)
+    _set_precision(image, single_precision)
+
 class FeaturesModule(PluginModule):
     category = "Features"
     cpp_headers=["features.hpp"]
+    if has_openmp:
+        extra_compile_args = ["-fopenmp"]
+        extra_link_args = ["-fopenmp"]
     functions = [black_area, moments, nholes,
                  nholes_extended, volume, area,
                  aspect_ratio, nrows_feature, ncols_feature, compactness,
                  volume16regions, volume64regions,
-                 generate_features, zernike_moments, zernike_moments_plugin,
+                 generate_features, fused_features, fused_features_list,
+                 zernike_moments,
+                 zernike_moments_plugin,
                  skeleton_features, top_bottom, diagonal_projection]
     author = "Michael Droettboom and Karl MacMillan"
     url = "http://gamera.sourceforge.net/"
@@ -430,24 +642,126 @@ def get_features_length(features):
     ff = core.ImageBase.get_feature_functions(features)
     return ff[1]
 
-def generate_features_list(list, features='all'):
+def generate_features_list(list, features='all', num_threads=1,
+                           single_precision=False, selected=None):
    """
    Generate features on a list of images.
 
    *features*
      Follows the same rules as for generate_features_.
+
+   *num_threads*
+     The built-in feature functions are computed for many images at
+     once with the global interpreter lock released.  When Gamera has
+     been compiled with OpenMP support, the images are distributed
+     among *num_threads* threads.  The features are the same for any
+     number of threads.
+
+   *single_precision*
+     Stores the features in single precision, as generate_features_
+     does.
+
+   *selected*
+     Optional.  The names of the feature functions that are actually
+     computed, as in generate_selected_features_.  By default all of
+     them are computed.
+
+   The feature cache is used as by generate_features_.
    """
    from gamera import core, util
    ff = core.Image.get_feature_functions(features)
+   selected = _normalize_selected(ff, selected)
+   cache = get_feature_cache()
    progress = util.ProgressFactory("Generating features...", len(list) / 10)
+   batch = []
+   unchanged = []
+   fused = []
+   fused_offsets = []
+   def compute_batch():
+      if len(fused) and len(batch):
+         _features.fused_features_list(batch, fused, fused_offsets,
+                                       num_threads)
+      if cache is not None and selected is None:
+         for glyph in batch:
+            cache.save(glyph, ff)
+      # the unchanged images only after the batch, since an image may
+      # be in the list twice
+      for glyph in batch + unchanged:
+         _set_precision(glyph, single_precision)
+      del batch[:]
+      del unchanged[:]
    try:
       for i, glyph in enumerate(list):
-         glyph.generate_features(ff)
+         if _has_features(glyph, ff, selected, single_precision) or \
+                (cache is not None and cache.load(glyph, ff)):
+            unchanged.append(glyph)
+         else:
+            fused, fused_offsets = _prepare_features(glyph, ff, selected)
+            batch.append(glyph)
+         if len(batch) + len(unchanged) == _batch_size:
+            compute_batch()
          if i % 10 == 0:
              progress.step()
+      compute_batch()
    finally:
+       if cache is not None:
+          cache.flush()
        progress.kill()
 
+# The number of images passed to fused_features_list at once by
+# generate_features_list
+_batch_size = 256
+
+def feature_matrix(list, features='all', num_threads=1, share=True):
+   """
+   Returns the features of a list of images as a single NumPy array
+   together with a list of the main id of each image
+   (see ``get_main_id``).  The array has a row of double precision
+   features for each image, in the order of the list.  Missing
+   features are generated as by generate_features_list_.
+
+   *features*
+     Follows the same rules as for generate_features_.
+
+   *num_threads*
+     The number of threads for generating the features, as for
+     generate_features_list_.
+
+   *share*
+     When ``True``, the ``features`` of each image become a view of its
+     row of the array.  The missing features are then computed directly
+     into the array, the features of all images are stored in one
+     buffer, and the images can be classified as usual.  Regenerating
+     the features of an image in double precision updates its row.
+     When ``False``, the images keep their own arrays and the array is
+     a copy.
+
+   This needs NumPy.
+   """
+   try:
+      import numpy
+   except ImportError:
+      raise RuntimeError("feature_matrix needs NumPy.")
+   from gamera import core
+   ff = core.ImageBase.get_feature_functions(features)
+   list = [x for x in list]
+   matrix = numpy.zeros((len(list), ff[1]))
+   rows = [matrix[i] for i in range(len(list))]
+   if share:
+      for glyph, row in zip(list, rows):
+         if not _has_features(glyph, ff):
+            glyph.features = row
+            # features in single precision are computed again
+            glyph.feature_functions = [[], 0]
+   generate_features_list(list, ff, num_threads)
+   for glyph, row in zip(list, rows):
+      if glyph.features is not row:
+         row[:] = numpy.frombuffer(glyph.features, numpy.float64)
+   if share:
+      for glyph, row in zip(list, rows):
+         glyph.features = row
+   return matrix, [glyph.get_main_id() for glyph in list]
+
 generate_features = generate_features()
 
 del Feature
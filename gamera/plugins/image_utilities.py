@@ -40,11 +40,16 @@ class image_copy(PluginFunction):
       no compression
     RLE (1)
       run-length encoding compression
+    PACKED (2)
+      one bit per pixel (only for ONEBIT images)
+    TILED (3)
+      tiles that are only kept in memory when they are not white (only
+      for ONEBIT, GREYSCALE, GREY16 and RGB images)
     """
     category = "Utility"
-    self_type = ImageType(ALL)
+    self_type = ImageType(ALL, packed=True, tiled=True)
     return_type = ImageType(ALL)
-    args = Args([Choice("storage_format", ["DENSE", "RLE"])])
+    args = Args([Choice("storage_format", ["DENSE", "RLE", "PACKED", "TILED"])])
     def __call__(image, storage_format = 0):
         if image.nrows <= 0 or image.ncols <= 0:
             return image
@@ -122,7 +127,7 @@ class fill(PluginFunction):
       A pixel value.  This value may be any value the pixel type can support.
     """
     category = "Draw"
-    self_type = ImageType(ALL)
+    self_type = ImageType(ALL, tiled=True)
     args = Args([Pixel("value")])
 
 class pad_image_default(PluginFunction):
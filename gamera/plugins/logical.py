@@ -21,9 +21,10 @@ from gamera.plugin import *
 import _logical
   
 class LogicalCombine(PluginFunction):
-  self_type = ImageType([ONEBIT])
+  self_type = ImageType([ONEBIT], packed=True)
   return_type = ImageType([ONEBIT])
-  args = Args([ImageType([ONEBIT], "other"), Check("in_place", default=False)])
+  args = Args([ImageType([ONEBIT], "other", packed=True),
+               Check("in_place", default=False)])
 
 class and_image(LogicalCombine):
   """
@@ -26,7 +26,7 @@ class erode(PluginFunction):
   """
   Morpholgically erodes the image with a 3x3 square structuring element.
   """
-  self_type = ImageType([ONEBIT, GREYSCALE, FLOAT])
+  self_type = ImageType([ONEBIT, GREYSCALE, FLOAT], packed=True)
   doc_examples = [(GREYSCALE,), (ONEBIT,)]
   return_type = ImageType([ONEBIT, GREYSCALE, FLOAT])
   pure_python = True
@@ -45,7 +45,7 @@ class dilate(PluginFunction):
 
 .. _pad_image: utility.html#pad-image
   """
-  self_type = ImageType([ONEBIT, GREYSCALE, FLOAT])
+  self_type = ImageType([ONEBIT, GREYSCALE, FLOAT], packed=True)
   doc_examples = [(GREYSCALE,), (ONEBIT,)]
   return_type = ImageType([ONEBIT, GREYSCALE, FLOAT])
   pure_python = True
@@ -83,7 +83,7 @@ class erode_dilate(PluginFunction):
       use octagonal morphology operator by alternately using
       a 3x3 cross and a 3x3 square structuring element
   """
-  self_type = ImageType([ONEBIT, GREYSCALE, FLOAT])
+  self_type = ImageType([ONEBIT, GREYSCALE, FLOAT], packed=True)
   args = Args([Int('ntimes', range=(0, 10), default=1), \
                Choice('direction', ['dilate', 'erode']), \
                Choice('shape', ['rectangular', 'octagonal'])])
@@ -69,7 +69,15 @@ else:
         | COMPLEX    | complex128       |
         +------------+------------------+
 
-        Requires two copying operations;  may fail for very large images.
+        *offset*
+          The position of the upper left corner of the new image.
+
+        *copy*
+          When ``True`` (the default), the image gets a copy of the
+          array.  When ``False``, the image uses the memory of the array
+          itself, so that changes to one are seen in the other, and
+          keeps the array alive.  The array must then be writable and
+          C-contiguous (as new arrays are).
 
         To use this function, which is not a method on images, do the
         following:
@@ -80,18 +88,16 @@ else:
           image = numpy_io.from_numpy(array)
         """
         self_type = None
-        args = Args([Class("array")])
+        args = Args([Class("array"), Point("offset", default=(0, 0)),
+                     Check("copy", default=True)])
         return_type = ImageType(ALL)
         pure_python = True
-        def __call__(array, offset=(0, 0)):
-            from gamera.plugins import _string_io
-            from gamera.core import Dim
-            pixel_type = from_numpy._check_input(array)
-            return _string_io._from_raw_string(
-                offset,
-                Dim(array.shape[1], array.shape[0]),
-                pixel_type, DENSE,
-                array.tostring())
+        def __call__(array, offset=(0, 0), copy=True):
+            from gamera.core import Image
+            from_numpy._check_input(array)
+            if copy:
+                array = n.array(array, order='C')
+            return Image.from_buffer(array, offset)
         __call__ = staticmethod(__call__)
 
         def _check_input(array):
@@ -108,7 +114,8 @@ else:
 
     class to_numpy(PluginFunction):
         """
-        Returns an ``Numeric`` array containing a copy of the image's data.
+        Returns an ``Numeric`` array containing a copy of the image's data,
+        or sharing the image's data when *copy* is ``False``.
 
         The array will be one of the following types corresponding to
         each of the Gamera image types:
@@ -131,7 +138,13 @@ else:
         | COMPLEX    | complex128      |
         +------------+-----------------+
 
-        Requires *three* copies, and may fail for very large images.
+        *copy*
+          When ``True`` (the default), the array gets a copy of the
+          pixels.  When ``False``, the array uses the memory of the image
+          itself, so that changes to one are seen in the other, and
+          keeps the image alive.  This is only possible for ``DENSE``
+          images that are not connected components.  The array of a
+          subimage has the row stride of the whole image.
 
         This method can be used for utilizing special functions present in
         numpy. If you need to compute the discrete fourier transform of
@@ -146,17 +159,21 @@ else:
           fourimage = numpy_io.from_numpy(fourarr)
         """
         self_type = ImageType(ALL)
+        args = Args([Check("copy", default=True)])
         return_type = Class("array")
         pure_python = True
-        def __call__(image):
-            from gamera.plugins import _string_io
-            pixel_type = image.data.pixel_type
-            shape = (image.nrows, image.ncols)
-            typecode = _typecodes[pixel_type]
-            if pixel_type == RGB:
-                shape += (3,)
-            array = n.fromstring(_string_io._to_raw_string(image), typecode)
-            return n.resize(array, shape)
+        def __call__(image, copy=True):
+            from gamera.core import Cc, MlCc
+            if (image.data.storage_format == DENSE and
+                not isinstance(image, (Cc, MlCc))):
+                array = n.asarray(image)
+                if copy:
+                    array = array.copy()
+                return array
+            if not copy:
+                raise ValueError("Only DENSE images that are not connected components can share their data with an array.")
+            # a Cc only has its own pixels in the copy
+            return n.asarray(image.image_copy(DENSE))
         __call__ = staticmethod(__call__)
 
         def __doc_example1__(images):
@@ -56,10 +56,12 @@ class load_PNG(PluginFunction):
         no compression
       RLE (1)
         run-length encoding compression
+      PACKED (2)
+        one bit per pixel (only for ONEBIT images)
     """
     self_type = None
     args = Args([FileOpen("image_file_name", "", "*.png"),
-                 Choice("storage format", ["DENSE", "RLE"])])
+                 Choice("storage format", ["DENSE", "RLE", "PACKED"])])
     return_type = ImageType([ONEBIT, GREYSCALE, GREY16, RGB, FLOAT])
     def __call__(filename, compression = 0):
         from gamera.plugins import _png_support
@@ -29,7 +29,7 @@ class projection_rows(PluginFunction):
     Compute the horizontal projections of an image.  This computes the
     number of pixels in each row.
     """
-    self_type = ImageType([ONEBIT])
+    self_type = ImageType([ONEBIT], packed=True)
     return_type = IntVector()
     doc_examples = [(ONEBIT,)]
 
@@ -38,7 +38,7 @@ class projection_cols(PluginFunction):
     Compute the vertical projections of an image.  This computes the
     number of pixels in each column.
     """
-    self_type = ImageType([ONEBIT])
+    self_type = ImageType([ONEBIT], packed=True)
     return_type = IntVector()
     doc_examples = [(ONEBIT,)]
 
@@ -54,7 +54,7 @@ class projections(PluginFunction):
 
     .. image:: images/projections.png
     """
-    self_type = ImageType([ONEBIT])
+    self_type = ImageType([ONEBIT], packed=True)
     return_type = Class()
     pure_python = 1
     def __call__(image):
@@ -47,8 +47,71 @@ class cc_analysis(Segmenter):
       ccs = [x.image_copy() for x in ccs]
 
     .. _image_copy: utility.html#image-copy
+
+    The labels are stored in the pixels.  When the labeling needs more
+    labels than the pixels can hold (on pages with more than 65533
+    connected components, or with many strokes that only meet further
+    down), it is done in a separate plane of 32-bit labels instead.
+    The plane is kept with the image data (at four bytes per pixel),
+    and the ccs tell their pixels apart by it, so their labels are
+    unique just as well.  The pixels of ccs with labels above 65535
+    then hold a smaller label that other ccs share, so code that
+    looks for a label in the pixels of the page should go through the
+    ccs instead.
+
+    A PACKED image stores only one bit per pixel and cannot hold the
+    labels.  For such an image, the labels are written into a new
+    DENSE copy, and the returned ccs share their data with that copy
+    instead of with the original image.
+    """
+    self_type = ImageType([ONEBIT], packed=True)
+
+
+class _cc_boxes(Segmenter):
+    """
+    Labels the image like cc_analysis_, and returns the label, bounding
+    box (ul_x, ul_y, lr_x, lr_y) and number of black pixels of each
+    connected component, six ints per component.
+
+    This function is not intended to be used directly.  Use
+    compact_cc_analysis_ instead.
+    """
+    return_type = IntVector("boxes")
+    doc_examples = []
+
+
+class compact_cc_analysis(Segmenter):
     """
-    pass
+    Performs connected component analysis on the image like
+    cc_analysis_, but returns a CcList_ instead of a list.
+
+    A CcList only keeps the label, bounding box and number of black
+    pixels of each connected component (in an array per field), and
+    creates the Cc objects when they are used.  So on pages with many
+    thousand connected components, where most of them are dropped by
+    size before anything else is done with them, much less time and
+    memory are spent on the Cc objects:
+
+    .. code:: Python
+
+      ccs = image.compact_cc_analysis().filter(min_area=5)
+      ccs.sort("ul_y")
+
+    Use ``to_list()`` for functions that need a list of Cc objects.
+
+    .. _CcList: image_types.html#cclist
+    """
+    self_type = ImageType([ONEBIT], packed=True)
+    return_type = Class("ccs")
+    pure_python = True
+    def __call__(image):
+        from gamera.core import CcList
+        # PACKED images cannot hold the labels (see cc_analysis)
+        if image.data.storage_format == PACKED:
+            image = image.image_copy(DENSE)
+        return CcList.from_boxes(image, _segmentation._cc_boxes(image))
+    __call__ = staticmethod(__call__)
+    doc_examples = []
 
 
 class cc_and_cluster(Segmenter):
@@ -258,7 +321,8 @@ def filter_black_area_large(ccs, max_size):
 class SegmentationModule(PluginModule):
     category = "Segmentation"
     cpp_headers=["segmentation.hpp"]
-    functions = [cc_analysis, cc_and_cluster, splitx, splity,
+    functions = [cc_analysis, _cc_boxes, compact_cc_analysis,
+                 cc_and_cluster, splitx, splity,
                  splitx_left, splitx_right, splity_top, splity_bottom,
                  splitx_max]
     author = "Michael Droettboom and Karl MacMillan"
@@ -47,10 +47,15 @@ class load_tiff(PluginFunction):
         no compression
       RLE (1)
         run-length encoding compression
+      PACKED (2)
+        one bit per pixel (only for ONEBIT images)
+      TILED (3)
+        the pixels are only read from the file when they are used
+        (not for FLOAT images)
     """
     self_type = None
     args = Args([FileOpen("image_file_name", "", "*.tiff;*.tif"),
-                 Choice("storage format", ["DENSE", "RLE"])])
+                 Choice("storage format", ["DENSE", "RLE", "PACKED", "TILED"])])
     return_type = ImageType([ONEBIT, GREYSCALE, GREY16, RGB, FLOAT])
     def __call__(filename, compression = 0):
         return _tiff_support.load_tiff(filename, compression)
@@ -66,7 +71,7 @@ class save_tiff(PluginFunction):
     *image_file_name*
       A TIFF image filename
     """
-    self_type = ImageType([ONEBIT, GREYSCALE, GREY16, RGB])
+    self_type = ImageType([ONEBIT, GREYSCALE, GREY16, RGB], tiled=True)
     args = Args([FileSave("image_file_name", "image.tiff", "*.tiff;*.tif")])
     return_type = None
     exts = ["tiff", "tif"]
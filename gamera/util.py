@@ -503,44 +503,32 @@ class CallbackSet(sets.Set, CallbackObject):
       sets.Set.clear(self)
       self.trigger_callback('length_change', len(self))
 
+   # The callbacks get lists, since every callback must see all elements
+
    def update(self, iterable):
-      def iter():
-         for i in iterable:
-            if i not in self:
-               yield i
-      self.trigger_callback('add', iter())
+      iterable = list(iterable)
+      self.trigger_callback('add', [i for i in iterable if i not in self])
       sets.Set.update(self, iterable)
       self.trigger_callback('length_change', len(self))
 
    def difference_update(self, iterable):
-      def iter():
-         for i in iterable:
-            if i in self:
-               yield i
-      self.trigger_callback('remove', iter())
+      iterable = list(iterable)
+      self.trigger_callback('remove', [i for i in iterable if i in self])
       sets.Set.difference_update(self, iterable)
       self.trigger_callback('length_change', len(self))
 
    def symmetric_difference_update(self, iterable):
-      def remove_iter():
-         for i in iterable:
-            if i in self:
-               yield i
-      def add_iter():
-         for i in iterable:
-            if not i in self:
-               yield i
-      self.trigger_callback('remove', remove_iter())
-      self.trigger_callback('add', add_iter())
+      iterable = list(iterable)
+      removed = [i for i in iterable if i in self]
+      added = [i for i in iterable if not i in self]
+      self.trigger_callback('remove', removed)
+      self.trigger_callback('add', added)
       sets.Set.symmetric_difference_update(self, iterable)
       self.trigger_callback('length_change', len(self))
 
    def intersection_update(self, iterable):
-      def iter():
-         for i in self:
-            if not i in iterable:
-               yield i
-      self.trigger_callback('remove', iter())
+      iterable = sets.Set(iterable)
+      self.trigger_callback('remove', [i for i in self if not i in iterable])
       sets.Set.intersection_update(self, iterable)
       self.trigger_callback('length_change', len(self))
 
@@ -32,6 +32,7 @@
 #include <exception>
 #include <map>
 #include <vector>
+#include <limits>
 
 #include <stdio.h>
 
@@ -48,10 +49,28 @@
   This class implements a filtered image view similar to ConnectedComponent,
   but with pixels visible that not only match a single label, but a
   set of possible labels.
+
+  Labels are 32-bit.  When the data has a label plane (see
+  ImageDataBase::label_plane), the pixels only hold pixel_label of their
+  label, which need not be unique, and the plane decides which labels
+  they have.
 */
 
 namespace Gamera {
 
+  /*
+    The pixel value for a cc label: the label itself, if it fits in the
+    pixel type.  Larger labels wrap around to the labels from 2 up, so
+    that their pixels are still black and labeled.
+  */
+  template<class T>
+  inline T pixel_label(unsigned int label) {
+    const unsigned int max = std::numeric_limits<T>::max();
+    if (label <= max)
+      return T(label);
+    return T(2 + (label - 2) % (max - 1));
+  }
+
   template <class T> class MultiLabelCC;    
     
   template<class T>
@@ -70,6 +89,7 @@ namespace Gamera {
     typedef typename T::difference_type difference_type;
     // Gamera specific
     typedef T data_type;
+    typedef unsigned int label_type;
 	
     // Vigra typedefs
     typedef value_type PixelType;
@@ -83,45 +103,50 @@ namespace Gamera {
     //
     ConnectedComponent() : base_type() {
       m_image_data = 0;
-      m_label = 0;
+      label(0);
     }
 
     ConnectedComponent(T& image_data)
       : base_type(image_data.offset(),
 		  image_data.dim()) {
       m_image_data = &image_data;
+      label(0);
       range_check();
       calculate_iterators();
     }
-    ConnectedComponent(T& image_data, value_type label,
+    ConnectedComponent(T& image_data, label_type label,
 		       const Rect& rect)
-      : base_type(rect), m_label(label) {
+      : base_type(rect) {
       m_image_data = &image_data;
+      this->label(label);
       range_check();
       calculate_iterators();
     }
-    ConnectedComponent(T& image_data, value_type label,
+    ConnectedComponent(T& image_data, label_type label,
 		       const Point& upper_left,
 		       const Point& lower_right)
-      : base_type(upper_left, lower_right), m_label(label) {
+      : base_type(upper_left, lower_right) {
       m_image_data = &image_data;
+      this->label(label);
       range_check();
       calculate_iterators();
     }
-    ConnectedComponent(T& image_data, value_type label,
+    ConnectedComponent(T& image_data, label_type label,
 		       const Point& upper_left,
 		       const Size& size)
-      : base_type(upper_left, size), m_label(label) {
+      : base_type(upper_left, size) {
       m_image_data = &image_data;
+      this->label(label);
       range_check();
       calculate_iterators();
     }
 
-    ConnectedComponent(T& image_data, value_type label,
+    ConnectedComponent(T& image_data, label_type label,
 		       const Point& upper_left,
 		       const Dim& dim)
-      : base_type(upper_left, dim), m_label(label) {
+      : base_type(upper_left, dim) {
       m_image_data = &image_data;
+      this->label(label);
       range_check();
       calculate_iterators();
     }
@@ -132,7 +157,7 @@ namespace Gamera {
     ConnectedComponent(const self& other, const Rect& rect)
       : base_type(rect) {
       m_image_data = other.m_image_data;
-      m_label = other.label();
+      label(other.label());
       range_check();
       calculate_iterators();
     }
@@ -140,7 +165,7 @@ namespace Gamera {
 		       const Point& lower_right)
       : base_type(upper_left, lower_right) {
       m_image_data = other.m_image_data;
-      m_label = other.label();
+      label(other.label());
       range_check();
       calculate_iterators();
     }
@@ -148,7 +173,7 @@ namespace Gamera {
 		       const Size& size)
       : base_type(upper_left, size) {
       m_image_data = other.m_image_data;
-      m_label = other.label();
+      label(other.label());
       range_check();
       calculate_iterators();
     }
@@ -156,7 +181,7 @@ namespace Gamera {
 		       const Dim& dim)
       : base_type(upper_left, dim) {
       m_image_data = other.m_image_data;
-      m_label = other.label();
+      label(other.label());
       range_check();
       calculate_iterators();
     }
@@ -174,8 +199,9 @@ namespace Gamera {
     //
 
     value_type get(const Point& p) const {
-      value_type tmp = *(m_const_begin + (p.y() * m_image_data->stride()) + p.x());
-      if (tmp == m_label)
+      typename T::const_iterator i = const_begin_iterator() + (p.y() * m_image_data->stride()) + p.x();
+      value_type tmp = *i;
+      if (owns(tmp, i))
       	return tmp;
       else
       	return 0;
@@ -185,7 +211,7 @@ namespace Gamera {
       // we simply set the pixel value regardless of the label
       // warning: when value different from Cc.labels, the pixel will
       // appear to be white, even though we have written a different value
-      *(m_begin + (p.y() * m_image_data->stride()) + p.x()) = value;
+      *(begin_iterator() + (p.y() * m_image_data->stride()) + p.x()) = value;
     }
 
     //
@@ -200,7 +226,8 @@ namespace Gamera {
     //
     // Misc
     //
-    virtual T* data() const { return m_image_data; }
+    virtual T* data() { return m_image_data; }
+    virtual const T* data() const { return m_image_data; }
     ImageView<T> parent() {
       return ImageView<T>(*m_image_data, 0, 0, m_image_data->nrows(),
 			   m_image_data->ncols());
@@ -208,12 +235,26 @@ namespace Gamera {
     ImageView<T> image() {
       return ImageView<T>(*m_image_data, this->origin(), this->dim());
     }
-    value_type label() const {
+    label_type label() const {
       return m_label;
     }
 
-    void label(value_type label) {
+    void label(label_type label) {
       m_label = label;
+      m_pixel_label = pixel_label<value_type>(label);
+    }
+
+    /*
+      Whether the pixel with the given value at the data iterator i
+      belongs to this cc: it must have the pixel label, and if the data
+      has a label plane, the plane must have the label there.
+    */
+    template<class I>
+    bool owns(value_type value, const I& i) const {
+      if (value != m_pixel_label)
+        return false;
+      const unsigned int* plane = m_image_data->label_plane();
+      return plane == 0 || plane[m_image_data->position(i)] == m_label;
     }
 
     //
@@ -221,18 +262,18 @@ namespace Gamera {
     //
     typedef CCDetail::RowIterator<self, typename T::iterator> row_iterator;
     row_iterator row_begin() {
-      return row_iterator(this, m_begin);
+      return row_iterator(this, begin_iterator());
     }
     row_iterator row_end() {
-      return row_iterator(this, m_end);
+      return row_iterator(this, end_iterator());
     }
 
     typedef CCDetail::ColIterator<self, typename T::iterator> col_iterator;
     col_iterator col_begin() {
-      return col_iterator(this, m_begin);
+      return col_iterator(this, begin_iterator());
     }
     col_iterator col_end() {
-      return col_iterator(this, m_begin + ncols());
+      return col_iterator(this, begin_iterator() + ncols());
     }
 
     //
@@ -240,18 +281,18 @@ namespace Gamera {
     //
     typedef CCDetail::ConstRowIterator<const self, typename T::const_iterator> const_row_iterator;
     const_row_iterator row_begin() const {
-      return const_row_iterator(this, m_const_begin);
+      return const_row_iterator(this, const_begin_iterator());
     }
     const_row_iterator row_end() const {
-      return const_row_iterator(this, m_const_end);
+      return const_row_iterator(this, const_end_iterator());
     }
 
     typedef CCDetail::ConstColIterator<const self, typename T::const_iterator> const_col_iterator;
     const_col_iterator col_begin() const {
-      return const_col_iterator(this, m_const_begin);
+      return const_col_iterator(this, const_begin_iterator());
     }
     const_col_iterator col_end() const {
-      return const_col_iterator(this, m_const_begin + ncols());
+      return const_col_iterator(this, const_begin_iterator() + ncols());
     }
 
     //
@@ -302,38 +343,28 @@ namespace Gamera {
     // OPERATOR ACCESS
     //
     col_iterator operator[](size_t n) {
-      return col_iterator(this, m_begin + (n * data()->stride())); }
+      return col_iterator(this, begin_iterator() + (n * data()->stride())); }
     const_col_iterator operator[](size_t n) const {
-      return const_col_iterator(this, m_begin + (n * data()->stride())); }
+      return const_col_iterator(this, const_begin_iterator() + (n * data()->stride())); }
   private:
-    /*
-      We pre-compute iterators here in an effort to make begin() and end()
-      methods a little faster. Unfortunately we have to to keep around both
-      normal and const iterators.
-    */
     void calculate_iterators() {
-      m_begin = m_image_data->begin()
-        // row offset
-        + (m_image_data->stride() * (offset_y() - m_image_data->page_offset_y()))
-        // col offset
-        + (offset_x() - m_image_data->page_offset_x());
-      m_end = m_image_data->begin()
-        // row offset
-        + (m_image_data->stride() * ((offset_y() - m_image_data->page_offset_y()) + nrows()))
-        // column offset
-        + (offset_x() - m_image_data->page_offset_x());
-      const T* cmd = static_cast<const T*>(m_image_data);
-      m_const_begin = cmd->begin()
-        // row offset
-	+ (m_image_data->stride() * (offset_y() - m_image_data->page_offset_y()))
-        // col offset
-        + (offset_x() - m_image_data->page_offset_x());
-      m_const_end = cmd->begin()
-        // row offset
-        + (m_image_data->stride() * ((offset_y() - m_image_data->page_offset_y()) + nrows()))
-        // column offset
+      m_first = m_image_data->stride() * (offset_y() - m_image_data->page_offset_y())
         + (offset_x() - m_image_data->page_offset_x());
     }
+    // not cached, for the same reason as in ImageView
+    typename T::iterator begin_iterator() {
+      return m_image_data->begin() + m_first;
+    }
+    typename T::iterator end_iterator() {
+      return m_image_data->begin() + (m_first + m_image_data->stride() * nrows());
+    }
+    typename T::const_iterator const_begin_iterator() const {
+      return static_cast<const T*>(m_image_data)->begin() + m_first;
+    }
+    typename T::const_iterator const_end_iterator() const {
+      return static_cast<const T*>(m_image_data)->begin()
+        + (m_first + m_image_data->stride() * nrows());
+    }
     void range_check() {
       if (offset_y() + nrows() - m_image_data->page_offset_y() > m_image_data->nrows() ||
 	  offset_x() + ncols() - m_image_data->page_offset_x() > m_image_data->ncols()
@@ -352,11 +383,12 @@ namespace Gamera {
     }
     // Pointer to the data for this view
     T* m_image_data;
-    // Cached iterators - see calculate_iterators above.
-    typename T::iterator m_begin, m_end;
-    typename T::const_iterator m_const_begin, m_const_end;
+    // the position of the upper left pixel in the data
+    size_t m_first;
     // The label for this connected-component
-    value_type m_label;
+    label_type m_label;
+    // the value of its pixels
+    value_type m_pixel_label;
   };
 
 
@@ -375,6 +407,7 @@ namespace Gamera {
     typedef typename T::difference_type difference_type;
     // Gamera specific
     typedef T data_type;
+    typedef unsigned int label_type;
 	
     // Vigra typedefs
     typedef value_type PixelType;
@@ -398,7 +431,7 @@ namespace Gamera {
       calculate_iterators();
     }
     
-    MultiLabelCC(T& image_data, value_type label,
+    MultiLabelCC(T& image_data, label_type label,
 		       const Rect& rect)
       : base_type(rect){
       m_image_data = &image_data;
@@ -407,7 +440,7 @@ namespace Gamera {
 
       m_labels[label]=new Rect(rect);
     }
-    MultiLabelCC(T& image_data, value_type label,
+    MultiLabelCC(T& image_data, label_type label,
 		       const Point& upper_left,
 		       const Point& lower_right)
       : base_type(upper_left, lower_right){
@@ -417,7 +450,7 @@ namespace Gamera {
 
       m_labels[label]=new Rect(upper_left, lower_right);
     }
-    MultiLabelCC(T& image_data, value_type label,
+    MultiLabelCC(T& image_data, label_type label,
 		       const Point& upper_left,
 		       const Size& size)
       : base_type(upper_left, size){
@@ -428,7 +461,7 @@ namespace Gamera {
       m_labels[label]=new Rect(upper_left, size);
     }
 
-    MultiLabelCC(T& image_data, value_type label,
+    MultiLabelCC(T& image_data, label_type label,
 		       const Point& upper_left,
 		       const Dim& dim)
       : base_type(upper_left, dim){
@@ -503,10 +536,19 @@ namespace Gamera {
 
     ConnectedComponent<T>* convert_to_cc(){
       // we must use iterators because set() is blocked for MlCc's
-      typename MultiLabelCC::vec_iterator i = this->vec_begin();
-      int label = m_labels.begin()->first;
-      for ( ; i != this->vec_end(); ++i) {
-        if (is_black(*i)) *i = label;
+      label_type label = m_labels.begin()->first;
+      value_type value = pixel_label<value_type>(label);
+      unsigned int* plane = m_image_data->label_plane();
+      typename MultiLabelCC::row_iterator row = this->row_begin();
+      for ( ; row != this->row_end(); ++row) {
+        typename MultiLabelCC::col_iterator i = row.begin();
+        for ( ; i != row.end(); ++i) {
+          if (is_black(*i)) {
+            *i = value;
+            if (plane)
+              plane[m_image_data->position(i.m_iterator)] = label;
+          }
+        }
       }
       for(it=m_labels.begin(); it!=m_labels.end(); it++){
          delete it->second;
@@ -521,8 +563,9 @@ namespace Gamera {
     //  FUNCTION ACCESS
     //
     value_type get(const Point& point) const{
-      value_type tmp = *(m_const_begin + (point.y() * m_image_data->stride()) + point.x());
-      if(m_labels.find(tmp) != m_labels.end())
+      typename T::const_iterator i = const_begin_iterator() + (point.y() * m_image_data->stride()) + point.x();
+      value_type tmp = *i;
+      if (owns(tmp, i))
         return tmp;
       else
         return 0;    		
@@ -532,7 +575,7 @@ namespace Gamera {
       // we simply set the pixel value regardless of the label
       // warning: when value is neither of the labels, the pixel will
       // appear to be white, even though we have written a different value
-      *(m_begin + (p.y() * m_image_data->stride()) + p.x()) = value;
+      *(begin_iterator() + (p.y() * m_image_data->stride()) + p.x()) = value;
     }
 
     //
@@ -547,7 +590,8 @@ namespace Gamera {
     //
     // Misc
     //
-    virtual T* data() const { return m_image_data; }
+    virtual T* data() { return m_image_data; }
+    virtual const T* data() const { return m_image_data; }
     ImageView<T> parent() {
       return ImageView<T>(*m_image_data, 0, 0, m_image_data->nrows(),
 			   m_image_data->ncols());
@@ -557,7 +601,7 @@ namespace Gamera {
     }
     
 /*
-    typename std::map<value_type, Rect*> labels(){
+    typename std::map<label_type, Rect*> labels(){
       return m_labels;
     }
 */
@@ -568,11 +612,24 @@ namespace Gamera {
       }
     }
     
-    bool has_label(value_type label) const {
+    bool has_label(label_type label) const {
     	return m_labels.find(label) != m_labels.end();
     }
+
+    /*
+      Whether the pixel with the given value at the data iterator i
+      belongs to this MlCc, like ConnectedComponent::owns.
+    */
+    template<class I>
+    bool owns(value_type value, const I& i) const {
+      const unsigned int* plane = m_image_data->label_plane();
+      if (plane == 0)
+        return has_label(value);
+      label_type label = plane[m_image_data->position(i)];
+      return value == pixel_label<value_type>(label) && has_label(label);
+    }
     
-    void add_label(value_type label, Rect& rect) {
+    void add_label(label_type label, Rect& rect) {
       if(m_labels.size()==0){
         this->rect_set(rect.ul(),rect.lr());
       }
@@ -581,7 +638,7 @@ namespace Gamera {
       this->union_rect(rect);
     }
 
-    void remove_label(value_type label){
+    void remove_label(label_type label){
       it=m_labels.find(label);
       if(it!=m_labels.end()){
         delete it->second;
@@ -610,7 +667,7 @@ namespace Gamera {
       }
     }
     
-    void add_neighbors(value_type i, value_type j){
+    void add_neighbors(label_type i, label_type j){
       m_neighbors.push_back(i);
       m_neighbors.push_back(j);
     }
@@ -627,7 +684,7 @@ namespace Gamera {
         for (size_t j=0; j<labelVector[i]->size(); j++){
           Rect* rect=m_labels[labelVector[i]->at(j)];
           if(rect!=NULL){
-            value_type label=(value_type)(labelVector[i]->at(j));
+            label_type label=(label_type)(labelVector[i]->at(j));
             mlcc->add_label(label, *rect);
           } else {
             //tidy up
@@ -646,18 +703,18 @@ namespace Gamera {
     //
     typedef MLCCDetail::RowIterator<self, typename T::iterator> row_iterator;
     row_iterator row_begin() {
-      return row_iterator(this, m_begin);
+      return row_iterator(this, begin_iterator());
     }
     row_iterator row_end() {
-      return row_iterator(this, m_end);
+      return row_iterator(this, end_iterator());
     }
 
     typedef MLCCDetail::ColIterator<self, typename T::iterator> col_iterator;
     col_iterator col_begin() {
-      return col_iterator(this, m_begin);
+      return col_iterator(this, begin_iterator());
     }
     col_iterator col_end() {
-      return col_iterator(this, m_begin + ncols());
+      return col_iterator(this, begin_iterator() + ncols());
     }
 
     //
@@ -665,18 +722,18 @@ namespace Gamera {
     //
     typedef MLCCDetail::ConstRowIterator<const self, typename T::const_iterator> const_row_iterator;
     const_row_iterator row_begin() const {
-      return const_row_iterator(this, m_const_begin);
+      return const_row_iterator(this, const_begin_iterator());
     }
     const_row_iterator row_end() const {
-      return const_row_iterator(this, m_const_end);
+      return const_row_iterator(this, const_end_iterator());
     }
 
     typedef MLCCDetail::ConstColIterator<const self, typename T::const_iterator> const_col_iterator;
     const_col_iterator col_begin() const {
-      return const_col_iterator(this, m_const_begin);
+      return const_col_iterator(this, const_begin_iterator());
     }
     const_col_iterator col_end() const {
-      return const_col_iterator(this, m_const_begin + ncols());
+      return const_col_iterator(this, const_begin_iterator() + ncols());
     }
 
     //
@@ -727,50 +784,40 @@ namespace Gamera {
     // OPERATOR ACCESS
     //
     col_iterator operator[](size_t n) {
-      return col_iterator(this, m_begin + (n * data()->stride())); }
+      return col_iterator(this, begin_iterator() + (n * data()->stride())); }
     const_col_iterator operator[](size_t n) const {
-      return const_col_iterator(this, m_begin + (n * data()->stride())); }
+      return const_col_iterator(this, const_begin_iterator() + (n * data()->stride())); }
 
     //for initialization of iterators
-    const typename std::map<value_type, Rect*>* get_labels_pointer() const {
+    const typename std::map<label_type, Rect*>* get_labels_pointer() const {
       return &m_labels;
     }
   private:
     void copy_labels(const self& other){
-      typename std::map<value_type, Rect*>::const_iterator iter;
+      typename std::map<label_type, Rect*>::const_iterator iter;
       for (iter = other.m_labels.begin(); iter != other.m_labels.end(); iter++){
         m_labels[iter->first]=new Rect(*(iter->second));
       }
     }
 
-    /*
-      We pre-compute iterators here in an effort to make begin() and end()
-      methods a little faster. Unfortunately we have to keep around both
-      normal and const iterators.
-    */
     void calculate_iterators() {
-      m_begin = m_image_data->begin()
-        // row offset
-        + (m_image_data->stride() * (offset_y() - m_image_data->page_offset_y()))
-        // col offset
-        + (offset_x() - m_image_data->page_offset_x());
-      m_end = m_image_data->begin()
-        // row offset
-        + (m_image_data->stride() * ((offset_y() - m_image_data->page_offset_y()) + nrows()))
-        // column offset
-        + (offset_x() - m_image_data->page_offset_x());
-      const T* cmd = static_cast<const T*>(m_image_data);
-      m_const_begin = cmd->begin()
-        // row offset
-        + (m_image_data->stride() * (offset_y() - m_image_data->page_offset_y()))
-        // col offset
-        + (offset_x() - m_image_data->page_offset_x());
-      m_const_end = cmd->begin()
-        // row offset
-        + (m_image_data->stride() * ((offset_y() - m_image_data->page_offset_y()) + nrows()))
-        // column offset
+      m_first = m_image_data->stride() * (offset_y() - m_image_data->page_offset_y())
         + (offset_x() - m_image_data->page_offset_x());
     }
+    // not cached, for the same reason as in ImageView
+    typename T::iterator begin_iterator() {
+      return m_image_data->begin() + m_first;
+    }
+    typename T::iterator end_iterator() {
+      return m_image_data->begin() + (m_first + m_image_data->stride() * nrows());
+    }
+    typename T::const_iterator const_begin_iterator() const {
+      return static_cast<const T*>(m_image_data)->begin() + m_first;
+    }
+    typename T::const_iterator const_end_iterator() const {
+      return static_cast<const T*>(m_image_data)->begin()
+        + (m_first + m_image_data->stride() * nrows());
+    }
     void range_check() {
       if (offset_y() + nrows() - m_image_data->page_offset_y() > m_image_data->nrows() ||
     	  offset_x() + ncols() - m_image_data->page_offset_x() > m_image_data->ncols()
@@ -789,13 +836,12 @@ namespace Gamera {
     }
     // Pointer to the data for this view
     T* m_image_data;
-    // Cached iterators - see calculate_iterators above.
-    typename T::iterator m_begin, m_end;
-    typename T::const_iterator m_const_begin, m_const_end;
+    // the position of the upper left pixel in the data
+    size_t m_first;
 
     // The labels/rects for this connected-component
-    typename std::map<value_type, Rect*> m_labels;
-    typename std::map<value_type, Rect*>::iterator it;
+    typename std::map<label_type, Rect*> m_labels;
+    typename std::map<label_type, Rect*>::iterator it;
 
     // The neighborhood-relations
     typename std::vector<int> m_neighbors;
@@ -37,39 +37,41 @@ namespace Gamera {
       more testing probably needs to be done.
 
       The basic idea is that instead of returning a reference to a value in the image_data, we
-      return an object that holds a reference to the data and the label for the ConnectedComponent.
+      return an object that holds a reference to the data and the ConnectedComponent.
       The object contains a conversion operator and an assignment operator. When conversion to the
-      type of the value is requested, the label is checked against the value. If they match, then the
+      type of the value is requested, the ConnectedComponent checks whether the pixel is one of its
+      own (see ConnectedComponent::owns). If it is, then the
       value is returned, otherwise 0 is returned. Assignment makes similar checks. This type of
       proxying can cause numerous problems, so care is required. KWM
     */
 
-    template<class T, class I>
+    template<class Image, class I>
     class CCProxy {
     public:
+      typedef typename Image::value_type T;
       /*
         constructor - we store a pointer to the value so that
         changing the ConnectedComponent from another place (say
         the set function of ConnectedComponent) doesn't invalidate
         this proxy object. This is probably not a big concern. KWM
       */
-      CCProxy(I i, T label) : m_iter(i), m_label(label) { }
+      CCProxy(I i, const Image* image) : m_iter(i), m_image(image) { }
       // conversion to T
       operator T() const {
         T tmp = m_accessor(m_iter);
-        if (tmp == m_label)
+        if (m_image->owns(tmp, m_iter))
           return tmp;
         else
           return 0;
       }
       // assignment only happens if the label matches
       void operator=(T value) {
-        if (m_accessor(m_iter) == m_label)
+        if (m_image->owns(m_accessor(m_iter), m_iter))
           m_accessor.set(value, m_iter);
         }
     private:
       I m_iter;
-      T m_label;
+      const Image* m_image;
       ImageAccessor<T> m_accessor;
     };
     
@@ -88,25 +90,25 @@ namespace Gamera {
 
       typedef RowIterator self;
       typedef RowIteratorBase<Image, self, T> base;
-      typedef CCProxy<value_type, T> proxy_type;
+      typedef CCProxy<Image, T> proxy_type;
 
       // Constructor
       RowIterator(Image* image, const T iterator) : base(image, iterator) { }
       RowIterator() { }
 
       proxy_type operator*() const {
-        return proxy_type(m_iterator, m_image->label());
+        return proxy_type(m_iterator, m_image);
       }
 
       value_type get() const {
-      if (m_accessor(m_iterator) == m_image->label())
+      if (m_image->owns(m_accessor(m_iterator), m_iterator))
         return m_accessor(m_iterator);
       else
         return 0;
       }
 
       void set(const value_type& v) {
-      if (m_accessor(m_iterator) == m_image->label())
+      if (m_image->owns(m_accessor(m_iterator), m_iterator))
         m_accessor.set(v, m_iterator);
       }
 
@@ -135,26 +137,26 @@ namespace Gamera {
       // Convenience typedefs
       typedef ColIterator self;
       typedef ColIteratorBase<Image, self, T> base;
-      typedef CCProxy<value_type, T> proxy_type;
+      typedef CCProxy<Image, T> proxy_type;
 
       // Constructor
       ColIterator(Image* image, const T iterator) : base(image, iterator) { }
       ColIterator() { }
 
       proxy_type operator*() const {
-      return proxy_type(m_iterator, m_image->label());
+      return proxy_type(m_iterator, m_image);
       }      
 
       // Image specific
       value_type get() const {
-      if (m_accessor(m_iterator) == m_image->label())
+      if (m_image->owns(m_accessor(m_iterator), m_iterator))
         return m_accessor(m_iterator);
       else
         return 0;
       }
       
       void set(const value_type& v) {
-        if (m_accessor(m_iterator) == m_image->label())
+        if (m_image->owns(m_accessor(m_iterator), m_iterator))
           m_accessor.set(v, m_iterator);
       }
 
@@ -194,7 +196,7 @@ namespace Gamera {
       }
 
       value_type get() const {
-      if (m_accessor(m_iterator) == m_image->label())
+      if (m_image->owns(m_accessor(m_iterator), m_iterator))
         return m_accessor(m_iterator);
       else
         return 0;
@@ -236,7 +238,7 @@ namespace Gamera {
 
       // Image specific
       value_type get() const {
-        if (m_accessor(m_iterator) == m_image->label())
+        if (m_image->owns(m_accessor(m_iterator), m_iterator))
           return m_accessor(m_iterator);
         else
           return 0;
@@ -262,7 +264,7 @@ namespace Gamera {
       typedef VecIterator self;
       typedef VecIteratorBase<Image, Row, Col, self> base;
       typedef typename Image::value_type value_type;
-      typedef CCProxy<value_type, typename Image::data_type::iterator> proxy_type;
+      typedef CCProxy<Image, typename Image::data_type::iterator> proxy_type;
       typedef ImageAccessor<value_type> accessor;
 
       // Constructor
@@ -271,18 +273,18 @@ namespace Gamera {
 
       // Operators
       proxy_type operator*() const {
-        return proxy_type(m_coliterator.m_iterator, m_coliterator.m_image->label());
+        return proxy_type(m_coliterator.m_iterator, m_coliterator.m_image);
       }
 
       value_type get() const {
-      if (m_accessor(m_coliterator) == m_coliterator.m_image->label())
+      if (m_coliterator.m_image->owns(m_accessor(m_coliterator.m_iterator), m_coliterator.m_iterator))
         return m_accessor(m_coliterator);
       else
         return 0;
       }
       
       void set(const value_type& v) {
-        if (m_accessor(m_coliterator) == m_coliterator.m_image->label())
+        if (m_coliterator.m_image->owns(m_accessor(m_coliterator.m_iterator), m_coliterator.m_iterator))
           m_accessor.set(v, m_coliterator);
       }
     private:
@@ -310,7 +312,7 @@ namespace Gamera {
       }
 
       value_type get() const {
-        if (m_accessor(m_coliterator) == m_coliterator.m_image->label())
+        if (m_coliterator.m_image->owns(m_accessor(m_coliterator.m_iterator), m_coliterator.m_iterator))
           return m_accessor(m_coliterator);
         else
           return 0;
@@ -326,17 +328,16 @@ namespace Gamera {
 
   namespace MLCCDetail {
 
-    template<class T, class I>
+    template<class Image, class I>
     class MLCCProxy {
     public:
-      MLCCProxy(I i, const typename std::map<T, Rect*> *labels) : m_iter(i){ 
-        this->m_labels=labels;
-      }
+      typedef typename Image::value_type T;
+      MLCCProxy(I i, const Image* image) : m_iter(i), m_image(image) { }
 
       // conversion to T
       operator T() {
         T tmp = m_accessor(m_iter);
-        if (m_labels->find(tmp) != m_labels->end())
+        if (m_image->owns(tmp, m_iter))
           return tmp;
         else
           return 0;
@@ -344,12 +345,12 @@ namespace Gamera {
       // assignment only happens if the label matches
       void operator=(T value) {
         T tmp=m_accessor(m_iter);
-        if (m_labels->find(tmp) != m_labels->end())
+        if (m_image->owns(tmp, m_iter))
           m_accessor.set(value, m_iter);
         }
     private:
       I m_iter;
-      const typename std::map<T, Rect*> *m_labels;
+      const Image* m_image;
       ImageAccessor<T> m_accessor;
     };
     
@@ -368,25 +369,25 @@ namespace Gamera {
 
       typedef RowIterator self;
       typedef RowIteratorBase<Image, self, T> base;
-      typedef MLCCProxy<value_type, T> proxy_type;
+      typedef MLCCProxy<Image, T> proxy_type;
 
       // Constructor
       RowIterator(Image* image, const T iterator) : base(image, iterator) { }
       RowIterator() { }
 
       proxy_type operator*() const {
-        return proxy_type(m_iterator, m_image->get_labels_pointer());
+        return proxy_type(m_iterator, m_image);
       }
 
       value_type get() const {
-        if (m_image->has_label(m_accessor(m_iterator)))
+        if (m_image->owns(m_accessor(m_iterator), m_iterator))
           return m_accessor(m_iterator);
         else
           return 0;
       }
 
       void set(const value_type& v) {
-        if (m_image->has_label(m_accessor(m_iterator)))
+        if (m_image->owns(m_accessor(m_iterator), m_iterator))
           m_accessor.set(v, m_iterator);
       }
 
@@ -415,26 +416,26 @@ namespace Gamera {
       // Convenience typedefs
       typedef ColIterator self;
       typedef ColIteratorBase<Image, self, T> base;
-      typedef MLCCProxy<value_type, T> proxy_type;
+      typedef MLCCProxy<Image, T> proxy_type;
 
       // Constructor
       ColIterator(Image* image, const T iterator) : base(image, iterator) { }
       ColIterator() { }
 
       proxy_type operator*() const {
-        return proxy_type(m_iterator, m_image->get_labels_pointer());
+        return proxy_type(m_iterator, m_image);
       }      
 
       // Image specific
       value_type get() const {
-      if (m_image->has_label(m_accessor(m_iterator)))
+      if (m_image->owns(m_accessor(m_iterator), m_iterator))
         return m_accessor(m_iterator);
       else
         return 0;
       }
       
       void set(const value_type& v) {
-        if (m_image->has_label(m_accessor(m_iterator)))
+        if (m_image->owns(m_accessor(m_iterator), m_iterator))
           m_accessor.set(v, m_iterator);
       }
 
@@ -474,7 +475,7 @@ namespace Gamera {
       }
 
       value_type get() const {
-        if (m_image->has_label(m_accessor(m_iterator)))
+        if (m_image->owns(m_accessor(m_iterator), m_iterator))
           return m_accessor(m_iterator);
         else
           return 0;
@@ -516,7 +517,7 @@ namespace Gamera {
 
       // Image specific
       value_type get() const {
-        if (m_image->has_label(m_accessor(m_iterator)))
+        if (m_image->owns(m_accessor(m_iterator), m_iterator))
           return m_accessor(m_iterator);
         else
           return 0;
@@ -542,7 +543,7 @@ namespace Gamera {
       typedef VecIterator self;
       typedef VecIteratorBase<Image, Row, Col, self> base;
       typedef typename Image::value_type value_type;
-      typedef MLCCProxy<value_type, typename Image::data_type::iterator> proxy_type;
+      typedef MLCCProxy<Image, typename Image::data_type::iterator> proxy_type;
       typedef ImageAccessor<value_type> accessor;
 
       // Constructor
@@ -551,18 +552,18 @@ namespace Gamera {
 
       // Operators
       proxy_type operator*() const {
-        return proxy_type(m_coliterator.m_iterator, m_coliterator.m_image->get_labels_pointer());
+        return proxy_type(m_coliterator.m_iterator, m_coliterator.m_image);
       }
 
       value_type get() const {
-        if (m_coliterator.m_image->has_label(m_accessor(m_coliterator)))
+        if (m_coliterator.m_image->owns(m_accessor(m_coliterator.m_iterator), m_coliterator.m_iterator))
           return m_accessor(m_coliterator);
         else
           return 0;
       }
       
       void set(const value_type& v) {
-        if (m_coliterator.m_image->has_label(m_accessor(m_coliterator)))
+        if (m_coliterator.m_image->owns(m_accessor(m_coliterator.m_iterator), m_coliterator.m_iterator))
           m_accessor.set(v, m_coliterator);
       }
     private:
@@ -590,7 +591,7 @@ namespace Gamera {
       }
 
       value_type get() const {
-        if (m_coliterator.m_image->has_label(m_accessor(m_coliterator)))
+        if (m_coliterator.m_image->owns(m_accessor(m_coliterator.m_iterator), m_coliterator.m_iterator))
           return m_accessor(m_coliterator);
         else
           return 0;
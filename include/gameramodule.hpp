@@ -624,6 +624,12 @@ struct ImageDataObject {
   ImageDataBase* m_x;
   int m_pixel_type;
   int m_storage_format;
+  // the buffer of another object (e.g. a NumPy array) whose memory
+  // holds the pixels, or NULL
+  Py_buffer* m_buffer;
+  // the number of buffers exported by images on this data; the data
+  // may not be resized while any are alive
+  int m_exports;
 };
 
 #ifndef GAMERACORE_INTERNAL
@@ -653,45 +659,92 @@ inline bool is_ImageDataObject(PyObject* x) {
   return PyObject_TypeCheck(x, t);
 }
 
+template<class T>
+inline ImageData<T>* new_image_data(const Dim& dim, const Point& offset,
+                                    const char* path) {
+  if (path != 0)
+    return new ImageData<T>(dim, offset, path);
+  return new ImageData<T>(dim, offset);
+}
+
+/*
+  When path is given, the (DENSE) pixels are the raw data of the file
+  at path instead of newly allocated memory.
+*/
 inline PyObject* create_ImageDataObject(const Dim& dim, const Point& offset,
-                                        int pixel_type, int storage_format) {
+                                        int pixel_type, int storage_format,
+                                        const char* path = 0) {
   ImageDataObject* o;
   PyTypeObject* id_type = get_ImageDataType();
   if (id_type == 0)
     return 0;
+  if (path != 0 && storage_format != DENSE) {
+    PyErr_SetString(PyExc_TypeError,
+                    "Only DENSE image data can be mapped from a file.");
+    return 0;
+  }
   o = (ImageDataObject*)id_type->tp_alloc(id_type, 0);
   o->m_pixel_type = pixel_type;
   o->m_storage_format = storage_format;
-  if (storage_format == DENSE) {
-    if (pixel_type == ONEBIT)
-      o->m_x = new ImageData<OneBitPixel>(dim, offset);
-    else if (pixel_type == GREYSCALE)
-      o->m_x = new ImageData<GreyScalePixel>(dim, offset);
-    else if (pixel_type == GREY16)
-      o->m_x = new ImageData<Grey16Pixel>(dim, offset);
-    // We have to explicity declare which FLOAT we want here, since there
-    // is a name clash on Mingw32 with a typedef in windef.h
-    else if (pixel_type == Gamera::FLOAT)
-      o->m_x = new ImageData<FloatPixel>(dim, offset);
-    else if (pixel_type == RGB)
-      o->m_x = new ImageData<RGBPixel>(dim, offset);
-    else if (pixel_type == Gamera::COMPLEX)
-      o->m_x = new ImageData<ComplexPixel>(dim, offset);
-    else {
-      PyErr_Format(PyExc_TypeError, "Unknown pixel type '%d'.", pixel_type);
-      return 0;
-    }
-  } else if (storage_format == RLE) {
-    if (pixel_type == ONEBIT)
-      o->m_x = new RleImageData<OneBitPixel>(dim, offset);
-    else {
-      PyErr_SetString(PyExc_TypeError,
-                      "Pixel type must be ONEBIT when storage format is RLE.");
+  o->m_exports = 0;
+  try {
+    if (storage_format == DENSE) {
+      if (pixel_type == ONEBIT)
+        o->m_x = new_image_data<OneBitPixel>(dim, offset, path);
+      else if (pixel_type == GREYSCALE)
+        o->m_x = new_image_data<GreyScalePixel>(dim, offset, path);
+      else if (pixel_type == GREY16)
+        o->m_x = new_image_data<Grey16Pixel>(dim, offset, path);
+      // We have to explicity declare which FLOAT we want here, since there
+      // is a name clash on Mingw32 with a typedef in windef.h
+      else if (pixel_type == Gamera::FLOAT)
+        o->m_x = new_image_data<FloatPixel>(dim, offset, path);
+      else if (pixel_type == RGB)
+        o->m_x = new_image_data<RGBPixel>(dim, offset, path);
+      else if (pixel_type == Gamera::COMPLEX)
+        o->m_x = new_image_data<ComplexPixel>(dim, offset, path);
+      else {
+        PyErr_Format(PyExc_TypeError, "Unknown pixel type '%d'.", pixel_type);
+        return 0;
+      }
+    } else if (storage_format == RLE) {
+      if (pixel_type == ONEBIT)
+        o->m_x = new RleImageData<OneBitPixel>(dim, offset);
+      else {
+        PyErr_SetString(PyExc_TypeError,
+                        "Pixel type must be ONEBIT when storage format is RLE.");
+        return 0;
+      }
+    } else if (storage_format == PACKED) {
+      if (pixel_type == ONEBIT)
+        o->m_x = new PackedImageData<OneBitPixel>(dim, offset);
+      else {
+        PyErr_SetString(PyExc_TypeError,
+                        "Pixel type must be ONEBIT when storage format is PACKED.");
+        return 0;
+      }
+    } else if (storage_format == TILED) {
+      if (pixel_type == ONEBIT)
+        o->m_x = new TiledImageData<OneBitPixel>(dim, offset);
+      else if (pixel_type == GREYSCALE)
+        o->m_x = new TiledImageData<GreyScalePixel>(dim, offset);
+      else if (pixel_type == GREY16)
+        o->m_x = new TiledImageData<Grey16Pixel>(dim, offset);
+      else if (pixel_type == RGB)
+        o->m_x = new TiledImageData<RGBPixel>(dim, offset);
+      else {
+        PyErr_SetString(PyExc_TypeError,
+                        "Pixel type must be ONEBIT, GREYSCALE, GREY16 or RGB when storage format is TILED.");
+        return 0;
+      }
+    } else {
+      PyErr_SetString(PyExc_TypeError, "Unknown pixel type/storage format combination.");
       return 0;
     }
-  } else {
-    PyErr_SetString(PyExc_TypeError, "Unknown pixel type/storage format combination.");
-    return 0;
+  } catch (std::exception&) {
+    // the data could not be allocated or mapped
+    Py_DECREF(o);
+    throw;
   }
   o->m_x->m_user_data = (void*)o;
   return (PyObject*)o;
@@ -905,6 +958,21 @@ inline int get_image_combination(PyObject* image) {
       return -1;
   } else if (storage == Gamera::RLE) {
     return Gamera::ONEBITRLEIMAGEVIEW;
+  } else if (storage == Gamera::PACKED) {
+    return Gamera::ONEBITPACKEDIMAGEVIEW;
+  } else if (storage == Gamera::TILED) {
+    switch (get_pixel_type(image)) {
+    case Gamera::ONEBIT:
+      return Gamera::ONEBITTILEDIMAGEVIEW;
+    case Gamera::GREYSCALE:
+      return Gamera::GREYSCALETILEDIMAGEVIEW;
+    case Gamera::GREY16:
+      return Gamera::GREY16TILEDIMAGEVIEW;
+    case Gamera::RGB:
+      return Gamera::RGBTILEDIMAGEVIEW;
+    default:
+      return -1;
+    }
   } else if (storage == Gamera::DENSE) {
     return get_pixel_type(image);
   } else {
@@ -1028,6 +1096,21 @@ inline PyObject* create_ImageObject(Image* image) {
     pixel_type = Gamera::ONEBIT;
     storage_type = Gamera::RLE;
     cc = true;
+  } else if (dynamic_cast<OneBitPackedImageView*>(image) != 0) {
+    pixel_type = Gamera::ONEBIT;
+    storage_type = Gamera::PACKED;
+  } else if (dynamic_cast<OneBitTiledImageView*>(image) != 0) {
+    pixel_type = Gamera::ONEBIT;
+    storage_type = Gamera::TILED;
+  } else if (dynamic_cast<GreyScaleTiledImageView*>(image) != 0) {
+    pixel_type = Gamera::GREYSCALE;
+    storage_type = Gamera::TILED;
+  } else if (dynamic_cast<Grey16TiledImageView*>(image) != 0) {
+    pixel_type = Gamera::GREY16;
+    storage_type = Gamera::TILED;
+  } else if (dynamic_cast<RGBTiledImageView*>(image) != 0) {
+    pixel_type = Gamera::RGB;
+    storage_type = Gamera::TILED;
   } else {
     PyErr_SetString(PyExc_TypeError, "Unknown Image type returned from plugin.  Receiving this error indicates an internal inconsistency or memory corruption.  Please report it on the Gamera mailing list.");
     return 0;
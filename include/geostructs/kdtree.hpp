@@ -82,6 +82,13 @@ private:
   bool neighbor_search(const CoordPoint &point, kdtree_node* node, size_t k);
   bool bounds_overlap_ball(const CoordPoint &point, double dist, kdtree_node* node);
   bool ball_within_bounds(const CoordPoint &point, double dist, kdtree_node* node);
+  // helper function for range search
+  void range_search(const CoordPoint &point, kdtree_node* node, double r, std::vector<size_t>* range_result);
+  // helper variables and functions for farthest neighbor search
+  size_t farthestindex;
+  double farthestdistance;
+  void farthest_search(const CoordPoint &point, kdtree_node* node);
+  double bounds_max_distance(const CoordPoint &point, kdtree_node* node);
   // class implementing the distance computation
   DistanceMeasure* distance;
   // search predicate in knn searches
@@ -95,6 +102,8 @@ public:
   ~KdTree();
   void set_distance(int distance_type, const DoubleVector* weights = NULL);
   void k_nearest_neighbors(const CoordPoint &point, size_t k, KdNodeVector* result, KdNodePredicate* pred = NULL);
+  void range_nearest_neighbors(const CoordPoint &point, double r, KdNodeVector* result);
+  void farthest_neighbor(const CoordPoint &point, KdNode* result);
 };
 
 }} // end namespace Gamera::Kdtree
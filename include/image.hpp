@@ -67,7 +67,10 @@ namespace Gamera {
     void resolution(double r) { m_resolution = r; }
     double scaling() const { return m_scaling; }
     void scaling(double v) { m_scaling = v; }
-    virtual ImageDataBase* data() const = 0;
+    virtual ImageDataBase* data() = 0;
+    // the data of a const image is const too, so that reads through it
+    // get the const iterators, which never detach shared pixels
+    virtual const ImageDataBase* data() const = 0;
   public:
     double* features;
     Py_ssize_t features_len;
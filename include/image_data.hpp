@@ -22,12 +22,26 @@
   rather than a standard vector so that we can control the iterator type - the
   Vigra iterators assume that the iterator type is T* and some std::vectors
   don't use that as the iterator type.
+
+  The pixels are normally allocated on the heap.  Images that are larger
+  than MappedFile::threshold() keep them in a memory-mapped temporary
+  file instead, and an ImageData can also be created directly on a raw
+  file of pixels or on memory that belongs to someone else (such as a
+  NumPy array).  Either way the iterators are plain pointers, so all
+  algorithms work the same on all of them.
+
+  Heap pixels can be shared by several ImageData (see shared_copy).
+  They are copied as soon as one of them is changed: everything that
+  can change the pixels (the non-const iterators and operator[]) makes
+  the data detach() from the others first.  Since the views address the
+  pixels as one block, the whole buffer is copied then.
 */
 
 #ifndef kwm11162001_image_data_hpp
 #define kwm11162001_image_data_hpp
 
 #include "dimensions.hpp"
+#include "mapped_file.hpp"
 
 #include <cstddef>
 #include <cmath>
@@ -45,6 +59,7 @@ namespace Gamera {
       m_page_offset_x = offset.x();
       m_page_offset_y = offset.y();
       m_user_data = 0;
+      m_label_plane = 0;
     }
 
     ImageDataBase(const Dim& dim) {
@@ -53,6 +68,7 @@ namespace Gamera {
       m_page_offset_x = 0;
       m_page_offset_y = 0;
       m_user_data = 0;
+      m_label_plane = 0;
     }
 
     ImageDataBase(const Size& size, const Point& offset) {
@@ -61,6 +77,7 @@ namespace Gamera {
       m_page_offset_x = offset.x();
       m_page_offset_y = offset.y();
       m_user_data = 0;
+      m_label_plane = 0;
     }
 
     ImageDataBase(const Size& size) {
@@ -69,6 +86,7 @@ namespace Gamera {
       m_page_offset_x = 0;
       m_page_offset_y = 0;
       m_user_data = 0;
+      m_label_plane = 0;
     }
 
     ImageDataBase(const Rect& rect) {
@@ -79,9 +97,11 @@ namespace Gamera {
       m_page_offset_x = rect.ul_x();
       m_page_offset_y = rect.ul_y();
       m_user_data = 0;
+      m_label_plane = 0;
     }
 
     virtual ~ImageDataBase() {
+      delete[] m_label_plane;
     }
 
     /*
@@ -97,6 +117,12 @@ namespace Gamera {
     size_t size() const { return m_size; }
     virtual size_t bytes() const = 0;
     virtual double mbytes() const = 0;
+    // whether the pixels are kept in a memory-mapped file
+    virtual bool mapped() const { return false; }
+    // whether the pixels are shared with another copy (see ImageData)
+    virtual bool shared() const { return false; }
+    // the size of the tiles the pixels are kept in (see tiled_data.hpp)
+    virtual Dim tile_dim() const { return Dim(m_stride, m_stride != 0 ? m_size / m_stride : 0); }
 
     /*
       Setting dimensions
@@ -112,10 +138,26 @@ namespace Gamera {
     }
     virtual void dimensions(size_t rows, size_t cols) = 0;
     virtual void dim(const Dim& dim) = 0;
+
+    /*
+      The 32-bit labels of the pixels (one per pixel, in the order of
+      the data), or 0.  cc_analysis labels pages with more connected
+      components than pixel labels into this plane, and the ccs then
+      tell their pixels apart by it (see ConnectedComponent::owns).
+      The plane belongs to the data: it is freed with it, and dropped
+      when the data is resized.
+    */
+    unsigned int* label_plane() const { return m_label_plane; }
+    void label_plane(unsigned int* plane) {
+      if (plane != m_label_plane)
+	delete[] m_label_plane;
+      m_label_plane = plane;
+    }
   public:
     void* m_user_data;
   protected:
     virtual void do_resize(size_t size) = 0;
+    unsigned int* m_label_plane;
     size_t m_size;
     size_t m_stride;
     size_t m_page_offset_x;
@@ -165,12 +207,46 @@ namespace Gamera {
       create_data();
     }
 
+    /*
+      Uses the raw pixels in the file at path (in the native byte order,
+      row by row) instead of allocating them.  The file is created or
+      grown if it is too small, and all changes are written to it.
+    */
+    ImageData(const Dim& dim, const Point& offset, const char* path) :
+      ImageDataBase(dim, offset) {
+      m_file = new MappedFile(path, m_size * sizeof(T));
+      m_data = (T*)m_file->data();
+      m_owner = false;
+      m_shares = 0;
+      m_pinned = false;
+    }
+
+    /*
+      Uses the given pixels (row by row, without padding) that belong to
+      someone else, such as a NumPy array.  They are not freed, and must
+      live at least as long as the ImageData.
+    */
+    ImageData(const Dim& dim, const Point& offset, T* data) :
+      ImageDataBase(dim, offset) {
+      m_file = 0;
+      m_data = data;
+      m_owner = false;
+      m_shares = 0;
+      m_pinned = false;
+    }
+
     /*
       Destructor
     */
     virtual ~ImageData() {
-      if (m_data != 0) {
-	delete[] m_data;
+      if (m_file != 0)
+	delete m_file;
+      else if (m_shares != 0 && --(*m_shares) > 0)
+	return;
+      else {
+	delete m_shares;
+	if (m_data != 0 && m_owner)
+	  delete[] m_data;
       }
     }
     
@@ -187,28 +263,92 @@ namespace Gamera {
     /*
       Iterators
     */
-    iterator begin() { return m_data; }
-    iterator end() { return m_data + m_size; }
+    iterator begin() { detach(); return m_data; }
+    iterator end() { detach(); return m_data + m_size; }
     const_iterator begin() const { return m_data; }
     const_iterator end() const { return m_data + m_size; }
 
+    // the position of the pixel at i in the data
+    size_t position(const_iterator i) const { return i - m_data; }
+
     /*
       Operators
     */
-    T& operator[](size_t n) { return m_data[n]; }
+    T& operator[](size_t n) { detach(); return m_data[n]; }
+    virtual bool mapped() const { return m_file != 0; }
+    virtual bool shared() const { return m_shares != 0 && *m_shares > 1; }
+
+    /*
+      A new ImageData with the same pixels.  Heap pixels are shared
+      until one of the two is changed; all others (mapped files, pixels
+      that belong to someone else, pinned pixels) are copied right away,
+      and so are the pixels of copies that are to be mapped (see
+      MappedFile::threshold).
+    */
+    ImageData* shared_copy() {
+      ImageData* copy;
+      size_t threshold = MappedFile::threshold();
+      if (m_file != 0 || !m_owner || m_pinned || m_data == 0
+	  || (threshold > 0 && m_size * sizeof(T) >= threshold)) {
+	copy = new ImageData(dim(), offset());
+	std::copy(m_data, m_data + m_size, copy->m_data);
+      } else {
+	copy = new ImageData(Dim(0, 0), offset());
+	copy->m_stride = m_stride;
+	copy->m_size = m_size;
+	copy->m_data = m_data;
+	if (m_shares == 0)
+	  m_shares = new size_t(1);
+	++(*m_shares);
+	copy->m_shares = m_shares;
+      }
+      return copy;
+    }
+    /*
+      Gives this data its own pixels, if they are shared.
+    */
+    void detach() {
+      if (m_shares == 0)
+	return;
+      if (*m_shares > 1) {
+	T* new_data = new T[m_size];
+	std::copy(m_data, m_data + m_size, new_data);
+	--(*m_shares);
+	m_data = new_data;
+      } else {
+	delete m_shares;
+      }
+      m_shares = 0;
+    }
+    /*
+      Detaches the pixels and never shares them again, for when their
+      address is handed out (for instance to NumPy).
+    */
+    void unshare() {
+      detach();
+      m_pinned = true;
+    }
   protected:
     virtual void do_resize(size_t size) {
-      if (size > 0) {
+      detach();
+      label_plane(0);
+      if (m_file != 0) {
+	// the file keeps the pixels that are not cut off
+	m_file->resize(size * sizeof(T));
+	m_data = (T*)m_file->data();
+	m_size = size;
+      } else if (size > 0) {
 	size_t smallest = std::min(m_size, size);
 	m_size = size;
 	T* new_data = new T[m_size];
 	for (size_t i = 0; i < smallest; ++i)
 	  new_data[i] = m_data[i];
-	if (m_data)
+	if (m_data && m_owner)
 	  delete[] m_data;
 	m_data = new_data;
+	m_owner = true;
       } else {
-	if (m_data)
+	if (m_data && m_owner)
 	  delete[] m_data;
 	m_data = 0;
 	m_size = 0;
@@ -216,12 +356,29 @@ namespace Gamera {
     }
   private:
     void create_data() {
-      if (m_size > 0)
+      m_file = 0;
+      m_owner = true;
+      m_shares = 0;
+      m_pinned = false;
+      size_t threshold = MappedFile::threshold();
+      if (threshold > 0 && m_size * sizeof(T) >= threshold) {
+	m_file = new MappedFile(m_size * sizeof(T));
+	m_data = (T*)m_file->data();
+	m_owner = false;
+      } else if (m_size > 0) {
 	m_data = new T[m_size];
+      }
       std::fill(m_data, m_data + m_size, pixel_traits<T>::default_value());
     }
 
     T* m_data;
+    MappedFile* m_file;
+    // whether m_data was allocated with new[] (and must be deleted)
+    bool m_owner;
+    // the number of ImageData sharing m_data, or 0 if it is not shared
+    size_t* m_shares;
+    // whether m_data may no longer be shared (see unshare)
+    bool m_pinned;
   };
 }
 
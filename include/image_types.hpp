@@ -25,6 +25,8 @@
 #include "image_data.hpp"
 #include "image_view.hpp"
 #include "rle_data.hpp"
+#include "packed_data.hpp"
+#include "tiled_data.hpp"
 #include "connected_components.hpp"
 
 #include <list>
@@ -45,6 +47,11 @@ namespace Gamera {
   typedef ImageData<ComplexPixel> ComplexImageData;
   typedef ImageData<OneBitPixel> OneBitImageData;
   typedef RleImageData<OneBitPixel> OneBitRleImageData;
+  typedef PackedImageData<OneBitPixel> OneBitPackedImageData;
+  typedef TiledImageData<OneBitPixel> OneBitTiledImageData;
+  typedef TiledImageData<GreyScalePixel> GreyScaleTiledImageData;
+  typedef TiledImageData<Grey16Pixel> Grey16TiledImageData;
+  typedef TiledImageData<RGBPixel> RGBTiledImageData;
 
   /*
     ImageView
@@ -56,6 +63,11 @@ namespace Gamera {
   typedef ImageView<ComplexImageData> ComplexImageView;
   typedef ImageView<OneBitImageData> OneBitImageView;
   typedef ImageView<OneBitRleImageData> OneBitRleImageView;
+  typedef ImageView<OneBitPackedImageData> OneBitPackedImageView;
+  typedef ImageView<OneBitTiledImageData> OneBitTiledImageView;
+  typedef ImageView<GreyScaleTiledImageData> GreyScaleTiledImageView;
+  typedef ImageView<Grey16TiledImageData> Grey16TiledImageView;
+  typedef ImageView<RGBTiledImageData> RGBTiledImageView;
 
   /*
     Connected-components
@@ -82,7 +94,9 @@ namespace Gamera {
   
   enum StorageTypes {
     DENSE,
-    RLE
+    RLE,
+    PACKED,
+    TILED
   };
   
   /*
@@ -100,7 +114,12 @@ namespace Gamera {
     ONEBITRLEIMAGEVIEW,
     CC,
     RLECC,
-    MLCC
+    MLCC,
+    ONEBITPACKEDIMAGEVIEW,
+    ONEBITTILEDIMAGEVIEW,
+    GREYSCALETILEDIMAGEVIEW,
+    GREY16TILEDIMAGEVIEW,
+    RGBTILEDIMAGEVIEW
   };
   
   enum ClassificationStates {
@@ -131,10 +150,14 @@ namespace Gamera {
     typedef typename T::data_type data_type;
     typedef ImageData<typename T::value_type> dense_data_type;
     typedef RleImageData<typename T::value_type> rle_data_type;
+    typedef PackedImageData<typename T::value_type> packed_data_type;
+    typedef TiledImageData<typename T::value_type> tiled_data_type;
     // view types
     typedef ImageView<data_type> view_type;
     typedef ImageView<dense_data_type> dense_view_type;
     typedef ImageView<rle_data_type> rle_view_type;
+    typedef ImageView<packed_data_type> packed_view_type;
+    typedef ImageView<tiled_data_type> tiled_view_type;
     // cc types
     typedef ConnectedComponent<data_type> cc_type;
     typedef ConnectedComponent<dense_data_type> dense_cc_type;
@@ -202,6 +225,42 @@ namespace Gamera {
     }
   };
 
+  template<>
+  struct ImageFactory<RGBTiledImageView> {
+    // data types
+    typedef RGBTiledImageView::data_type data_type;
+    typedef ImageData<RGBImageView::value_type> dense_data_type;
+    typedef ImageData<RGBImageView::value_type> rle_data_type;
+    // view types
+    typedef ImageView<data_type> view_type;
+    typedef ImageView<dense_data_type> dense_view_type;
+    typedef ImageView<rle_data_type> rle_view_type;
+    // cc types
+    typedef ConnectedComponent<data_type> cc_type;
+    typedef ConnectedComponent<dense_data_type> dense_cc_type;
+    typedef ConnectedComponent<rle_data_type> rle_cc_type;
+    typedef std::list<cc_type*> ccs_type;
+    typedef std::list<dense_cc_type*> dense_ccs_type;
+    typedef std::list<rle_cc_type*> rle_ccs_type;
+    static view_type* new_view(const RGBTiledImageView& view) {
+      view_type* nview = new view_type(*((data_type*)view.data()),
+				       view.origin(), view.dim());
+      return nview;
+    }
+    static view_type* new_view(const RGBTiledImageView& view, const Point& origin,
+			       const Dim& dim) {
+      view_type* nview = new view_type(*((data_type*)view.data()),
+				       origin, dim);
+      return nview;
+    }
+
+    static view_type* new_image(const RGBTiledImageView& view) {
+      data_type* data = new data_type(view.dim(), view.origin());
+      view_type* nview = new view_type(*data, view.origin(), view.dim());
+      return nview;
+    }
+  };
+
   template<>
   struct ImageFactory<ComplexImageView> {
     // data types
@@ -268,6 +327,56 @@ namespace Gamera {
     }
   };
 
+  template<>
+  struct TypeIdImageFactory<ONEBIT, PACKED> {
+    typedef OneBitPackedImageData data_type;
+    typedef OneBitPackedImageView image_type;
+    static image_type* create(const Point& origin, const Dim& dim) {
+      data_type* data = new data_type(dim, origin);
+      return new image_type(*data, origin, dim);
+    }
+  };
+
+  template<>
+  struct TypeIdImageFactory<ONEBIT, TILED> {
+    typedef OneBitTiledImageData data_type;
+    typedef OneBitTiledImageView image_type;
+    static image_type* create(const Point& origin, const Dim& dim) {
+      data_type* data = new data_type(dim, origin);
+      return new image_type(*data, origin, dim);
+    }
+  };
+
+  template<>
+  struct TypeIdImageFactory<GREYSCALE, TILED> {
+    typedef GreyScaleTiledImageData data_type;
+    typedef GreyScaleTiledImageView image_type;
+    static image_type* create(const Point& origin, const Dim& dim) {
+      data_type* data = new data_type(dim, origin);
+      return new image_type(*data, origin, dim);
+    }
+  };
+
+  template<>
+  struct TypeIdImageFactory<GREY16, TILED> {
+    typedef Grey16TiledImageData data_type;
+    typedef Grey16TiledImageView image_type;
+    static image_type* create(const Point& origin, const Dim& dim) {
+      data_type* data = new data_type(dim, origin);
+      return new image_type(*data, origin, dim);
+    }
+  };
+
+  template<>
+  struct TypeIdImageFactory<RGB, TILED> {
+    typedef RGBTiledImageData data_type;
+    typedef RGBTiledImageView image_type;
+    static image_type* create(const Point& origin, const Dim& dim) {
+      data_type* data = new data_type(dim, origin);
+      return new image_type(*data, origin, dim);
+    }
+  };
+
   template<>
   struct TypeIdImageFactory<GREYSCALE, DENSE> {
     typedef GreyScaleImageData data_type;
@@ -273,7 +273,7 @@ Use ImageView<T>::get(Point(col, row)) instead.
     */
     GAMERA_CPP_DEPRECATED
     value_type get(size_t row, size_t col) const {
-      return m_accessor(m_const_begin + (row * m_image_data->stride()) + col);
+      return m_accessor(const_begin_iterator() + (row * m_image_data->stride()) + col);
     }
 #endif
 
@@ -288,21 +288,22 @@ Use ImageView<T>::get(Point(col, row)) instead.
     */
     GAMERA_CPP_DEPRECATED
     void set(size_t row, size_t col, value_type value) {
-      m_accessor.set(value, m_begin + (row * m_image_data->stride()) + col);
+      m_accessor.set(value, begin_iterator() + (row * m_image_data->stride()) + col);
     }
 #endif
     value_type get(const Point& p) const {
-      return m_accessor(m_const_begin + (p.y() * m_image_data->stride()) + p.x());
+      return m_accessor(const_begin_iterator() + (p.y() * m_image_data->stride()) + p.x());
 
     }
     void set(const Point& p, value_type value) {
-      m_accessor.set(value, m_begin + (p.y() * m_image_data->stride()) + p.x());
+      m_accessor.set(value, begin_iterator() + (p.y() * m_image_data->stride()) + p.x());
     }
 
     //
     // Misc
     //
-    virtual T* data() const { return m_image_data; }
+    virtual T* data() { return m_image_data; }
+    virtual const T* data() const { return m_image_data; }
     self parent() const { return self(*m_image_data, m_image_data->offset(), m_image_data->dim()); }
     self& image() { return *this; }
 
@@ -312,15 +313,15 @@ Use ImageView<T>::get(Point(col, row)) instead.
     typedef ImageViewDetail::RowIterator<self,
       typename T::iterator> row_iterator;
     row_iterator row_begin() {
-      return row_iterator(this, m_begin); }
+      return row_iterator(this, begin_iterator()); }
     row_iterator row_end() {
-      return row_iterator(this, m_end); }
+      return row_iterator(this, end_iterator()); }
 
     typedef ImageViewDetail::ColIterator<self, typename T::iterator> col_iterator;
     col_iterator col_begin() {
-      return col_iterator(this, m_begin); }
+      return col_iterator(this, begin_iterator()); }
     col_iterator col_end() {
-      return col_iterator(this, m_begin + ncols()); }
+      return col_iterator(this, begin_iterator() + ncols()); }
 
     //
     // Const Iterators
@@ -328,16 +329,16 @@ Use ImageView<T>::get(Point(col, row)) instead.
     typedef ImageViewDetail::ConstRowIterator<const self,
       typename T::const_iterator> const_row_iterator;
     const_row_iterator row_begin() const {
-      return const_row_iterator(this, m_const_begin); }
+      return const_row_iterator(this, const_begin_iterator()); }
     const_row_iterator row_end() const {
-      return const_row_iterator(this, m_const_end); }
+      return const_row_iterator(this, const_end_iterator()); }
 
     typedef ImageViewDetail::ConstColIterator<const self,
       typename T::const_iterator> const_col_iterator;
     const_col_iterator col_begin() const {
-      return const_col_iterator(this, m_const_begin); }
+      return const_col_iterator(this, const_begin_iterator()); }
     const_col_iterator col_end() const {
-      return const_col_iterator(this, m_const_begin + ncols()); }
+      return const_col_iterator(this, const_begin_iterator() + ncols()); }
 
 
     //
@@ -385,8 +386,10 @@ Use ImageView<T>::get(Point(col, row)) instead.
     //
     // OPERATOR ACCESS
     //
-    typename T::iterator operator[](size_t n) const {
-      return m_begin + (n * data()->stride()); }
+    typename T::iterator operator[](size_t n) {
+      return begin_iterator() + (n * data()->stride()); }
+    typename T::const_iterator operator[](size_t n) const {
+      return const_begin_iterator() + (n * data()->stride()); }
   protected:
     // redefine the dimensions change function from Rect
     virtual void dimensions_change() {
@@ -394,28 +397,30 @@ Use ImageView<T>::get(Point(col, row)) instead.
       calculate_iterators();
     }
     void calculate_iterators() {
-      m_begin = m_image_data->begin()
-        // row offset
-        + (m_image_data->stride() * (offset_y() - m_image_data->page_offset_y()))
-        // col offset
-        + (offset_x() - m_image_data->page_offset_x());
-      m_end = m_image_data->begin()
-        // row offset
-        + (m_image_data->stride() * ((offset_y() - m_image_data->page_offset_y()) + nrows()))
-        // column offset
-        + (offset_x() - m_image_data->page_offset_x());
-      const T* cmd = static_cast<const T*>(m_image_data);
-      m_const_begin = cmd->begin()
-        // row offset
-        + (m_image_data->stride() * (offset_y() - m_image_data->page_offset_y()))
-        // col offset
-        + (offset_x() - m_image_data->page_offset_x());
-      m_const_end = cmd->begin()
-        // row offset
-        + (m_image_data->stride() * ((offset_y() - m_image_data->page_offset_y()) + nrows()))
-        // column offset
+      m_first = m_image_data->stride() * (offset_y() - m_image_data->page_offset_y())
         + (offset_x() - m_image_data->page_offset_x());
     }
+    /*
+      The iterators are computed from the data each time, since the
+      pixels of DENSE data can move when shared pixels are copied on
+      the first change (see ImageData::detach).  Only the non-const
+      ones may do that, so they cannot be used from const methods:
+      reading must never detach (or touch the share count), since
+      fused_features_list reads the images with the GIL released.
+    */
+    typename T::iterator begin_iterator() {
+      return m_image_data->begin() + m_first;
+    }
+    typename T::iterator end_iterator() {
+      return m_image_data->begin() + (m_first + m_image_data->stride() * nrows());
+    }
+    typename T::const_iterator const_begin_iterator() const {
+      return static_cast<const T*>(m_image_data)->begin() + m_first;
+    }
+    typename T::const_iterator const_end_iterator() const {
+      return static_cast<const T*>(m_image_data)->begin()
+        + (m_first + m_image_data->stride() * nrows());
+    }
     void range_check() {
       if (offset_y() + nrows() - m_image_data->page_offset_y() > m_image_data->nrows() ||
           offset_x() + ncols() - m_image_data->page_offset_x() > m_image_data->ncols()
@@ -435,8 +440,8 @@ Use ImageView<T>::get(Point(col, row)) instead.
       }
     }
     T* m_image_data;
-    typename T::iterator m_begin, m_end;
-    typename T::const_iterator m_const_begin, m_const_end;
+    // the position of the upper left pixel in the data
+    size_t m_first;
     accessor m_accessor;
   };
 
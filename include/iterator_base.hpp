@@ -36,9 +36,8 @@ namespace Gamera {
   // find the current col
   template<class Mat, class T>
   inline size_t col_number(const Mat* mat, const T curr) {
-    size_t row = row_number(mat, curr) + mat->offset_y();
-    T row_begin = mat->data()->begin() + (row * mat->data()->stride());
-    return (curr - row_begin) - mat->offset_x();
+    return ((curr - mat->data()->begin()) % mat->data()->stride())
+      - mat->offset_x();
   }
   
   template<class Image, class Iterator, class T>
@@ -99,6 +99,172 @@ namespace Gamera {
       return distance;
     }
 
+    /*
+      DISTANCE FUNCTIONS without selection.
+
+      These distance functions are meant for feature vectors from which
+      the deselected features have already been removed, so that the
+      distance is a dense loop over the remaining features. The versions
+      without a weighting vector can be used when all weights are one.
+      The results are exactly the same as those of the functions above
+      for the selected features.
+
+      IterA: iterator type for the known feature vector
+      IterB: iterator type for the unknown feature vector
+      IterD: iterator type for the weighting vector
+    */
+    template<class IterA, class IterB, class IterD>
+    inline double city_block_distance(IterA known, const IterA end,
+                                      IterB unknown, IterD weight) {
+      double distance = 0;
+      for (; known != end; ++known, ++unknown, ++weight)
+        distance += (*weight) * std::abs((*unknown) - (*known));
+      return distance;
+    }
+
+    template<class IterA, class IterB>
+    inline double city_block_distance(IterA known, const IterA end,
+                                      IterB unknown) {
+      double distance = 0;
+      for (; known != end; ++known, ++unknown)
+        distance += std::abs((*unknown) - (*known));
+      return distance;
+    }
+
+    template<class IterA, class IterB, class IterD>
+    inline double euclidean_distance(IterA known, const IterA end,
+                                     IterB unknown, IterD weight) {
+      double distance = 0;
+      for (; known != end; ++known, ++unknown, ++weight)
+        distance += (*weight) *
+          std::sqrt(((*unknown) - (*known)) * ((*unknown) - (*known)));
+      return distance;
+    }
+
+    template<class IterA, class IterB>
+    inline double euclidean_distance(IterA known, const IterA end,
+                                     IterB unknown) {
+      double distance = 0;
+      for (; known != end; ++known, ++unknown)
+        distance += std::sqrt(((*unknown) - (*known)) * ((*unknown) - (*known)));
+      return distance;
+    }
+
+    template<class IterA, class IterB, class IterD>
+    inline double fast_euclidean_distance(IterA known, const IterA end,
+                                          IterB unknown, IterD weight) {
+      double distance = 0;
+      for (; known != end; ++known, ++unknown, ++weight)
+        distance += (*weight) * (((*unknown) - (*known)) * ((*unknown) - (*known)));
+      return distance;
+    }
+
+    template<class IterA, class IterB>
+    inline double fast_euclidean_distance(IterA known, const IterA end,
+                                          IterB unknown) {
+      double distance = 0;
+      for (; known != end; ++known, ++unknown)
+        distance += ((*unknown) - (*known)) * ((*unknown) - (*known));
+      return distance;
+    }
+
+    /*
+      BOUNDED DISTANCE FUNCTIONS
+
+      These are the distance functions without selection from above, but
+      they stop summing up as soon as the distance is not smaller than
+      bound anymore. In a nearest neighbor search the bound is the
+      distance of the k-th nearest neighbor found so far, so that most
+      distance computations can be abandoned early. As long as all weights
+      are non-negative, the partial sum can never decrease again, thus an
+      abandoned feature vector is never closer than bound.
+
+      The terms are added to distance (which is usually zero at the
+      beginning) in the same order as in the functions above, so that a
+      complete sum is exactly the same. The return value is the position
+      in the known feature vector where summing up was stopped, i.e. end
+      if the distance is complete. Calling the function again from this
+      position continues the summation.
+    */
+    template<class IterA, class IterB, class IterD>
+    inline IterA city_block_distance_bounded(IterA known, const IterA end,
+                                             IterB unknown, IterD weight,
+                                             double bound, double& distance) {
+      while (known != end) {
+        distance += (*weight) * std::abs((*unknown) - (*known));
+        ++known; ++unknown; ++weight;
+        if (distance >= bound)
+          break;
+      }
+      return known;
+    }
+
+    template<class IterA, class IterB>
+    inline IterA city_block_distance_bounded(IterA known, const IterA end,
+                                             IterB unknown,
+                                             double bound, double& distance) {
+      while (known != end) {
+        distance += std::abs((*unknown) - (*known));
+        ++known; ++unknown;
+        if (distance >= bound)
+          break;
+      }
+      return known;
+    }
+
+    template<class IterA, class IterB, class IterD>
+    inline IterA euclidean_distance_bounded(IterA known, const IterA end,
+                                            IterB unknown, IterD weight,
+                                            double bound, double& distance) {
+      while (known != end) {
+        distance += (*weight) *
+          std::sqrt(((*unknown) - (*known)) * ((*unknown) - (*known)));
+        ++known; ++unknown; ++weight;
+        if (distance >= bound)
+          break;
+      }
+      return known;
+    }
+
+    template<class IterA, class IterB>
+    inline IterA euclidean_distance_bounded(IterA known, const IterA end,
+                                            IterB unknown,
+                                            double bound, double& distance) {
+      while (known != end) {
+        distance += std::sqrt(((*unknown) - (*known)) * ((*unknown) - (*known)));
+        ++known; ++unknown;
+        if (distance >= bound)
+          break;
+      }
+      return known;
+    }
+
+    template<class IterA, class IterB, class IterD>
+    inline IterA fast_euclidean_distance_bounded(IterA known, const IterA end,
+                                                 IterB unknown, IterD weight,
+                                                 double bound, double& distance) {
+      while (known != end) {
+        distance += (*weight) * (((*unknown) - (*known)) * ((*unknown) - (*known)));
+        ++known; ++unknown; ++weight;
+        if (distance >= bound)
+          break;
+      }
+      return known;
+    }
+
+    template<class IterA, class IterB>
+    inline IterA fast_euclidean_distance_bounded(IterA known, const IterA end,
+                                                 IterB unknown,
+                                                 double bound, double& distance) {
+      while (known != end) {
+        distance += ((*unknown) - (*known)) * ((*unknown) - (*known));
+        ++known; ++unknown;
+        if (distance >= bound)
+          break;
+      }
+      return known;
+    }
+
     /*
       DISTANCE FUNCTIONS with skip.
       
@@ -338,10 +504,12 @@ namespace Gamera {
       public:
         IdStat() {
           min_distance = std::numeric_limits<double>::max();
+          total_distance = 0.0;
           count = 0;
         }
         IdStat(double distance, size_t c) {
           min_distance = distance;
+          total_distance = distance;
           count = c;
         }
         double min_distance;
@@ -406,6 +574,19 @@ namespace Gamera {
         if (distance > m_max_distance)
           m_max_distance = distance;
       }
+      /*
+        Set the largest distance of all elements in the database. This
+        is only needed when add has not been called for every element
+        (e.g. because the candidates have been preselected with a spatial
+        index), because the default confidence is relative to it.
+      */
+      void set_max_distance(double distance) {
+        m_max_distance = distance;
+      }
+      // The largest distance of all elements added so far
+      double max_distance() const {
+        return m_max_distance;
+      }
       /*
         Find the id of the majority of the k nearest neighbors. This
         includes tie-breaking if necessary.
@@ -23,11 +23,309 @@
 
 #include <Python.h>
 #include <vector>
+#include <map>
+#include <string>
+#include <limits>
 #include "gameramodule.hpp"
 #include "knn.hpp"
 #include "knnmodule.hpp"
+#include "geostructs/kdtree.hpp"
 
 namespace Gamera { namespace kNN {
+  /*
+    COMPILED FEATURES
+
+    The feature vectors reduced to the features that are actually used
+    for a given selection vector (and optionally a list of feature
+    indexes), stored as a contiguous row-major matrix together with the
+    weights of the remaining features. As no selection needs to be
+    applied anymore, the distance computation is a dense loop over
+    contiguous memory, and deselected features do not even have to be
+    read. When all remaining weights are one, the weights are dropped
+    as well. The distances can also be computed with a bound (see the
+    bounded distance functions in knn.hpp), which is only honored when
+    no weight is negative.
+
+    The distances are exactly the same as those computed on the full
+    feature vectors with compute_distance. When all features are used,
+    the feature vectors are not copied at all (so that e.g. a memory
+    mapped classifier stays shared between processes).
+
+    Feature vectors stored in single precision are compiled to single
+    precision as well. The unknown feature vectors and the summation of
+    the distances are always in double precision.
+  */
+  class CompiledFeatures {
+  public:
+    CompiledFeatures(const double* feature_vectors, const float* single_feature_vectors,
+                     size_t num_feature_vectors, size_t num_features,
+                     const int* selections, const double* weights,
+                     const std::vector<long>* indexes = 0) {
+      m_selections.assign(selections, selections + num_features);
+      m_weights.assign(weights, weights + num_features);
+      if (indexes == 0) {
+        for (size_t i = 0; i < num_features; ++i)
+          if (selections[i])
+            m_indexes.push_back(i);
+      } else {
+        for (size_t i = 0; i < indexes->size(); ++i)
+          if (selections[(*indexes)[i]])
+            m_indexes.push_back((*indexes)[i]);
+      }
+      m_num_features = m_indexes.size();
+      m_unweighted = true;
+      m_nonnegative = true;
+      m_compiled_weights = new double[m_num_features];
+      for (size_t i = 0; i < m_num_features; ++i) {
+        m_compiled_weights[i] = weights[m_indexes[i]];
+        if (m_compiled_weights[i] != 1.0)
+          m_unweighted = false;
+        if (!(m_compiled_weights[i] >= 0.0))
+          m_nonnegative = false;
+      }
+      m_feature_vectors = 0;
+      m_owned_feature_vectors = 0;
+      m_single_feature_vectors = 0;
+      m_owned_single_feature_vectors = 0;
+      bool copy = !(m_num_features == num_features && indexes == 0);
+      if (single_feature_vectors == 0) {
+        m_feature_vectors = feature_vectors;
+        if (copy) {
+          m_owned_feature_vectors = new double[num_feature_vectors * m_num_features];
+          for (size_t i = 0; i < num_feature_vectors; ++i)
+            compile(feature_vectors + i * num_features,
+                    m_owned_feature_vectors + i * m_num_features);
+          m_feature_vectors = m_owned_feature_vectors;
+        }
+      } else {
+        m_single_feature_vectors = single_feature_vectors;
+        if (copy) {
+          m_owned_single_feature_vectors = new float[num_feature_vectors * m_num_features];
+          for (size_t i = 0; i < num_feature_vectors; ++i)
+            compile(single_feature_vectors + i * num_features,
+                    m_owned_single_feature_vectors + i * m_num_features);
+          m_single_feature_vectors = m_owned_single_feature_vectors;
+        }
+      }
+      m_min.assign(m_num_features, std::numeric_limits<double>::infinity());
+      m_max.assign(m_num_features, -std::numeric_limits<double>::infinity());
+      std::vector<double> fv(m_num_features);
+      for (size_t i = 0; i < num_feature_vectors; ++i) {
+        get(i, &fv[0]);
+        for (size_t j = 0; j < m_num_features; ++j) {
+          if (fv[j] < m_min[j])
+            m_min[j] = fv[j];
+          if (fv[j] > m_max[j])
+            m_max[j] = fv[j];
+        }
+      }
+    }
+    ~CompiledFeatures() {
+      if (m_owned_feature_vectors != 0)
+        delete[] m_owned_feature_vectors;
+      if (m_owned_single_feature_vectors != 0)
+        delete[] m_owned_single_feature_vectors;
+      delete[] m_compiled_weights;
+    }
+    // whether this has been compiled for the given selections and weights
+    bool matches(const int* selections, const double* weights) const {
+      return std::equal(m_selections.begin(), m_selections.end(), selections)
+        && std::equal(m_weights.begin(), m_weights.end(), weights);
+    }
+    // copy the used features of a full feature vector to out
+    template<class T, class U>
+    void compile(const T* in, U* out) const {
+      for (size_t i = 0; i < m_num_features; ++i)
+        out[i] = U(in[m_indexes[i]]);
+    }
+    // copy the compiled feature vector with index i to out
+    void get(size_t i, double* out) const {
+      if (m_single_feature_vectors != 0)
+        std::copy(m_single_feature_vectors + i * m_num_features,
+                  m_single_feature_vectors + (i + 1) * m_num_features, out);
+      else
+        std::copy(m_feature_vectors + i * m_num_features,
+                  m_feature_vectors + (i + 1) * m_num_features, out);
+    }
+    /*
+      The distance between the compiled feature vector with index i and
+      the compiled unknown, but summing up stops as soon as the distance
+      reaches bound. The partial sum is added to distance, and the number
+      of features summed up so far is returned (i.e. num_features() when
+      the distance is complete). Passing this number as start continues
+      an abandoned summation.
+    */
+    size_t bounded_distance(DistanceType distance_type, size_t i,
+                            const double* unknown, double bound,
+                            double& distance, size_t start = 0) const {
+      if (!m_nonnegative)
+        bound = std::numeric_limits<double>::infinity();
+      if (m_single_feature_vectors != 0)
+        return bounded_distance(distance_type, m_single_feature_vectors + i * m_num_features,
+                                unknown, bound, distance, start);
+      else
+        return bounded_distance(distance_type, m_feature_vectors + i * m_num_features,
+                                unknown, bound, distance, start);
+    }
+    /*
+      Upper bounds for the rest of a distance to the compiled unknown
+      from any of the compiled feature vectors: remaining[i] is at least
+      the sum of the terms for the features i to num_features() - 1, so
+      that remaining must have num_features() + 1 entries. The bounds
+      follow from the range of each feature in the database.
+    */
+    void remaining_bounds(DistanceType distance_type, const double* unknown,
+                          double* remaining) const {
+      remaining[m_num_features] = 0.0;
+      for (size_t i = m_num_features; i > 0; --i) {
+        double diff = std::max(unknown[i-1] - m_min[i-1], m_max[i-1] - unknown[i-1]);
+        if (distance_type == FAST_EUCLIDEAN)
+          diff *= diff;
+        remaining[i-1] = remaining[i] + m_compiled_weights[i-1] * diff;
+      }
+    }
+    size_t num_features() const {
+      return m_num_features;
+    }
+    // whether bounded_distance may stop early
+    bool can_abandon() const {
+      return m_nonnegative;
+    }
+  private:
+    template<class T>
+    size_t bounded_distance(DistanceType distance_type, const T* known,
+                            const double* unknown, double bound,
+                            double& distance, size_t start) const {
+      const T* begin = known;
+      const T* end = known + m_num_features;
+      const double* weight = m_compiled_weights + start;
+      known += start;
+      unknown += start;
+      if (m_unweighted) {
+        if (distance_type == CITY_BLOCK)
+          known = city_block_distance_bounded(known, end, unknown, bound, distance);
+        else if (distance_type == FAST_EUCLIDEAN)
+          known = fast_euclidean_distance_bounded(known, end, unknown, bound, distance);
+        else
+          known = euclidean_distance_bounded(known, end, unknown, bound, distance);
+      } else {
+        if (distance_type == CITY_BLOCK)
+          known = city_block_distance_bounded(known, end, unknown, weight,
+                                              bound, distance);
+        else if (distance_type == FAST_EUCLIDEAN)
+          known = fast_euclidean_distance_bounded(known, end, unknown, weight,
+                                                  bound, distance);
+        else
+          known = euclidean_distance_bounded(known, end, unknown, weight,
+                                             bound, distance);
+      }
+      return known - begin;
+    }
+
+    // the number of features that are actually used
+    size_t m_num_features;
+    // the indexes of the used features in the full feature vectors
+    std::vector<size_t> m_indexes;
+    // selections and weights this has been compiled for
+    std::vector<int> m_selections;
+    std::vector<double> m_weights;
+    double* m_compiled_weights;
+    bool m_unweighted;
+    bool m_nonnegative;
+    /*
+      the compiled feature vectors in either double or single precision,
+      which are only owned if they were copied
+    */
+    const double* m_feature_vectors;
+    double* m_owned_feature_vectors;
+    const float* m_single_feature_vectors;
+    float* m_owned_single_feature_vectors;
+    // the range of each used feature
+    std::vector<double> m_min, m_max;
+  };
+
+  /*
+    GLYPH STORE
+
+    The feature vectors and id_names of the glyphs in the database of an
+    interactive classifier. The store is kept up to date whenever glyphs
+    are added to or removed from the database, so that classification
+    does not have to get the features and id_names from every glyph in
+    the database again. Glyphs can be added, updated and removed in
+    constant (amortized) time; when a glyph is removed the last row is
+    moved into its place.
+  */
+  class GlyphStore {
+  public:
+    GlyphStore(size_t num_features) : m_num_features(num_features) { }
+    ~GlyphStore() {
+      clear();
+    }
+    size_t size() const {
+      return m_glyphs.size();
+    }
+    const double* features(size_t i) const {
+      return &m_features[i * m_num_features];
+    }
+    char* id_name(size_t i) {
+      return const_cast<char*>(m_id_names[i].c_str());
+    }
+    // add the glyph, or update it if it is already in the store
+    void set(PyObject* glyph, const double* features, const char* id_name) {
+      size_t row;
+      std::map<PyObject*, size_t>::iterator it = m_rows.find(glyph);
+      if (it != m_rows.end()) {
+        row = it->second;
+        m_id_names[row] = id_name;
+      } else {
+        row = m_glyphs.size();
+        m_features.resize((row + 1) * m_num_features);
+        m_id_names.push_back(id_name);
+        Py_INCREF(glyph);
+        m_glyphs.push_back(glyph);
+        m_rows[glyph] = row;
+      }
+      std::copy(features, features + m_num_features,
+                m_features.begin() + row * m_num_features);
+    }
+    void remove(PyObject* glyph) {
+      std::map<PyObject*, size_t>::iterator it = m_rows.find(glyph);
+      if (it == m_rows.end())
+        return;
+      size_t row = it->second;
+      size_t last = m_glyphs.size() - 1;
+      m_rows.erase(it);
+      if (row != last) {
+        std::copy(m_features.begin() + last * m_num_features,
+                  m_features.begin() + (last + 1) * m_num_features,
+                  m_features.begin() + row * m_num_features);
+        m_id_names[row] = m_id_names[last];
+        m_glyphs[row] = m_glyphs[last];
+        m_rows[m_glyphs[row]] = row;
+      }
+      m_features.resize(last * m_num_features);
+      m_id_names.pop_back();
+      m_glyphs.pop_back();
+      Py_DECREF(glyph);
+    }
+    void clear() {
+      for (size_t i = 0; i < m_glyphs.size(); ++i)
+        Py_DECREF(m_glyphs[i]);
+      m_glyphs.clear();
+      m_features.clear();
+      m_id_names.clear();
+      m_rows.clear();
+    }
+  private:
+    size_t m_num_features;
+    // the glyphs (owned references) and the row of each glyph
+    std::vector<PyObject*> m_glyphs;
+    std::map<PyObject*, size_t> m_rows;
+    // the feature vectors as a contiguous row-major matrix
+    std::vector<double> m_features;
+    std::vector<std::string> m_id_names;
+  };
+
 #if 0
   static PyTypeObject KnnType = {
     PyObject_HEAD_INIT(NULL)
@@ -45,12 +343,30 @@ namespace Gamera { namespace kNN {
     // the number of features in each feature vector
     size_t num_features;
 
+    // the number of feature vectors
+    size_t num_feature_vectors;
     /*
       The feature vectors.
-      A vector to double arrays of size num_features is used to store the
-      feature vectors. It is only used for non-interactive classification).
+      They are stored in one contiguous row-major matrix, i.e. the feature
+      vector with index i starts at feature_vectors + i * num_features.
+      It is only used for non-interactive classification.
+    */
+    double* feature_vectors;
+    /*
+      When single_precision is set, the feature vectors are stored in
+      single precision in single_feature_vectors instead (with the same
+      layout), and feature_vectors is 0. This halves the memory and the
+      bandwidth of each scan; the distances are still summed up in
+      double precision.
+    */
+    bool single_precision;
+    float* single_feature_vectors;
+    /*
+      The feature vectors compiled for the current selections and weights
+      (see CompiledFeatures). This is created on demand by classify and
+      recreated whenever the selections or weights have changed.
     */
-    std::vector<double*> *feature_vectors;
+    CompiledFeatures* compiled;
 
     // The id_names for the feature vectors
     char** id_names;
@@ -77,6 +393,31 @@ namespace Gamera { namespace kNN {
     size_t num_k;
     // the distance type currently being used.
     DistanceType distance_type;
+    // whether classify uses a spatial index instead of a linear scan
+    bool use_index;
+    /*
+      The spatial index over the feature vectors. The data member of
+      each node is the index of the feature vector.
+    */
+    Kdtree::KdTree* index;
+    /*
+      The number of distance computations that have been abandoned early
+      because the feature vector could not be among the nearest neighbors
+      (see the bounded distance functions in knn.hpp).
+    */
+    unsigned long abandoned_comparisons;
+    /*
+      When the classifier has been unserialized from a memory mapped file,
+      this is the start and size of the mapping. The feature vectors and
+      the id_names then point into the mapping and must not be deleted.
+    */
+    char* mapping;
+    size_t mapping_size;
+    /*
+      The features and id_names of the database of an interactive
+      classifier (only if they are kept in the store).
+    */
+    GlyphStore* store;
   };
 
   /*
@@ -93,6 +434,37 @@ namespace Gamera { namespace kNN {
     }
   };
 
+  /*
+    Search predicate for the kd-tree that only admits feature vectors
+    whose id_name differs from the given one. This is used for finding
+    the nearest unlike neighbor.
+  */
+  struct UnlikeIdPredicate : public Kdtree::KdNodePredicate {
+    UnlikeIdPredicate(char** id_names_, const char* id_) {
+      id_names = id_names_;
+      id = id_;
+    }
+    bool operator()(const Kdtree::KdNode& kn) const {
+      return strcmp(id_names[(size_t)kn.data], id) != 0;
+    }
+    char** id_names;
+    const char* id;
+  };
+
+  // the feature vector with index i (only in double precision)
+  inline double* get_feature_vector(KnnObject* o, size_t i) {
+    return o->feature_vectors + i * o->num_features;
+  }
+
+  // copy the feature vector with index i to out (in either precision)
+  inline void copy_feature_vector(KnnObject* o, size_t i, double* out) {
+    if (o->single_feature_vectors != 0)
+      std::copy(o->single_feature_vectors + i * o->num_features,
+                o->single_feature_vectors + (i + 1) * o->num_features, out);
+    else
+      std::copy(get_feature_vector(o, i), get_feature_vector(o, i + 1), out);
+  }
+
   static std::pair<int,int> leave_one_out(KnnObject* o, int stop_threshold,
                                           int* selection_vector = 0,
                                           double* weight_vector = 0,
@@ -107,73 +479,59 @@ namespace Gamera { namespace kNN {
       weights = o->weight_vector;
     }
 
-    assert(o->feature_vectors != 0);
+    assert(o->num_feature_vectors != 0);
     kNearestNeighbors<char*, ltstr, eqstr> knn(o->num_k);
 
+    /*
+      Compiling the feature vectors only takes linear time, so it always
+      pays off compared to the quadratic number of distance computations.
+    */
+    CompiledFeatures compiled(o->feature_vectors, o->single_feature_vectors,
+                              o->num_feature_vectors, o->num_features,
+                              selections, weights, indexes);
+    std::vector<double> unknown(compiled.num_features());
+
+    const double infinity = std::numeric_limits<double>::infinity();
+    unsigned long abandoned = 0;
     int total_correct = 0;
     int total_queries = 0;
-    if (indexes == 0) {
-      for (size_t i = 0; i < o->feature_vectors->size(); ++i/*, cur += o->num_features*/) {
-        // We don't want to do the calculation if there is no
-        // hope that kNN will return the correct answer (because
-        // there aren't enough examples in the database).
-        if (o->id_name_histogram[i] < int((o->num_k + 0.5) / 2)) {
-          continue;
-        }
-        double* current_known;
-        double* unknown = (*o->feature_vectors)[i];
-        for (size_t j = 0; j < o->feature_vectors->size(); ++j) {
-          current_known = (*o->feature_vectors)[j];
-          if (i == j)
-            continue;
-          double distance;
-          compute_distance(o->distance_type, current_known, o->num_features,
-                           unknown, &distance, selections, weights);
-          knn.add(o->id_names[j], distance);
-        }
-        knn.majority();
-        if (strcmp(knn.answer[0].first, o->id_names[i]) == 0) {
-          total_correct++;
-        }
-        knn.reset();
-        total_queries++;
-        if (total_queries - total_correct > stop_threshold)
-          return std::make_pair(total_correct, total_queries);
+    for (size_t i = 0; i < o->num_feature_vectors; ++i) {
+      // We don't want to do the calculation if there is no
+      // hope that kNN will return the correct answer (because
+      // there aren't enough examples in the database).
+      if (o->id_name_histogram[i] < int((o->num_k + 0.5) / 2)) {
+        continue;
       }
-    } else {
-      for (size_t i = 0; i < o->feature_vectors->size(); ++i) {
-        if (o->id_name_histogram[i] < int((o->num_k + 0.5) / 2))
+      compiled.get(i, &unknown[0]);
+      for (size_t j = 0; j < o->num_feature_vectors; ++j) {
+        if (i == j)
+          continue;
+        // only the k nearest neighbors matter for the majority
+        double bound = infinity;
+        if (knn.m_nn.size() == o->num_k)
+          bound = knn.m_nn.back().distance;
+        double distance = 0.0;
+        if (compiled.bounded_distance(o->distance_type, j, &unknown[0],
+                                      bound, distance) < compiled.num_features()) {
+          ++abandoned;
           continue;
-        double* current_known;
-        double* unknown = (*o->feature_vectors)[i];
-        for (size_t j = 0; j < o->feature_vectors->size(); ++j) {
-          current_known = (*o->feature_vectors)[j];
-          if (i == j)
-            continue;
-          double distance;
-          if (o->distance_type == CITY_BLOCK) {
-            distance = city_block_distance_skip(current_known, unknown, selections, weights,
-                                                indexes->begin(), indexes->end());
-          } else if (o->distance_type == FAST_EUCLIDEAN) {
-            distance = fast_euclidean_distance_skip(current_known, unknown, selections, weights,
-                                                    indexes->begin(), indexes->end());
-          } else {
-            distance = euclidean_distance_skip(current_known, unknown, selections, weights,
-                                               indexes->begin(), indexes->end());
-          }
-
-          knn.add(o->id_names[j], distance);
-        }
-        knn.majority();
-        if (strcmp(knn.answer[0].first, o->id_names[i]) == 0) {
-          total_correct++;
         }
-        knn.reset();
-        total_queries++;
-        if (total_queries - total_correct > stop_threshold)
-          return std::make_pair(total_correct, total_queries);
+        knn.add(o->id_names[j], distance);
       }
+      knn.majority();
+      if (strcmp(knn.answer[0].first, o->id_names[i]) == 0) {
+        total_correct++;
+      }
+      knn.reset();
+      total_queries++;
+      if (total_queries - total_correct > stop_threshold)
+        break;
     }
+    // leave_one_out may run in several threads during feature selection
+#ifdef _OPENMP
+#pragma omp atomic
+#endif
+    o->abandoned_comparisons += abandoned;
     return std::make_pair(total_correct, total_queries);
   }
 
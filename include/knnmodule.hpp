@@ -24,6 +24,7 @@
 #define KWM12172002_knnmodule
 
 #include <Python.h>
+#include <vector>
 #include "knn.hpp"
 
 using namespace Gamera;
@@ -42,27 +43,61 @@ enum DistanceType {
 
 
 /*
-  get the feature vector from an image. image argument _must_ an image - no
-  type checking is performed.
+  get the feature vector from an array of features. Features in single
+  precision (typecode 'f', see generate_features) are converted to double
+  into converted, so that buf is only valid as long as converted is not
+  changed. Without converted (as in the plugin wrappers), single precision
+  features are treated like missing features: buf is 0, len is 0 and no
+  Python exception is set.
 */
-inline int image_get_fv(PyObject* image, double** buf, Py_ssize_t* len) {
-  ImageObject* x = (ImageObject*)image;
-
-  if (PyObject_CheckReadBuffer(x->m_features) < 0) {
-    return -1;
-  }
-
-  if (PyObject_AsReadBuffer(x->m_features, (const void**)buf, len) < 0) {
+inline int features_get_fv(PyObject* features, double** buf, Py_ssize_t* len,
+                           std::vector<double>* converted = 0) {
+  const void* data;
+  if (PyObject_AsReadBuffer(features, &data, len) < 0) {
     PyErr_SetString(PyExc_TypeError, "knn: Could not use image as read buffer.");
     return -1;
   }
   if (*len == 0) {
     return -1;
   }
-  *len = *len / sizeof(double);
+  bool single = false;
+  PyObject* typecode = PyObject_GetAttrString(features, (char*)"typecode");
+  if (typecode == 0) {
+    PyErr_Clear();
+  } else {
+    single = PyString_Check(typecode) && PyString_AS_STRING(typecode)[0] == 'f';
+    Py_DECREF(typecode);
+  }
+  if (!single) {
+    *buf = (double*)data;
+    *len = *len / sizeof(double);
+    return 0;
+  }
+  if (converted == 0) {
+    *buf = 0;
+    *len = 0;
+    return -1;
+  }
+  *len = *len / sizeof(float);
+  converted->assign((const float*)data, (const float*)data + *len);
+  *buf = &(*converted)[0];
   return 0;
 }
 
+/*
+  get the feature vector from an image. image argument _must_ an image - no
+  type checking is performed.
+*/
+inline int image_get_fv(PyObject* image, double** buf, Py_ssize_t* len,
+                        std::vector<double>* converted = 0) {
+  ImageObject* x = (ImageObject*)image;
+
+  if (PyObject_CheckReadBuffer(x->m_features) < 0) {
+    return -1;
+  }
+  return features_get_fv(x->m_features, buf, len, converted);
+}
+
 /*
   get the id_name from an image. The image argument _must_ be an image -
   no type checking is performed.
@@ -120,8 +155,9 @@ inline int compute_distance(DistanceType distance_type, PyObject* known,
                 int* selections, double* weights, Py_ssize_t unknown_len) {
   double* known_buf;
   Py_ssize_t known_len;
+  std::vector<double> known_converted;
 
-  if (image_get_fv(known, &known_buf, &known_len) < 0)
+  if (image_get_fv(known, &known_buf, &known_len, &known_converted) < 0)
     return -1;
 
   if (unknown_len != known_len) {
@@ -146,11 +182,12 @@ inline int compute_distance(DistanceType distance_type, PyObject* known,
                 double* weights, int weights_len) {
   double *known_buf, *unknown_buf;
   Py_ssize_t known_len, unknown_len;
+  std::vector<double> known_converted, unknown_converted;
 
-  if (image_get_fv(known, &known_buf, &known_len) < 0)
+  if (image_get_fv(known, &known_buf, &known_len, &known_converted) < 0)
     return -1;
 
-  if (image_get_fv(unknown, &unknown_buf, &unknown_len) < 0)
+  if (image_get_fv(unknown, &unknown_buf, &unknown_len, &unknown_converted) < 0)
     return -1;
 
   if (unknown_len != known_len) {
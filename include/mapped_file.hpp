@@ -0,0 +1,199 @@
+/*
+ *
+ * Copyright (C) 2001-2005 Ichiro Fujinaga, Michael Droettboom, and Karl MacMillan
+ *
+ * This program is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU General Public License
+ * as published by the Free Software Foundation; either version 2
+ * of the License, or (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; if not, write to the Free Software
+ * Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+ */
+
+/*
+  MappedFile is a block of memory backed by a file instead of the
+  swap space.  ImageData uses it for the pixels of images that are
+  too large to be kept in memory, and for images that are created
+  directly on a raw pixel file.
+
+  The pages of the file are read in by the operating system when they
+  are accessed and written back when memory gets low, so an image can
+  be much larger than the available memory.
+*/
+
+#ifndef gamera_mapped_file_hpp
+#define gamera_mapped_file_hpp
+
+#include <cstddef>
+#include <cstdlib>
+#include <cstring>
+#include <cerrno>
+#include <string>
+#include <stdexcept>
+
+#ifndef _WIN32
+#include <unistd.h>
+#include <fcntl.h>
+#include <sys/types.h>
+#include <sys/stat.h>
+#include <sys/mman.h>
+#endif
+
+namespace Gamera {
+
+  class MappedFile {
+  public:
+    /*
+      Maps a new temporary file of the given size.  The file is removed
+      from the directory right away, so it disappears with the mapping
+      (even if the process is killed).  It is created in the directory
+      given by the TMPDIR environment variable, or in /tmp.
+    */
+    explicit MappedFile(size_t bytes) : m_fd(-1), m_data(0), m_bytes(0) {
+#ifndef _WIN32
+      const char* dir = std::getenv("TMPDIR");
+      std::string name = std::string(dir && *dir ? dir : "/tmp")
+        + "/gamera-XXXXXX";
+      m_fd = mkstemp(&name[0]);
+      if (m_fd == -1)
+        error("Could not create a temporary file in", name.c_str(), errno);
+      unlink(name.c_str());
+      map(bytes);
+#else
+      unsupported();
+#endif
+    }
+
+    /*
+      Maps the file at path, which holds the raw pixels.  The file is
+      created if it does not exist, and is grown (with zeros) if it is
+      smaller than the given size.  All changes of the pixels are
+      written to the file.
+    */
+    MappedFile(const char* path, size_t bytes)
+      : m_fd(-1), m_data(0), m_bytes(0), m_path(path) {
+#ifndef _WIN32
+      m_fd = open(path, O_RDWR | O_CREAT, 0666);
+      if (m_fd == -1)
+        error("Could not open", path, errno);
+      map(bytes);
+#else
+      unsupported();
+#endif
+    }
+
+    ~MappedFile() {
+#ifndef _WIN32
+      unmap();
+      if (m_fd != -1)
+        close(m_fd);
+#endif
+    }
+
+    void* data() const { return m_data; }
+    size_t bytes() const { return m_bytes; }
+    // the path of the file, or an empty string for a temporary file
+    const std::string& path() const { return m_path; }
+
+    /*
+      Changes the size of the mapping.  The data up to the smaller of
+      the two sizes is kept, but the memory may move to another address.
+      A temporary file is cut to the new size, but a file given by path
+      is only ever grown, so that no data of the user's file is lost.
+    */
+    void resize(size_t bytes) {
+#ifndef _WIN32
+      if (bytes == m_bytes)
+        return;
+      unmap();
+      map(bytes);
+#endif
+    }
+
+    /*
+      The size in bytes from which ImageData keeps new pixel data in a
+      temporary file.  It is set in megabytes with the environment
+      variable GAMERA_MMAP_THRESHOLD (so that it is the same in all
+      plugin modules); 0 or an unset variable turns the spill-over off.
+    */
+    static size_t threshold() {
+#ifndef _WIN32
+      const char* value = std::getenv("GAMERA_MMAP_THRESHOLD");
+      if (value == 0)
+        return 0;
+      double megabytes = std::atof(value);
+      if (megabytes <= 0.0)
+        return 0;
+      return size_t(megabytes * 1048576.0);
+#else
+      return 0;
+#endif
+    }
+
+  private:
+    // not copyable, since the destructor releases the mapping
+    MappedFile(const MappedFile&);
+    MappedFile& operator=(const MappedFile&);
+
+#ifndef _WIN32
+    void map(size_t bytes) {
+      struct stat info;
+      // never cut off the data of a file given by path
+      bool keep = !m_path.empty() && fstat(m_fd, &info) == 0
+        && size_t(info.st_size) >= bytes;
+      if (!keep && ftruncate(m_fd, bytes) != 0) {
+        int code = errno;
+        close(m_fd);
+        m_fd = -1;
+        error("Could not resize the file for", name(), code);
+      }
+      m_bytes = bytes;
+      if (bytes == 0)
+        return;
+      m_data = mmap(0, bytes, PROT_READ | PROT_WRITE, MAP_SHARED, m_fd, 0);
+      if (m_data == MAP_FAILED) {
+        int code = errno;
+        m_data = 0;
+        close(m_fd);
+        m_fd = -1;
+        error("Could not map the file for", name(), code);
+      }
+    }
+
+    void unmap() {
+      if (m_data != 0)
+        munmap(m_data, m_bytes);
+      m_data = 0;
+      m_bytes = 0;
+    }
+
+    const char* name() const {
+      return m_path.empty() ? "the image data" : m_path.c_str();
+    }
+
+    static void error(const char* message, const char* name, int code) {
+      throw std::runtime_error(std::string(message) + " '" + name + "': "
+                               + std::strerror(code));
+    }
+#else
+    static void unsupported() {
+      throw std::runtime_error
+        ("Memory-mapped image data is not supported on this platform.");
+    }
+#endif
+
+    int m_fd;
+    void* m_data;
+    size_t m_bytes;
+    std::string m_path;
+  };
+}
+
+#endif
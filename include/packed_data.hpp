@@ -0,0 +1,241 @@
+/*
+ *
+ * Copyright (C) 2001-2005 Ichiro Fujinaga, Michael Droettboom, and Karl MacMillan
+ *
+ * This program is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU General Public License
+ * as published by the Free Software Foundation; either version 2
+ * of the License, or (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; if not, write to the Free Software
+ * Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+ */
+
+/*
+  Bit-packed Image Data (one bit per pixel)
+*/
+
+#include "image_data.hpp"
+#include "dimensions.hpp"
+#include "vector_proxy.hpp"
+
+#include <vector>
+#include <algorithm>
+
+#ifndef gamera_packed_data
+#define gamera_packed_data
+
+namespace Gamera {
+
+  namespace PackedDataDetail {
+    /*
+      PackedVector stores one bit per pixel in a vector of machine
+      words, which makes ONEBIT images 16 times smaller than with
+      dense storage.  A set bit is a black pixel, so all non-zero
+      values (including the labels of connected components) are
+      stored as 1 and read back as 1.
+
+      The pixels are stored one after the other without any padding
+      between the rows, beginning with the least significant bit of
+      the first word.  Just like the other image data, a pixel is
+      addressed by its position y * stride + x.
+
+      Single pixels are accessed through a proxy (like the RLEProxy),
+      which is slower than accessing dense data.  Algorithms that have
+      a special implementation for packed data can instead read and
+      write up to WORD_BITS pixels at once with get_word and set_word,
+      from any position.
+    */
+    typedef unsigned long word_type;
+    static const size_t WORD_BITS = sizeof(word_type) * 8;
+
+    inline size_t words_for(size_t bits) {
+      return (bits + WORD_BITS - 1) / WORD_BITS;
+    }
+
+    // a word with the lowest n bits set (n <= WORD_BITS)
+    inline word_type low_bits(size_t n) {
+      return n < WORD_BITS ? (word_type(1) << n) - 1 : ~word_type(0);
+    }
+
+    // the number of set bits of a word
+    inline size_t bit_count(word_type w) {
+#ifdef __GNUC__
+      return __builtin_popcountl(w);
+#else
+      size_t count = 0;
+      for (; w; w &= w - 1)
+        ++count;
+      return count;
+#endif
+    }
+
+    // the index of the lowest set bit of a (non-zero) word
+    inline size_t first_bit(word_type w) {
+#ifdef __GNUC__
+      return __builtin_ctzl(w);
+#else
+      size_t index = 0;
+      for (; !(w & 1); w >>= 1)
+        ++index;
+      return index;
+#endif
+    }
+
+    template<class Data>
+    class PackedVector {
+    public:
+      typedef VectorProxyDetail::VectorProxy<PackedVector> proxy_type;
+      typedef Data value_type;
+      typedef proxy_type reference;
+      typedef proxy_type pointer;
+      typedef int difference_type;
+      typedef PackedVector self;
+
+      typedef VectorProxyDetail::VectorProxyIterator<self> iterator;
+      typedef VectorProxyDetail::ConstVectorProxyIterator<const self> const_iterator;
+
+      PackedVector(size_t size = 0) : m_length(size), m_words(words_for(size), 0) { }
+
+      void resize(size_t size) {
+        // clear the bits beyond the new end, so that they are white
+        // again when the vector grows later
+        if (size < m_length && size % WORD_BITS)
+          m_words[size / WORD_BITS] &= low_bits(size % WORD_BITS);
+        m_length = size;
+        m_words.resize(words_for(size), 0);
+      }
+      size_t size() const {
+        return m_length;
+      }
+
+      value_type get(size_t pos) const {
+        return value_type((m_words[pos / WORD_BITS] >> (pos % WORD_BITS)) & 1);
+      }
+      void set(size_t pos, value_type v) {
+        word_type bit = word_type(1) << (pos % WORD_BITS);
+        if (v)
+          m_words[pos / WORD_BITS] |= bit;
+        else
+          m_words[pos / WORD_BITS] &= ~bit;
+      }
+
+      // the n pixels (n <= WORD_BITS) beginning at pos, with the first
+      // one in the lowest bit
+      word_type get_word(size_t pos, size_t n = WORD_BITS) const {
+        size_t i = pos / WORD_BITS, shift = pos % WORD_BITS;
+        word_type w = m_words[i] >> shift;
+        if (shift != 0 && shift + n > WORD_BITS)
+          w |= m_words[i + 1] << (WORD_BITS - shift);
+        return w & low_bits(n);
+      }
+      // sets the n pixels (n <= WORD_BITS) beginning at pos
+      void set_word(size_t pos, word_type w, size_t n = WORD_BITS) {
+        size_t i = pos / WORD_BITS, shift = pos % WORD_BITS;
+        word_type mask = low_bits(n);
+        w &= mask;
+        m_words[i] = (m_words[i] & ~(mask << shift)) | (w << shift);
+        if (shift != 0 && shift + n > WORD_BITS)
+          m_words[i + 1] = (m_words[i + 1] & ~(mask >> (WORD_BITS - shift)))
+            | (w >> (WORD_BITS - shift));
+      }
+
+      iterator begin() {
+        return iterator(this, 0);
+      }
+      iterator end() {
+        return iterator(this, m_length);
+      }
+      const_iterator begin() const {
+        return const_iterator(this, 0);
+      }
+      const_iterator end() const {
+        return const_iterator(this, m_length);
+      }
+      proxy_type operator[](size_t pos) {
+        return proxy_type(this, pos);
+      }
+
+    protected:
+      size_t m_length;
+      std::vector<word_type> m_words;
+    };
+  } // namespace PackedDataDetail
+
+  /*
+    This is a PackedVector with the additional interface necessary to
+    allow it to be used with an ImageView.
+  */
+  template<class T>
+  class PackedImageData : public PackedDataDetail::PackedVector<T>,
+                          public ImageDataBase {
+  public:
+    using PackedDataDetail::PackedVector<T>::resize;
+    using PackedDataDetail::PackedVector<T>::size;
+    typedef T value_type;
+    typedef typename PackedDataDetail::PackedVector<T>::reference reference;
+    typedef typename PackedDataDetail::PackedVector<T>::pointer pointer;
+    typedef typename PackedDataDetail::PackedVector<T>::iterator iterator;
+    typedef typename PackedDataDetail::PackedVector<T>::const_iterator const_iterator;
+
+    PackedImageData(const Size& size, const Point& offset)
+      : PackedDataDetail::PackedVector<T>((size.height() + 1) * (size.width() + 1)),
+        ImageDataBase(size, offset) {
+    }
+    PackedImageData(const Size& size)
+      : PackedDataDetail::PackedVector<T>((size.height() + 1) * (size.width() + 1)),
+        ImageDataBase(size) {
+    }
+    PackedImageData(const Dim& dim, const Point& offset)
+      : PackedDataDetail::PackedVector<T>(dim.nrows() * dim.ncols()),
+        ImageDataBase(dim, offset) {
+    }
+    PackedImageData(const Dim& dim)
+      : PackedDataDetail::PackedVector<T>(dim.nrows() * dim.ncols()),
+        ImageDataBase(dim) {
+    }
+    PackedImageData(const Rect& rect)
+      : PackedDataDetail::PackedVector<T>(rect.nrows() * rect.ncols()),
+        ImageDataBase(rect) {
+    }
+
+    virtual size_t bytes() const {
+      return this->m_words.size() * sizeof(PackedDataDetail::word_type);
+    }
+    virtual double mbytes() const { return bytes() / 1048576.0; }
+    virtual void dimensions(size_t rows, size_t cols) {
+      m_stride = cols;
+      do_resize(rows * cols);
+    }
+    virtual void dim(const Dim& dim) {
+      m_stride = dim.ncols();
+      do_resize(dim.nrows() * dim.ncols());
+    }
+    virtual Dim dim() const {
+      return Dim(m_stride, size() / m_stride);
+    }
+  protected:
+    virtual void do_resize(size_t size) {
+      ImageDataBase::m_size = size;
+      resize(size);
+    }
+  };
+
+  /*
+    The position in the packed data of the first pixel of row y of
+    view, for use with get_word and set_word.
+  */
+  template<class View>
+  size_t packed_row_start(const View& view, size_t y) {
+    return (view.offset_y() + y - view.data()->page_offset_y()) * view.data()->stride()
+      + view.offset_x() - view.data()->page_offset_x();
+  }
+}
+
+#endif
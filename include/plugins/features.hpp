@@ -23,16 +23,514 @@
 #ifndef kwm10242002_features
 #define kwm10242002_features
 
+#include <Python.h>
 #include "gamera.hpp"
 #include "image_utilities.hpp"
 #include "morphology.hpp"
 #include "thinning.hpp"
 #include "plugins/projections.hpp"
 #include "plugins/transformation.hpp"
+#include <algorithm>
 #include <cmath>
+#include <complex>
+#include <limits>
+#include <string>
 #include <vector>
 
 namespace Gamera {
+  //
+  // Black runs
+  //
+  // Most of the features below only depend on a few statistics of the
+  // black pixels (their number per row and column, raw moments, the
+  // runs of the rows and columns and the number of black pixels in
+  // some regions). All of them can be gathered from the black runs of
+  // the rows instead of pixel by pixel, which is much faster for the
+  // usually small and sparse connected components.
+  //
+  // BlackRunReader returns the black runs of one row after the other as
+  // [start, end) column ranges. For RLE images the runs are read
+  // directly from the run length data, for all other images they are
+  // extracted from the pixels of the row (directly from the memory for
+  // dense ONEBIT images). Features that are not much more than a count
+  // of the black pixels only use the runs when they are stored
+  // (from_run_lengths), because counting the pixels of a dense image
+  // is just as fast.
+  //
+  typedef std::pair<size_t, size_t> BlackRun;
+  typedef std::vector<BlackRun> BlackRunList;
+
+  template<class T>
+  class BlackRunReader {
+  public:
+    static const bool from_run_lengths = false;
+    BlackRunReader(const T& image) : m_it(image.vec_begin()), m_ncols(image.ncols()) { }
+    void next(BlackRunList& runs) {
+      runs.clear();
+      size_t start = 0;
+      bool in_run = false;
+      for (size_t x = 0; x < m_ncols; ++x, ++m_it) {
+        if (is_black(*m_it)) {
+          if (!in_run) {
+            start = x;
+            in_run = true;
+          }
+        } else if (in_run) {
+          runs.push_back(BlackRun(start, x));
+          in_run = false;
+        }
+      }
+      if (in_run)
+        runs.push_back(BlackRun(start, m_ncols));
+    }
+  private:
+    typename T::const_vec_iterator m_it;
+    size_t m_ncols;
+  };
+
+  // Reads the runs of the given label (or of all non-zero values when
+  // the label is 0) from the memory of a dense image. On data with a
+  // label plane, the label of the pixels is taken from the plane (see
+  // ConnectedComponent::owns).
+  template<class T>
+  class DenseBlackRunReader {
+  public:
+    static const bool from_run_lengths = false;
+    DenseBlackRunReader(const T& image, unsigned int label)
+      : m_label(label), m_value(pixel_label<typename T::value_type>(label)),
+        m_ncols(image.ncols()), m_stride(image.data()->stride()),
+        // the const begin(), which never detaches shared data (this
+        // runs with the GIL released)
+        m_row(static_cast<const typename T::data_type*>(image.data())->begin()
+              + image.data()->stride() * (image.offset_y() - image.data()->page_offset_y())
+              + image.offset_x() - image.data()->page_offset_x()),
+        m_plane_row(0) {
+      if (label != 0 && image.data()->label_plane() != 0)
+        m_plane_row = image.data()->label_plane()
+          + image.data()->stride() * (image.offset_y() - image.data()->page_offset_y())
+          + image.offset_x() - image.data()->page_offset_x();
+    }
+    void next(BlackRunList& runs) {
+      runs.clear();
+      const typename T::value_type* row = m_row;
+      const unsigned int* plane_row = m_plane_row;
+      m_row += m_stride;
+      if (m_plane_row != 0)
+        m_plane_row += m_stride;
+      size_t x = 0;
+      while (x < m_ncols) {
+        for (; x < m_ncols && !is_label(row, plane_row, x); ++x) ;
+        if (x == m_ncols)
+          break;
+        size_t start = x;
+        for (; x < m_ncols && is_label(row, plane_row, x); ++x) ;
+        runs.push_back(BlackRun(start, x));
+      }
+    }
+  private:
+    bool is_label(const typename T::value_type* row, const unsigned int* plane_row,
+                  size_t x) const {
+      if (m_label == 0)
+        return row[x] != 0;
+      return row[x] == m_value && (plane_row == 0 || plane_row[x] == m_label);
+    }
+    unsigned int m_label;
+    typename T::value_type m_value;
+    size_t m_ncols, m_stride;
+    const typename T::value_type* m_row;
+    const unsigned int* m_plane_row;
+  };
+
+  template<>
+  class BlackRunReader<OneBitImageView> : public DenseBlackRunReader<OneBitImageView> {
+  public:
+    BlackRunReader(const OneBitImageView& image)
+      : DenseBlackRunReader<OneBitImageView>(image, 0) { }
+  };
+
+  template<>
+  class BlackRunReader<Cc> : public DenseBlackRunReader<Cc> {
+  public:
+    BlackRunReader(const Cc& image)
+      : DenseBlackRunReader<Cc>(image, image.label()) { }
+  };
+
+  // Reads the runs of the given label (or of all non-zero values when
+  // the label is 0) from the run length data of an RLE image. On data
+  // with a label plane, the runs of the pixel label are split up by the
+  // labels in the plane.
+  template<class T>
+  class RleBlackRunReader {
+  public:
+    static const bool from_run_lengths = true;
+    RleBlackRunReader(const T& image, unsigned int label)
+      : m_data(*image.data()), m_label(label),
+        m_value(pixel_label<typename T::value_type>(label)), m_ncols(image.ncols()),
+        m_stride(image.data()->stride()),
+        m_pos(image.data()->stride() * (image.offset_y() - image.data()->page_offset_y())
+              + image.offset_x() - image.data()->page_offset_x()),
+        m_plane(label != 0 ? image.data()->label_plane() : 0) { }
+    void next(BlackRunList& runs) {
+      using namespace RleDataDetail;
+      runs.clear();
+      size_t begin = m_pos, end = m_pos + m_ncols;
+      m_pos += m_stride;
+      for (size_t chunk = get_chunk(begin); (chunk << RLE_CHUNK_BITS) < end; ++chunk) {
+        // the runs of a chunk follow each other without gaps, starting
+        // at the beginning of the chunk
+        size_t run_start = chunk << RLE_CHUNK_BITS;
+        typename list_type::const_iterator i = m_data.m_data[chunk].begin();
+        for (; i != m_data.m_data[chunk].end() && run_start < end; ++i) {
+          size_t run_end = get_global_pos(i->end, chunk) + 1;
+          if (run_end > begin && is_label(i->value)) {
+            size_t start = std::max(run_start, begin) - begin;
+            size_t stop = std::min(run_end, end) - begin;
+            if (m_plane != 0)
+              add_plane_runs(runs, begin, start, stop);
+            else
+              add_run(runs, start, stop);
+          }
+          run_start = run_end;
+        }
+      }
+    }
+  private:
+    typedef typename T::data_type::list_type list_type;
+    bool is_label(typename T::value_type value) const {
+      return m_label ? value == m_value : value != 0;
+    }
+    static void add_run(BlackRunList& runs, size_t start, size_t stop) {
+      // runs may continue in the next chunk
+      if (!runs.empty() && runs.back().second == start)
+        runs.back().second = stop;
+      else
+        runs.push_back(BlackRun(start, stop));
+    }
+    // adds the parts of [start, stop) that have the label in the plane
+    void add_plane_runs(BlackRunList& runs, size_t begin, size_t start, size_t stop) const {
+      const unsigned int* plane = m_plane + begin;
+      size_t x = start;
+      while (x < stop) {
+        for (; x < stop && plane[x] != m_label; ++x) ;
+        if (x == stop)
+          break;
+        size_t run_start = x;
+        for (; x < stop && plane[x] == m_label; ++x) ;
+        add_run(runs, run_start, x);
+      }
+    }
+    const typename T::data_type& m_data;
+    unsigned int m_label;
+    typename T::value_type m_value;
+    size_t m_ncols, m_stride, m_pos;
+    const unsigned int* m_plane;
+  };
+
+  template<>
+  class BlackRunReader<OneBitRleImageView> : public RleBlackRunReader<OneBitRleImageView> {
+  public:
+    BlackRunReader(const OneBitRleImageView& image)
+      : RleBlackRunReader<OneBitRleImageView>(image, 0) { }
+  };
+
+  template<>
+  class BlackRunReader<RleCc> : public RleBlackRunReader<RleCc> {
+  public:
+    BlackRunReader(const RleCc& image)
+      : RleBlackRunReader<RleCc>(image, image.label()) { }
+  };
+
+  // The holes of one row or column, as counted by nholes_1d.
+  struct RunHoles {
+    RunHoles() : holes(0), last(false), has_black(false) { }
+    int holes;
+    bool last;
+    bool has_black;
+  };
+
+  //
+  // RunStatistics gathers the statistics the features need in a single
+  // pass over the black runs of an image. Only the statistics selected
+  // by the flags are kept. The counts in regions are only available for
+  // the regions given to the constructor. All statistics are integers,
+  // so the features computed from them are exactly the same as when the
+  // pixels are visited one by one.
+  //
+  enum {
+    RUN_STATS_PROJECTIONS = 1,  // black pixels per row and per column
+    RUN_STATS_MOMENTS = 2,      // sums of x and x*x of each row
+    RUN_STATS_HOLES = 4,        // holes of each row and column
+    RUN_STATS_POINTS = 8,       // the coordinates of all black pixels
+    RUN_STATS_DILATION = 16     // black pixels after a 3x3 dilation
+  };
+
+  class RunStatistics {
+  public:
+    template<class T>
+    RunStatistics(const T& image, int what,
+                  const std::vector<Rect>& regions = std::vector<Rect>())
+      : nrows(image.nrows()), ncols(image.ncols()), black(0), dilated(0),
+        m_num_x(0), m_num_y(0) {
+      if (what & RUN_STATS_MOMENTS)
+        what |= RUN_STATS_PROJECTIONS;
+      bool need_columns = (what & (RUN_STATS_PROJECTIONS | RUN_STATS_HOLES)) != 0;
+      if (what & RUN_STATS_PROJECTIONS)
+        row_count.resize(nrows, 0);
+      if (what & RUN_STATS_MOMENTS) {
+        row_sum_x.resize(nrows, 0);
+        row_sum_xx.resize(nrows, 0);
+      }
+      if (what & RUN_STATS_HOLES)
+        row_holes.resize(nrows);
+      init_regions(regions);
+
+      // differences of the black pixels and of the vertical run starts
+      // between neighbouring columns
+      std::vector<long> col_diff, start_diff;
+      if (need_columns)
+        col_diff.resize(ncols + 1, 0);
+      if (what & RUN_STATS_HOLES)
+        start_diff.resize(ncols + 1, 0);
+
+      BlackRunReader<T> reader(image);
+      BlackRunList runs, previous;
+      runs.reserve(16);
+      previous.reserve(16);
+      // the widened runs of the rows y - 2, y - 1 and y
+      BlackRunList widened[3];
+      for (size_t y = 0; y < nrows; ++y) {
+        reader.next(runs);
+        size_t row_black = 0;
+        for (size_t i = 0; i < runs.size(); ++i) {
+          size_t start = runs[i].first, end = runs[i].second;
+          row_black += end - start;
+          if (need_columns) {
+            ++col_diff[start];
+            --col_diff[end];
+          }
+          if (what & RUN_STATS_MOMENTS) {
+            row_sum_x[y] += (start + end - 1) * (end - start) / 2;
+            row_sum_xx[y] += sum_of_squares(end) - sum_of_squares(start);
+          }
+          if (what & RUN_STATS_POINTS)
+            for (size_t x = start; x < end; ++x)
+              points.push_back(Point(x, y));
+        }
+        black += row_black;
+        if (what & RUN_STATS_PROJECTIONS)
+          row_count[y] = row_black;
+        if (what & RUN_STATS_HOLES) {
+          RunHoles& holes = row_holes[y];
+          holes.has_black = !runs.empty();
+          holes.last = holes.has_black && runs.back().second == ncols;
+          holes.holes = int(runs.size()) - int(holes.last);
+          // a vertical run starts where a row is black and the previous
+          // row is not
+          for (size_t i = 0; i < runs.size(); ++i) {
+            ++start_diff[runs[i].first];
+            --start_diff[runs[i].second];
+          }
+          size_t i = 0, j = 0;
+          while (i < runs.size() && j < previous.size()) {
+            size_t start = std::max(runs[i].first, previous[j].first);
+            size_t end = std::min(runs[i].second, previous[j].second);
+            if (start < end) {
+              --start_diff[start];
+              ++start_diff[end];
+            }
+            if (runs[i].second < previous[j].second)
+              ++i;
+            else
+              ++j;
+          }
+        }
+        if (m_num_x)
+          add_row_to_regions(y, runs);
+        if (what & RUN_STATS_DILATION) {
+          // row y - 1 of the dilation is the union of the widened runs
+          // of its own and both neighbouring rows
+          widen_runs(runs, widened[2]);
+          if (y > 0)
+            dilated += union_length(widened);
+          std::swap(widened[0], widened[1]);
+          std::swap(widened[1], widened[2]);
+        }
+        std::swap(runs, previous);
+      }
+      if ((what & RUN_STATS_DILATION) && nrows) {
+        widened[2].clear();
+        dilated += union_length(widened);
+      }
+
+      if (need_columns) {
+        col_count.resize(ncols);
+        long count = 0;
+        for (size_t x = 0; x < ncols; ++x)
+          col_count[x] = size_t(count += col_diff[x]);
+      }
+      if (what & RUN_STATS_HOLES) {
+        // previous holds the runs of the last row
+        col_holes.resize(ncols);
+        for (size_t i = 0; i < previous.size(); ++i)
+          for (size_t x = previous[i].first; x < previous[i].second; ++x)
+            col_holes[x].last = true;
+        long starts = 0;
+        for (size_t x = 0; x < ncols; ++x) {
+          starts += start_diff[x];
+          col_holes[x].has_black = col_count[x] > 0;
+          col_holes[x].holes = int(starts) - int(col_holes[x].last);
+        }
+      }
+    }
+
+    // the raw moments, accumulated the same way as moments_1d and moments_2d
+    void raw_moments(feature_t& m00, feature_t& m01, feature_t& m02, feature_t& m03,
+                     feature_t& m10, feature_t& m20, feature_t& m30,
+                     feature_t& m11, feature_t& m12, feature_t& m21) const {
+      feature_t tmp;
+      m00 = m01 = m02 = m03 = m10 = m20 = m30 = m11 = m12 = m21 = 0;
+      for (size_t y = 0; y < row_count.size(); ++y) {
+        m00 += row_count[y];
+        m01 += (tmp = y * row_count[y]);
+        m02 += (tmp *= y);
+        m03 += (tmp * y);
+      }
+      for (size_t x = 0; x < col_count.size(); ++x) {
+        m10 += (tmp = x * col_count[x]);
+        m20 += (tmp *= x);
+        m30 += (tmp * x);
+      }
+      for (size_t y = 0; y < row_sum_x.size(); ++y) {
+        m11 += (tmp = y * row_sum_x[y]);
+        m12 += (tmp * y);
+        m21 += feature_t(y * row_sum_xx[y]);
+      }
+    }
+
+    // the same as nholes_1d for the rows or columns [begin, end)
+    static int nholes(const std::vector<RunHoles>& holes, size_t begin, size_t end) {
+      int hole_count = 0;
+      for (size_t i = begin; i < end; ++i) {
+        hole_count += holes[i].holes;
+        if (!holes[i].last && hole_count && holes[i].has_black)
+          hole_count--;
+      }
+      return hole_count;
+    }
+
+    // the number of black pixels in one of the regions given to the constructor
+    size_t region_count(const Rect& region) const {
+      size_t x0 = m_x_slot[region.ul_x()], x1 = m_x_slot[region.ul_x() + region.ncols()];
+      size_t y0 = m_y_slot[region.ul_y()], y1 = m_y_slot[region.ul_y() + region.nrows()];
+      return m_table[y1 * m_num_x + x1] + m_table[y0 * m_num_x + x0]
+        - m_table[y0 * m_num_x + x1] - m_table[y1 * m_num_x + x0];
+    }
+
+    size_t nrows, ncols, black, dilated;
+    std::vector<size_t> row_count, col_count, row_sum_x, row_sum_xx;
+    std::vector<RunHoles> row_holes, col_holes;
+    std::vector<Point> points;
+
+  private:
+    // the runs widened by one pixel to both sides (within the image),
+    // with overlapping runs merged
+    void widen_runs(const BlackRunList& runs, BlackRunList& widened) const {
+      widened.clear();
+      for (size_t i = 0; i < runs.size(); ++i) {
+        size_t start = runs[i].first ? runs[i].first - 1 : 0;
+        size_t end = std::min(runs[i].second + 1, ncols);
+        if (!widened.empty() && start <= widened.back().second)
+          widened.back().second = end;
+        else
+          widened.push_back(BlackRun(start, end));
+      }
+    }
+
+    // the number of pixels covered by the runs of three rows
+    static size_t union_length(const BlackRunList rows[3]) {
+      size_t next[3] = {0, 0, 0};
+      size_t total = 0, start = 0, end = 0;
+      while (true) {
+        // the run that starts first
+        int row = -1;
+        for (int i = 0; i < 3; ++i)
+          if (next[i] < rows[i].size() &&
+              (row < 0 || rows[i][next[i]].first < rows[row][next[row]].first))
+            row = i;
+        if (row < 0)
+          break;
+        const BlackRun& run = rows[row][next[row]++];
+        if (run.first <= end && end > 0)
+          end = std::max(end, run.second);
+        else {
+          total += end - start;
+          start = run.first;
+          end = run.second;
+        }
+      }
+      return total + end - start;
+    }
+
+    // 0*0 + 1*1 + ... + (n-1)*(n-1)
+    static size_t sum_of_squares(size_t n) {
+      return n ? (n - 1) * n * (2 * n - 1) / 6 : 0;
+    }
+
+    // The black pixels in the regions are counted with a summed area
+    // table that is only kept at the borders of the regions.
+    void init_regions(const std::vector<Rect>& regions) {
+      if (regions.empty())
+        return;
+      m_x_slot.resize(ncols + 1, -1);
+      m_y_slot.resize(nrows + 1, -1);
+      for (size_t i = 0; i < regions.size(); ++i) {
+        m_x_slot[regions[i].ul_x()] = 0;
+        m_x_slot[regions[i].ul_x() + regions[i].ncols()] = 0;
+        m_y_slot[regions[i].ul_y()] = 0;
+        m_y_slot[regions[i].ul_y() + regions[i].nrows()] = 0;
+      }
+      m_num_x = number_slots(m_x_slot);
+      m_num_y = number_slots(m_y_slot);
+      m_x_borders.reserve(m_num_x);
+      for (size_t x = 0; x < m_x_slot.size(); ++x)
+        if (m_x_slot[x] >= 0)
+          m_x_borders.push_back(x);
+      m_row_prefix.resize(m_num_x, 0);
+      m_cumulative.resize(m_num_x, 0);
+      m_table.resize(m_num_x * m_num_y, 0);
+    }
+    static size_t number_slots(std::vector<int>& slots) {
+      size_t n = 0;
+      for (size_t i = 0; i < slots.size(); ++i)
+        if (slots[i] == 0)
+          slots[i] = int(n++);
+      return n;
+    }
+    void add_row_to_regions(size_t y, const BlackRunList& runs) {
+      // the black pixels of the row left of each border
+      size_t i = 0, full = 0;
+      for (size_t k = 0; k < m_x_borders.size(); ++k) {
+        size_t x = m_x_borders[k];
+        for (; i < runs.size() && runs[i].second <= x; ++i)
+          full += runs[i].second - runs[i].first;
+        size_t count = full;
+        if (i < runs.size() && runs[i].first < x)
+          count += x - runs[i].first;
+        m_row_prefix[k] = count;
+      }
+      for (size_t k = 0; k < m_num_x; ++k)
+        m_cumulative[k] += m_row_prefix[k];
+      int slot = m_y_slot[y + 1];
+      if (slot >= 0)
+        std::copy(m_cumulative.begin(), m_cumulative.end(), m_table.begin() + slot * m_num_x);
+    }
+
+    std::vector<int> m_x_slot, m_y_slot;
+    std::vector<size_t> m_x_borders;
+    size_t m_num_x, m_num_y;
+    std::vector<size_t> m_row_prefix, m_cumulative, m_table;
+  };
+
   //
   // Black Area
   //
@@ -42,16 +540,13 @@ namespace Gamera {
   //
   template<class T>
   void black_area(const T& mat, feature_t* buf) {
-    *buf = 0;
-    for (typename T::const_vec_iterator i = mat.vec_begin();
-         i != mat.vec_end(); ++i) {
-      if (is_black(*i))
-        (*buf)++;
-    }
+    *buf = black_area(mat);
   }
   // Old-style version, since it is called from C++ elsewhere
   template<class T>
   feature_t black_area(const T& mat) {
+    if (BlackRunReader<T>::from_run_lengths)
+      return feature_t(RunStatistics(mat, 0).black);
     int black_pixels = 0;
     for (typename T::const_vec_iterator i = mat.vec_begin();
          i != mat.vec_end(); ++i) {
@@ -64,6 +559,8 @@ namespace Gamera {
   // Ratio of black to white pixels
   template<class T>
   feature_t volume(const T &m) {
+    if (BlackRunReader<T>::from_run_lengths)
+      return (feature_t(RunStatistics(m, 0).black) / (m.nrows() * m.ncols()));
     unsigned int count = 0;
     typename T::const_vec_iterator i = m.vec_begin();
     for (; i != m.vec_end(); i++)
@@ -123,14 +620,12 @@ namespace Gamera {
     }
   }
 
-  template<class T>
-  void moments(T &m, feature_t* buf) {
-    feature_t m10 = 0, m11 = 0, m20 = 0, m21 = 0, m12 = 0, 
-      m01 = 0, m02 = 0, m30 = 0, m03 = 0, m00 = 0, dummy = 0;
-    moments_1d(m.row_begin(), m.row_end(), m00, m01, m02, m03);
-    moments_1d(m.col_begin(), m.col_end(), dummy, m10, m20, m30);
-    moments_2d(m.col_begin(), m.col_end(), m11, m12, m21);
-
+  // the moments feature from the raw moments of an image of the given size
+  inline void moments_from_raw(feature_t m00, feature_t m01, feature_t m02,
+                               feature_t m03, feature_t m10, feature_t m20,
+                               feature_t m30, feature_t m11, feature_t m12,
+                               feature_t m21, size_t nrows, size_t ncols,
+                               feature_t* buf) {
     if (m00 == 0.0) m00 = 1.0; // special case: no black pixels
 
     feature_t x, y, x2, y2, div;
@@ -140,12 +635,12 @@ namespace Gamera {
     y2 = 2 * y * y;
 
     // normalized center of gravity [0,1]
-    if (m.ncols() > 1)
-      *(buf++) = x / (m.ncols()-1);
+    if (ncols > 1)
+      *(buf++) = x / (ncols-1);
     else
       *(buf++) = 0.5; // only one pixel wide
-    if (m.nrows() > 1)
-      *(buf++) = y / (m.nrows()-1);
+    if (nrows > 1)
+      *(buf++) = y / (nrows-1);
     else
       *(buf++) = 0.5; // only one pixel high
   
@@ -160,6 +655,15 @@ namespace Gamera {
     *(buf++) = (m21 - (2 * x * m11) - (y * m20) + (x2 * m01)) / div;    // u21
     *buf = (m03 - (3 * y * m02) + (y2 * m01)) / div;                // u03
   }
+
+  template<class T>
+  void moments(T &m, feature_t* buf) {
+    feature_t m10, m11, m20, m21, m12, m01, m02, m30, m03, m00;
+    RunStatistics(m, RUN_STATS_MOMENTS).raw_moments(m00, m01, m02, m03, m10, m20, m30,
+                                                    m11, m12, m21);
+    moments_from_raw(m00, m01, m02, m03, m10, m20, m30, m11, m12, m21,
+                     m.nrows(), m.ncols(), buf);
+  }
  
   // Number of holes in x and y direction
   
@@ -205,9 +709,10 @@ namespace Gamera {
   template<class T>
   void nholes(T &m, feature_t* buf) {
     int vert, horiz;
-    
-    vert = nholes_1d(m.col_begin(), m.col_end());
-    horiz = nholes_1d(m.row_begin(), m.row_end());
+    RunStatistics stats(m, RUN_STATS_HOLES);
+
+    vert = RunStatistics::nholes(stats.col_holes, 0, m.ncols());
+    horiz = RunStatistics::nholes(stats.row_holes, 0, m.nrows());
     
     *(buf++) = (feature_t)vert / m.ncols();
     *buf = (feature_t)horiz / m.nrows();
@@ -219,26 +724,33 @@ namespace Gamera {
   // This divides the image into strips (both horizontally
   // and vertically) and computes the number of holes on each strip.
   //
-  template<class T>
-  void nholes_extended(const T& m, feature_t* buf) {
-    double quarter_cols = m.ncols() / 4.0;
+  inline void nholes_extended_from_holes(const std::vector<RunHoles>& col_holes,
+                                         const std::vector<RunHoles>& row_holes,
+                                         feature_t* buf) {
+    double quarter_cols = col_holes.size() / 4.0;
     double start = 0.0;
     for (size_t i = 0; i < 4; ++i) {
-      *(buf++) = nholes_1d(m.col_begin() + size_t(start),
-                m.col_begin() + size_t(start) + size_t(quarter_cols))
+      *(buf++) = RunStatistics::nholes(col_holes, size_t(start),
+                                       size_t(start) + size_t(quarter_cols))
                 /quarter_cols;
       start += quarter_cols;
     }
-    double quarter_rows = m.nrows() / 4.0;
+    double quarter_rows = row_holes.size() / 4.0;
     start = 0.0;
     for (size_t i = 0; i < 4; ++i) {
-      *(buf++) = nholes_1d(m.row_begin() + size_t(start),
-               m.row_begin() + size_t(start) + size_t(quarter_rows))
+      *(buf++) = RunStatistics::nholes(row_holes, size_t(start),
+                                       size_t(start) + size_t(quarter_rows))
                / quarter_rows;
       start += quarter_rows;
     }
   }
 
+  template<class T>
+  void nholes_extended(const T& m, feature_t* buf) {
+    RunStatistics stats(m, RUN_STATS_HOLES);
+    nholes_extended_from_holes(stats.col_holes, stats.row_holes, buf);
+  }
+
   template<class T>
   void area(const T& image, feature_t* buf) {
     *buf = feature_t(image.nrows() * image.ncols()) / image.scaling();
@@ -351,29 +863,77 @@ namespace Gamera {
   // the volume of the image.
   //
   template<class T>
-  void compactness(const T& image, feature_t* buf) {
+  feature_t compactness_from_stats(const T& image, const RunStatistics& stats) {
     // I've converted this to a more efficient method.  Rather than
     // using (volume(outline) / volume(original)), I just use
     // volume(dilated) - volume(original) / volume(original).  This
     // prevents the unnecessary xor_image pixel-by-pixel operation from
-    // happening.  We still need to create a copy to dilate, however,
-    // since we don't want to change the original.
+    // happening.  The black pixels of the dilated image are counted
+    // from the black runs (see RunStatistics), so that no dilated copy
+    // is needed.  Like erode_dilate, images with less than three rows
+    // or columns are not dilated.
     // as dilate does not extend beyond the image borders,
     // we must compute the surface of the border pixels separately
-    feature_t vol = volume(image);
     feature_t outer_vol = compactness_border_outer_volume(image);
+    size_t nrows = image.nrows(), ncols = image.ncols();
+    feature_t vol = feature_t(stats.black) / (nrows * ncols);
     feature_t result;
     if (vol == 0)
       result = std::numeric_limits<feature_t>::max();
     else {
-      typedef typename ImageFactory<T>::view_type* view_type;
-      view_type copy = erode_dilate(image, 1, 0, 0);
-      // dilate(*copy);
-      result = (volume(*copy) + outer_vol - vol) / vol;
-      delete copy->data();
-      delete copy;
+      size_t dilated = (nrows < 3 || ncols < 3) ? stats.black : stats.dilated;
+      result = (feature_t(dilated) / (nrows * ncols) + outer_vol - vol) / vol;
     }
-    *buf = result;
+    return result;
+  }
+
+  template<class T>
+  void compactness(const T& image, feature_t* buf) {
+    *buf = compactness_from_stats(image, RunStatistics(image, RUN_STATS_DILATION));
+  }
+
+  // the regions of volume16regions (n = 4) and volume64regions (n = 8),
+  // relative to the image
+  template<class T>
+  void volume_regions(const T& image, size_t n, std::vector<Rect>& regions) {
+    regions.reserve(regions.size() + n * n);
+    double rows = image.nrows() / double(n);
+    double cols = image.ncols() / double(n);
+    size_t rows_int = size_t(rows);
+    size_t cols_int = size_t(cols);
+    Dim size(cols_int, rows_int);
+    if (size.ncols() == 0)
+        size.ncols(1);
+    if (size.nrows() == 0)
+        size.nrows(1);
+    double start_col = double(image.offset_x());
+    for (size_t i = 0; i < n; ++i) {
+      double start_row = double(image.offset_y());
+      for (size_t j = 0; j < n; ++j) {
+        regions.push_back(Rect(Point((size_t)start_col - image.offset_x(),
+                                     (size_t)start_row - image.offset_y()), size));
+        start_row += rows;
+        size.nrows( size_t(start_row + rows)-size_t(start_row));
+        if (size.nrows() == 0)
+            size.nrows(1);
+      }
+      start_col += cols;
+      size.ncols( size_t(start_col + cols) - size_t(start_col));
+      if (size.ncols() == 0)
+        size.ncols(1);
+    }
+  }
+
+  // the volumes of the regions of volume16regions and volume64regions,
+  // counted from the runs
+  template<class T>
+  void volume_regions_from_runs(const T& image, size_t n, feature_t* buf) {
+    std::vector<Rect> regions;
+    volume_regions(image, n, regions);
+    RunStatistics stats(image, 0, regions);
+    for (size_t i = 0; i < regions.size(); ++i)
+      *(buf++) = feature_t(stats.region_count(regions[i]))
+        / (regions[i].nrows() * regions[i].ncols());
   }
 
   //
@@ -384,6 +944,10 @@ namespace Gamera {
   //
   template<class T>
   void volume16regions(const T& image, feature_t* buf) {
+    if (BlackRunReader<T>::from_run_lengths) {
+      volume_regions_from_runs(image, 4, buf);
+      return;
+    }
     double rows = image.nrows() / 4.0;
     double cols = image.ncols() / 4.0;
     size_t rows_int = size_t(rows);
@@ -419,6 +983,10 @@ namespace Gamera {
   //
   template<class T>
   void volume64regions(const T& image, feature_t* buf) {
+    if (BlackRunReader<T>::from_run_lengths) {
+      volume_regions_from_runs(image, 8, buf);
+      return;
+    }
     double rows = image.nrows() / 8.0;
     double cols = image.ncols() / 8.0;
     size_t rows_int = size_t(rows);
@@ -510,102 +1078,164 @@ namespace Gamera {
   }
 
 
-  template<class T>
-  void zernike_moments(const T& image, feature_t* buf, size_t order_n) {
+  // The coefficients of the radial polynomials R_nm of the Zernike
+  // moments up to the given order, in the order of the features
+  // (A20, A22, A31, ...). coefficients[idx][s] is the coefficient
+  // of rho^(n-2s).
+  inline void zernike_coefficients(size_t order_n, std::vector<std::vector<double> >& coefficients) {
+    std::vector<double> factorial(order_n + 1, 1.0);
+    for (size_t i = 2; i <= order_n; ++i)
+      factorial[i] = factorial[i - 1] * i;
+    coefficients.clear();
+    for (size_t n = 2; n <= order_n; ++n) {
+      for (size_t m = n % 2; m <= n; m += 2) {
+        std::vector<double> c((n - m) / 2 + 1);
+        double sign = 1.0;
+        for (size_t s = 0; s < c.size(); ++s) {
+          c[s] = sign * factorial[n - s] /
+            (factorial[s] * factorial[(n + m) / 2 - s] * factorial[(n - m) / 2 - s]);
+          sign = -sign;
+        }
+        coefficients.push_back(c);
+      }
+    }
+  }
+
+  // Adds (or with sign = -1 removes) a pixel at the distance (dx, dy)
+  // from the centroid to the sums of zernike_moments_from_points.
+  inline void zernike_add_point(double dx, double dy, double sign,
+                                std::vector<std::vector<std::complex<double> > >& sums,
+                                std::vector<std::complex<double> >& w_pow,
+                                std::vector<double>& r2_pow) {
+    std::complex<double> w(dx, -dy);
+    double r2 = dx * dx + dy * dy;
+    w_pow[0] = sign;
+    for (size_t m = 1; m < w_pow.size(); ++m)
+      w_pow[m] = w_pow[m - 1] * w;
+    r2_pow[0] = 1.0;
+    for (size_t j = 1; j < r2_pow.size(); ++j)
+      r2_pow[j] = r2_pow[j - 1] * r2;
+    for (size_t m = 0; m < sums.size(); ++m)
+      for (size_t j = 0; j < sums[m].size(); ++j)
+        sums[m][j] += w_pow[m] * r2_pow[j];
+  }
+
+  // the Zernike moments of the black pixels given in row major order
+  // and the raw moments m00, m10 and m01 of the image
+  //
+  // The value of the complex Zernike polynomial V_nm at a pixel with
+  // the polar coordinates (rho, theta) relative to the centroid is
+  // R_nm(rho) exp(-i m theta), and rho^k exp(-i m theta) equals
+  // (dx - i dy)^m (dx^2 + dy^2)^((k-m)/2). The moments are therefore
+  // computed from sums of such powers in pixel units, which need
+  // neither square roots nor trigonometric functions, and the radius
+  // of the unit circle is found in the same pass. The sums are scaled
+  // to the unit circle afterwards. The results agree with those of
+  // zer_pol up to rounding errors, which stay below 1e-10 for
+  // glyphs of up to a few thousand pixels in width and height.
+  inline void zernike_moments_from_points(const std::vector<Point>& black,
+                                          feature_t m00, feature_t m10, feature_t m01,
+                                          feature_t* buf, size_t order_n) {
     size_t const max_order_n=order_n; 
     size_t num_features=0; // evaluated by max_order_n
-    double x_dist, y_dist, real_tmp, imag_tmp;
-    
     
     // number of features depends on maximum order
     for (size_t i=0 ; i<=max_order_n; i++)
         num_features += i/2 + 1;
     num_features -= 2; // A00 and A11 are constants
     
-    size_t m, n, idx;
-    double* tmp_real = new double[num_features];
-    double* tmp_imag = new double[num_features];
-    
-    memset(tmp_real, 0, num_features * sizeof(double));
-    memset(tmp_imag, 0, num_features * sizeof(double));
-    
-    feature_t* begin = buf;
-    for (size_t i = 0; i < num_features; ++i)                       
-      *(buf++) = 0.0;
-    buf = begin;
-    
-    const T* scaled_image = &image; // we do not scale
-
-    //compute center of mass and normalization factor m00
-    feature_t m00=0, m10=0, m01=0, dummy1=0, dummy2=0, dummy3=0;
-    moments_1d(scaled_image->row_begin(), scaled_image->row_end(), m00, m01, dummy1, dummy2);
-    moments_1d(scaled_image->col_begin(), scaled_image->col_end(), dummy1, m10, dummy2, dummy3);
+    for (size_t i = 0; i < num_features; ++i)
+      buf[i] = 0.0;
     
     double centroid_x = m10/m00;
     double centroid_y = m01/m00;
 
-    // we use a Zernike circle that includes the entire image
-    // beware however that some pixels can fall outside the circle
-    // by normalizing ZMs to be translation invariant, e.g. a large
-    // bunch of pixels in the upper left corner which draws the
-    // center to it, excludes pixels in the lower right corner.
+    // sums[m][j] is the sum of (dx - i dy)^m (dx^2 + dy^2)^j
+    std::vector<std::vector<std::complex<double> > > sums(max_order_n + 1);
+    for (size_t m = 0; m <= max_order_n; ++m)
+      sums[m].resize((max_order_n - m) / 2 + 1);
+    std::vector<std::complex<double> > w_pow(max_order_n + 1);
+    std::vector<double> r2_pow(max_order_n / 2 + 1);
 
+    // we use a Zernike circle that includes all black pixels
     double unit_circle_scale = 0;
-
-    for(size_t y = 0; y < scaled_image->nrows(); ++y) {
-      for (size_t x = 0; x < scaled_image->ncols(); ++x) {
-        if (is_black(scaled_image->get(Point(x,y)))) {
-          double scale_tmp = (centroid_x - (double)x)*(centroid_x - (double)x) + (centroid_y - (double)y)*(centroid_y - (double)y);
-          if(scale_tmp > unit_circle_scale)
-            unit_circle_scale = scale_tmp;
-        }
-      }
+    double min_dist = std::numeric_limits<double>::max();
+    for (std::vector<Point>::const_iterator p = black.begin(); p != black.end(); ++p) {
+      double dx = p->x() - centroid_x;
+      double dy = p->y() - centroid_y;
+      double scale_tmp = dx * dx + dy * dy;
+      if (scale_tmp > unit_circle_scale)
+        unit_circle_scale = scale_tmp;
+      min_dist = std::min(min_dist, std::max(std::fabs(dx), std::fabs(dy)));
+      zernike_add_point(dx, dy, 1.0, sums, w_pow, r2_pow);
     }
     
     // Make sure that the farthest pixel is within our analysis circle
     unit_circle_scale = 1.01 * sqrt(unit_circle_scale);
     if (unit_circle_scale < 0.00001) unit_circle_scale = 1.0;
-    
-    typename T::const_vec_iterator it = scaled_image->vec_begin();
-    for (size_t y = 0; y < scaled_image->nrows(); ++y) {
-      for (size_t x = 0; x < scaled_image->ncols(); ++x, ++it) {
-        if (is_black(*it)) {
-          x_dist = (x - centroid_x) / unit_circle_scale;
-          y_dist = (y - centroid_y) / unit_circle_scale;
-          if (abs(x_dist) > 0.00001 || abs(y_dist) > 0.00001) {   
-            for (n = 2, idx=0; n <= max_order_n; ++n) {
-              for (m = n%2; m <= n; m+=2) {
-                zer_pol(n, m, x_dist, y_dist, real_tmp, imag_tmp);
-                tmp_real[idx] += real_tmp;
-                tmp_imag[idx++] += imag_tmp;
-              }
-            }
-          }
-        }
+
+    // pixels at the centroid itself are left out
+    double min_dist_scaled = 0.00001 * unit_circle_scale;
+    if (min_dist <= min_dist_scaled) {
+      for (std::vector<Point>::const_iterator p = black.begin(); p != black.end(); ++p) {
+        double dx = p->x() - centroid_x;
+        double dy = p->y() - centroid_y;
+        if (std::fabs(dx) <= min_dist_scaled && std::fabs(dy) <= min_dist_scaled)
+          zernike_add_point(dx, dy, -1.0, sums, w_pow, r2_pow);
       }
     }
-    
-    for(idx = 0; idx<num_features; idx++)
-      buf[idx] = sqrt(tmp_real[idx]*tmp_real[idx] + tmp_imag[idx]*tmp_imag[idx]);
-    
-    // scale normalization by m00
-    for (size_t n = 2, idx=0; n <= max_order_n; ++n) {
+
+    std::vector<double> scale_pow(max_order_n + 1);
+    scale_pow[0] = 1.0;
+    for (size_t k = 1; k <= max_order_n; ++k)
+      scale_pow[k] = scale_pow[k - 1] * unit_circle_scale;
+
+    std::vector<std::vector<double> > coefficients;
+    zernike_coefficients(max_order_n, coefficients);
+    size_t idx = 0;
+    for (size_t n = 2; n <= max_order_n; ++n) {
+      // scale normalization by m00
       double multiplier = (n + 1) / M_PI;
       if (m00 != 0.0)
         multiplier /= m00;
-      for (m= n%2; m<= n; m+=2)
-        buf[idx++] *= multiplier;
+      for (size_t m = n % 2; m <= n; m += 2, ++idx) {
+        std::complex<double> moment(0.0, 0.0);
+        for (size_t s = 0; s < coefficients[idx].size(); ++s)
+          moment += sums[m][(n - m) / 2 - s] * (coefficients[idx][s] / scale_pow[n - 2 * s]);
+        buf[idx] = std::abs(moment) * multiplier;
+      }
     }
+  }
 
-    delete [] tmp_real;
-    delete [] tmp_imag;
+  template<class T>
+  void zernike_moments(const T& image, feature_t* buf, size_t order_n) {
+    // compute center of mass and normalization factor m00 while
+    // collecting the black pixels
+    feature_t m00=0, m10=0, m01=0;
+    std::vector<Point> black;
+    typename T::const_vec_iterator it = image.vec_begin();
+    for (size_t y = 0; y < image.nrows(); ++y) {
+      for (size_t x = 0; x < image.ncols(); ++x, ++it) {
+        if (is_black(*it)) {
+          black.push_back(Point(x, y));
+          m00 += 1;
+          m10 += x;
+          m01 += y;
+        }
+      }
+    }
+    zernike_moments_from_points(black, m00, m10, m01, buf, order_n);
   }
 
+  // Unlike zernike_moments, this sums up the absolute values of the
+  // Zernike polynomials at each pixel, which only depend on the radial
+  // polynomials R_nm. These are computed with per row and per column
+  // tables of the distances to the centroid, and white pixels are
+  // skipped.
   template<class T>
   FloatVector* zernike_moments_plugin(const T& image, int order_n) {
     size_t const max_order_n=(size_t)order_n;
     size_t num_features=0; // evaluated by max_order_n
-    double x_dist, y_dist, real_tmp, imag_tmp;
     size_t m, n, idx;  
     
     // number of features depends on maximum order
@@ -618,11 +1248,13 @@ namespace Gamera {
     //compute center of mass and normalization factor m00
     double m00, m10, m01;
     m00 = m10 = m01 = 0.0;
+    typename T::const_vec_iterator it = scaled_image->vec_begin();
     for(size_t y = 0; y < scaled_image->nrows(); ++y) {
-      for (size_t x = 0; x < scaled_image->ncols(); ++x) {
-        m00 += invert(scaled_image->get(Point(x,y)));
-        m10 += x*invert(scaled_image->get(Point(x,y)));
-        m01 += y*invert(scaled_image->get(Point(x,y)));
+      for (size_t x = 0; x < scaled_image->ncols(); ++x, ++it) {
+        double pixel_factor = invert(*it);
+        m00 += pixel_factor;
+        m10 += x*pixel_factor;
+        m01 += y*pixel_factor;
       }
     }
     double centroid_x = m10/m00;
@@ -653,21 +1285,39 @@ namespace Gamera {
     unit_circle_scale = 1.01 * sqrt(unit_circle_scale);
     if (unit_circle_scale < 0.00001) unit_circle_scale = 1.0;
 
+    std::vector<double> x_dist(scaled_image->ncols()), y_dist(scaled_image->nrows());
+    for (size_t x = 0; x < x_dist.size(); ++x)
+      x_dist[x] = (x - centroid_x) / unit_circle_scale;
+    for (size_t y = 0; y < y_dist.size(); ++y)
+      y_dist[y] = (y - centroid_y) / unit_circle_scale;
+
+    std::vector<std::vector<double> > coefficients;
+    zernike_coefficients(max_order_n, coefficients);
+    std::vector<double> rho_pow(max_order_n + 1);
+    rho_pow[0] = 1.0;
+
     FloatVector* result = new FloatVector(num_features, 0.0);
     double pixel_factor;
-    typename T::const_vec_iterator it = scaled_image->vec_begin();
+    it = scaled_image->vec_begin();
     for (size_t y = 0; y < scaled_image->nrows(); ++y) {
       for (size_t x = 0; x < scaled_image->ncols(); ++x, ++it) {
         pixel_factor = invert(*it);
-        x_dist = (x - centroid_x) / unit_circle_scale;
-        y_dist = (y - centroid_y) / unit_circle_scale;
-        if (abs(x_dist) > 0.00001 || abs(y_dist) > 0.00001) {   
-          for (n = 2, idx=0; n <= max_order_n; ++n) {
-            for (m = n%2; m <= n; m+=2) {
-              zer_pol(n, m, x_dist, y_dist, real_tmp, imag_tmp);
-              result->at(idx) += pixel_factor*sqrt(real_tmp*real_tmp + imag_tmp*imag_tmp);
-              idx++;
-            }
+        if (pixel_factor == 0)
+          continue;
+        if (std::fabs(x_dist[x]) <= 0.00001 && std::fabs(y_dist[y]) <= 0.00001)
+          continue;
+        double r2 = x_dist[x]*x_dist[x] + y_dist[y]*y_dist[y];
+        if (r2 > 1.0)
+          continue;
+        rho_pow[1] = sqrt(r2);
+        for (size_t k = 2; k <= max_order_n; ++k)
+          rho_pow[k] = rho_pow[k - 1] * rho_pow[1];
+        for (n = 2, idx=0; n <= max_order_n; ++n) {
+          for (m = n%2; m <= n; m+=2, ++idx) {
+            double Rnm = 0.0;
+            for (size_t s = 0; s < coefficients[idx].size(); ++s)
+              Rnm += coefficients[idx][s] * rho_pow[n - 2 * s];
+            (*result)[idx] += pixel_factor*std::fabs(Rnm);
           }
         }
       }
@@ -679,17 +1329,55 @@ namespace Gamera {
       if (m00 != 0.0)
         multiplier /= m00;
       for (m= n%2; m<= n; m+=2)
-        result->at(idx++) *= multiplier;
+        (*result)[idx++] *= multiplier;
     }
 
     return result;
   }
 
+  //
+  // Scratch images
+  //
+  // FeatureScratch keeps the temporary images that some features need,
+  // so that they are allocated once for a whole list of images instead
+  // of once per image. Its buffers only grow, up to the size of the
+  // largest image they have been used for, and are freed with it.
+  //
+  class FeatureScratch {
+  public:
+    FeatureScratch() {
+      m_data[0] = m_data[1] = 0;
+    }
+    ~FeatureScratch() {
+      delete m_data[0];
+      delete m_data[1];
+    }
+    // a view of the given size on buffer 0 or 1, with undefined contents
+    OneBitImageView image(size_t which, const Dim& dim) {
+      OneBitImageData*& data = m_data[which];
+      if (data == 0 || data->ncols() < dim.ncols() || data->nrows() < dim.nrows()) {
+        Dim size(dim.ncols(), dim.nrows());
+        if (data != 0) {
+          size = Dim(std::max(dim.ncols(), data->ncols()),
+                     std::max(dim.nrows(), data->nrows()));
+          delete data;
+          data = 0;
+        }
+        data = new OneBitImageData(size);
+      }
+      return OneBitImageView(*data, Point(0, 0), dim);
+    }
+  private:
+    FeatureScratch(const FeatureScratch&);
+    FeatureScratch& operator=(const FeatureScratch&);
+    OneBitImageData* m_data[2];
+  };
+
   //
   // Skeleton features
   //
   template<class T>
-  void skeleton_features(const T& image, feature_t* buf) {
+  void skeleton_features(const T& image, feature_t* buf, FeatureScratch& scratch) {
     if (image.nrows() == 1 || image.ncols() == 1) {
       *(buf++) = 0.0;
       *(buf++) = 0.0;
@@ -700,22 +1388,26 @@ namespace Gamera {
       return;
     }
 
-    typedef typename ImageFactory<T>::view_type* view_type;
-    view_type skel = thin_lc(image);
+    // the same as thin_lc, but in the buffers of scratch
+    OneBitImageView skel = scratch.image(0, image.dim());
+    OneBitImageView flag = scratch.image(1, image.dim());
+    image_copy_fill(image, skel);
+    thin_zs_in_place(skel, flag);
+    thin_lc_in_place(skel);
     unsigned char p;
     size_t T_joints = 0, X_joints = 0, bend_points = 0;
     size_t end_points = 0, total_pixels = 0;
     size_t center_x = 0, center_y = 0;
-    for (size_t y = 0; y < skel->nrows(); ++y) {
+    for (size_t y = 0; y < skel.nrows(); ++y) {
       size_t y_before = (y == 0) ? 1 : y - 1;
-      size_t y_after = (y == skel->nrows() - 1) ? skel->nrows() - 2 : y + 1;
-      for (size_t x = 0; x < skel->ncols(); ++x) {
-    if (is_black(skel->get(Point(x, y)))) {
+      size_t y_after = (y == skel.nrows() - 1) ? skel.nrows() - 2 : y + 1;
+      for (size_t x = 0; x < skel.ncols(); ++x) {
+    if (is_black(skel.get(Point(x, y)))) {
       ++total_pixels;
       center_x += x;
       center_y += y;
       size_t N, S;
-      thin_zs_get(y, y_before, y_after, x, *skel, p, N, S);
+      thin_zs_get(y, y_before, y_after, x, skel, p, N, S);
       switch (N) {
       case 4:
         ++X_joints;
@@ -746,8 +1438,8 @@ namespace Gamera {
     center_x /= total_pixels;
     size_t x_axis_crossings = 0;
     bool last_pixel = false;
-    for (size_t y = 0; y < skel->nrows(); ++y)
-      if (is_black(skel->get(Point(center_x, y))) && !last_pixel) {
+    for (size_t y = 0; y < skel.nrows(); ++y)
+      if (is_black(skel.get(Point(center_x, y))) && !last_pixel) {
         last_pixel = true;
         ++x_axis_crossings;
       } else {
@@ -757,17 +1449,15 @@ namespace Gamera {
     center_y /= total_pixels;
     size_t y_axis_crossings = 0;
     last_pixel = false;
-    for (size_t x = 0; x < skel->ncols(); ++x) {
-      if (is_black(skel->get(Point(x, center_y))) && !last_pixel) {
+    for (size_t x = 0; x < skel.ncols(); ++x) {
+      if (is_black(skel.get(Point(x, center_y))) && !last_pixel) {
         last_pixel = true;
         ++y_axis_crossings;
       } else {
         last_pixel = false;
       }
     }
-    
-    delete skel->data();
-    delete skel;
+
 
     *(buf++) = feature_t(X_joints);
     *(buf++) = feature_t(T_joints);
@@ -777,6 +1467,12 @@ namespace Gamera {
     *buf = feature_t(y_axis_crossings);
   }
 
+  template<class T>
+  void skeleton_features(const T& image, feature_t* buf) {
+    FeatureScratch scratch;
+    skeleton_features(image, buf, scratch);
+  }
+
   //
   // Top Bottom
   //
@@ -856,5 +1552,219 @@ namespace Gamera {
     delete proj_y;
     delete rotated_image;
   }
+
+  //
+  // Fused feature extraction
+  //
+  // fused_features computes several of the built-in features at once and
+  // writes each of them to the features array of the image at the given
+  // offset. All of the statistics of the black pixels (see
+  // RunStatistics) are gathered in a single pass over the runs, so that the
+  // features only need as many passes as they need transformed copies
+  // of the image (skeleton_features and diagonal_projection). The
+  // results are the same as those of the feature functions themselves.
+  //
+  // The feature numbers must match the list _fused_features in
+  // features.py.
+  //
+  enum FusedFeature {
+    FUSED_AREA, FUSED_ASPECT_RATIO, FUSED_BLACK_AREA, FUSED_COMPACTNESS,
+    FUSED_DIAGONAL_PROJECTION, FUSED_MOMENTS, FUSED_NCOLS_FEATURE,
+    FUSED_NHOLES, FUSED_NHOLES_EXTENDED, FUSED_NROWS_FEATURE,
+    FUSED_SKELETON_FEATURES, FUSED_TOP_BOTTOM, FUSED_VOLUME,
+    FUSED_VOLUME16REGIONS, FUSED_VOLUME64REGIONS, FUSED_ZERNIKE_MOMENTS,
+    FUSED_NUM_FEATURES
+  };
+
+  static const size_t fused_feature_lengths[FUSED_NUM_FEATURES] = {
+    1, 1, 1, 1, 1, 9, 1, 2, 8, 1, 6, 2, 1, 16, 64, 14
+  };
+
+  template<class T>
+  void fused_features(const T& image, const IntVector* features, const IntVector* offsets,
+                      FeatureScratch& scratch) {
+    if (features->size() != offsets->size())
+      throw std::invalid_argument("fused_features: there must be an offset for each feature.");
+    bool wanted[FUSED_NUM_FEATURES];
+    std::fill(wanted, wanted + FUSED_NUM_FEATURES, false);
+    for (size_t i = 0; i < features->size(); ++i) {
+      int feature = (*features)[i];
+      if (feature < 0 || feature >= FUSED_NUM_FEATURES)
+        throw std::invalid_argument("fused_features: unknown feature.");
+      if ((*offsets)[i] < 0 || image.features == 0 ||
+          size_t((*offsets)[i]) + fused_feature_lengths[feature] > size_t(image.features_len))
+        throw std::range_error("fused_features: feature outside of the features array.");
+      wanted[feature] = true;
+    }
+
+    // what has to be collected in the pass over the runs
+    int what = 0;
+    if (wanted[FUSED_TOP_BOTTOM])
+      what |= RUN_STATS_PROJECTIONS;
+    if (wanted[FUSED_MOMENTS])
+      what |= RUN_STATS_MOMENTS;
+    if (wanted[FUSED_NHOLES] || wanted[FUSED_NHOLES_EXTENDED])
+      what |= RUN_STATS_HOLES;
+    if (wanted[FUSED_ZERNIKE_MOMENTS])
+      what |= RUN_STATS_PROJECTIONS | RUN_STATS_POINTS;
+    if (wanted[FUSED_COMPACTNESS])
+      what |= RUN_STATS_DILATION;
+
+    size_t nrows = image.nrows(), ncols = image.ncols();
+    std::vector<Rect> regions16, regions64;
+    if (wanted[FUSED_VOLUME16REGIONS])
+      volume_regions(image, 4, regions16);
+    if (wanted[FUSED_VOLUME64REGIONS])
+      volume_regions(image, 8, regions64);
+    std::vector<Rect> regions(regions16);
+    regions.insert(regions.end(), regions64.begin(), regions64.end());
+    RunStatistics stats(image, what, regions);
+    size_t black = stats.black;
+
+    feature_t m00, m01, m02, m03, m10, m20, m30, m11, m12, m21;
+    stats.raw_moments(m00, m01, m02, m03, m10, m20, m30, m11, m12, m21);
+
+    for (size_t i = 0; i < features->size(); ++i) {
+      feature_t* buf = image.features + (*offsets)[i];
+      switch ((*features)[i]) {
+      case FUSED_AREA:
+        area(image, buf);
+        break;
+      case FUSED_ASPECT_RATIO:
+        aspect_ratio(image, buf);
+        break;
+      case FUSED_BLACK_AREA:
+        *buf = feature_t(black);
+        break;
+      case FUSED_COMPACTNESS:
+        *buf = compactness_from_stats(image, stats);
+        break;
+      case FUSED_DIAGONAL_PROJECTION:
+        diagonal_projection(image, buf);
+        break;
+      case FUSED_MOMENTS:
+        moments_from_raw(m00, m01, m02, m03, m10, m20, m30, m11, m12, m21,
+                         nrows, ncols, buf);
+        break;
+      case FUSED_NCOLS_FEATURE:
+        ncols_feature(image, buf);
+        break;
+      case FUSED_NHOLES:
+        *(buf++) = (feature_t)RunStatistics::nholes(stats.col_holes, 0, ncols) / ncols;
+        *buf = (feature_t)RunStatistics::nholes(stats.row_holes, 0, nrows) / nrows;
+        break;
+      case FUSED_NHOLES_EXTENDED:
+        nholes_extended_from_holes(stats.col_holes, stats.row_holes, buf);
+        break;
+      case FUSED_NROWS_FEATURE:
+        nrows_feature(image, buf);
+        break;
+      case FUSED_SKELETON_FEATURES:
+        skeleton_features(image, buf, scratch);
+        break;
+      case FUSED_TOP_BOTTOM: {
+        // like top_bottom, the bottom is searched for in all rows but the first
+        int top = -1, bottom = -1;
+        for (size_t y = 0; y < nrows && top == -1; ++y)
+          if (stats.row_count[y])
+            top = int(y);
+        for (size_t y = nrows - 1; y > 0 && bottom == -1; --y)
+          if (stats.row_count[y])
+            bottom = int(y);
+        if (top == -1) {
+          *(buf++) = 1.0;
+          *buf = 0.0;
+        } else {
+          *(buf++) = feature_t(top) / feature_t(nrows);
+          *buf = feature_t(bottom) / feature_t(nrows);
+        }
+        break;
+      }
+      case FUSED_VOLUME:
+        *buf = feature_t(black) / (nrows * ncols);
+        break;
+      case FUSED_VOLUME16REGIONS:
+      case FUSED_VOLUME64REGIONS: {
+        const std::vector<Rect>& r =
+          ((*features)[i] == FUSED_VOLUME16REGIONS) ? regions16 : regions64;
+        for (size_t j = 0; j < r.size(); ++j)
+          *(buf++) = feature_t(stats.region_count(r[j])) / (r[j].nrows() * r[j].ncols());
+        break;
+      }
+      case FUSED_ZERNIKE_MOMENTS:
+        zernike_moments_from_points(stats.points, m00, m10, m01, buf, 6);
+        break;
+      }
+    }
+  }
+
+  template<class T>
+  void fused_features(const T& image, const IntVector* features, const IntVector* offsets) {
+    FeatureScratch scratch;
+    fused_features(image, features, offsets, scratch);
+  }
+
+  inline void fused_features_image(std::pair<Image*, int>& image, const IntVector* features,
+                                   const IntVector* offsets, FeatureScratch& scratch) {
+    switch (image.second) {
+    case ONEBITIMAGEVIEW:
+      fused_features(*((OneBitImageView*)image.first), features, offsets, scratch);
+      break;
+    case CC:
+      fused_features(*((Cc*)image.first), features, offsets, scratch);
+      break;
+    case ONEBITRLEIMAGEVIEW:
+      fused_features(*((OneBitRleImageView*)image.first), features, offsets, scratch);
+      break;
+    case RLECC:
+      fused_features(*((RleCc*)image.first), features, offsets, scratch);
+      break;
+    case MLCC:
+      fused_features(*((MlCc*)image.first), features, offsets, scratch);
+      break;
+    default:
+      throw std::invalid_argument("fused_features_list: all images must be ONEBIT.");
+    }
+  }
+
+  // fused_features_list runs fused_features for each image of a list.
+  // The interpreter lock is released meanwhile, and when OpenMP is
+  // available the images are spread over num_threads threads. Every
+  // image is handled by a single thread and only writes to its own
+  // features array, so the results do not depend on the number of
+  // threads. Each thread reuses its own scratch images for all of its
+  // images. The images must only be read through const views here:
+  // a non-const access could detach shared pixels (see
+  // ImageData::detach), whose share count relies on the interpreter
+  // lock.
+  inline void fused_features_list(ImageVector& images, const IntVector* features,
+                                  const IntVector* offsets, int num_threads) {
+    if (num_threads < 1)
+      throw std::invalid_argument("fused_features_list: num_threads must be at least 1.");
+    std::string error;
+    Py_BEGIN_ALLOW_THREADS
+#ifdef _OPENMP
+#pragma omp parallel num_threads(num_threads)
+#endif
+    {
+      FeatureScratch scratch;
+#ifdef _OPENMP
+#pragma omp for schedule(dynamic, 4)
+#endif
+      for (long i = 0; i < (long)images.size(); ++i) {
+        try {
+          fused_features_image(images[i], features, offsets, scratch);
+        } catch (std::exception& e) {
+#ifdef _OPENMP
+#pragma omp critical
+#endif
+          error = e.what();
+        }
+      }
+    }
+    Py_END_ALLOW_THREADS
+    if (!error.empty())
+      throw std::runtime_error(error);
+  }
 }
 #endif
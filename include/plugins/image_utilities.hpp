@@ -135,6 +135,123 @@ namespace Gamera {
 
   
 
+  /*
+    packed_image_copy
+
+    Creates a PACKED copy of a ONEBIT image.  The pixels of each row are
+    collected into whole words, so that the bits are not set one by one.
+    The overload for the other pixel types only throws, since they
+    cannot be stored with one bit per pixel.
+  */
+  template<class T>
+  Image* packed_image_copy(const T& a, OneBitPixel) {
+    using namespace PackedDataDetail;
+    OneBitPackedImageData* data = new OneBitPackedImageData(a.size(), a.origin());
+    OneBitPackedImageView* view = new OneBitPackedImageView(*data, a.origin(), a.size());
+    typename T::const_row_iterator row = a.row_begin();
+    for (size_t y = 0; row != a.row_end(); ++row, ++y) {
+      size_t pos = packed_row_start(*view, y);
+      word_type bits = 0;
+      size_t n = 0;
+      for (typename T::const_col_iterator col = row.begin(); col != row.end(); ++col) {
+        if (is_black(*col))
+          bits |= word_type(1) << n;
+        if (++n == WORD_BITS) {
+          data->set_word(pos, bits);
+          pos += WORD_BITS;
+          bits = 0;
+          n = 0;
+        }
+      }
+      if (n)
+        data->set_word(pos, bits, n);
+    }
+    image_copy_attributes(a, *view);
+    return view;
+  }
+
+  template<class T, class V>
+  Image* packed_image_copy(const T& a, V) {
+    throw std::runtime_error("Only ONEBIT images can have the storage format PACKED.");
+  }
+
+  /*
+    tiled_image_copy
+
+    Creates a TILED copy of an image.  Each tile is collected in a
+    buffer first, so that the pixels do not go through the proxies of
+    the tiled data, and tiles that are all white are not stored at all.
+  */
+  template<class T, class V>
+  Image* tiled_image_copy(const T& a, V) {
+    typedef TiledImageData<V> data_type;
+    data_type* data = new data_type(a.size(), a.origin());
+    ImageView<data_type>* view = new ImageView<data_type>(*data, a.origin(), a.size());
+    Dim tile_dim = data->tile_dim();
+    std::vector<V> buffer(data->tile_size(), pixel_traits<V>::default_value());
+    ImageAccessor<V> acc;
+    for (size_t ty = 0; ty < data->tiles_y(); ++ty) {
+      size_t y0 = ty * tile_dim.nrows();
+      size_t nrows = std::min(tile_dim.nrows(), a.nrows() - y0);
+      for (size_t tx = 0; tx < data->tiles_x(); ++tx) {
+        size_t x0 = tx * tile_dim.ncols();
+        size_t ncols = std::min(tile_dim.ncols(), a.ncols() - x0);
+        bool white = true;
+        typename T::const_row_iterator row = a.row_begin() + y0;
+        for (size_t y = 0; y < nrows; ++y, ++row) {
+          typename T::const_col_iterator col = row.begin() + x0;
+          typename std::vector<V>::iterator dest = buffer.begin() + y * tile_dim.ncols();
+          for (size_t x = 0; x < ncols; ++x, ++col, ++dest) {
+            *dest = acc.get(col);
+            if (!(*dest == pixel_traits<V>::default_value()))
+              white = false;
+          }
+        }
+        if (!white)
+          std::copy(buffer.begin(), buffer.end(),
+                    data->writable_tile(ty * data->tiles_x() + tx));
+      }
+    }
+    image_copy_attributes(a, *view);
+    return view;
+  }
+
+  template<class T>
+  Image* tiled_image_copy(const T& a, FloatPixel) {
+    throw std::runtime_error("FLOAT images can not have the storage format TILED.");
+  }
+
+  template<class T>
+  Image* tiled_image_copy(const T& a, ComplexPixel) {
+    throw std::runtime_error("COMPLEX images can not have the storage format TILED.");
+  }
+
+  /*
+    shared_image_copy
+
+    A DENSE copy of an image that covers all of its data shares the
+    pixels with it, until one of the two is changed (see
+    ImageData::shared_copy).  For all other images (subimages, connected
+    components, the other storage formats) it returns 0, and the pixels
+    have to be copied.
+  */
+  template<class T>
+  Image* shared_image_copy(T& a) {
+    return 0;
+  }
+
+  template<class V>
+  Image* shared_image_copy(ImageView<ImageData<V> >& a) {
+    ImageData<V>* src = a.data();
+    if (a.nrows() != src->nrows() || a.ncols() != src->ncols())
+      return 0;
+    ImageData<V>* data = src->shared_copy();
+    ImageView<ImageData<V> >* view =
+      new ImageView<ImageData<V> >(*data, a.origin(), a.size());
+    image_copy_attributes(a, *view);
+    return view;
+  }
+
   /*
     image_copy
 
@@ -148,6 +265,9 @@ namespace Gamera {
     if (a.ul_x() > a.lr_x() || a.ul_y() > a.lr_y())
       throw std::exception();
     if (storage_format == DENSE) {
+      Image* shared = shared_image_copy(a);
+      if (shared != 0)
+        return shared;
       typename ImageFactory<T>::dense_data_type* data =
         new typename ImageFactory<T>::dense_data_type(a.size(), a.origin());
       typename ImageFactory<T>::dense_view_type* view =
@@ -160,6 +280,10 @@ namespace Gamera {
         throw;
       }
       return view;
+    } else if (storage_format == PACKED) {
+      return packed_image_copy(a, typename T::value_type());
+    } else if (storage_format == TILED) {
+      return tiled_image_copy(a, typename T::value_type());
     } else {
       typename ImageFactory<T>::rle_data_type* data =
         new typename ImageFactory<T>::rle_data_type(a.size(), a.origin());
@@ -513,7 +637,7 @@ namespace Gamera {
     Point lr(max_x + image.offset_x(), max_y + image.offset_y());
 
     // Create the view and return it
-    res = new view_type(*image.data(), ul, lr);
+    res = new view_type(*((typename T::data_type*)image.data()), ul, lr);
     return res;
   }
 
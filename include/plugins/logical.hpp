@@ -79,6 +79,57 @@ logical_combine(T& a, const U& b, const FUNCTOR& functor, bool in_place) {
   }
 }
 
+/*
+  When both images are PACKED, the functor is applied to whole words
+  of pixels at once.  combine_words gives the word-wide version of each
+  of the functors used below.
+*/
+inline PackedDataDetail::word_type
+combine_words(const std::logical_and<bool>&, PackedDataDetail::word_type a,
+              PackedDataDetail::word_type b) {
+  return a & b;
+}
+
+inline PackedDataDetail::word_type
+combine_words(const std::logical_or<bool>&, PackedDataDetail::word_type a,
+              PackedDataDetail::word_type b) {
+  return a | b;
+}
+
+template<class FUNCTOR>
+OneBitPackedImageView*
+logical_combine(OneBitPackedImageView& a, const OneBitPackedImageView& b,
+                const FUNCTOR& functor, bool in_place) {
+  using namespace PackedDataDetail;
+  if (a.nrows() != b.nrows() || a.ncols() != b.ncols())
+    throw std::runtime_error("Images must be the same size.");
+
+  OneBitPackedImageData* dest_data = NULL;
+  OneBitPackedImageView* dest = &a;
+  if (!in_place) {
+    dest_data = new OneBitPackedImageData(a.size(), a.origin());
+    dest = new OneBitPackedImageView(*dest_data);
+  }
+  const OneBitPackedImageData* ad = a.data();
+  const OneBitPackedImageData* bd = b.data();
+  OneBitPackedImageData* dd = dest->data();
+  for (size_t y = 0; y < a.nrows(); ++y) {
+    size_t pa = packed_row_start(a, y);
+    size_t pb = packed_row_start(b, y);
+    size_t pd = packed_row_start(*dest, y);
+    for (size_t x = 0; x < a.ncols(); x += WORD_BITS) {
+      size_t n = std::min(WORD_BITS, a.ncols() - x);
+      dd->set_word(pd + x, combine_words(functor, ad->get_word(pa + x, n),
+                                         bd->get_word(pb + x, n)), n);
+    }
+  }
+
+  // Returning NULL is converted to None by the wrapper mechanism
+  if (in_place)
+    return NULL;
+  return dest;
+}
+
 template<class T, class U>
 typename ImageFactory<T>::view_type* 
 and_image(T& a, const U& b, bool in_place=true) {
@@ -100,6 +151,12 @@ struct logical_xor : public std::binary_function<_Tp,_Tp,bool>
   bool operator()(const _Tp& __x, const _Tp& __y) const { return __x ^ __y; }
 };
 
+inline PackedDataDetail::word_type
+combine_words(const logical_xor<bool>&, PackedDataDetail::word_type a,
+              PackedDataDetail::word_type b) {
+  return a ^ b;
+}
+
 template<class T, class U>
 typename ImageFactory<T>::view_type* 
 xor_image(T& a, const U& b, bool in_place=true) {
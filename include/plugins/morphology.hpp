@@ -341,6 +341,93 @@ namespace Gamera {
 
 	return result;
   }
+
+  /*
+    One step of erosion (erode = true) or dilation with the 3x3 square
+    for PACKED images, computed a word at a time.  Pixels outside the
+    image count as white, which gives the same borders as
+    erode_with_structure and dilate_with_structure.
+  */
+  inline PackedDataDetail::word_type
+  packed_row_neighbours(const OneBitPackedImageView& image, size_t y,
+                        size_t x, size_t n, bool erode) {
+    using namespace PackedDataDetail;
+    const OneBitPackedImageData* data = image.data();
+    size_t pos = packed_row_start(image, y) + x;
+    word_type center = data->get_word(pos, n);
+    word_type left = center << 1;
+    if (x > 0)
+      left |= data->get(pos - 1);
+    word_type right = center >> 1;
+    if (x + n < image.ncols())
+      right |= word_type(data->get(pos + n)) << (n - 1);
+    if (erode)
+      return center & left & right & low_bits(n);
+    return (center | left | right) & low_bits(n);
+  }
+
+  inline void erode_dilate_packed_step(const OneBitPackedImageView& src,
+                                       OneBitPackedImageView& dest, bool erode) {
+    using namespace PackedDataDetail;
+    OneBitPackedImageData* dest_data = dest.data();
+    for (size_t y = 0; y < src.nrows(); ++y) {
+      size_t pos = packed_row_start(dest, y);
+      for (size_t x = 0; x < src.ncols(); x += WORD_BITS) {
+        size_t n = std::min(WORD_BITS, src.ncols() - x);
+        word_type above = 0, below = 0;
+        if (y > 0)
+          above = packed_row_neighbours(src, y - 1, x, n, erode);
+        if (y + 1 < src.nrows())
+          below = packed_row_neighbours(src, y + 1, x, n, erode);
+        word_type here = packed_row_neighbours(src, y, x, n, erode);
+        dest_data->set_word(pos + x, erode ? above & here & below
+                                           : above | here | below, n);
+      }
+    }
+  }
+
+  /* for PACKED images the square structuring element is applied as
+     repeated 3x3 steps on whole words; the octagonal one is computed
+     on a DENSE copy */
+  template<>
+  ImageFactory<OneBitPackedImageView>::view_type* erode_dilate<OneBitPackedImageView>(OneBitPackedImageView &src, const size_t times, int direction, int geo){
+    typedef OneBitPackedImageView view_type;
+
+    if (src.nrows() < 3 || src.ncols() < 3 || times < 1)
+      return simple_image_copy(src);
+
+    if (geo) {
+      OneBitImageData dense_data(src.size(), src.origin());
+      OneBitImageView dense(dense_data);
+      image_copy_fill(src, dense);
+      OneBitImageView* result = erode_dilate(dense, times, direction, geo);
+      Image* packed = image_copy(*result, PACKED);
+      delete result->data();
+      delete result;
+      return (view_type*)packed;
+    }
+
+    OneBitPackedImageData* dest_data = new OneBitPackedImageData(src.size(), src.origin());
+    view_type* dest = new view_type(*dest_data, src.origin(), src.size());
+    OneBitPackedImageData* tmp_data = NULL;
+    view_type* tmp = NULL;
+    if (times > 1) {
+      tmp_data = new OneBitPackedImageData(src.size(), src.origin());
+      tmp = new view_type(*tmp_data, src.origin(), src.size());
+    }
+    // alternate between dest and tmp so that the last step writes dest
+    const view_type* from = &src;
+    for (size_t i = 0; i < times; ++i) {
+      view_type* to = ((times - i) % 2) ? dest : tmp;
+      erode_dilate_packed_step(*from, *to, direction != 0);
+      from = to;
+    }
+    if (tmp) {
+      delete tmp;
+      delete tmp_data;
+    }
+    return dest;
+  }
   
   template<class T>
   void erode(T& image) {
@@ -198,6 +198,8 @@ void load_PNG_onebit(T& image, png_structp& png_ptr) {
 }
 
 Image* load_PNG(const char* filename, int storage) {
+  if (storage == TILED)
+    throw std::runtime_error("PNG files can not be loaded as TILED images.");
   FILE* fp;
   png_structp png_ptr;
   png_infop info_ptr, end_info;
@@ -222,9 +224,9 @@ Image* load_PNG(const char* filename, int storage) {
 
   if (color_type == PNG_COLOR_TYPE_RGB || color_type == PNG_COLOR_TYPE_PALETTE ||
       color_type == PNG_COLOR_TYPE_RGB_ALPHA) {
-    if (storage == RLE) {
+    if (storage != DENSE) {
       PNG_close(fp, png_ptr, info_ptr, end_info);
-      throw std::runtime_error("Pixel type must be OneBit to use RLE data.");
+      throw std::runtime_error("Pixel type must be OneBit to use RLE or PACKED data.");
     }
     if (bit_depth > 8) {
 #if PNG_LIBPNG_VER >= 10504
@@ -260,6 +262,14 @@ Image* load_PNG(const char* filename, int storage) {
         //Damon: end    
         PNG_close(fp, png_ptr, info_ptr, end_info);
         return image;
+      } else if (storage == PACKED) {
+        typedef TypeIdImageFactory<ONEBIT, PACKED> fact;
+        fact::image_type* image =
+          fact::create(Point(0, 0), Dim(width, height));
+        load_PNG_onebit(*image, png_ptr);
+        image->resolution(reso);
+        PNG_close(fp, png_ptr, info_ptr, end_info);
+        return image;
       } else {
         typedef TypeIdImageFactory<ONEBIT, RLE> fact;
         fact::image_type* image =
@@ -272,9 +282,9 @@ Image* load_PNG(const char* filename, int storage) {
         return image;
       } 
     } else if (bit_depth <= 8) {
-      if (storage == RLE) {
+      if (storage != DENSE) {
         PNG_close(fp, png_ptr, info_ptr, end_info);
-        throw std::runtime_error("Pixel type must be OneBit to use RLE data.");
+        throw std::runtime_error("Pixel type must be OneBit to use RLE or PACKED data.");
       }
       if (bit_depth < 8) {
 #if PNG_LIBPNG_VER > 10399
@@ -293,9 +303,9 @@ Image* load_PNG(const char* filename, int storage) {
       PNG_close(fp, png_ptr, info_ptr, end_info);
       return image;
     } else if (bit_depth == 16) {
-      if (storage == RLE) {
+      if (storage != DENSE) {
         PNG_close(fp, png_ptr, info_ptr, end_info);
-        throw std::runtime_error("Pixel type must be OneBit to use RLE data.");
+        throw std::runtime_error("Pixel type must be OneBit to use RLE or PACKED data.");
       }
       typedef TypeIdImageFactory<GREY16, DENSE> fact_type;
       fact_type::image_type*
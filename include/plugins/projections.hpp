@@ -62,6 +62,21 @@ namespace Gamera {
     return projection(image.row_begin(), image.row_end());
   }
 
+  /*
+    For PACKED images, the black pixels are counted a word at a time.
+  */
+  inline IntVector* projection_rows(const OneBitPackedImageView& image) {
+    using namespace PackedDataDetail;
+    IntVector* proj = new IntVector(image.nrows(), 0);
+    const OneBitPackedImageData* data = image.data();
+    for (size_t r = 0; r != image.nrows(); ++r) {
+      size_t pos = packed_row_start(image, r);
+      for (size_t c = 0; c < image.ncols(); c += WORD_BITS)
+        (*proj)[r] += bit_count(data->get_word(pos + c, std::min(WORD_BITS, image.ncols() - c)));
+    }
+    return proj;
+  }
+
   /*
     Projection along the y axis (rows) of a portion
     on an image.
@@ -98,6 +113,21 @@ namespace Gamera {
     return proj;
   }
 
+  inline IntVector* projection_cols(const OneBitPackedImageView& image) {
+    using namespace PackedDataDetail;
+    IntVector* proj = new IntVector(image.ncols(), 0);
+    const OneBitPackedImageData* data = image.data();
+    for (size_t r = 0; r != image.nrows(); ++r) {
+      size_t pos = packed_row_start(image, r);
+      for (size_t c = 0; c < image.ncols(); c += WORD_BITS) {
+        word_type w = data->get_word(pos + c, std::min(WORD_BITS, image.ncols() - c));
+        for (; w; w &= w - 1)
+          (*proj)[c + first_bit(w)] += 1;
+      }
+    }
+    return proj;
+  }
+
   /*
     Projection along the y axis (rows) of a portion
     on an image.    
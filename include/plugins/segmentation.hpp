@@ -40,9 +40,10 @@
   will work on any matrix regardless of the storage format but only for
   OneBit or floating-point pixels.  The labeling works by setting the value
   in the matrix to the correct label (that is why OneBit matrices use
-  unsigned shorts instead of some bit-packed format).  This means that the
-  number of components is limited by the size of the pixel type (65536 for
-  unsigned shorts).
+  unsigned shorts instead of some bit-packed format).  When the labels of
+  the pixel type run out, the labeling is redone in a separate plane of
+  32-bit labels (see cc_analysis_label_plane), which is then kept with
+  the image data, so that the ccs can tell their pixels apart by it.
 
   Authors
   -------
@@ -90,12 +91,183 @@ namespace {
       }
     }
   };
+
+  /*
+    The equivalences of the 32-bit labels are kept in a union-find
+    forest instead, where each label points towards the smallest label
+    of its component.  Label 0 is the background.
+  */
+  struct label_forest : public std::vector<unsigned int> {
+    label_forest() : std::vector<unsigned int>(1, 0) { }
+    unsigned int add() {
+      if (size() == std::numeric_limits<unsigned int>::max())
+        throw std::range_error("Max label exceeded in the 32-bit label plane.");
+      push_back((unsigned int)size());
+      return back();
+    }
+    unsigned int find(unsigned int label) {
+      while ((*this)[label] != label) {
+        (*this)[label] = (*this)[(*this)[label]];
+        label = (*this)[label];
+      }
+      return label;
+    }
+    // joins the components of a and b (either may be the background)
+    unsigned int merge(unsigned int a, unsigned int b) {
+      if (b == 0)
+        return a;
+      if (a == 0)
+        return b;
+      a = find(a);
+      b = find(b);
+      if (a < b)
+        (*this)[b] = a;
+      else
+        (*this)[a] = b;
+      return std::min(a, b);
+    }
+  };
 }
 
 namespace Gamera {
 
+  /*
+    The label, bounding box and number of pixels of a connected
+    component.  The coordinates are those of the page, like the ones of
+    the image.
+  */
+  struct CcBox {
+    size_t label;
+    size_t ul_x, ul_y, lr_x, lr_y;
+    size_t area;
+  };
+  typedef std::vector<CcBox> CcBoxes;
+
+  /*
+    The position in the data of the pixel (x, y) of the image.
+  */
   template<class T>
-  ImageList* cc_analysis(T& image) {
+  inline size_t data_position(const T& image, size_t x, size_t y) {
+    return (y + image.offset_y() - image.data()->page_offset_y()) * image.data()->stride()
+      + x + image.offset_x() - image.data()->page_offset_x();
+  }
+
+  /*
+    cc_analysis_label_plane
+
+    Labels the components in a separate plane of 32-bit labels, for
+    pages on which the labeling runs out of pixel labels (pages with
+    more components than pixel labels, or many strokes that only join
+    further down).  The components are numbered from 2 up like in the
+    usual labeling, and the plane with their numbers is kept with the
+    data (see ImageDataBase::label_plane).  The pixels get pixel_label
+    of the numbers, so they are still black and labeled.
+  */
+  template<class T>
+  void cc_analysis_label_plane(T& image, CcBoxes& boxes) {
+    typedef typename T::value_type value_type;
+    const size_t nrows = image.nrows(), ncols = image.ncols();
+    std::vector<unsigned int> plane(nrows * ncols, 0);
+    label_forest forest;
+    ImageAccessor<value_type> acc;
+    typename T::Iterator row, col;
+
+    // First pass - provisional labels and their equivalences
+    row = image.upperLeft();
+    for (size_t y = 0; y < nrows; ++y, ++row.y) {
+      unsigned int* line = &plane[y * ncols];
+      unsigned int* above = y > 0 ? line - ncols : NULL;
+      col = row;
+      for (size_t x = 0; x < ncols; ++x, ++col.x) {
+        if (acc(col) == 0)
+          continue;
+        unsigned int label = 0;
+        if (x > 0)
+          label = forest.merge(label, line[x - 1]);
+        if (y > 0) {
+          if (x > 0)
+            label = forest.merge(label, above[x - 1]);
+          label = forest.merge(label, above[x]);
+          if (x + 1 < ncols)
+            label = forest.merge(label, above[x + 1]);
+        }
+        if (label == 0)
+          label = forest.add();
+        line[x] = label;
+      }
+    }
+
+    /*
+      Number the components in the order of their smallest label (which
+      is the order of their first pixel) and get their bounding boxes.
+    */
+    const size_t first_label = 2;
+    std::vector<size_t> component(forest.size(), 0);
+    size_t ncomponents = 0;
+    for (size_t i = 1; i < forest.size(); ++i) {
+      unsigned int root = forest.find(i);
+      if (root == i)
+        component[i] = ncomponents++;
+      else
+        component[i] = component[root];
+    }
+    std::vector<size_t> ul_x(ncomponents, ncols), ul_y(ncomponents, nrows);
+    std::vector<size_t> lr_x(ncomponents, 0), lr_y(ncomponents, 0);
+    std::vector<size_t> area(ncomponents, 0);
+
+    /*
+      Second pass - write the final labels to the plane of the data and
+      the pixels, and get the bounding boxes.  The plane of the data
+      covers all of the data, since other ccs may refer to it outside
+      of the image.
+    */
+    unsigned int* data_plane = image.data()->label_plane();
+    if (data_plane == 0) {
+      size_t size = image.data()->nrows() * image.data()->stride();
+      data_plane = new unsigned int[size];
+      std::fill(data_plane, data_plane + size, 0);
+      image.data()->label_plane(data_plane);
+    }
+    row = image.upperLeft();
+    for (size_t y = 0, i = 0; y < nrows; ++y, ++row.y) {
+      unsigned int* line = data_plane + data_position(image, 0, y);
+      col = row;
+      for (size_t x = 0; x < ncols; ++x, ++col.x, ++i) {
+        if (plane[i] == 0) {
+          line[x] = 0;
+          continue;
+        }
+        size_t c = component[plane[i]];
+        line[x] = (unsigned int)(first_label + c);
+        acc.set(pixel_label<value_type>(line[x]), col);
+        ul_x[c] = std::min(ul_x[c], x);
+        ul_y[c] = std::min(ul_y[c], y);
+        lr_x[c] = std::max(lr_x[c], x);
+        lr_y[c] = std::max(lr_y[c], y);
+        ++area[c];
+      }
+    }
+
+    boxes.resize(ncomponents);
+    for (size_t c = 0; c < ncomponents; ++c) {
+      CcBox& box = boxes[c];
+      box.label = first_label + c;
+      box.ul_x = ul_x[c] + image.offset_x();
+      box.ul_y = ul_y[c] + image.offset_y();
+      box.lr_x = lr_x[c] + image.offset_x();
+      box.lr_y = lr_y[c] + image.offset_y();
+      box.area = area[c];
+    }
+  }
+
+  /*
+    cc_label
+
+    Labels the pixels of the image and finds the connected components,
+    in the order of their labels.
+  */
+  template<class T>
+  void cc_label(T& image, CcBoxes& boxes) {
     equiv_table eq;
     // get the max value that can be held in the matrix
     typename T::value_type max_value = 
@@ -148,10 +320,16 @@ namespace Gamera {
           if (smallest_label > NE) smallest_label = NE;
         
           if (smallest_label == max_value) { // new object found!
-            acc.set(curr_label, col);
+            /*
+              The labels of the pixel type have run out.  The labels
+              written so far are all non-zero, so the black pixels can
+              still be told apart.
+            */
             if (curr_label == max_value) {
-              throw std::range_error("Max label exceeded - change OneBitPixel type in pixel.hpp");
+              cc_analysis_label_plane(image, boxes);
+              return;
             }
+            acc.set(curr_label, col);
             curr_label++;
           } else {
             acc.set(smallest_label, col);
@@ -229,65 +407,142 @@ namespace Gamera {
   
     /*
       Second Pass - relabel with equivalences and get bounding boxes
-      This used to use a map, but I think that it is worth the memory
-      use to use a vector for mapping the labels to the rects. The 
-      vector is a lot faster.
+      The boxes are kept in a vector indexed by the label, so that no
+      memory is allocated per component.  If the data has a label plane
+      from an earlier labeling, the labels are written there too.
     */
-    ImageList* ccs = NULL;
-
-    typedef std::vector<Rect*> map_type;
-    map_type rects(labels.size(), 0);
-    try {
-      row = image.upperLeft();
-      for (size_t i = 0; i < image.nrows(); i++, ++row.y) {
-        size_t j;
-        for (j = 0, col = row; j < image.ncols(); j++, ++col.x) {
-          // relabel
-          acc.set(labels[acc(col)], col); 
-          // put bounding box in map
-          typename T::value_type label = acc(col);
-          if (label) {
-            if (rects[label] == 0) {
-              rects[label] = new Rect(Point(j, i), Dim(1, 1));
-            } else {
-              if (j < rects[label]->ul_x())
-                rects[label]->ul_x(j);
-              if (j > rects[label]->lr_x())
-                rects[label]->lr_x(j);
-              if (i < rects[label]->ul_y())
-                rects[label]->ul_y(i);
-              if (i > rects[label]->lr_y())
-                rects[label]->lr_y(i);
-            }
+    std::vector<CcBox> by_label(labels.size());
+    for (size_t i = 0; i < by_label.size(); ++i)
+      by_label[i].area = 0;
+    unsigned int* data_plane = image.data()->label_plane();
+    row = image.upperLeft();
+    for (size_t i = 0; i < image.nrows(); i++, ++row.y) {
+      size_t j;
+      unsigned int* line = data_plane ? data_plane + data_position(image, 0, i) : 0;
+      for (j = 0, col = row; j < image.ncols(); j++, ++col.x) {
+        // relabel
+        acc.set(labels[acc(col)], col); 
+        typename T::value_type label = acc(col);
+        if (line)
+          line[j] = label;
+        if (label) {
+          CcBox& box = by_label[label];
+          if (box.area == 0) {
+            box.ul_x = box.lr_x = j;
+            box.ul_y = box.lr_y = i;
+          } else {
+            if (j < box.ul_x)
+              box.ul_x = j;
+            if (j > box.lr_x)
+              box.lr_x = j;
+            // the rows are visited from the top
+            box.lr_y = i;
           }
+          ++box.area;
         }
-        // if ((i % 20) == 0)
-        // progress_bar.step();
       }
+    }
 
-      // create ConnectedComponents
-      ccs = new ImageList();
-      try {
-        for (size_t i = 0; i < rects.size(); ++i) {
-          if (rects[i] != 0) {
-            ccs->push_back(new ConnectedComponent<typename T::data_type>(*((typename T::data_type*)image.data()),
-                                                                         OneBitPixel(i),
-                                                                         Point(rects[i]->offset_x() + image.offset_x(),
-                                                                               rects[i]->offset_y() + image.offset_y()),
-                                                                         rects[i]->dim()));
-            delete rects[i];
-          }
-        }
-      } catch (std::exception e) {
-        for (ImageList::iterator i = ccs->begin(); i != ccs->end(); ++i)
-          delete *i;
-        delete ccs;
-        throw;
+    boxes.clear();
+    for (size_t i = 0; i < by_label.size(); ++i) {
+      if (by_label[i].area != 0) {
+        CcBox box = by_label[i];
+        box.label = i;
+        box.ul_x += image.offset_x();
+        box.ul_y += image.offset_y();
+        box.lr_x += image.offset_x();
+        box.lr_y += image.offset_y();
+        boxes.push_back(box);
       }
+    }
+  }
+
+  /*
+    ccs_from_boxes
+
+    Creates a ConnectedComponent for each of the boxes found by cc_label.
+  */
+  template<class T>
+  ImageList* ccs_from_boxes(T& image, const CcBoxes& boxes) {
+    ImageList* ccs = new ImageList();
+    try {
+      for (CcBoxes::const_iterator i = boxes.begin(); i != boxes.end(); ++i) {
+        ccs->push_back(new ConnectedComponent<typename T::data_type>(*((typename T::data_type*)image.data()),
+                                                                     i->label,
+                                                                     Point(i->ul_x, i->ul_y),
+                                                                     Dim(i->lr_x - i->ul_x + 1,
+                                                                         i->lr_y - i->ul_y + 1)));
+      }
+    } catch (std::exception e) {
+      for (ImageList::iterator i = ccs->begin(); i != ccs->end(); ++i)
+        delete *i;
+      delete ccs;
+      throw;
+    }
+    return ccs;
+  }
+
+  template<class T>
+  ImageList* cc_analysis(T& image) {
+    CcBoxes boxes;
+    cc_label(image, boxes);
+    return ccs_from_boxes(image, boxes);
+  }
+
+  /*
+    _cc_boxes
+
+    Labels the image like cc_analysis, but only returns the label,
+    bounding box (ul_x, ul_y, lr_x, lr_y) and number of pixels of each
+    component, six ints per component.  CcList keeps them as separate
+    arrays and only creates the Cc objects when they are used.
+  */
+  template<class T>
+  IntVector* _cc_boxes(T& image) {
+    CcBoxes boxes;
+    cc_label(image, boxes);
+    IntVector* result = new IntVector(boxes.size() * 6);
+    IntVector::iterator out = result->begin();
+    for (CcBoxes::const_iterator i = boxes.begin(); i != boxes.end(); ++i) {
+      *(out++) = int(i->label);
+      *(out++) = int(i->ul_x);
+      *(out++) = int(i->ul_y);
+      *(out++) = int(i->lr_x);
+      *(out++) = int(i->lr_y);
+      *(out++) = int(i->area);
+    }
+    return result;
+  }
+
+  /*
+    PACKED images cannot hold the labels, so they are unpacked into a new
+    DENSE image first, which then becomes the data of the returned ccs.
+    The packed words are scanned for their black bits, so that white
+    areas cost almost nothing.
+  */
+  inline ImageList* cc_analysis(OneBitPackedImageView& image) {
+    using namespace PackedDataDetail;
+    OneBitImageData* data = new OneBitImageData(image.size(), image.origin());
+    OneBitImageView view(*data, image.origin(), image.size());
+    const OneBitPackedImageData* packed = image.data();
+    for (size_t y = 0; y < image.nrows(); ++y) {
+      size_t pos = packed_row_start(image, y);
+      for (size_t x = 0; x < image.ncols(); x += WORD_BITS) {
+        word_type w = packed->get_word(pos + x, std::min(WORD_BITS, image.ncols() - x));
+        for (; w; w &= w - 1)
+          view.set(Point(x + first_bit(w), y), black(view));
+      }
+    }
+    ImageList* ccs;
+    try {
+      ccs = cc_analysis(view);
     } catch (std::exception e) {
-      for (size_t i = 0; i != rects.size(); ++i)
-        delete rects[i];
+      delete data;
+      throw;
     }
+    // without any ccs, nothing refers to the data
+    if (ccs == NULL || ccs->empty())
+      delete data;
     return ccs;
   }
 
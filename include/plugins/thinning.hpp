@@ -108,10 +108,25 @@ namespace Gamera {
     return deleted;
   }
 
+  // Thins the image thin in place, using flag (an image of the same
+  // size whose contents do not matter) for the pixels to be deleted.
   template<class T>
-  typename ImageFactory<T>::view_type* thin_zs(const T& in) {
+  void thin_zs_in_place(T& thin, T& flag) {
     const unsigned char constants[2][2] = {{21, 84}, {69, 81}};
 
+    if (thin.nrows() == 1 || thin.ncols() == 1)
+      return;
+    bool deleted = true;
+    bool constant_i = false;
+    while (deleted) {
+      thin_zs_flag(thin, flag, constants[constant_i][0], constants[constant_i][1]);
+      deleted = thin_zs_del_fbp(thin, flag);
+      constant_i = !constant_i;
+    }
+  }
+
+  template<class T>
+  typename ImageFactory<T>::view_type* thin_zs(const T& in) {
     typedef typename ImageFactory<T>::data_type data_type;
     typedef typename ImageFactory<T>::view_type view_type;
     data_type* thin_data = new data_type(in.size(), in.origin());
@@ -128,14 +143,7 @@ namespace Gamera {
       flag_view = new view_type(*flag_data);
       
       try {
-	bool deleted = true;
-	bool constant_i = false;
-	while (deleted) {
-	  thin_zs_flag(*thin_view, *flag_view, 
-		       constants[constant_i][0], constants[constant_i][1]);
-	  deleted = thin_zs_del_fbp(*thin_view, *flag_view);
-	  constant_i = !constant_i;
-	}
+	thin_zs_in_place(*thin_view, *flag_view);
       } catch (std::exception e) {
 	delete flag_view;
 	delete flag_data;
@@ -348,6 +356,40 @@ namespace Gamera {
 					       0x2020, 0x20a0, 0x0,    0xa0a0, 
 					       0x2020, 0x5b5b, 0xa020, 0x4850};
 
+  // The Lee and Chen post-processing of an image thinned by
+  // thin_zs_in_place, in place.
+  template<class T>
+  void thin_lc_in_place(T& thin) {
+    if (thin.nrows() == 1 || thin.ncols() == 1)
+      return;
+    size_t nrows = thin.nrows();
+    size_t ncols = thin.ncols();
+    typename T::vec_iterator it = thin.vec_begin();
+    for (size_t y = 0; y < nrows; ++y) {
+      size_t y_before = (y == 0) ? 1 : y - 1;
+      size_t y_after = (y == nrows - 1) ? nrows - 2 : y + 1;
+      for (size_t x = 0; x < ncols; ++x, ++it) {
+	if (is_black(*it)) {
+	  size_t x_before = (x == 0) ? 1 : x - 1;
+	  size_t x_after = (x == ncols - 1) ? ncols - 2 : x + 1;
+	  
+	  size_t j = ((is_black(thin.get(Point(x_after, y_after))) << 3) |
+		      (is_black(thin.get(Point(x_after, y))) << 2) |
+		      (is_black(thin.get(Point(x_after, y_before))) << 1) |
+		      (is_black(thin.get(Point(x, y_before)))));
+	  
+	  size_t i = ((is_black(thin.get(Point(x_before, y_before))) << 3) |
+		      (is_black(thin.get(Point(x_before, y))) << 2) |
+		      (is_black(thin.get(Point(x_before, y_after))) << 1) |
+		      (is_black(thin.get(Point(x, y_after)))));
+	  
+	  if (thin_lc_look_up[i] & (1 << j))
+	    *it = white(thin);
+	}
+      }
+    }
+  }
+
   template<class T>
   typename ImageFactory<T>::view_type* thin_lc(const T& in) {
     //typedef typename ImageFactory<T>::data_type data_type;
@@ -355,37 +397,8 @@ namespace Gamera {
 
     // Chain to thin_zs
     view_type* thin_view = thin_zs(in);
-    if (in.nrows() == 1 || in.ncols() == 1) {
-      return thin_view;
-    }
-
     try {
-      size_t nrows = thin_view->nrows();
-      size_t ncols = thin_view->ncols();
-      typename view_type::vec_iterator it = thin_view->vec_begin();
-      for (size_t y = 0; y < nrows; ++y) {
-	size_t y_before = (y == 0) ? 1 : y - 1;
-	size_t y_after = (y == nrows - 1) ? nrows - 2 : y + 1;
-	for (size_t x = 0; x < ncols; ++x, ++it) {
-	  if (is_black(*it)) {
-	    size_t x_before = (x == 0) ? 1 : x - 1;
-	    size_t x_after = (x == ncols - 1) ? ncols - 2 : x + 1;
-	    
-	    size_t j = ((is_black(thin_view->get(Point(x_after, y_after))) << 3) |
-			(is_black(thin_view->get(Point(x_after, y))) << 2) |
-			(is_black(thin_view->get(Point(x_after, y_before))) << 1) |
-			(is_black(thin_view->get(Point(x, y_before)))));
-	    
-	    size_t i = ((is_black(thin_view->get(Point(x_before, y_before))) << 3) |
-			(is_black(thin_view->get(Point(x_before, y))) << 2) |
-			(is_black(thin_view->get(Point(x_before, y_after))) << 1) |
-			(is_black(thin_view->get(Point(x, y_after)))));
-	    
-	    if (thin_lc_look_up[i] & (1 << j))
-	      *it = white(*thin_view);
-	  }
-	}
-      }
+      thin_lc_in_place(*thin_view);
     } catch (std::exception e) {
       delete thin_view->data();
       delete thin_view;
@@ -27,6 +27,7 @@
 #include <exception>
 #include <stdexcept>
 #include <bitset>
+#include <algorithm>
 
 namespace Gamera {
 
@@ -230,6 +231,138 @@ namespace {
     TIFFClose(tif);
   }
 
+  /*
+    Converts one row of TIFF samples to pixels.
+  */
+  inline void tiff_unpack_row(const unsigned char* data, OneBitPixel* pixels,
+                              size_t ncols, bool inverted) {
+    for (size_t j = 0; j < ncols; ++j) {
+      bool bit = (data[j / 8] >> (7 - j % 8)) & 1;
+      // MINISWHITE has black for set bits, MINISBLACK has white
+      if (bit == inverted)
+        pixels[j] = pixel_traits<OneBitPixel>::black();
+      else
+        pixels[j] = pixel_traits<OneBitPixel>::white();
+    }
+  }
+
+  inline void tiff_unpack_row(const unsigned char* data, GreyScalePixel* pixels,
+                              size_t ncols, bool inverted) {
+    for (size_t j = 0; j < ncols; ++j)
+      pixels[j] = inverted ? 255 - data[j] : data[j];
+  }
+
+  inline void tiff_unpack_row(const unsigned char* data, Grey16Pixel* pixels,
+                              size_t ncols, bool inverted) {
+    const unsigned short* samples = (const unsigned short*)data;
+    for (size_t j = 0; j < ncols; ++j)
+      pixels[j] = samples[j];
+  }
+
+  inline void tiff_unpack_row(const unsigned char* data, RGBPixel* pixels,
+                              size_t ncols, bool inverted) {
+    for (size_t j = 0; j < ncols; ++j, data += 3)
+      pixels[j] = RGBPixel(data[0], data[1], data[2]);
+  }
+
+  /*
+    Decodes the tiles of a TILED image from a TIFF file, which stays
+    open as long as the image.  The tiles have the size of the tiles
+    in the file, or, for files that are stored in strips, of the strips.
+  */
+  template<class T>
+  class TiffTileSource : public TileSource<T> {
+  public:
+    TiffTileSource(const char* filename, ImageInfo& info)
+      : m_tif(0), m_buf(0), m_nrows(info.nrows()), m_inverted(info.inverted()) {
+      m_tif = TIFFOpen(filename, "r");
+      if (!m_tif)
+        throw std::runtime_error("TIFF Error opening file");
+      uint32 ncols, nrows;
+      m_tiled = TIFFIsTiled(m_tif) != 0;
+      if (m_tiled) {
+        TIFFGetField(m_tif, TIFFTAG_TILEWIDTH, &ncols);
+        TIFFGetField(m_tif, TIFFTAG_TILELENGTH, &nrows);
+        m_row_bytes = TIFFTileRowSize(m_tif);
+        m_buf = _TIFFmalloc(TIFFTileSize(m_tif));
+      } else {
+        ncols = info.ncols();
+        TIFFGetFieldDefaulted(m_tif, TIFFTAG_ROWSPERSTRIP, &nrows);
+        nrows = std::min(nrows, (uint32)info.nrows());
+        m_row_bytes = TIFFScanlineSize(m_tif);
+        m_buf = _TIFFmalloc(TIFFStripSize(m_tif));
+      }
+      m_tile_dim = Dim(ncols, nrows);
+      if (!m_buf) {
+        TIFFClose(m_tif);
+        throw std::runtime_error("TIFF Error allocating tile");
+      }
+    }
+    virtual ~TiffTileSource() {
+      _TIFFfree(m_buf);
+      TIFFClose(m_tif);
+    }
+    Dim tile_dim() const { return m_tile_dim; }
+
+    virtual void read_tile(size_t tile_x, size_t tile_y, T* pixels) {
+      size_t ncols = m_tile_dim.ncols(), nrows = m_tile_dim.nrows();
+      TIFFErrorHandler saved_handler = TIFFSetErrorHandler(NULL);
+      tsize_t result;
+      if (m_tiled) {
+        result = TIFFReadTile(m_tif, m_buf, tile_x * ncols, tile_y * nrows, 0, 0);
+      } else {
+        result = TIFFReadEncodedStrip(m_tif, tile_y, m_buf, (tsize_t)-1);
+        // the last strip is cut off at the end of the image
+        nrows = std::min(nrows, m_nrows - tile_y * nrows);
+      }
+      TIFFSetErrorHandler(saved_handler);
+      if (result < 0)
+        throw std::runtime_error("TIFF Error reading tile");
+      for (size_t i = 0; i < nrows; ++i)
+        tiff_unpack_row((unsigned char*)m_buf + i * m_row_bytes, pixels + i * ncols,
+                        ncols, m_inverted);
+      std::fill(pixels + nrows * ncols, pixels + m_tile_dim.nrows() * ncols,
+                pixel_traits<T>::default_value());
+    }
+
+  private:
+    TIFF* m_tif;
+    tdata_t m_buf;
+    bool m_tiled;
+    Dim m_tile_dim;
+    size_t m_row_bytes;
+    size_t m_nrows;
+    bool m_inverted;
+  };
+
+  template<class T>
+  Image* tiff_load_tiled(ImageInfo& info, const char* filename) {
+    TiffTileSource<T>* source = new TiffTileSource<T>(filename, info);
+    Dim dim(info.ncols(), info.nrows());
+    TiledImageData<T>* data =
+      new TiledImageData<T>(dim, Point(0, 0), source->tile_dim(), source);
+    ImageView<TiledImageData<T> >* image =
+      new ImageView<TiledImageData<T> >(*data, Point(0, 0), dim);
+    image->resolution(info.x_resolution());
+    return image;
+  }
+
+  /*
+    Only the pixels that are used are read from the file (see
+    TiffTileSource).
+  */
+  Image* tiff_load_tiled(ImageInfo& info, const char* filename) {
+    if (info.ncolors() == 1 && info.depth() == 1)
+      return tiff_load_tiled<OneBitPixel>(info, filename);
+    else if (info.ncolors() == 3 && info.depth() == 8)
+      return tiff_load_tiled<RGBPixel>(info, filename);
+    else if (info.ncolors() == 1 && info.depth() == 8)
+      return tiff_load_tiled<GreyScalePixel>(info, filename);
+    else if (info.ncolors() == 1 && info.depth() == 16)
+      return tiff_load_tiled<Grey16Pixel>(info, filename);
+    throw std::runtime_error("Unable to load image of this type!");
+  }
+
     template<class Pixel>
   struct tiff_saver {
 
@@ -352,6 +485,19 @@ namespace {
 Image* load_tiff(const char* filename, int storage) {
   TIFFErrorHandler saved_handler = TIFFSetErrorHandler(NULL);
   ImageInfo* info = tiff_info(filename);
+  if (storage == TILED) {
+    Image* image;
+    try {
+      image = tiff_load_tiled(*info, filename);
+    } catch (std::exception&) {
+      delete info;
+      TIFFSetErrorHandler(saved_handler);
+      throw;
+    }
+    delete info;
+    TIFFSetErrorHandler(saved_handler);
+    return image;
+  }
   if (info->ncolors() == 1) {
     if (info->depth() == 1) {
       if (storage == DENSE) {
@@ -363,6 +509,15 @@ Image* load_tiff(const char* filename, int storage) {
         delete info;
         TIFFSetErrorHandler(saved_handler);
         return image;
+      } else if (storage == PACKED) {
+        typedef TypeIdImageFactory<ONEBIT, PACKED> fact_type;
+        fact_type::image_type*
+          image = fact_type::create(Point(0, 0), Dim(info->ncols(), info->nrows()));
+        image->resolution(info->x_resolution());
+        tiff_load_onebit(*image, *info, filename);
+        delete info;
+        TIFFSetErrorHandler(saved_handler);
+        return image;
       } else {
         typedef TypeIdImageFactory<ONEBIT, RLE> fact_type;
         fact_type::image_type*
@@ -375,10 +530,10 @@ Image* load_tiff(const char* filename, int storage) {
       }
     }
   }
-  if (storage == RLE) {
+  if (storage != DENSE) {
     delete info;
     TIFFSetErrorHandler(saved_handler);
-    throw std::runtime_error("Pixel type must be OneBit to use RLE data.");
+    throw std::runtime_error("Pixel type must be OneBit to use RLE or PACKED data.");
   }
   if (info->ncolors() == 3) {
     typedef TypeIdImageFactory<RGB, DENSE> fact;
@@ -217,9 +217,9 @@ namespace Gamera {
 
       There are two cases for the Proxy:
       a) we have a position that is in the middle of a run (so we have
-         a pointer to an iterator that points to the run - we use
-	 a pointer so we can determine whether or not we have the
-	 iterator by comparison to 0).
+         an iterator that points to the run - it is copied into the
+	 proxy, because a pointer to it would dangle once the
+	 iterator is gone).
       b) we only have the position and not an iterator.
       Case 'a' allows us to avoid a rather slow lookup, but we can't
       always use this optimization.
@@ -234,39 +234,32 @@ namespace Gamera {
       RLEProxy(T* vec, size_t pos) {
 	m_vec = vec;
 	m_pos = pos;
-	m_iterator = 0;
+	m_has_run = false;
 	m_dirty = vec->m_dirty;
       }
-      RLEProxy(T* vec, size_t pos, const iterator* it) {
-	m_vec = vec;
-	m_pos = pos;
-	m_iterator = it;
-	m_dirty = vec->m_dirty;
-      }
-      // this is for RleVector[] - so, so, stupid, but oh well
       RLEProxy(T* vec, size_t pos, iterator i) {
 	m_vec = vec;
 	m_pos = pos;
 	m_i = i;
-	m_iterator = &m_i;
+	m_has_run = true;
 	m_dirty = vec->m_dirty;
       }
       void operator=(value_type v) {
-	if (m_dirty == m_vec->m_dirty && m_iterator != 0)
- 	  m_vec->set(m_pos, v, *m_iterator);
+	if (m_dirty == m_vec->m_dirty && m_has_run)
+ 	  m_vec->set(m_pos, v, m_i);
  	else
 	  m_vec->set(m_pos, v);
       }
       operator value_type() const {
-	if (m_dirty == m_vec->m_dirty && m_iterator != 0)
-	  return (*m_iterator)->value;
+	if (m_dirty == m_vec->m_dirty && m_has_run)
+	  return m_i->value;
 	return m_vec->get(m_pos);
       }
     private:
       T* m_vec;
       size_t m_pos;
-      const iterator* m_iterator;
       iterator m_i;
+      bool m_has_run;
       size_t m_dirty;
     };
   
@@ -407,6 +400,10 @@ namespace Gamera {
       difference_type operator-(const self& other) const {
 	return m_pos - other.m_pos;
       }
+      // the position in the vector
+      size_t pos() const {
+	return m_pos;
+      }
       value_type get() const {
 	// Unfortunately, for const-correctness reasons, I can't change
 	// m_i or m_dirty here, so multiple calls to the get without moving
@@ -486,7 +483,7 @@ namespace Gamera {
 	else 
 	  i = m_i;
 	if (i != m_vec->m_data[m_chunk].end())
-	  return proxy_type(m_vec, m_pos, &i);
+	  return proxy_type(m_vec, m_pos, i);
 	return proxy_type(m_vec, m_pos);
       }
     };
@@ -853,18 +850,22 @@ namespace Gamera {
     virtual double mbytes() const { return bytes() / 1048576.0; }
     virtual void dimensions(size_t rows, size_t cols) {
       m_stride = cols;
-      resize(rows * cols);
+      do_resize(rows * cols);
     }
     virtual void dim(const Dim& dim) {
       m_stride = dim.ncols();
-      resize(dim.nrows() * dim.ncols());
+      do_resize(dim.nrows() * dim.ncols());
     }
     virtual Dim dim() const {
       size_t size = ((RleDataDetail::RleVector<T>*)(this))->m_size;
       return Dim(m_stride, size / m_stride);      
     }
+    // the position of the pixel at i in the data
+    template<class I>
+    size_t position(const I& i) const { return i.pos(); }
   protected:
     virtual void do_resize(size_t size) {
+      label_plane(0);
       resize(size);
     }
   };
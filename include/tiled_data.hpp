@@ -0,0 +1,327 @@
+/*
+ *
+ * Copyright (C) 2001-2005 Ichiro Fujinaga, Michael Droettboom, and Karl MacMillan
+ *
+ * This program is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU General Public License
+ * as published by the Free Software Foundation; either version 2
+ * of the License, or (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; if not, write to the Free Software
+ * Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+ */
+
+/*
+  Tiled Image Data
+
+  The image is split into tiles of a fixed size (the last row and
+  column of tiles may reach beyond the image), which are only put into
+  memory when they are used.  A tile that has never been written and
+  has no source is white, without taking any memory.
+
+  The tiles of images that are loaded from a file (such as a tiled
+  TIFF) are decoded by a TileSource when they are first read.  Each
+  image keeps at most cache_bytes() of these tiles in memory: when there
+  are more, the least recently used tile is freed again, and decoded
+  again when it is needed.  Tiles that have been written to are never freed, since
+  they cannot be decoded again.
+
+  Just like the other image data, a pixel is addressed by its position
+  y * stride + x, and single pixels are accessed through a proxy.
+  Algorithms can also work on the pixels of one tile directly (see
+  tile() and writable_tile()).
+*/
+
+#ifndef gamera_tiled_data_hpp
+#define gamera_tiled_data_hpp
+
+#include "image_data.hpp"
+#include "dimensions.hpp"
+#include "vector_proxy.hpp"
+
+#include <vector>
+#include <list>
+#include <algorithm>
+#include <cstdlib>
+
+namespace Gamera {
+
+  /*
+    TileSource
+
+    Decodes the tiles of TiledImageData on demand.  read_tile fills
+    all tile_ncols * tile_nrows pixels of the tile (tile_x, tile_y),
+    row by row.
+  */
+  template<class T>
+  class TileSource {
+  public:
+    virtual ~TileSource() { }
+    virtual void read_tile(size_t tile_x, size_t tile_y, T* pixels) = 0;
+  };
+
+  namespace TiledDataDetail {
+    // the size of the tiles of images that are not loaded from a file
+    static const size_t DEFAULT_TILE_SIZE = 256;
+
+    /*
+      The maximum size of the decoded tiles that each image keeps in
+      memory (it is not shared between images).  It is set in megabytes
+      with the environment variable GAMERA_TILE_CACHE (so that it is the
+      same in all plugin modules), and is 256 MB by default.
+    */
+    inline size_t cache_bytes() {
+      const char* value = std::getenv("GAMERA_TILE_CACHE");
+      double megabytes = value != 0 ? std::atof(value) : 0.0;
+      if (megabytes <= 0.0)
+        megabytes = 256.0;
+      return size_t(megabytes * 1048576.0);
+    }
+  }
+
+  template<class T>
+  class TiledImageData : public ImageDataBase {
+  public:
+    typedef T value_type;
+    typedef VectorProxyDetail::VectorProxy<TiledImageData> proxy_type;
+    typedef proxy_type reference;
+    typedef proxy_type pointer;
+    typedef int difference_type;
+    typedef TiledImageData self;
+    typedef VectorProxyDetail::VectorProxyIterator<self> iterator;
+    typedef VectorProxyDetail::ConstVectorProxyIterator<const self> const_iterator;
+
+    TiledImageData(const Size& size, const Point& offset)
+      : ImageDataBase(size, offset) {
+      create_tiles(TiledDataDetail::DEFAULT_TILE_SIZE, TiledDataDetail::DEFAULT_TILE_SIZE);
+    }
+    TiledImageData(const Size& size) : ImageDataBase(size) {
+      create_tiles(TiledDataDetail::DEFAULT_TILE_SIZE, TiledDataDetail::DEFAULT_TILE_SIZE);
+    }
+    TiledImageData(const Dim& dim, const Point& offset)
+      : ImageDataBase(dim, offset) {
+      create_tiles(TiledDataDetail::DEFAULT_TILE_SIZE, TiledDataDetail::DEFAULT_TILE_SIZE);
+    }
+    TiledImageData(const Dim& dim) : ImageDataBase(dim) {
+      create_tiles(TiledDataDetail::DEFAULT_TILE_SIZE, TiledDataDetail::DEFAULT_TILE_SIZE);
+    }
+    TiledImageData(const Rect& rect) : ImageDataBase(rect) {
+      create_tiles(TiledDataDetail::DEFAULT_TILE_SIZE, TiledDataDetail::DEFAULT_TILE_SIZE);
+    }
+    /*
+      Uses tiles of the given size, which are decoded by source (if it
+      is not 0).  The data takes over the source and deletes it.
+    */
+    TiledImageData(const Dim& dim, const Point& offset, const Dim& tile_dim,
+                   TileSource<T>* source = 0)
+      : ImageDataBase(dim, offset) {
+      create_tiles(tile_dim.ncols(), tile_dim.nrows());
+      m_source = source;
+    }
+
+    virtual ~TiledImageData() {
+      free_tiles();
+      delete m_source;
+    }
+
+    // only the tiles in memory count
+    virtual size_t bytes() const { return m_resident * tile_size() * sizeof(T); }
+    virtual double mbytes() const { return bytes() / 1048576.0; }
+    virtual void dimensions(size_t rows, size_t cols) {
+      m_stride = cols;
+      do_resize(rows * cols);
+    }
+    virtual void dim(const Dim& dim) {
+      m_stride = dim.ncols();
+      do_resize(dim.nrows() * dim.ncols());
+    }
+    virtual Dim dim() const {
+      return Dim(m_stride, m_size / m_stride);
+    }
+    virtual Dim tile_dim() const {
+      return Dim(m_tile_ncols, m_tile_nrows);
+    }
+
+    /*
+      The tiles are numbered row by row.
+    */
+    size_t tiles_x() const { return m_tiles_x; }
+    size_t tiles_y() const { return m_tiles_y; }
+    size_t tile_index(size_t pos) const {
+      size_t y = pos / m_stride;
+      return (y / m_tile_nrows) * m_tiles_x + (pos - y * m_stride) / m_tile_ncols;
+    }
+    size_t tile_size() const { return m_tile_ncols * m_tile_nrows; }
+    size_t resident_tiles() const { return m_resident; }
+
+    /*
+      The pixels of a tile (row by row, tile_ncols wide) for reading,
+      or 0 when the tile is white and has never been written.  The
+      pointer is only valid until another tile is used, since that may
+      free this one.
+    */
+    const T* tile(size_t index) const {
+      T* pixels = m_tiles[index];
+      if (pixels == 0) {
+        if (m_source == 0)
+          return 0;
+        return load(index);
+      }
+      if (!m_dirty[index])
+        m_lru.splice(m_lru.end(), m_lru, m_lru_pos[index]);
+      return pixels;
+    }
+    /*
+      The pixels of a tile for writing.  The tile stays in memory from
+      now on.
+    */
+    T* writable_tile(size_t index) {
+      T* pixels = m_tiles[index];
+      if (pixels == 0) {
+        if (m_source != 0) {
+          pixels = load(index);
+        } else {
+          pixels = new T[tile_size()];
+          std::fill(pixels, pixels + tile_size(), pixel_traits<T>::default_value());
+          m_tiles[index] = pixels;
+          ++m_resident;
+        }
+      }
+      if (!m_dirty[index]) {
+        // a written tile cannot be freed, so it leaves the LRU list
+        if (m_source != 0)
+          m_lru.erase(m_lru_pos[index]);
+        m_dirty[index] = true;
+      }
+      return pixels;
+    }
+
+    value_type get(size_t pos) const {
+      size_t y = pos / m_stride, x = pos - y * m_stride;
+      const T* pixels = tile((y / m_tile_nrows) * m_tiles_x + x / m_tile_ncols);
+      if (pixels == 0)
+        return pixel_traits<T>::default_value();
+      return pixels[(y % m_tile_nrows) * m_tile_ncols + x % m_tile_ncols];
+    }
+    void set(size_t pos, value_type v) {
+      size_t y = pos / m_stride, x = pos - y * m_stride;
+      T* pixels = writable_tile((y / m_tile_nrows) * m_tiles_x + x / m_tile_ncols);
+      pixels[(y % m_tile_nrows) * m_tile_ncols + x % m_tile_ncols] = v;
+    }
+
+    iterator begin() {
+      return iterator(this, 0);
+    }
+    iterator end() {
+      return iterator(this, m_size);
+    }
+    const_iterator begin() const {
+      return const_iterator(this, 0);
+    }
+    const_iterator end() const {
+      return const_iterator(this, m_size);
+    }
+    proxy_type operator[](size_t pos) {
+      return proxy_type(this, pos);
+    }
+
+  protected:
+    /*
+      Like for dense data, the pixels keep their positions (and not
+      their coordinates) when the size changes.  All tiles are decoded
+      for this.
+    */
+    virtual void do_resize(size_t size) {
+      // the tiles are still laid out for the old stride
+      size_t stride = m_stride;
+      m_stride = m_tiles_stride;
+      std::vector<T> pixels(std::min(m_size, size));
+      for (size_t pos = 0; pos < pixels.size(); ++pos)
+        pixels[pos] = get(pos);
+      m_stride = stride;
+      free_tiles();
+      delete m_source;
+      m_source = 0;
+      m_size = size;
+      create_tiles(m_tile_ncols, m_tile_nrows);
+      for (size_t pos = 0; pos < pixels.size(); ++pos)
+        set(pos, pixels[pos]);
+    }
+
+  private:
+    void create_tiles(size_t tile_ncols, size_t tile_nrows) {
+      m_source = 0;
+      m_tile_ncols = std::max(tile_ncols, size_t(1));
+      m_tile_nrows = std::max(tile_nrows, size_t(1));
+      m_tiles_stride = m_stride;
+      size_t nrows = m_stride != 0 ? m_size / m_stride : 0;
+      m_tiles_x = (m_stride + m_tile_ncols - 1) / m_tile_ncols;
+      m_tiles_y = (nrows + m_tile_nrows - 1) / m_tile_nrows;
+      m_tiles.assign(m_tiles_x * m_tiles_y, (T*)0);
+      m_dirty.assign(m_tiles.size(), false);
+      m_lru.clear();
+      m_lru_pos.assign(m_tiles.size(), m_lru.end());
+      m_resident = 0;
+      m_cache_tiles = std::max(TiledDataDetail::cache_bytes() / (tile_size() * sizeof(T)),
+                               size_t(1));
+    }
+
+    void free_tiles() {
+      for (size_t i = 0; i < m_tiles.size(); ++i)
+        delete[] m_tiles[i];
+      m_tiles.clear();
+      m_lru.clear();
+      m_resident = 0;
+    }
+
+    T* load(size_t index) const {
+      T* pixels = new T[tile_size()];
+      try {
+        m_source->read_tile(index % m_tiles_x, index / m_tiles_x, pixels);
+      } catch (...) {
+        delete[] pixels;
+        throw;
+      }
+      m_tiles[index] = pixels;
+      m_lru_pos[index] = m_lru.insert(m_lru.end(), index);
+      ++m_resident;
+      evict();
+      return pixels;
+    }
+
+    /*
+      Frees the least recently used tiles that can be decoded again.
+      The tile that was just loaded is the most recent one, so it is
+      only kept over the limit when nothing else can be freed.
+    */
+    void evict() const {
+      while (m_resident > m_cache_tiles && m_lru.size() > 1) {
+        size_t oldest = m_lru.front();
+        m_lru.pop_front();
+        delete[] m_tiles[oldest];
+        m_tiles[oldest] = 0;
+        --m_resident;
+      }
+    }
+
+    size_t m_tile_ncols, m_tile_nrows;
+    size_t m_tiles_x, m_tiles_y, m_tiles_stride;
+    // the tiles are decoded on demand, also from the const methods
+    mutable std::vector<T*> m_tiles;
+    // the decoded tiles that have not been written, least recently used first
+    mutable std::list<size_t> m_lru;
+    mutable std::vector<std::list<size_t>::iterator> m_lru_pos;
+    mutable size_t m_resident;
+    std::vector<bool> m_dirty;
+    size_t m_cache_tiles;
+    TileSource<T>* m_source;
+  };
+}
+
+#endif
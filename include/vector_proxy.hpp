@@ -0,0 +1,197 @@
+/*
+ *
+ * Copyright (C) 2001-2005 Ichiro Fujinaga, Michael Droettboom, and Karl MacMillan
+ *
+ * This program is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU General Public License
+ * as published by the Free Software Foundation; either version 2
+ * of the License, or (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; if not, write to the Free Software
+ * Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+ */
+
+/*
+  Proxies and iterators for image data that does not keep its pixels
+  in one array (bit-packed and tiled data).  The vector V only needs a
+  value_type and the methods get(pos) and set(pos, value).
+*/
+
+#ifndef gamera_vector_proxy_hpp
+#define gamera_vector_proxy_hpp
+
+#include <cstddef>
+#include <iterator>
+
+namespace Gamera {
+
+  namespace VectorProxyDetail {
+    /*
+      VectorProxy
+
+      The iterators cannot return a reference to a pixel, so this
+      proxy is returned instead.  It converts to the value for
+      reading and sets the pixel when a value is assigned.
+    */
+    template<class V>
+    class VectorProxy {
+    public:
+      typedef typename V::value_type value_type;
+
+      VectorProxy(V* vec, size_t pos) : m_vec(vec), m_pos(pos) { }
+      VectorProxy& operator=(value_type v) {
+        m_vec->set(m_pos, v);
+        return *this;
+      }
+      // assigns the value of another pixel (instead of the proxy itself)
+      VectorProxy& operator=(const VectorProxy& other) {
+        m_vec->set(m_pos, value_type(other));
+        return *this;
+      }
+      operator value_type() const {
+        return m_vec->get(m_pos);
+      }
+    private:
+      V* m_vec;
+      size_t m_pos;
+    };
+
+    template<class V, class Iterator>
+    class VectorProxyIteratorBase {
+    public:
+      typedef typename V::value_type value_type;
+      typedef int difference_type;
+      typedef std::random_access_iterator_tag iterator_tag;
+      typedef Iterator self;
+
+      VectorProxyIteratorBase() : m_vec(0), m_pos(0) { }
+      VectorProxyIteratorBase(V* vec, size_t pos) : m_vec(vec), m_pos(pos) { }
+
+      self& operator++() {
+        ++m_pos;
+        return (self&)*this;
+      }
+      self operator++(int) {
+        self tmp = (self&)*this;
+        ++m_pos;
+        return tmp;
+      }
+      self& operator--() {
+        --m_pos;
+        return (self&)*this;
+      }
+      self operator--(int) {
+        self tmp = (self&)*this;
+        --m_pos;
+        return tmp;
+      }
+      self& operator+=(size_t n) {
+        m_pos += n;
+        return (self&)*this;
+      }
+      self operator+(size_t n) const {
+        self tmp = (const self&)*this;
+        tmp.m_pos += n;
+        return tmp;
+      }
+      self& operator-=(size_t n) {
+        m_pos -= n;
+        return (self&)*this;
+      }
+      self operator-(size_t n) const {
+        self tmp = (const self&)*this;
+        tmp.m_pos -= n;
+        return tmp;
+      }
+      bool operator==(const self& other) const {
+        return m_pos == other.m_pos;
+      }
+      bool operator!=(const self& other) const {
+        return m_pos != other.m_pos;
+      }
+      bool operator<(const self& other) const {
+        return m_pos < other.m_pos;
+      }
+      bool operator<=(const self& other) const {
+        return m_pos <= other.m_pos;
+      }
+      bool operator>(const self& other) const {
+        return m_pos > other.m_pos;
+      }
+      bool operator>=(const self& other) const {
+        return m_pos >= other.m_pos;
+      }
+      difference_type operator-(const self& other) const {
+        return m_pos - other.m_pos;
+      }
+      value_type get() const {
+        return m_vec->get(m_pos);
+      }
+      // the position of the pixel in the data
+      size_t position() const {
+        return m_pos;
+      }
+    protected:
+      V* m_vec;
+      size_t m_pos;
+    };
+
+    template<class V>
+    class VectorProxyIterator
+      : public VectorProxyIteratorBase<V, VectorProxyIterator<V> > {
+    public:
+      typedef VectorProxyIterator self;
+      typedef VectorProxyIteratorBase<V, self> base;
+      using base::m_vec;
+      using base::m_pos;
+
+      typedef VectorProxy<V> proxy_type;
+      typedef proxy_type reference;
+      typedef proxy_type pointer;
+
+      VectorProxyIterator() : base() { }
+      VectorProxyIterator(V* vec, size_t pos) : base(vec, pos) { }
+
+      proxy_type operator*() const {
+        return proxy_type(m_vec, m_pos);
+      }
+      proxy_type operator[](size_t n) const {
+        return proxy_type(m_vec, m_pos + n);
+      }
+      void set(const typename base::value_type& v) {
+        m_vec->set(m_pos, v);
+      }
+    };
+
+    template<class V>
+    class ConstVectorProxyIterator
+      : public VectorProxyIteratorBase<V, ConstVectorProxyIterator<V> > {
+    public:
+      typedef ConstVectorProxyIterator self;
+      typedef VectorProxyIteratorBase<V, self> base;
+      using base::m_vec;
+      using base::m_pos;
+
+      typedef void reference;
+      typedef typename V::value_type* pointer;
+
+      ConstVectorProxyIterator() : base() { }
+      ConstVectorProxyIterator(V* vec, size_t pos) : base(vec, pos) { }
+
+      typename V::value_type operator*() const {
+        return m_vec->get(m_pos);
+      }
+      typename V::value_type operator[](size_t n) const {
+        return m_vec->get(m_pos + n);
+      }
+    };
+  }
+}
+
+#endif
@@ -305,21 +305,78 @@ namespace Gamera {
     }
   };
   
+  /*
+    The iterator into the image data for an iterator that Vigra gives
+    to an accessor (an iterator of the data itself, a 2D iterator or a
+    row iterator of the image), so that the CC accessors can ask the
+    cc whether the pixel is one of its own (see ConnectedComponent::owns).
+  */
+  template<class I>
+  inline const I& data_iterator(const I& i) {
+    return i;
+  }
+  template<class Image, class I>
+  inline I data_iterator(const ImageIterator<Image, I>& i) {
+    return i.rowIterator();
+  }
+  template<class Image, class I>
+  inline I data_iterator(const ConstImageIterator<Image, I>& i) {
+    return i.rowIterator();
+  }
+  template<class Image, class I>
+  inline I data_iterator(const ImageViewDetail::RowIterator<Image, I>& i) {
+    return i.m_iterator;
+  }
+  template<class Image, class I>
+  inline I data_iterator(const ImageViewDetail::ConstRowIterator<Image, I>& i) {
+    return i.m_iterator;
+  }
+  template<class Image, class I>
+  inline I data_iterator(const CCDetail::VecIterator<Image,
+                         CCDetail::RowIterator<Image, I>,
+                         CCDetail::ColIterator<Image, I> >& i) {
+    return i.m_coliterator.m_iterator;
+  }
+  template<class Image, class CImage, class I>
+  inline I data_iterator(const CCDetail::ConstVecIterator<Image,
+                         CCDetail::ConstRowIterator<CImage, I>,
+                         CCDetail::ConstColIterator<CImage, I> >& i) {
+    return i.m_coliterator.m_iterator;
+  }
+  template<class Image, class I>
+  inline I data_iterator(const MLCCDetail::VecIterator<Image,
+                         MLCCDetail::RowIterator<Image, I>,
+                         MLCCDetail::ColIterator<Image, I> >& i) {
+    return i.m_coliterator.m_iterator;
+  }
+  template<class Image, class CImage, class I>
+  inline I data_iterator(const MLCCDetail::ConstVecIterator<Image,
+                         MLCCDetail::ConstRowIterator<CImage, I>,
+                         MLCCDetail::ConstColIterator<CImage, I> >& i) {
+    return i.m_coliterator.m_iterator;
+  }
+
   /*
     The CCAccessor provides filtering of pixels based on an image label. This serves the
     same purpose as the CCProxy in connected_component_iterators.hpp.
   */
 
+  template<class Image>
   class CCAccessor {
   public:
     typedef OneBitPixel value_type;
     typedef OneBitPixel VALUETYPE;
 
-    CCAccessor(OneBitPixel label) : m_label(label) { }
+    CCAccessor(const Image& image) : m_image(&image) { }
+
+    template <class ITERATOR>
+    bool owns(ITERATOR const & i) const {
+      return m_image->owns(m_accessor(i), data_iterator(i));
+    }
     
     template <class ITERATOR>
     VALUETYPE operator()(ITERATOR const & i) const {
-      if (m_label == m_accessor(i))
+      if (owns(i))
       	return 0;
       else
       	return 1;
@@ -329,7 +386,7 @@ namespace Gamera {
     VALUETYPE operator()(ITERATOR & i, DIFFERENCE diff) const
     {
       ITERATOR tmp = i + diff;
-      if (m_label == m_accessor(tmp))
+      if (owns(tmp))
         return 0; 
       else
       	return 1;
@@ -339,11 +396,11 @@ namespace Gamera {
     void set(V const & value, ITERATOR & i) const 
     {
       VALUETYPE tmp = vigra::detail::RequiresExplicitCast<VALUETYPE>::cast(value);
-      if (m_accessor(i) == m_label) {
+      if (owns(i)) {
 	      if (tmp) {
 	        m_accessor.set(0, i);
 	      } else {
-	        m_accessor.set(m_label, i);
+	        m_accessor.set(m_accessor(i), i);
 	      }
       }
     }
@@ -353,28 +410,34 @@ namespace Gamera {
     { 
       VALUETYPE tmp = vigra::detail::RequiresExplicitCast<VALUETYPE>::cast(value); 
 	    ITERATOR tmpi = i + diff;
-	    if (m_accessor(tmpi) == m_label) {
+	    if (owns(tmpi)) {
 	      if (tmp) {
 	        m_accessor.set(0, tmpi);
 	      } else {
-	        m_accessor.set(m_label, tmpi);
+	        m_accessor.set(m_accessor(tmpi), tmpi);
 	      }
       }
     }
-    OneBitPixel m_label;
+    const Image* m_image;
     ImageAccessor<value_type> m_accessor;
   };
 
+  template<class Image>
   class RawCCAccessor {
   public:
     typedef OneBitPixel value_type;
     typedef OneBitPixel VALUETYPE;
 
-    RawCCAccessor(OneBitPixel label) : m_label(label) { }
+    RawCCAccessor(const Image& image) : m_image(&image) { }
+
+    template <class ITERATOR>
+    bool owns(ITERATOR const & i) const {
+      return m_image->owns(m_accessor(i), data_iterator(i));
+    }
     
     template <class ITERATOR>
     VALUETYPE operator()(ITERATOR const & i) const {
-      if (m_label == m_accessor(i))
+      if (owns(i))
 	      return 1;
       else
 	      return 0;
@@ -384,7 +447,7 @@ namespace Gamera {
     VALUETYPE operator()(ITERATOR & i, DIFFERENCE diff) const
     {
       ITERATOR tmp = i + diff;
-      if (m_label == m_accessor(tmp))
+      if (owns(tmp))
         return 1; 
       else
 	      return 0;
@@ -394,9 +457,9 @@ namespace Gamera {
     void set(V const & value, ITERATOR & i) const 
     {
       VALUETYPE tmp = vigra::detail::RequiresExplicitCast<VALUETYPE>::cast(value);
-      if (m_accessor(i) == m_label) {
+      if (owns(i)) {
 	      if (tmp) {
-	        m_accessor.set(m_label, i);
+	        m_accessor.set(m_accessor(i), i);
 	      } else {
 	        m_accessor.set(0, i);
       	}
@@ -408,15 +471,15 @@ namespace Gamera {
     { 
       VALUETYPE tmp = vigra::detail::RequiresExplicitCast<VALUETYPE>::cast(value); 
 	    ITERATOR tmpi = i + diff;
-	    if (m_accessor(tmpi) == m_label) {
+	    if (owns(tmpi)) {
 	      if (tmp) {
-	        m_accessor.set(m_label, tmpi);
+	        m_accessor.set(m_accessor(tmpi), tmpi);
 	      } else {
 	        m_accessor.set(0, tmpi);
 	      }
       }
     }
-    OneBitPixel m_label;
+    const Image* m_image;
     ImageAccessor<value_type> m_accessor;
   };
 
@@ -427,22 +490,22 @@ namespace Gamera {
     same purpose as the MLCCProxy in connected_component_iterators.hpp.
   */
 
+  template<class Image>
   class MLCCAccessor {
   public:
     typedef OneBitPixel value_type;
     typedef OneBitPixel VALUETYPE;
 
-    MLCCAccessor(const std::map<value_type, Rect*>* labels){
-      m_labels=labels;
-    }
+    MLCCAccessor(const Image& image) : m_image(&image) { }
     
-    inline bool has_label(value_type value) const {
-      return m_labels->find(value)==m_labels->end();
+    template <class ITERATOR>
+    inline bool has_label(ITERATOR const & i) const {
+      return !m_image->owns(m_accessor(i), data_iterator(i));
     }
     
     template <class ITERATOR>
     VALUETYPE operator()(ITERATOR const & i) const {
-      if (has_label(m_accessor(i)))
+      if (has_label(i))
       	return 0;
       else
       	return 1;
@@ -452,7 +515,7 @@ namespace Gamera {
     VALUETYPE operator()(ITERATOR & i, DIFFERENCE diff) const
     {
       ITERATOR tmp = i + diff;
-      if (has_label(m_accessor(tmp)))
+      if (has_label(tmp))
         return 0; 
       else
       	return 1;
@@ -463,7 +526,7 @@ namespace Gamera {
     {
       VALUETYPE tmp = vigra::detail::RequiresExplicitCast<VALUETYPE>::cast(value);
       value_type val=m_accessor(i);
-      if (has_label(val)) {
+      if (has_label(i)) {
 	      if (tmp) {
 	        m_accessor.set(0, i);
 	      } else {
@@ -478,7 +541,7 @@ namespace Gamera {
       VALUETYPE tmp = vigra::detail::RequiresExplicitCast<VALUETYPE>::cast(value); 
 	    ITERATOR tmpi = i + diff;
 	    value_type val=m_accessor(tmpi);
-	    if (has_label(val)) {
+	    if (has_label(tmpi)) {
 	      if (tmp) {
 	        m_accessor.set(0, tmpi);
 	      } else {
@@ -486,26 +549,26 @@ namespace Gamera {
 	      }
       }
     }
-    const std::map<value_type, Rect*>* m_labels;
+    const Image* m_image;
     ImageAccessor<value_type> m_accessor;
   };
 
+  template<class Image>
   class RawMLCCAccessor {
   public:
     typedef OneBitPixel value_type;
     typedef OneBitPixel VALUETYPE;
 
-    RawMLCCAccessor(const std::map<value_type, Rect*>* labels){ 
-      m_labels=labels;
-    }
+    RawMLCCAccessor(const Image& image) : m_image(&image) { }
     
-   inline bool has_label(value_type value) const {
-      return m_labels->find(value)==m_labels->end();
+    template <class ITERATOR>
+    inline bool has_label(ITERATOR const & i) const {
+      return !m_image->owns(m_accessor(i), data_iterator(i));
     }
     
     template <class ITERATOR>
     VALUETYPE operator()(ITERATOR const & i) const {
-      if (has_label(m_accessor(i)))
+      if (has_label(i))
 	      return 1;
       else
 	      return 0;
@@ -515,7 +578,7 @@ namespace Gamera {
     VALUETYPE operator()(ITERATOR & i, DIFFERENCE diff) const
     {
       ITERATOR tmp = i + diff;
-      if (has_label(m_accessor(tmp)))
+      if (has_label(tmp))
         return 1; 
       else
 	      return 0;
@@ -526,7 +589,7 @@ namespace Gamera {
     {
       VALUETYPE tmp = vigra::detail::RequiresExplicitCast<VALUETYPE>::cast(value);
       value_type val=m_accessor(i);
-      if (has_label(val)) {
+      if (has_label(i)) {
 	      if (tmp) {
 	        m_accessor.set(val, i);
 	      } else {
@@ -541,7 +604,7 @@ namespace Gamera {
       VALUETYPE tmp = vigra::detail::RequiresExplicitCast<VALUETYPE>::cast(value); 
 	    ITERATOR tmpi = i + diff;
 	    value_type val=m_accessor(tmpi);
-	    if (has_label(val)) {
+	    if (has_label(tmpi)) {
 	      if (tmp) {
 	        m_accessor.set(val, tmpi);
 	      } else {
@@ -549,7 +612,7 @@ namespace Gamera {
 	      }
       }
     }
-    const std::map<value_type, Rect*>* m_labels;
+    const Image* m_image;
     ImageAccessor<value_type> m_accessor;
   };
 
@@ -751,6 +814,66 @@ namespace Gamera {
     }
   };
 
+  template<>
+  struct choose_accessor<OneBitPackedImageView> {
+    typedef OneBitAccessor accessor;
+    static accessor make_accessor(const OneBitPackedImageView& mat) {
+      return accessor();
+    }
+    typedef RawOneBitAccessor raw_accessor;
+    static raw_accessor make_raw_accessor(const OneBitPackedImageView& mat) {
+      return raw_accessor();
+    }
+    typedef accessor real_accessor;
+    static real_accessor make_real_accessor(const OneBitPackedImageView& mat) {
+      return real_accessor();
+    }
+    typedef BilinearInterpolatingAccessor<raw_accessor, OneBitPixel> interp_accessor;
+    static interp_accessor make_interp_accessor(const OneBitPackedImageView& mat) {
+      return interp_accessor(make_raw_accessor(mat));
+    }
+  };
+
+  template<>
+  struct choose_accessor<OneBitTiledImageView> {
+    typedef OneBitAccessor accessor;
+    static accessor make_accessor(const OneBitTiledImageView& mat) {
+      return accessor();
+    }
+    typedef RawOneBitAccessor raw_accessor;
+    static raw_accessor make_raw_accessor(const OneBitTiledImageView& mat) {
+      return raw_accessor();
+    }
+    typedef accessor real_accessor;
+    static real_accessor make_real_accessor(const OneBitTiledImageView& mat) {
+      return real_accessor();
+    }
+    typedef BilinearInterpolatingAccessor<raw_accessor, OneBitPixel> interp_accessor;
+    static interp_accessor make_interp_accessor(const OneBitTiledImageView& mat) {
+      return interp_accessor(make_raw_accessor(mat));
+    }
+  };
+
+  template<>
+  struct choose_accessor<RGBTiledImageView> {
+    typedef Gamera::RGBAccessor<RGBPixel> accessor;
+    static accessor make_accessor(const RGBTiledImageView& mat) {
+      return accessor();
+    }
+    typedef Gamera::RGBAccessor<RGBPixel> raw_accessor;
+    static raw_accessor make_raw_accessor(const RGBTiledImageView& mat) {
+      return raw_accessor();
+    }
+    typedef RGBRealAccessor real_accessor;
+    static real_accessor make_real_accessor(const RGBTiledImageView& mat) {
+      return real_accessor();
+    }
+    typedef BilinearInterpolatingAccessor<raw_accessor, RGBPixel> interp_accessor;
+    static interp_accessor make_interp_accessor(const RGBTiledImageView& mat) {
+      return interp_accessor(make_raw_accessor(mat));
+    }
+  };
+
   template<>
   struct choose_accessor<StaticImage<OneBitPixel> > {
     typedef OneBitAccessor accessor;
@@ -773,17 +896,17 @@ namespace Gamera {
 
   template<>
   struct choose_accessor<Cc> {
-    typedef CCAccessor accessor;
+    typedef CCAccessor<Cc> accessor;
     static accessor make_accessor(const Cc& mat) {
-      return accessor(mat.label());
+      return accessor(mat);
     }
-    typedef RawCCAccessor raw_accessor;
+    typedef RawCCAccessor<Cc> raw_accessor;
     static raw_accessor make_raw_accessor(const Cc& mat) {
-      return raw_accessor(mat.label());
+      return raw_accessor(mat);
     }
     typedef accessor real_accessor;
     static real_accessor make_real_accessor(const Cc& mat) {
-      return real_accessor(mat.label());
+      return real_accessor(mat);
     }
     typedef BilinearInterpolatingAccessor<raw_accessor, OneBitPixel> interp_accessor;
     static interp_accessor make_interp_accessor(const Cc& mat) {
@@ -793,17 +916,17 @@ namespace Gamera {
 
   template<>
   struct choose_accessor<MlCc> {
-    typedef MLCCAccessor accessor;
+    typedef MLCCAccessor<MlCc> accessor;
     static accessor make_accessor(const MlCc& mat) {
-      return accessor(mat.get_labels_pointer());
+      return accessor(mat);
     }
-    typedef RawMLCCAccessor raw_accessor;
+    typedef RawMLCCAccessor<MlCc> raw_accessor;
     static raw_accessor make_raw_accessor(const MlCc& mat) {
-      return raw_accessor(mat.get_labels_pointer());
+      return raw_accessor(mat);
     }
     typedef accessor real_accessor;
     static real_accessor make_real_accessor(const MlCc& mat) {
-      return real_accessor(mat.get_labels_pointer());
+      return real_accessor(mat);
     }
     typedef BilinearInterpolatingAccessor<raw_accessor, OneBitPixel> interp_accessor;
     static interp_accessor make_interp_accessor(MlCc& mat) {
@@ -813,17 +936,17 @@ namespace Gamera {
 
   template<>
   struct choose_accessor<RleCc> {
-    typedef CCAccessor accessor;
+    typedef CCAccessor<RleCc> accessor;
     static accessor make_accessor(const RleCc& mat) {
-      return accessor(mat.label());
+      return accessor(mat);
     }
-    typedef RawCCAccessor raw_accessor;
+    typedef RawCCAccessor<RleCc> raw_accessor;
     static raw_accessor make_raw_accessor(const RleCc& mat) {
-      return raw_accessor(mat.label());
+      return raw_accessor(mat);
     }
     typedef accessor real_accessor;
     static real_accessor make_real_accessor(const RleCc& mat) {
-      return real_accessor(mat.label());
+      return real_accessor(mat);
     }
     typedef BilinearInterpolatingAccessor<raw_accessor, OneBitPixel> interp_accessor;
     static interp_accessor make_interp_accessor(const RleCc& mat) {
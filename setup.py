@@ -86,10 +86,10 @@ f = open("gamera/__compiletime_config__.py", "w")
 f.write("# automatically generated configuration at compile time\n")
 if has_openmp:
     f.write("has_openmp = True\n")
-    print "Compiling genetic algorithms with parallelization (OpenMP)"
+    print "Compiling genetic algorithms and kNN with parallelization (OpenMP)"
 else:
     f.write("has_openmp = False\n")
-    print "Compiling genetic algorithms without parallelization (OpenMP)"
+    print "Compiling genetic algorithms and kNN without parallelization (OpenMP)"
 f.close()
 
 from distutils.core import setup, Extension
@@ -193,6 +193,22 @@ else:
                       extra_compile_args=["-Wall"]
                       )
 
+knncore_files = ["src/knncoremodule.cpp", "src/geostructs/kdtree.cpp"]
+if has_openmp:
+    ExtKnn = Extension("gamera.knncore",
+                       knncore_files,
+                       include_dirs=["include", "src"],
+                       libraries=galibraries,
+                       extra_compile_args=["-Wall", "-fopenmp"],
+                       extra_link_args=["-fopenmp"]
+                       )
+else:
+    ExtKnn = Extension("gamera.knncore",
+                       knncore_files,
+                       include_dirs=["include", "src"],
+                       **gamera_setup.extras
+                       )
+
 
 extensions = [Extension("gamera.gameracore",
                         ["src/gameramodule.cpp",
@@ -212,11 +228,7 @@ extensions = [Extension("gamera.gameracore",
                         include_dirs=["include"],
                         **gamera_setup.extras
                         ),
-              Extension("gamera.knncore", 
-                        ["src/knncoremodule.cpp"],
-                        include_dirs=["include", "src"],
-                        **gamera_setup.extras
-                        ),
+              ExtKnn,
               ExtGA,
               Extension("gamera.graph", graph_files,
                         include_dirs=["include", "src", "include/graph", "src/graph/graphmodule"],
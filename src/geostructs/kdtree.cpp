@@ -389,4 +389,89 @@ bool KdTree::ball_within_bounds(const CoordPoint &point, double dist, kdtree_nod
   return true;
 }
 
+//--------------------------------------------------------------
+// range search
+// returns all nodes with a distance of at most *r* from *point*
+// in no particular order. Note that *r* is given in the units
+// of the distance measure, i.e. for the Euclidean distance it
+// is the squared radius.
+//--------------------------------------------------------------
+void KdTree::range_nearest_neighbors(const CoordPoint &point, double r, KdNodeVector* result)
+{
+  size_t i;
+  std::vector<size_t> range_result;
+
+  result->clear();
+  if (point.size() != dimension)
+    throw std::invalid_argument("kdtree::range_nearest_neighbors(): point must be of same dimension as kdtree");
+
+  range_search(point, root, r, &range_result);
+  for (i=0; i<range_result.size(); i++)
+    result->push_back(allnodes[range_result[i]]);
+}
+
+//--------------------------------------------------------------
+// recursive function for range search in subtree under *node*.
+// Stores the indices of all nodes in range in *range_result*.
+//--------------------------------------------------------------
+void KdTree::range_search(const CoordPoint &point, kdtree_node* node, double r, std::vector<size_t>* range_result)
+{
+  if (distance->distance(point, node->point) <= r)
+    range_result->push_back(node->dataindex);
+  if (node->loson && bounds_overlap_ball(point, r, node->loson))
+    range_search(point, node->loson, r, range_result);
+  if (node->hison && bounds_overlap_ball(point, r, node->hison))
+    range_search(point, node->hison, r, range_result);
+}
+
+//--------------------------------------------------------------
+// farthest neighbor search
+// returns the node with the largest distance from *point*.
+// Subtrees are only visited when their bounding box could
+// contain a point farther away than the farthest point found
+// so far.
+//--------------------------------------------------------------
+void KdTree::farthest_neighbor(const CoordPoint &point, KdNode* result)
+{
+  if (point.size() != dimension)
+    throw std::invalid_argument("kdtree::farthest_neighbor(): point must be of same dimension as kdtree");
+  farthestindex = root->dataindex;
+  farthestdistance = -1.0;
+  farthest_search(point, root);
+  *result = allnodes[farthestindex];
+}
+
+//--------------------------------------------------------------
+// recursive function for farthest neighbor search in subtree
+// under *node*. Updates the class members *farthestindex*
+// and *farthestdistance*.
+//--------------------------------------------------------------
+void KdTree::farthest_search(const CoordPoint &point, kdtree_node* node)
+{
+  double curdist = distance->distance(point, node->point);
+  if (curdist > farthestdistance) {
+    farthestdistance = curdist;
+    farthestindex = node->dataindex;
+  }
+  if (node->loson && bounds_max_distance(point, node->loson) > farthestdistance)
+    farthest_search(point, node->loson);
+  if (node->hison && bounds_max_distance(point, node->hison) > farthestdistance)
+    farthest_search(point, node->hison);
+}
+
+// returns an upper bound for the distance between *point*
+// and any point within the bounds of *node*
+double KdTree::bounds_max_distance(const CoordPoint &point, kdtree_node* node)
+{
+  double distsum = 0.0;
+  double lodist, updist;
+  size_t i;
+  for (i=0; i<dimension; i++) {
+    lodist = distance->coordinate_distance(point[i],node->lobound[i],i);
+    updist = distance->coordinate_distance(point[i],node->upbound[i],i);
+    distsum += (lodist > updist) ? lodist : updist;
+  }
+  return distsum;
+}
+
 }} // end namespace Gamera::Kdtree
@@ -24,6 +24,9 @@
 #include "iteratorobject.hpp"
 #include "bfsdfsiterator.hpp"
 #include "nodeobject.hpp"
+#include <vector>
+#include <algorithm>
+#include <limits>
 
 
 
@@ -164,6 +167,103 @@ struct DistsSorter {
 
 
 
+// -----------------------------------------------------------------------------
+// graph_create_minimum_spanning_tree_condensed
+// -----------------------------------------------------------------------------
+
+/// An edge of the minimum spanning tree for sorting by cost
+struct CondensedEdge {
+   size_t row, col;
+   float cost;
+   bool operator<(const CondensedEdge& other) const {
+      if (cost != other.cost)
+         return cost < other.cost;
+      if (row != other.row)
+         return row < other.row;
+      return col < other.col;
+   }
+};
+
+
+
+// -----------------------------------------------------------------------------
+/// Creates the minimum spanning tree from the upper triangle of a distance
+/// matrix, given as a buffer of floats in row order. Prim's algorithm needs
+/// no memory beyond the distances, unlike sorting all pairs for Kruskal's
+/// algorithm. The edges are added in the order Kruskal's algorithm would
+/// add them.
+PyObject* graph_create_minimum_spanning_tree_condensed(GraphObject* so, 
+      PyObject* images_seq, PyObject* uniq_dists) {
+
+   size_t n = PySequence_Fast_GET_SIZE(images_seq);
+   const float* dists;
+   Py_ssize_t len;
+   if (!PyObject_CheckReadBuffer(uniq_dists) || 
+         PyObject_AsReadBuffer(uniq_dists, (const void**)&dists, &len) != 0) {
+      PyErr_SetString(PyExc_TypeError, 
+            "uniq_dists must be a float image or a buffer of floats.");
+      return 0;
+   }
+   if (size_t(len) != ((n * n - n) / 2) * sizeof(float)) {
+      PyErr_SetString(PyExc_ValueError, 
+            "uniq_dists must contain the distances of all unique pairs of images.");
+      return 0;
+   }
+
+   // Prim's algorithm on the complete graph
+   std::vector<CondensedEdge> edges;
+   if (n > 1) {
+      std::vector<bool> in_tree(n, false);
+      std::vector<float> best(n, std::numeric_limits<float>::infinity());
+      std::vector<size_t> parent(n, 0);
+      size_t current = 0;
+      in_tree[0] = true;
+      for (size_t added = 1; added < n; ++added) {
+         size_t next = n;
+         for (size_t i = 0; i < n; ++i) {
+            if (in_tree[i])
+               continue;
+            float cost;
+            if (i < current)
+               cost = dists[i * n - (i * (i + 1)) / 2 + (current - i - 1)];
+            else
+               cost = dists[current * n - (current * (current + 1)) / 2 + (i - current - 1)];
+            if (cost < best[i]) {
+               best[i] = cost;
+               parent[i] = current;
+            }
+            if (next == n || best[i] < best[next])
+               next = i;
+         }
+         CondensedEdge edge;
+         edge.row = std::min(next, parent[next]);
+         edge.col = std::max(next, parent[next]);
+         edge.cost = best[next];
+         edges.push_back(edge);
+         in_tree[next] = true;
+         current = next;
+      }
+   }
+   std::sort(edges.begin(), edges.end());
+
+   // get the graph ready
+   so->_graph->remove_all_edges();
+   GRAPH_UNSET_FLAG(so->_graph, FLAG_CYCLIC);
+
+   std::vector<Node*> nodes(n);
+   for (size_t i = 0; i < n; ++i) {
+      GraphDataPyObject* obj = new GraphDataPyObject(PySequence_Fast_GET_ITEM(images_seq, i));
+      nodes[i] = so->_graph->add_node_ptr(obj);
+      assert(nodes[i] != NULL);
+   }
+   for (size_t i = 0; i < edges.size(); ++i)
+      so->_graph->add_edge(nodes[edges[i].row], nodes[edges[i].col], edges[i].cost);
+
+   RETURN_VOID();
+}
+
+
+
 // -----------------------------------------------------------------------------
 PyObject* graph_create_minimum_spanning_tree_unique_distances(GraphObject* so, 
       PyObject* images, PyObject* uniq_dists) {
@@ -189,9 +289,16 @@ PyObject* graph_create_minimum_spanning_tree_unique_distances(GraphObject* so,
       imagebase = (PyTypeObject*)PyDict_GetItemString(dict, "Image");
    }
 
+   // a condensed distance array (see kNN condensed_distances)
+   if (!PyObject_TypeCheck(uniq_dists, imagebase)) {
+      PyObject* result = graph_create_minimum_spanning_tree_condensed(so, 
+            images_seq, uniq_dists);
+      Py_DECREF(images_seq);
+      return result;
+   }
+
    // get the matrix
-   if (!PyObject_TypeCheck(uniq_dists, imagebase)
-         || get_pixel_type(uniq_dists) != Gamera::FLOAT) {
+   if (get_pixel_type(uniq_dists) != Gamera::FLOAT) {
       PyErr_SetString(PyExc_TypeError, "uniq_dists must be a float image.");
       Py_DECREF(images_seq);
       return 0;
@@ -230,15 +337,27 @@ PyObject* graph_create_minimum_spanning_tree_unique_distances(GraphObject* so,
    }
    Py_DECREF(images_seq);
 
-   // create the mst using kruskal
+   // create the mst using kruskal (the graph does not check for cycles on
+   // insertion, so the components are tracked with a union-find structure)
+   std::vector<size_t> component(images_len);
+   for (i = 0; i < images_len; ++i)
+      component[i] = i;
    i = 0;
    while (i < int(indexes.size()) && (int(so->_graph->get_nedges()) 
             < (images_len - 1))) {
 
       size_t row = indexes[i].first;
       size_t col = indexes[i].second;
-      cost_t weight = dists->get(Point(col, row));
-      so->_graph->add_edge(nodes[row], nodes[col], weight);
+      size_t row_root = row, col_root = col;
+      while (component[row_root] != row_root)
+         row_root = component[row_root] = component[component[row_root]];
+      while (component[col_root] != col_root)
+         col_root = component[col_root] = component[component[col_root]];
+      if (row_root != col_root) {
+         component[row_root] = col_root;
+         cost_t weight = dists->get(Point(col, row));
+         so->_graph->add_edge(nodes[row], nodes[col], weight);
+      }
       ++i;
    }
 
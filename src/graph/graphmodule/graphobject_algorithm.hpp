@@ -83,7 +83,12 @@ extern "C" {
   { CHAR_PTR_CAST "create_minimum_spanning_tree", graph_create_minimum_spanning_tree, METH_VARARGS, \
     CHAR_PTR_CAST "**create_minimum_spanning_tree** ()\n\n" \
     "Creates a minimum spanning tree of the entire graph in place using Kruskal's algorithm.\n" \
-    "A minimum spanning tree connects all nodes using the minimum total edge cost.\n" \
+    "A minimum spanning tree connects all nodes using the minimum total edge cost.\n\n" \
+    "**create_minimum_spanning_tree** (*images*, *uniq_dists*)\n\n" \
+    "Replaces the graph with a minimum spanning tree of the given images. *uniq_dists* is " \
+    "either a symmetric FloatImage of the distances (see ``kNN.distance_matrix``) or a " \
+    "buffer of single precision floats with the distances of all unique pairs " \
+    "(see ``kNN.condensed_distances``). The latter needs much less memory.\n" \
   }, \
 
 
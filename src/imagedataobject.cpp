@@ -37,6 +37,9 @@ extern "C" {
   static PyObject* imagedata_get_mbytes(PyObject* self);
   static PyObject* imagedata_get_pixel_type(PyObject* self);
   static PyObject* imagedata_get_storage_format(PyObject* self);
+  static PyObject* imagedata_get_mapped(PyObject* self);
+  static PyObject* imagedata_get_tile_dim(PyObject* self);
+  static PyObject* imagedata_get_shared(PyObject* self);
   static int imagedata_set_page_offset_x(PyObject* self, PyObject* v);
   static int imagedata_set_page_offset_y(PyObject* self, PyObject* v);
   static int imagedata_set_nrows(PyObject* self, PyObject* v);
@@ -73,6 +76,12 @@ static PyGetSetDef imagedata_getset[] = {
     (char *)"(int property get/set)\n\nThe type of the pixels.  See `pixel types`__ for more info.\n\n.. __: image_types.html#pixel-types", 0 },
   { (char *)"storage_format", (getter)imagedata_get_storage_format, 0,
     (char *)"(int property get/set)\n\nThe format of the storage.  See `storage formats`__ for more info.\n\n.. __: image_types.html#storage-formats", 0 },
+  { (char *)"mapped", (getter)imagedata_get_mapped, 0,
+    (char *)"(bool property get)\n\nWhether the pixels are kept in a memory-mapped file.  See `memory-mapped images`__ for more info.\n\n.. __: image_types.html#memory-mapped-images", 0 },
+  { (char *)"tile_dim", (getter)imagedata_get_tile_dim, 0,
+    (char *)"(Dim property get)\n\nThe size of the tiles of TILED image data.  For the other storage formats, the whole data is one tile.  See `tiled images`__ for more info.\n\n.. __: image_types.html#tiled-images", 0 },
+  { (char *)"shared", (getter)imagedata_get_shared, 0,
+    (char *)"(bool property get)\n\nWhether the pixels are shared with a copy of the image, until one of them is changed.  See `shared pixels`__ for more info.\n\n.. __: image_types.html#shared-pixels", 0 },
   { NULL }
 };
 
@@ -99,6 +108,9 @@ static PyObject* imagedata_new(PyTypeObject* pytype, PyObject* args,
 	  return create_ImageDataObject(*(((DimObject*)py_dim)->m_x), coerce_Point(py_point), pixel, format);
 	} catch (std::invalid_argument e) {
 	  ;
+	} catch (std::exception& e) {
+	  PyErr_SetString(PyExc_RuntimeError, e.what());
+	  return 0;
 	}
       }
     }
@@ -124,9 +136,23 @@ static PyObject* imagedata_new(PyTypeObject* pytype, PyObject* args,
 static void imagedata_dealloc(PyObject* self) {
   ImageDataObject* x = (ImageDataObject*)self;
   delete x->m_x;
+  if (x->m_buffer != NULL) {
+    PyBuffer_Release(x->m_buffer);
+    PyMem_Free(x->m_buffer);
+  }
   self->ob_type->tp_free(self);
 }
 
+static bool imagedata_exported(PyObject* self) {
+  if (((ImageDataObject*)self)->m_exports > 0) {
+    PyErr_SetString(PyExc_BufferError,
+                    "The image data cannot be resized while a buffer "
+                    "exported from it (e.g. by to_numpy(copy=False)) is alive.");
+    return true;
+  }
+  return false;
+}
+
 #define CREATE_GET_FUNC(name) static PyObject* imagedata_get_##name(PyObject* self) {\
   ImageDataBase* x = ((ImageDataObject*)self)->m_x; \
   return PyInt_FromLong((int)x->name()); \
@@ -138,6 +164,16 @@ static void imagedata_dealloc(PyObject* self) {
   return 0; \
 }
 
+// setters that resize the data, which would move the pixels under
+// any buffer exported on it
+#define CREATE_RESIZE_SET_FUNC(name) static int imagedata_set_##name(PyObject* self, PyObject* value) {\
+  if (imagedata_exported(self)) \
+    return -1; \
+  ImageDataBase* x = ((ImageDataObject*)self)->m_x; \
+  x->name((size_t)PyInt_AS_LONG(value)); \
+  return 0; \
+}
+
 CREATE_GET_FUNC(stride)
 CREATE_GET_FUNC(ncols)
 CREATE_GET_FUNC(nrows)
@@ -148,8 +184,8 @@ CREATE_GET_FUNC(bytes)
 
 CREATE_SET_FUNC(page_offset_x)
 CREATE_SET_FUNC(page_offset_y)
-CREATE_SET_FUNC(nrows)
-CREATE_SET_FUNC(ncols)
+CREATE_RESIZE_SET_FUNC(nrows)
+CREATE_RESIZE_SET_FUNC(ncols)
 
 static PyObject* imagedata_get_mbytes(PyObject* self) {
   ImageDataBase* x = ((ImageDataObject*)self)->m_x;
@@ -164,7 +200,21 @@ static PyObject* imagedata_get_storage_format(PyObject* self) {
   return Py_BuildValue(CHAR_PTR_CAST "i", ((ImageDataObject*)self)->m_storage_format);
 }
 
+static PyObject* imagedata_get_mapped(PyObject* self) {
+  return PyBool_FromLong(((ImageDataObject*)self)->m_x->mapped());
+}
+
+static PyObject* imagedata_get_tile_dim(PyObject* self) {
+  return create_DimObject(((ImageDataObject*)self)->m_x->tile_dim());
+}
+
+static PyObject* imagedata_get_shared(PyObject* self) {
+  return PyBool_FromLong(((ImageDataObject*)self)->m_x->shared());
+}
+
 static PyObject* imagedata_dimensions(PyObject* self, PyObject* args) {
+  if (imagedata_exported(self))
+    return 0;
   ImageDataBase* x = ((ImageDataObject*)self)->m_x;
   int num_args = PyTuple_GET_SIZE(args);
   if (num_args == 1) {
@@ -226,6 +276,10 @@ void init_ImageDataType(PyObject* module_dict) {
 		       Py_BuildValue(CHAR_PTR_CAST "i", DENSE));
   PyDict_SetItemString(module_dict, "RLE",
 		       Py_BuildValue(CHAR_PTR_CAST "i", RLE));
+  PyDict_SetItemString(module_dict, "PACKED",
+		       Py_BuildValue(CHAR_PTR_CAST "i", PACKED));
+  PyDict_SetItemString(module_dict, "TILED",
+		       Py_BuildValue(CHAR_PTR_CAST "i", TILED));
 }
 
 
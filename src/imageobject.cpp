@@ -22,6 +22,7 @@
 #include "gameramodule.hpp"
 #include "pixel.hpp"
 #include <vector>
+#include <cstring>
 
 using namespace Gamera;
 
@@ -55,6 +56,11 @@ extern "C" {
   static PyObject* image_getitem(PyObject* self, PyObject* args);
   static PyObject* image_setitem(PyObject* self, PyObject* args);
   static PyObject* image_len(PyObject* self, PyObject* args);
+  static PyObject* image_from_mmap(PyObject* pytype, PyObject* args, PyObject* kwds);
+  static PyObject* image_from_buffer(PyObject* pytype, PyObject* args, PyObject* kwds);
+  // buffer interface
+  static int image_getbuffer(PyObject* self, Py_buffer* view, int flags);
+  static void image_releasebuffer(PyObject* self, Py_buffer* view);
   // Removed 07/28/04 MGD.  Can't figure out why this is useful.
   // static PyObject* image_sort(PyObject* self, PyObject* args);
   // Get/set
@@ -207,6 +213,35 @@ static PyMethodDef image_methods[] = {
   { (char *)"black", image_black, METH_NOARGS,
 (char *)"Pixel **black** ()\n\n"
 "Returns the pixel value representing the color black for this image."
+  },
+  { (char *)"from_mmap", (PyCFunction)image_from_mmap,
+    METH_VARARGS | METH_KEYWORDS | METH_CLASS,
+(char *)"Image **from_mmap** (str *path*, Dim *dim*, int *pixel_type* = ONEBIT)\n\n"
+"Creates a DENSE image whose pixels are the raw data of the file *path*, "
+"mapped into memory instead of being read.  The file holds the pixels "
+"row by row in the machine's byte order (for instance one byte per pixel "
+"for GREYSCALE, three for RGB and four for GREY16).\n\n"
+"If the file does not exist or is too short, it is created or extended "
+"with zeros.  All changes to the image are written to the file, and only "
+"the parts of the image that are used are held in memory.  See "
+"`memory-mapped images`__ for more info.\n\n"
+".. __: image_types.html#memory-mapped-images"
+  },
+  { (char *)"from_buffer", (PyCFunction)image_from_buffer,
+    METH_VARARGS | METH_KEYWORDS | METH_CLASS,
+(char *)"Image **from_buffer** (object *buffer*, Point *offset* = (0, 0))\n\n"
+"Creates a DENSE image on the memory of *buffer*, which can be any "
+"object with the buffer interface, such as a NumPy array.  The pixels "
+"are not copied: changes to the image are seen in *buffer* and vice "
+"versa.  The image keeps *buffer* alive.\n\n"
+"The buffer must be writable and C-contiguous with two dimensions "
+"(rows, columns), or three for RGB.  Its values determine the pixel "
+"type: uint16 for ONEBIT, uint8 for GREYSCALE (or RGB on three planes), "
+"uint32 for GREY16, float64 for FLOAT and complex128 for COMPLEX.\n\n"
+"Conversely, DENSE images themselves support the buffer interface, "
+"so that for instance ``numpy.asarray(image)`` shares the pixels of "
+"*image*.  The buffer of a subimage has the row stride of the whole "
+"image."
   },
   { (char *)"__getitem__", image_getitem, METH_VARARGS },
   { (char *)"__setitem__", image_setitem, METH_VARARGS },
@@ -217,7 +252,7 @@ static PyMethodDef image_methods[] = {
 };
 
 static PyObject* _image_new(PyTypeObject* pytype, const Point& offset, const Dim& dim,
-                            int pixel, int format) {
+                            int pixel, int format, const char* path = NULL) {
   /*
     This is looks really awful, but it is not. We are simply creating a
     matrix view and some matrix data based on the pixel type and storage
@@ -233,27 +268,27 @@ static PyObject* _image_new(PyTypeObject* pytype, const Point& offset, const Dim
   try {
     if (format == DENSE) {
       if (pixel == ONEBIT) {
-        py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format);
+        py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format, path);
         ImageData<OneBitPixel>* data = (ImageData<OneBitPixel>*)(py_data->m_x);
         image = (Rect*)new ImageView<ImageData<OneBitPixel> >(*data, offset, dim);
       } else if (pixel == GREYSCALE) {
-        py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format);
+        py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format, path);
         ImageData<GreyScalePixel>* data = (ImageData<GreyScalePixel>*)(py_data->m_x);
         image = (Rect *)new ImageView<ImageData<GreyScalePixel> >(*data, offset, dim);
       } else if (pixel == GREY16) {
-        py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format);
+        py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format, path);
         ImageData<Grey16Pixel>* data = (ImageData<Grey16Pixel>*)(py_data->m_x);
         image = (Rect*)new ImageView<ImageData<Grey16Pixel> >(*data, offset, dim);
       } else if (pixel == Gamera::FLOAT) {
-        py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format);
+        py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format, path);
         ImageData<FloatPixel>* data = (ImageData<FloatPixel>*)(py_data->m_x);
         image = (Rect*)new ImageView<ImageData<FloatPixel> >(*data, offset, dim);
       } else if (pixel == RGB) {
-        py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format);
+        py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format, path);
         ImageData<RGBPixel>* data = (ImageData<RGBPixel>*)(py_data->m_x);
         image = (Rect*)new ImageView<ImageData<RGBPixel> >(*data, offset, dim);
       } else if (pixel == Gamera::COMPLEX) {
-        py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format);
+        py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format, path);
         ImageData<ComplexPixel>* data = (ImageData<ComplexPixel>*)(py_data->m_x);
         image = (Rect*)new ImageView<ImageData<ComplexPixel> >(*data, offset, dim);
       } else {
@@ -270,12 +305,44 @@ static PyObject* _image_new(PyTypeObject* pytype, const Point& offset, const Dim
                         "Pixel type must be ONEBIT if storage format is RLE.");
         return NULL;
       }
+    } else if (format == PACKED) {
+      if (pixel == ONEBIT) {
+        py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format);
+        PackedImageData<OneBitPixel>* data = (PackedImageData<OneBitPixel>*)(py_data->m_x);
+        image = (Rect*)new ImageView<PackedImageData<OneBitPixel> >(*data, offset, dim);
+      } else {
+        PyErr_SetString(PyExc_TypeError,
+                        "Pixel type must be ONEBIT if storage format is PACKED.");
+        return NULL;
+      }
+    } else if (format == TILED) {
+      if (pixel == ONEBIT) {
+        py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format);
+        TiledImageData<OneBitPixel>* data = (TiledImageData<OneBitPixel>*)(py_data->m_x);
+        image = (Rect*)new ImageView<TiledImageData<OneBitPixel> >(*data, offset, dim);
+      }       else if (pixel == GREYSCALE) {
+        py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format);
+        TiledImageData<GreyScalePixel>* data = (TiledImageData<GreyScalePixel>*)(py_data->m_x);
+        image = (Rect*)new ImageView<TiledImageData<GreyScalePixel> >(*data, offset, dim);
+      }       else if (pixel == GREY16) {
+        py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format);
+        TiledImageData<Grey16Pixel>* data = (TiledImageData<Grey16Pixel>*)(py_data->m_x);
+        image = (Rect*)new ImageView<TiledImageData<Grey16Pixel> >(*data, offset, dim);
+      }       else if (pixel == RGB) {
+        py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format);
+        TiledImageData<RGBPixel>* data = (TiledImageData<RGBPixel>*)(py_data->m_x);
+        image = (Rect*)new ImageView<TiledImageData<RGBPixel> >(*data, offset, dim);
+      } else {
+        PyErr_SetString(PyExc_TypeError,
+                        "Pixel type must be ONEBIT, GREYSCALE, GREY16 or RGB if storage format is TILED.");
+        return NULL;
+      }
     } else {
       PyErr_SetString(PyExc_TypeError, "Unknown pixel type/storage format combination.");
       return NULL;
     }
   } catch (std::exception& e) {
-    Py_DECREF(py_data);
+    Py_XDECREF(py_data);
     delete image;
     PyErr_SetString(PyExc_RuntimeError, e.what());
     return NULL;
@@ -407,6 +474,264 @@ static PyObject* image_new(PyTypeObject* pytype, PyObject* args,
   return 0;
 }
 
+static PyObject* image_from_mmap(PyObject* pytype, PyObject* args,
+                                 PyObject* kwds) {
+  char* path;
+  PyObject* py_dim;
+  int pixel = ONEBIT;
+  static const char *kwlist[] = {"path", "dim", "pixel_type", NULL};
+  if (PyArg_ParseTupleAndKeywords(args, kwds, (char *)"sO|i", (char **)kwlist,
+                                  &path, &py_dim, &pixel) <= 0)
+    return 0;
+  if (!is_DimObject(py_dim)) {
+    PyErr_SetString(PyExc_TypeError, "dim must be a Dim object.");
+    return 0;
+  }
+  return _image_new((PyTypeObject*)pytype, Point(0, 0), *((DimObject*)py_dim)->m_x,
+                    pixel, DENSE, path);
+}
+
+/*
+  The buffer interface gives other objects (like NumPy arrays) direct
+  access to the pixels of DENSE images.  RGB images have a third
+  dimension with the three color planes.  For the format strings, see
+  the struct module.
+*/
+static const char* buffer_format(int pixel_type, size_t& itemsize, size_t& planes) {
+  planes = 1;
+  switch (pixel_type) {
+  case Gamera::ONEBIT:
+    itemsize = sizeof(OneBitPixel);
+    return "H";
+  case Gamera::GREYSCALE:
+    itemsize = sizeof(GreyScalePixel);
+    return "B";
+  case Gamera::GREY16:
+    itemsize = sizeof(Grey16Pixel);
+    return "I";
+  case Gamera::FLOAT:
+    itemsize = sizeof(FloatPixel);
+    return "d";
+  case Gamera::RGB:
+    itemsize = sizeof(GreyScalePixel);
+    planes = 3;
+    return "B";
+  case Gamera::COMPLEX:
+    itemsize = sizeof(ComplexPixel);
+    return "Zd";
+  default:
+    return 0;
+  }
+}
+
+/*
+  The pixels are handed out, so they must not be shared with (or by)
+  copies of the image any more.
+*/
+template<class T>
+static char* unshared_pixels(ImageDataBase* data) {
+  ImageData<T>* dense = (ImageData<T>*)data;
+  dense->unshare();
+  return (char*)dense->begin();
+}
+
+static char* dense_pixels(ImageDataObject* od) {
+  switch (od->m_pixel_type) {
+  case Gamera::ONEBIT:
+    return unshared_pixels<OneBitPixel>(od->m_x);
+  case Gamera::GREYSCALE:
+    return unshared_pixels<GreyScalePixel>(od->m_x);
+  case Gamera::GREY16:
+    return unshared_pixels<Grey16Pixel>(od->m_x);
+  case Gamera::FLOAT:
+    return unshared_pixels<FloatPixel>(od->m_x);
+  case Gamera::RGB:
+    return unshared_pixels<RGBPixel>(od->m_x);
+  case Gamera::COMPLEX:
+    return unshared_pixels<ComplexPixel>(od->m_x);
+  default:
+    return 0;
+  }
+}
+
+static int image_getbuffer(PyObject* self, Py_buffer* view, int flags) {
+  ImageDataObject* od = (ImageDataObject*)((ImageObject*)self)->m_data;
+  Rect* r = ((RectObject*)self)->m_x;
+  if (is_CCObject(self) || is_MLCCObject(self)) {
+    PyErr_SetString(PyExc_BufferError,
+                    "Connected components share their data with other connected "
+                    "components and have no buffer.  Use image_copy first.");
+    return -1;
+  }
+  size_t itemsize, planes;
+  const char* format = buffer_format(od->m_pixel_type, itemsize, planes);
+  if (od->m_storage_format != DENSE || format == 0) {
+    PyErr_SetString(PyExc_BufferError,
+                    "Only DENSE images have a buffer.  Use image_copy(DENSE) first.");
+    return -1;
+  }
+  ImageDataBase* data = od->m_x;
+  // the rows of subimages are not contiguous
+  bool contiguous = r->nrows() == 1 || r->ncols() == data->stride();
+  if ((flags & PyBUF_F_CONTIGUOUS) == PyBUF_F_CONTIGUOUS
+      || (!contiguous && ((flags & PyBUF_STRIDES) != PyBUF_STRIDES
+                          || (flags & PyBUF_C_CONTIGUOUS) == PyBUF_C_CONTIGUOUS
+                          || (flags & PyBUF_ANY_CONTIGUOUS) == PyBUF_ANY_CONTIGUOUS))) {
+    PyErr_SetString(PyExc_BufferError,
+                    "The image is not contiguous.  Use image_copy first.");
+    return -1;
+  }
+
+  size_t pixel_size = itemsize * planes;
+  Py_ssize_t* dims = (Py_ssize_t*)PyMem_Malloc(6 * sizeof(Py_ssize_t));
+  if (dims == 0) {
+    PyErr_NoMemory();
+    return -1;
+  }
+  Py_ssize_t* shape = dims;
+  Py_ssize_t* strides = dims + 3;
+  shape[0] = r->nrows();
+  shape[1] = r->ncols();
+  shape[2] = planes;
+  strides[0] = data->stride() * pixel_size;
+  strides[1] = pixel_size;
+  strides[2] = itemsize;
+
+  view->buf = dense_pixels(od)
+    + ((r->offset_y() - data->page_offset_y()) * data->stride()
+       + r->offset_x() - data->page_offset_x()) * pixel_size;
+  view->obj = self;
+  Py_INCREF(self);
+  view->len = r->nrows() * r->ncols() * pixel_size;
+  view->readonly = 0;
+  view->itemsize = itemsize;
+  view->format = (flags & PyBUF_FORMAT) ? (char*)format : NULL;
+  view->ndim = planes == 1 ? 2 : 3;
+  view->shape = (flags & PyBUF_ND) == PyBUF_ND ? shape : NULL;
+  view->strides = (flags & PyBUF_STRIDES) == PyBUF_STRIDES ? strides : NULL;
+  view->suboffsets = NULL;
+  view->internal = dims;
+  ++od->m_exports;
+  return 0;
+}
+
+static void image_releasebuffer(PyObject* self, Py_buffer* view) {
+  --((ImageDataObject*)((ImageObject*)self)->m_data)->m_exports;
+  PyMem_Free(view->internal);
+}
+
+static int buffer_pixel_type(const Py_buffer* view) {
+  const char* format = view->format;
+  if (format == 0)
+    format = "B";
+  else if (format[0] == '@' || format[0] == '=')
+    ++format;
+  int pixel_types[] = {ONEBIT, GREYSCALE, GREY16, Gamera::FLOAT, RGB, Gamera::COMPLEX};
+  for (size_t i = 0; i < sizeof(pixel_types) / sizeof(int); ++i) {
+    size_t itemsize, planes;
+    const char* pixel_format = buffer_format(pixel_types[i], itemsize, planes);
+    if (strcmp(format, pixel_format) == 0 && size_t(view->itemsize) == itemsize
+        && view->ndim == (planes == 1 ? 2 : 3)
+        && (planes == 1 || view->shape[2] == Py_ssize_t(planes)))
+      return pixel_types[i];
+  }
+  return -1;
+}
+
+template<class T>
+static Rect* _image_on_buffer(ImageDataObject* py_data, const Point& offset,
+                              const Dim& dim) {
+  ImageData<T>* data = new ImageData<T>(dim, offset, (T*)py_data->m_buffer->buf);
+  py_data->m_x = data;
+  data->m_user_data = (void*)py_data;
+  return (Rect*)new ImageView<ImageData<T> >(*data, offset, dim);
+}
+
+static PyObject* image_from_buffer(PyObject* pytype, PyObject* args,
+                                   PyObject* kwds) {
+  PyObject* py_buffer;
+  PyObject* py_offset = NULL;
+  static const char *kwlist[] = {"buffer", "offset", NULL};
+  if (PyArg_ParseTupleAndKeywords(args, kwds, (char *)"O|O", (char **)kwlist,
+                                  &py_buffer, &py_offset) <= 0)
+    return 0;
+  Point offset;
+  if (py_offset != NULL) {
+    try {
+      offset = coerce_Point(py_offset);
+    } catch (std::invalid_argument e) {
+      PyErr_SetString(PyExc_TypeError, "offset must be a Point.");
+      return 0;
+    }
+  }
+  if (!PyObject_CheckBuffer(py_buffer)) {
+    PyErr_SetString(PyExc_TypeError, "The object does not have a buffer.");
+    return 0;
+  }
+
+  Py_buffer* view = (Py_buffer*)PyMem_Malloc(sizeof(Py_buffer));
+  if (view == 0)
+    return PyErr_NoMemory();
+  if (PyObject_GetBuffer(py_buffer, view,
+                         PyBUF_C_CONTIGUOUS | PyBUF_FORMAT | PyBUF_WRITABLE) < 0) {
+    PyMem_Free(view);
+    return 0;
+  }
+  int pixel = buffer_pixel_type(view);
+  if (pixel < 0 || view->shape[0] < 1 || view->shape[1] < 1) {
+    PyBuffer_Release(view);
+    PyMem_Free(view);
+    PyErr_SetString(PyExc_TypeError,
+                    "The buffer must have two dimensions (three for RGB) and "
+                    "hold uint16 (ONEBIT), uint8 (GREYSCALE, or RGB on three "
+                    "planes), uint32 (GREY16), float64 (FLOAT) or complex128 "
+                    "(COMPLEX) values.");
+    return 0;
+  }
+  Dim dim(view->shape[1], view->shape[0]);
+
+  PyTypeObject* id_type = get_ImageDataType();
+  if (id_type == 0) {
+    PyBuffer_Release(view);
+    PyMem_Free(view);
+    return 0;
+  }
+  ImageDataObject* py_data = (ImageDataObject*)id_type->tp_alloc(id_type, 0);
+  py_data->m_pixel_type = pixel;
+  py_data->m_storage_format = DENSE;
+  py_data->m_exports = 0;
+  // released with the image data
+  py_data->m_buffer = view;
+  Rect* image;
+  switch (pixel) {
+  case ONEBIT:
+    image = _image_on_buffer<OneBitPixel>(py_data, offset, dim);
+    break;
+  case GREYSCALE:
+    image = _image_on_buffer<GreyScalePixel>(py_data, offset, dim);
+    break;
+  case GREY16:
+    image = _image_on_buffer<Grey16Pixel>(py_data, offset, dim);
+    break;
+  case Gamera::FLOAT:
+    image = _image_on_buffer<FloatPixel>(py_data, offset, dim);
+    break;
+  case RGB:
+    image = _image_on_buffer<RGBPixel>(py_data, offset, dim);
+    break;
+  default:
+    image = _image_on_buffer<ComplexPixel>(py_data, offset, dim);
+    break;
+  }
+
+  PyTypeObject* type = (PyTypeObject*)pytype;
+  ImageObject* o = (ImageObject*)type->tp_alloc(type, 0);
+  o->m_weakreflist = NULL;
+  o->m_data = (PyObject*)py_data;
+  ((RectObject*)o)->m_x = image;
+  return init_image_members(o);
+}
+
 static PyObject* _sub_image_new(PyTypeObject* pytype, PyObject* py_src, const Point& offset,
                                 const Dim& dim) {
   if (!is_ImageObject(py_src)) {
@@ -460,6 +785,38 @@ static PyObject* _sub_image_new(PyTypeObject* pytype, PyObject* py_src, const Po
                         "Pixel type must be ONEBIT if storage format is RLE.  Receiving this error indicates an internal inconsistency or memory corruption.  Please report it on the Gamera mailing list.");
         return NULL;
       }
+    } else if (format == PACKED) {
+      if (pixel == ONEBIT) {
+        PackedImageData<OneBitPixel>* data =
+          ((PackedImageData<OneBitPixel>*)((ImageDataObject*)src->m_data)->m_x);
+        subimage = (Rect *)new ImageView<PackedImageData<OneBitPixel> >(*data, offset, dim);
+      } else {
+        PyErr_SetString(PyExc_TypeError,
+                        "Pixel type must be ONEBIT if storage format is PACKED.  Receiving this error indicates an internal inconsistency or memory corruption.  Please report it on the Gamera mailing list.");
+        return NULL;
+      }
+    } else if (format == TILED) {
+      if (pixel == ONEBIT) {
+        TiledImageData<OneBitPixel>* data =
+          ((TiledImageData<OneBitPixel>*)((ImageDataObject*)src->m_data)->m_x);
+        subimage = (Rect *)new ImageView<TiledImageData<OneBitPixel> >(*data, offset, dim);
+      }       else if (pixel == GREYSCALE) {
+        TiledImageData<GreyScalePixel>* data =
+          ((TiledImageData<GreyScalePixel>*)((ImageDataObject*)src->m_data)->m_x);
+        subimage = (Rect *)new ImageView<TiledImageData<GreyScalePixel> >(*data, offset, dim);
+      }       else if (pixel == GREY16) {
+        TiledImageData<Grey16Pixel>* data =
+          ((TiledImageData<Grey16Pixel>*)((ImageDataObject*)src->m_data)->m_x);
+        subimage = (Rect *)new ImageView<TiledImageData<Grey16Pixel> >(*data, offset, dim);
+      }       else if (pixel == RGB) {
+        TiledImageData<RGBPixel>* data =
+          ((TiledImageData<RGBPixel>*)((ImageDataObject*)src->m_data)->m_x);
+        subimage = (Rect *)new ImageView<TiledImageData<RGBPixel> >(*data, offset, dim);
+      } else {
+        PyErr_SetString(PyExc_TypeError,
+                        "Pixel type must be ONEBIT, GREYSCALE, GREY16 or RGB if storage format is TILED.  Receiving this error indicates an internal inconsistency or memory corruption.  Please report it on the Gamera mailing list.");
+        return NULL;
+      }
     } else {
       PyErr_SetString(PyExc_TypeError, "Unknown pixel type/storage format combination.  Receiving this error indicates an internal inconsistency or memory corruption.  Please report it on the Gamera mailing list.");
       return NULL;
@@ -590,6 +947,12 @@ static PyObject* _cc_new(PyTypeObject* pytype, PyObject* py_src, int label,
       RleImageData<OneBitPixel>* data =
         ((RleImageData<OneBitPixel>*)((ImageDataObject*)src->m_data)->m_x);
       cc = (Rect*)new ConnectedComponent<RleImageData<OneBitPixel> >(*data, label, offset, dim);
+    } else if (format == PACKED) {
+      PyErr_SetString(PyExc_TypeError, "Cc objects cannot be created from PACKED images, since they store only one bit per pixel and no labels.");
+      return NULL;
+    } else if (format == TILED) {
+      PyErr_SetString(PyExc_TypeError, "Cc objects cannot be created from TILED images.  Convert the image with image_copy(DENSE) first.");
+      return NULL;
     } else {
       PyErr_SetString(PyExc_TypeError, "Unknown pixel type/storage format combination.   Receiving this error indicates an internal inconsistency or memory corruption.  Please report it on the Gamera mailing list.");
       return NULL;
@@ -752,6 +1115,66 @@ static PyObject* image_repr(PyObject* self) {
                              (int)x->ncols(), (int)x->nrows());
 }
 
+/*
+  The tiles of TILED images may have to be read from a file, which can
+  fail.
+*/
+static PyObject* tiled_image_get(ImageDataObject* od, Rect* image, const Point& point) {
+  try {
+    switch (od->m_pixel_type) {
+    case Gamera::RGB:
+      return create_RGBPixelObject(((RGBTiledImageView*)image)->get(point));
+    case Gamera::GREYSCALE:
+      return PyInt_FromLong(((GreyScaleTiledImageView*)image)->get(point));
+    case Gamera::GREY16:
+      return PyInt_FromLong(((Grey16TiledImageView*)image)->get(point));
+    case Gamera::ONEBIT:
+      return PyInt_FromLong(((OneBitTiledImageView*)image)->get(point));
+    default:
+      return 0;
+    }
+  } catch (std::exception& e) {
+    PyErr_SetString(PyExc_RuntimeError, e.what());
+    return 0;
+  }
+}
+
+static PyObject* tiled_image_set(PyObject* self, const Point& point, PyObject* value) {
+  ImageDataObject* od = (ImageDataObject*)((ImageObject*)self)->m_data;
+  Rect* image = ((RectObject*)self)->m_x;
+  if (od->m_pixel_type == RGB) {
+    if (!is_RGBPixelObject(value)) {
+      PyErr_SetString(PyExc_TypeError, "Pixel value for RGB objects must be an RGBPixel");
+      return 0;
+    }
+  } else if (!PyInt_Check(value)) {
+    PyErr_Format(PyExc_TypeError, "Pixel value for %s objects must be an int.",
+                 get_pixel_type_name(self));
+    return 0;
+  }
+  try {
+    switch (od->m_pixel_type) {
+    case Gamera::RGB:
+      ((RGBTiledImageView*)image)->set(point, *((RGBPixelObject*)value)->m_x);
+      break;
+    case Gamera::GREYSCALE:
+      ((GreyScaleTiledImageView*)image)->set(point, (GreyScalePixel)PyInt_AS_LONG(value));
+      break;
+    case Gamera::GREY16:
+      ((Grey16TiledImageView*)image)->set(point, (Grey16Pixel)PyInt_AS_LONG(value));
+      break;
+    case Gamera::ONEBIT:
+      ((OneBitTiledImageView*)image)->set(point, (OneBitPixel)PyInt_AS_LONG(value));
+      break;
+    }
+  } catch (std::exception& e) {
+    PyErr_SetString(PyExc_RuntimeError, e.what());
+    return 0;
+  }
+  Py_INCREF(Py_None);
+  return Py_None;
+}
+
 static PyObject* image_get(PyObject* self, const Point& point) {
   RectObject* o = (RectObject*)self;
   ImageDataObject* od = (ImageDataObject*)((ImageObject*)self)->m_data;
@@ -769,6 +1192,10 @@ static PyObject* image_get(PyObject* self, const Point& point) {
     return PyInt_FromLong(((MlCc*)o->m_x)->get(point));
   } else if (od->m_storage_format == RLE) {
     return PyInt_FromLong(((OneBitRleImageView*)o->m_x)->get(point));
+  } else if (od->m_storage_format == PACKED) {
+    return PyInt_FromLong(((OneBitPackedImageView*)o->m_x)->get(point));
+  } else if (od->m_storage_format == TILED) {
+    return tiled_image_get(od, o->m_x, point);
   } else {
     switch (od->m_pixel_type) {
     case Gamera::FLOAT:
@@ -820,6 +1247,8 @@ static PyObject* image_set(PyObject* self, const Point& point, PyObject* value)
       return 0;
     }
     ((MlCc*)o->m_x)->set(point, (OneBitPixel)PyInt_AS_LONG(value));
+  } else if (od->m_storage_format == TILED) {
+    return tiled_image_set(self, point, value);
   } else if (od->m_pixel_type == Gamera::FLOAT) {
     if (!PyFloat_Check(value)) {
       PyErr_SetString(PyExc_TypeError, "Pixel value for Float objects must be a float.");
@@ -833,6 +1262,13 @@ static PyObject* image_set(PyObject* self, const Point& point, PyObject* value)
     }
     ((OneBitRleImageView*)o->m_x)->set(point,
                                        (OneBitPixel)PyInt_AS_LONG(value));
+  } else if (od->m_storage_format == PACKED) {
+    if (!PyInt_Check(value)) {
+      PyErr_SetString(PyExc_TypeError, "Pixel value for OneBit objects must be an int.");
+      return 0;
+    }
+    ((OneBitPackedImageView*)o->m_x)->set(point,
+                                          (OneBitPixel)PyInt_AS_LONG(value));
   } else if (od->m_pixel_type == RGB) {
     if (!is_RGBPixelObject((PyObject*)value)) {
       PyErr_SetString(PyExc_TypeError, "Pixel value for RGB objects must be an RGBPixel");
@@ -1644,6 +2080,12 @@ static PyObject* _mlcc_new(PyTypeObject* pytype, PyObject* py_src, int label, co
     } else if (format == RLE) {
       PyErr_SetString(PyExc_TypeError, "MultiLabelCCs cannot be used with runline length encoding.");
       return NULL;
+    } else if (format == PACKED) {
+      PyErr_SetString(PyExc_TypeError, "MultiLabelCCs cannot be used with PACKED images.");
+      return NULL;
+    } else if (format == TILED) {
+      PyErr_SetString(PyExc_TypeError, "MultiLabelCCs cannot be used with TILED images.");
+      return NULL;
     } else {
       PyErr_SetString(PyExc_TypeError, "Unknown pixel type/storage format combination. Receiving this error indicates an internal inconsistency or memory corruption.  Please report it on the Gamera mailing list.");
       return NULL;
@@ -1862,13 +2304,17 @@ static PyObject* mlcc_richcompare(PyObject* a, PyObject* b, int op) {
   }
 }
 
+static PyBufferProcs image_as_buffer = {
+  0, 0, 0, 0, (getbufferproc)image_getbuffer, (releasebufferproc)image_releasebuffer
+};
+
 void init_ImageType(PyObject* module_dict) {
   ImageType.ob_type = &PyType_Type;
   ImageType.tp_name = CHAR_PTR_CAST "gameracore.Image";
   ImageType.tp_basicsize = sizeof(ImageObject);
   ImageType.tp_dealloc = image_dealloc;
   ImageType.tp_flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE |
-    Py_TPFLAGS_HAVE_WEAKREFS | Py_TPFLAGS_HAVE_GC;
+    Py_TPFLAGS_HAVE_WEAKREFS | Py_TPFLAGS_HAVE_GC | Py_TPFLAGS_HAVE_NEWBUFFER;
   ImageType.tp_base = get_RectType();
   ImageType.tp_getset = image_getset;
   ImageType.tp_methods = image_methods;
@@ -1882,6 +2328,7 @@ void init_ImageType(PyObject* module_dict) {
   ImageType.tp_traverse = image_traverse;
   ImageType.tp_clear = image_clear;
   ImageType.tp_repr = image_repr;
+  ImageType.tp_as_buffer = &image_as_buffer;
   ImageType.tp_doc = CHAR_PTR_CAST
 "The Image constructor creates a new image with newly allocated underlying data.\n\n"
 "There are multiple ways to create an Image:\n\n"
@@ -1912,7 +2359,7 @@ void init_ImageType(PyObject* module_dict) {
   SubImageType.tp_basicsize = sizeof(SubImageObject);
   SubImageType.tp_dealloc = image_dealloc;
   SubImageType.tp_flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE |
-    Py_TPFLAGS_HAVE_WEAKREFS | Py_TPFLAGS_HAVE_GC;
+    Py_TPFLAGS_HAVE_WEAKREFS | Py_TPFLAGS_HAVE_GC | Py_TPFLAGS_HAVE_NEWBUFFER;
   SubImageType.tp_base = &ImageType;
   SubImageType.tp_new = sub_image_new;
   SubImageType.tp_init = (initproc)sub_image_init;
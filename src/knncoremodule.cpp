@@ -41,6 +41,15 @@
 #include <time.h>
 // exception handling
 #include <stdexcept>
+#include <string>
+#include <limits>
+// memory mapped classifier files
+#ifndef _WIN32
+#define KNN_HAVE_MMAP
+#include <sys/types.h>
+#include <sys/stat.h>
+#include <sys/mman.h>
+#endif
 
 using namespace Gamera;
 using namespace Gamera::kNN;
@@ -64,13 +73,24 @@ extern "C" {
   // classification
   static PyObject* knn_classify(PyObject* self, PyObject* args);
   static PyObject* knn_classify_with_images(PyObject* self, PyObject* args);
+  static PyObject* knn_classify_batch(PyObject* self, PyObject* args);
   static PyObject* knn_leave_one_out(PyObject* self, PyObject* args);
+  static PyObject* knn_leave_one_out_neighbors(PyObject* self, PyObject* args);
+  static PyObject* knn_leave_one_out_from_neighbors(PyObject* self, PyObject* args);
+  static PyObject* knn_edit_mnn(PyObject* self, PyObject* args);
+  static PyObject* knn_edit_cnn(PyObject* self, PyObject* args);
+  // the glyph store of interactive classifiers
+  static PyObject* knn_store_add(PyObject* self, PyObject* args);
+  static PyObject* knn_store_remove(PyObject* self, PyObject* args);
+  static PyObject* knn_store_clear(PyObject* self, PyObject* args);
+  static PyObject* knn_classify_with_store(PyObject* self, PyObject* args);
   // distance
   static PyObject* knn_knndistance_statistics(PyObject* self, PyObject* args);
   static PyObject* knn_distance_from_images(PyObject* self, PyObject* args);
   static PyObject* knn_distance_between_images(PyObject* self, PyObject* args);
   static PyObject* knn_distance_matrix(PyObject* self, PyObject* args);
   static PyObject* knn_unique_distances(PyObject* self, PyObject* args);
+  static PyObject* knn_condensed_distances(PyObject* self, PyObject* args);
   // settings
   static PyObject* knn_get_num_k(PyObject* self);
   static int knn_set_num_k(PyObject* self, PyObject* v);
@@ -84,6 +104,12 @@ extern "C" {
   static PyObject* knn_set_weights(PyObject* self, PyObject* args);
   static PyObject* knn_get_num_features(PyObject* self);
   static int knn_set_num_features(PyObject* self, PyObject* v);
+  static PyObject* knn_get_use_index(PyObject* self);
+  static int knn_set_use_index(PyObject* self, PyObject* v);
+  static PyObject* knn_get_single_precision(PyObject* self);
+  static int knn_set_single_precision(PyObject* self, PyObject* v);
+  static PyObject* knn_get_abandoned_comparisons(PyObject* self);
+  static int knn_set_abandoned_comparisons(PyObject* self, PyObject* v);
   // saving/loading
   static PyObject* knn_serialize(PyObject* self, PyObject* args);
   static PyObject* knn_unserialize(PyObject* self, PyObject* args);
@@ -107,6 +133,7 @@ PyMethodDef knn_methods[] = {
   { (char *)"_distance_between_images", knn_distance_between_images, METH_VARARGS, (char *)"" },
   { (char *)"_distance_matrix", knn_distance_matrix, METH_VARARGS, (char *)"" },
   { (char *)"_unique_distances", knn_unique_distances, METH_VARARGS, (char *)"" },
+  { (char *)"_condensed_distances", knn_condensed_distances, METH_VARARGS, (char *)"" },
   { (char *)"set_selections", knn_set_selections, METH_VARARGS,
     (char *)"Set the feature selection used for classification."},
   { (char *)"get_selections", knn_get_selections, METH_VARARGS,
@@ -117,7 +144,17 @@ PyMethodDef knn_methods[] = {
     (char *)"Get the weights used for classification." },
   { (char *)"classify", knn_classify, METH_VARARGS,
     (char *)"" },
+  { (char *)"_classify_batch", knn_classify_batch, METH_VARARGS, (char *)"" },
   { (char *)"leave_one_out", knn_leave_one_out, METH_VARARGS, (char *)"" },
+  { (char *)"_leave_one_out_neighbors", knn_leave_one_out_neighbors, METH_VARARGS, (char *)"" },
+  { (char *)"_leave_one_out_from_neighbors", knn_leave_one_out_from_neighbors, METH_VARARGS,
+    (char *)"" },
+  { (char *)"_edit_mnn", knn_edit_mnn, METH_VARARGS, (char *)"" },
+  { (char *)"_edit_cnn", knn_edit_cnn, METH_VARARGS, (char *)"" },
+  { (char *)"_store_add", knn_store_add, METH_VARARGS, (char *)"" },
+  { (char *)"_store_remove", knn_store_remove, METH_VARARGS, (char *)"" },
+  { (char *)"_store_clear", knn_store_clear, METH_VARARGS, (char *)"" },
+  { (char *)"_classify_with_store", knn_classify_with_store, METH_VARARGS, (char *)"" },
   { (char *)"_knndistance_statistics", knn_knndistance_statistics, METH_VARARGS,
     (char *)"" },
   { (char *)"serialize", knn_serialize, METH_VARARGS, (char *)"" },
@@ -134,35 +171,87 @@ PyGetSetDef knn_getset[] = {
     (char *)"The types of confidences computed during classification.", 0 },
   { (char *)"num_features", (getter)knn_get_num_features, (setter)knn_set_num_features,
     (char *)"The current number of features.", 0 },
+  { (char *)"use_index", (getter)knn_get_use_index, (setter)knn_set_use_index,
+    (char *)"Whether classify uses a kd-tree index instead of a linear scan.", 0 },
+  { (char *)"single_precision", (getter)knn_get_single_precision,
+    (setter)knn_set_single_precision,
+    (char *)"Whether the feature vectors are stored in single precision.", 0 },
+  { (char *)"abandoned_comparisons", (getter)knn_get_abandoned_comparisons,
+    (setter)knn_set_abandoned_comparisons,
+    (char *)"The number of distance computations that have been abandoned early.", 0 },
   { NULL }
 };
 
 static PyObject* array_init;
 
+/*
+  Delete the spatial index (if any).
+*/
+static void knn_delete_index(KnnObject* o) {
+  if (o->index != 0) {
+    delete o->index;
+    o->index = 0;
+  }
+}
+
+/*
+  Build the spatial index over the current feature vectors. The index
+  only depends on the (normalized) feature vectors, so it must be
+  rebuilt whenever they change. Selections, weights and the distance
+  type are applied at query time.
+*/
+static int knn_create_index(KnnObject* o) {
+  knn_delete_index(o);
+  try {
+    Kdtree::KdNodeVector nodes;
+    nodes.reserve(o->num_feature_vectors);
+    Kdtree::CoordPoint fv(o->num_features);
+    for (size_t i = 0; i < o->num_feature_vectors; ++i) {
+      copy_feature_vector(o, i, &fv[0]);
+      nodes.push_back(Kdtree::KdNode(fv, (void*)i));
+    }
+    o->index = new Kdtree::KdTree(&nodes);
+  } catch (std::exception& e) {
+    PyErr_SetString(PyExc_RuntimeError, e.what());
+    return -1;
+  }
+  return 1;
+}
+
+// whether the data at p is part of the memory mapped file
+static bool knn_is_mapped(KnnObject* o, const void* p) {
+  return o->mapping != 0 && (const char*)p >= o->mapping
+    && (const char*)p < o->mapping + o->mapping_size;
+}
+
 /*
   Convenience function to delete all of the dynamic data used for
   classification.
 */
 static void knn_delete_feature_data(KnnObject* o) {
-  size_t num_feature_vectors;
-
-  if (o->feature_vectors == NULL ) {
-    num_feature_vectors = 0;
-  } else {
-    num_feature_vectors = o->feature_vectors->size();
+  knn_delete_index(o);
 
-    std::vector<double*>::iterator fv_it;
-    for (fv_it = o->feature_vectors->begin(); fv_it != o->feature_vectors->end(); ++fv_it ) {
-      delete[] *fv_it;
-    }
-    delete o->feature_vectors;
+  if (o->compiled != 0) {
+    delete o->compiled;
+    o->compiled = 0;
+  }
+  if (o->feature_vectors != 0) {
+    if (!knn_is_mapped(o, o->feature_vectors))
+      delete[] o->feature_vectors;
     o->feature_vectors = 0;
   }
+  if (o->single_feature_vectors != 0) {
+    if (!knn_is_mapped(o, o->single_feature_vectors))
+      delete[] o->single_feature_vectors;
+    o->single_feature_vectors = 0;
+  }
 
   if (o->id_names != 0) {
-    for (size_t i = 0; i < num_feature_vectors; ++i) {
-      if (o->id_names[i] != 0)
-        delete[] o->id_names[i];
+    if (o->mapping == 0) {
+      for (size_t i = 0; i < o->num_feature_vectors; ++i) {
+        if (o->id_names[i] != 0)
+          delete[] o->id_names[i];
+      }
     }
     delete[] o->id_names;
     o->id_names = 0;
@@ -171,6 +260,78 @@ static void knn_delete_feature_data(KnnObject* o) {
     delete[] o->id_name_histogram;
     o->id_name_histogram = 0;
   }
+  o->num_feature_vectors = 0;
+
+  if (o->mapping != 0) {
+#ifdef KNN_HAVE_MMAP
+    munmap(o->mapping, o->mapping_size);
+#endif
+    o->mapping = 0;
+    o->mapping_size = 0;
+  }
+}
+
+/*
+  Make sure that o->compiled holds the feature vectors compiled for the
+  current selections and weights. This must be called with the GIL held
+  before any classification, because the selections and weights may be
+  changed by Python code (or the genetic algorithms) at any time.
+*/
+static int knn_update_compiled(KnnObject* o) {
+  if (o->compiled != 0 &&
+      o->compiled->matches(o->selection_vector, o->weight_vector))
+    return 1;
+  if (o->compiled != 0) {
+    delete o->compiled;
+    o->compiled = 0;
+  }
+  try {
+    o->compiled = new CompiledFeatures(o->feature_vectors, o->single_feature_vectors,
+                                       o->num_feature_vectors, o->num_features,
+                                       o->selection_vector, o->weight_vector);
+  } catch (std::exception& e) {
+    PyErr_SetString(PyExc_RuntimeError, e.what());
+    return -1;
+  }
+  return 1;
+}
+
+/*
+  Convert the feature vectors to the precision selected with
+  single_precision, if they are stored in the other one.
+*/
+static int knn_convert_precision(KnnObject* o) {
+  if (o->num_feature_vectors == 0)
+    return 1;
+  if (o->single_precision == (o->single_feature_vectors != 0))
+    return 1;
+  size_t size = o->num_feature_vectors * o->num_features;
+  try {
+    if (o->single_precision) {
+      float* converted = new float[size];
+      std::copy(o->feature_vectors, o->feature_vectors + size, converted);
+      if (!knn_is_mapped(o, o->feature_vectors))
+        delete[] o->feature_vectors;
+      o->feature_vectors = 0;
+      o->single_feature_vectors = converted;
+    } else {
+      double* converted = new double[size];
+      std::copy(o->single_feature_vectors, o->single_feature_vectors + size, converted);
+      if (!knn_is_mapped(o, o->single_feature_vectors))
+        delete[] o->single_feature_vectors;
+      o->single_feature_vectors = 0;
+      o->feature_vectors = converted;
+    }
+  } catch (std::exception& e) {
+    PyErr_SetString(PyExc_RuntimeError, e.what());
+    return -1;
+  }
+  // the compiled feature vectors may point to the old ones
+  if (o->compiled != 0) {
+    delete o->compiled;
+    o->compiled = 0;
+  }
+  return 1;
 }
 
 static void set_num_features(KnnObject* o, size_t num_features) {
@@ -181,6 +342,10 @@ static void set_num_features(KnnObject* o, size_t num_features) {
     of the feature data if the number of features has changed.
   */
   knn_delete_feature_data(o);
+  if (o->store != 0) {
+    delete o->store;
+    o->store = 0;
+  }
   o->num_features = num_features;
   if (o->selection_vector != 0)
     delete[] o->selection_vector;
@@ -209,7 +374,11 @@ static PyObject* knn_new(PyTypeObject* pytype, PyObject* args,
     Initialize knn
   */
   o->num_features = 0;
+  o->num_feature_vectors = 0;
   o->feature_vectors = 0;
+  o->single_precision = false;
+  o->single_feature_vectors = 0;
+  o->compiled = 0;
   o->id_names = 0;
   o->id_name_histogram = 0;
   o->selection_vector = 0;
@@ -218,6 +387,12 @@ static PyObject* knn_new(PyTypeObject* pytype, PyObject* args,
   o->unknown = 0;
   o->num_k = 1;
   o->distance_type = CITY_BLOCK;
+  o->use_index = false;
+  o->index = 0;
+  o->abandoned_comparisons = 0;
+  o->mapping = 0;
+  o->mapping_size = 0;
+  o->store = 0;
   o->confidence_types = new std::vector<int>();
   o->confidence_types->push_back(CONFIDENCE_DEFAULT);
 
@@ -239,9 +414,8 @@ static int knn_create_feature_data(KnnObject* o, size_t num_feature_vectors) {
   try {
     assert(num_feature_vectors > 0);
 
-    o->feature_vectors = new std::vector<double*>(num_feature_vectors);
-    for (size_t i = 0; i < num_feature_vectors; ++i)
-      (*o->feature_vectors)[i] = new double[o->num_features];
+    o->feature_vectors = new double[num_feature_vectors * o->num_features];
+    o->num_feature_vectors = num_feature_vectors;
 
     o->id_names = new char*[num_feature_vectors];
     for (size_t i = 0; i < num_feature_vectors; ++i)
@@ -258,6 +432,8 @@ static int knn_create_feature_data(KnnObject* o, size_t num_feature_vectors) {
 static void knn_dealloc(PyObject* self) {
   KnnObject* o = (KnnObject*)self;
   knn_delete_feature_data(o);
+  if (o->store != 0)
+    delete o->store;
   if (o->selection_vector != 0)
     delete[] o->selection_vector;
   if (o->weight_vector != 0)
@@ -332,15 +508,16 @@ static PyObject* knn_instantiate_from_images(PyObject* self, PyObject* args) {
   */
   double* tmp_fv;
   Py_ssize_t tmp_fv_len;
+  std::vector<double> tmp_fv_converted;
 
   std::map<char*, int, ltstr> id_name_histogram;
   double *current_features;
-  for (size_t i = 0; i < o->feature_vectors->size(); ++i) {
-    current_features = (*o->feature_vectors)[i];
+  for (size_t i = 0; i < o->num_feature_vectors; ++i) {
+    current_features = get_feature_vector(o, i);
 
     PyObject* cur_image = PySequence_Fast_GET_ITEM(images_seq, i);
 
-    if (image_get_fv(cur_image, &tmp_fv, &tmp_fv_len) < 0) {
+    if (image_get_fv(cur_image, &tmp_fv, &tmp_fv_len, &tmp_fv_converted) < 0) {
       knn_delete_feature_data(o);
       PyErr_SetString(PyExc_ValueError, "knn: could not get features from image");
       goto error;
@@ -373,18 +550,27 @@ static PyObject* knn_instantiate_from_images(PyObject* self, PyObject* args) {
   if (o->normalize != 0) {
     o->normalize->compute_normalization();
 
-    for (size_t i = 0; i < o->feature_vectors->size(); ++i) {
-      current_features = (*o->feature_vectors)[i];
+    for (size_t i = 0; i < o->num_feature_vectors; ++i) {
+      current_features = get_feature_vector(o, i);
       o->normalize->apply(current_features, current_features + o->num_features);
       o->id_name_histogram[i] = id_name_histogram[o->id_names[i]];
     }
   } else {
-    for (size_t i = 0; i < o->feature_vectors->size(); ++i) {
-      current_features = (*o->feature_vectors)[i];
+    for (size_t i = 0; i < o->num_feature_vectors; ++i) {
+      current_features = get_feature_vector(o, i);
       o->id_name_histogram[i] = id_name_histogram[o->id_names[i]];
     }
   }
 
+  // the feature vectors are collected in double precision first
+  if (knn_convert_precision(o) < 0) {
+    knn_delete_feature_data(o);
+    goto error;
+  }
+
+  if (o->use_index && knn_create_index(o) < 0)
+    goto error;
+
   Py_DECREF(images_seq);
   Py_INCREF(Py_None);
   return Py_None;
@@ -393,6 +579,165 @@ static PyObject* knn_instantiate_from_images(PyObject* self, PyObject* args) {
   return 0;
 }
 
+/*
+  Find the k nearest neighbors of the (already normalized) unknown
+  feature vector with the spatial index and store them in knn.
+
+  The result is the same as adding all feature vectors to knn in turn:
+  all feature vectors that are not farther away than the k-th nearest
+  neighbor are added in database order (so that ties are broken in the
+  same way) and their distances are recomputed with compute_distance.
+  The nearest unlike neighbor and the largest distance, which knn would
+  otherwise collect from the whole database, are looked up separately
+  with the index.
+*/
+static double knn_index_distance(KnnObject* o, size_t i, double* unknown,
+                                 std::vector<double>& fv) {
+  double distance;
+  copy_feature_vector(o, i, &fv[0]);
+  compute_distance(o->distance_type, &fv[0], o->num_features, unknown, &distance,
+                   o->selection_vector, o->weight_vector);
+  return distance;
+}
+
+static void knn_index_neighbors(KnnObject* o, double* unknown,
+                                kNearestNeighbors<char*, ltstr, eqstr>& knn) {
+  typedef kNearestNeighbors<char*, ltstr, eqstr>::neighbor_type neighbor_type;
+  std::vector<double> fv(o->num_features);
+
+  // CITY_BLOCK and EUCLIDEAN both sum up absolute differences
+  Kdtree::DoubleVector weights(o->num_features);
+  for (size_t i = 0; i < o->num_features; ++i)
+    weights[i] = o->selection_vector[i] * o->weight_vector[i];
+  o->index->set_distance((o->distance_type == FAST_EUCLIDEAN) ? 2 : 1, &weights);
+
+  Kdtree::CoordPoint point(unknown, unknown + o->num_features);
+  Kdtree::KdNodeVector neighbors;
+  double distance, max_distance = 0.0;
+  o->index->k_nearest_neighbors(point, o->num_k, &neighbors);
+  for (size_t i = 0; i < neighbors.size(); ++i) {
+    distance = knn_index_distance(o, (size_t)neighbors[i].data, unknown, fv);
+    if (distance > max_distance)
+      max_distance = distance;
+  }
+  // allow for rounding differences between the kd-tree distance and
+  // compute_distance, additional candidates do not change the result
+  max_distance += max_distance * 1e-9 + std::numeric_limits<double>::min();
+  o->index->range_nearest_neighbors(point, max_distance, &neighbors);
+
+  std::vector<size_t> candidates;
+  for (size_t i = 0; i < neighbors.size(); ++i)
+    candidates.push_back((size_t)neighbors[i].data);
+  std::sort(candidates.begin(), candidates.end());
+
+  for (size_t i = 0; i < candidates.size(); ++i) {
+    distance = knn_index_distance(o, candidates[i], unknown, fv);
+    knn.add(o->id_names[candidates[i]], distance);
+  }
+
+  if (knn.m_nn.empty())
+    return;
+
+  // nearest unlike neighbor
+  if (knn.m_nun)
+    delete knn.m_nun;
+  knn.m_nun = NULL;
+  UnlikeIdPredicate unlike(o->id_names, knn.m_nn[0].id);
+  o->index->k_nearest_neighbors(point, 1, &neighbors, &unlike);
+  if (!neighbors.empty()) {
+    size_t i = (size_t)neighbors[0].data;
+    distance = knn_index_distance(o, i, unknown, fv);
+    knn.m_nun = new neighbor_type(o->id_names[i], distance);
+  }
+
+  // largest distance
+  Kdtree::KdNode farthest;
+  o->index->farthest_neighbor(point, &farthest);
+  distance = knn_index_distance(o, (size_t)farthest.data, unknown, fv);
+  knn.set_max_distance(distance);
+}
+
+/*
+  Add the neighbors of the (already normalized) unknown feature vector
+  from the data created by instantiate_from_images to knn. This only
+  reads from the KnnObject, so it may be called from several threads
+  at once as long as no spatial index is used. knn_update_compiled
+  must have been called before.
+
+  Distance computations are abandoned as soon as a feature vector can
+  neither be one of the k nearest neighbors nor the nearest unlike
+  neighbor. As the default confidence is relative to the largest
+  distance in the database, an abandoned computation is only skipped
+  for good when the range of the remaining features shows that it
+  cannot exceed the largest distance found so far; otherwise it is
+  completed. The return value is the number of skipped computations.
+*/
+static unsigned long knn_find_neighbors(KnnObject* o, double* unknown,
+                                        kNearestNeighbors<char*, ltstr, eqstr>& knn) {
+  if (o->index != 0) {
+    knn_index_neighbors(o, unknown, knn);
+    return 0;
+  }
+  const CompiledFeatures& compiled = *o->compiled;
+  size_t num_features = compiled.num_features();
+  std::vector<double> compiled_unknown(num_features);
+  compiled.compile(unknown, &compiled_unknown[0]);
+  std::vector<double> remaining(num_features + 1);
+  compiled.remaining_bounds(o->distance_type, &compiled_unknown[0], &remaining[0]);
+
+  const double infinity = std::numeric_limits<double>::infinity();
+  unsigned long abandoned = 0;
+  for (size_t i = 0; i < o->num_feature_vectors; ++i) {
+    double bound = infinity;
+    if (knn.m_nn.size() == o->num_k && knn.m_nun != 0)
+      bound = std::max(knn.m_nn.back().distance, knn.m_nun->distance);
+    double distance = 0.0;
+    size_t pos = compiled.bounded_distance(o->distance_type, i,
+                                           &compiled_unknown[0], bound, distance);
+    if (pos < num_features) {
+      // allow for rounding differences in the summation of the bounds
+      if ((distance + remaining[pos]) * (1.0 + 1e-9) < knn.max_distance()) {
+        ++abandoned;
+        continue;
+      }
+      compiled.bounded_distance(o->distance_type, i, &compiled_unknown[0],
+                                infinity, distance, pos);
+    }
+    knn.add(o->id_names[i], distance);
+  }
+  return abandoned;
+}
+
+/*
+  Create the Python return value of the classify methods, i.e. the
+  tuple (id_name, confidencemap), from the answer and the confidences.
+*/
+static PyObject* knn_make_result(const std::vector<std::pair<char*, double> >& answer,
+                                 const std::vector<int>& confidence_types,
+                                 const std::vector<double>& confidence) {
+  PyObject* ans_list = PyList_New(answer.size());
+  for (size_t i = 0; i < answer.size(); ++i) {
+    // PyList_SET_ITEM steals references so this code only looks
+    // like it leaks. KWM
+    PyObject* ans = PyTuple_New(2);
+    PyTuple_SET_ITEM(ans, 0, PyFloat_FromDouble(answer[i].second));
+    PyTuple_SET_ITEM(ans, 1, PyString_FromString(answer[i].first));
+    PyList_SET_ITEM(ans_list, i, ans);
+  }
+  PyObject* conf_dict = PyDict_New();
+  for (size_t i = 0; i < confidence.size(); ++i) {
+    PyObject* o1 = PyInt_FromLong(confidence_types[i]);
+    PyObject* o2 = PyFloat_FromDouble(confidence[i]);
+    PyDict_SetItem(conf_dict, o1, o2);
+    Py_DECREF(o1);
+    Py_DECREF(o2);
+  }
+  PyObject* result = PyTuple_New(2);
+  PyTuple_SET_ITEM(result, 0, ans_list);
+  PyTuple_SET_ITEM(result, 1, conf_dict);
+  return result;
+}
+
 /*
   non-interactive classification using the data created by
   instantiate from images.
@@ -400,7 +745,7 @@ static PyObject* knn_instantiate_from_images(PyObject* self, PyObject* args) {
 static PyObject* knn_classify(PyObject* self, PyObject* args) {
   KnnObject* o = (KnnObject*)self;
 
-  if (o->feature_vectors == 0) {
+  if (o->num_feature_vectors == 0) {
       PyErr_SetString(PyExc_RuntimeError,
                       "knn: classify called before instantiate from images");
       return 0;
@@ -416,7 +761,8 @@ static PyObject* knn_classify(PyObject* self, PyObject* args) {
   }
   double* fv;
   Py_ssize_t fv_len;
-  if (image_get_fv(unknown, &fv, &fv_len) < 0) {
+  std::vector<double> fv_converted;
+  if (image_get_fv(unknown, &fv, &fv_len, &fv_converted) < 0) {
     PyErr_SetString(PyExc_ValueError, "knn: could not get features");
     return 0;
   }
@@ -433,45 +779,240 @@ static PyObject* knn_classify(PyObject* self, PyObject* args) {
   }
 
   // create the kNN object
+  if (knn_update_compiled(o) < 0)
+    return 0;
   kNearestNeighbors<char*, ltstr, eqstr> knn(o->num_k);
   knn.confidence_types = *(o->confidence_types);
 
-  double *current_known;
+  try {
+    o->abandoned_comparisons += knn_find_neighbors(o, o->unknown, knn);
+    knn.majority();
+  } catch (std::exception& e) {
+    PyErr_SetString(PyExc_RuntimeError, e.what());
+    return 0;
+  }
+  knn.calculate_confidences();
+  return knn_make_result(knn.answer, knn.confidence_types, knn.confidence);
+}
 
-  for (size_t i = 0; i < o->feature_vectors->size(); ++i) {
-    double distance;
+/*
+  Non-interactive classification of many feature vectors at once. The
+  first argument is a sequence of feature vectors (typically the
+  features arrays of the glyphs), the second the number of threads.
+  The feature vectors are copied (and normalized) up front, so that the
+  classification itself runs without the GIL. The return value is a
+  list of (id_name, confidencemap) tuples in the order of the input.
+*/
+static PyObject* knn_classify_batch(PyObject* self, PyObject* args) {
+  KnnObject* o = (KnnObject*)self;
+  PyObject* features;
+  int num_threads = 1;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "O|i", &features, &num_threads) <= 0) {
+    return 0;
+  }
+  if (o->num_feature_vectors == 0) {
+    PyErr_SetString(PyExc_RuntimeError,
+                    "knn: classify_batch called before instantiate from images");
+    return 0;
+  }
+  if (num_threads < 1) {
+    PyErr_SetString(PyExc_ValueError, "knn: the number of threads must be positive");
+    return 0;
+  }
+  PyObject* features_seq = PySequence_Fast(features, "First argument must be iterable");
+  if (features_seq == NULL)
+    return 0;
 
-    current_known = (*o->feature_vectors)[i];
+  size_t num_unknowns = PySequence_Fast_GET_SIZE(features_seq);
+  std::vector<double> unknowns(num_unknowns * o->num_features);
+  for (size_t i = 0; i < num_unknowns; ++i) {
+    PyObject* cur = PySequence_Fast_GET_ITEM(features_seq, i);
+    double* fv;
+    Py_ssize_t len;
+    std::vector<double> converted;
+    if (features_get_fv(cur, &fv, &len, &converted) < 0) {
+      PyErr_SetString(PyExc_TypeError, "knn: could not get features");
+      Py_DECREF(features_seq);
+      return 0;
+    }
+    if (size_t(len) != o->num_features) {
+      PyErr_SetString(PyExc_ValueError, "knn: features not the correct size");
+      Py_DECREF(features_seq);
+      return 0;
+    }
+    double* unknown = &unknowns[i * o->num_features];
+    if (o->normalize != 0) {
+      o->normalize->apply(fv, fv + o->num_features, unknown);
+    } else {
+      std::copy(fv, fv + o->num_features, unknown);
+    }
+  }
+  Py_DECREF(features_seq);
+
+  // the kd-tree keeps its search state in the object itself
+  if (o->index != 0)
+    num_threads = 1;
+  if (knn_update_compiled(o) < 0)
+    return 0;
+
+  std::vector<std::vector<std::pair<char*, double> > > answers(num_unknowns);
+  std::vector<std::vector<double> > confidences(num_unknowns);
+  std::string error;
+  unsigned long abandoned = 0;
+  Py_BEGIN_ALLOW_THREADS
+#ifdef _OPENMP
+#pragma omp parallel for num_threads(num_threads) schedule(dynamic, 16) reduction(+:abandoned)
+#endif
+  for (long i = 0; i < (long)num_unknowns; ++i) {
+    kNearestNeighbors<char*, ltstr, eqstr> knn(o->num_k);
+    knn.confidence_types = *(o->confidence_types);
+    try {
+      abandoned += knn_find_neighbors(o, &unknowns[i * o->num_features], knn);
+      knn.majority();
+      knn.calculate_confidences();
+      answers[i] = knn.answer;
+      confidences[i] = knn.confidence;
+    } catch (std::exception& e) {
+#ifdef _OPENMP
+#pragma omp critical
+#endif
+      error = e.what();
+    }
+  }
+  Py_END_ALLOW_THREADS
+  o->abandoned_comparisons += abandoned;
 
-    compute_distance(o->distance_type, current_known, o->num_features,
-                     o->unknown, &distance,
-                     o->selection_vector, o->weight_vector);
+  if (!error.empty()) {
+    PyErr_SetString(PyExc_RuntimeError, error.c_str());
+    return 0;
+  }
+  PyObject* result = PyList_New(num_unknowns);
+  for (size_t i = 0; i < num_unknowns; ++i) {
+    PyList_SET_ITEM(result, i, knn_make_result(answers[i], *(o->confidence_types),
+                                               confidences[i]));
+  }
+  return result;
+}
 
-    knn.add(o->id_names[i], distance);
+/*
+  The glyph store keeps the features and id_names of the database of an
+  interactive classifier. _store_add adds (or updates) the glyphs of the
+  given sequence, _store_remove removes them and _store_clear removes all
+  glyphs. The Python wrapper calls these whenever the database changes.
+*/
+static PyObject* knn_store_add(PyObject* self, PyObject* args) {
+  KnnObject* o = (KnnObject*)self;
+  PyObject* glyphs;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "O", &glyphs) <= 0)
+    return 0;
+  PyObject* glyphs_seq = PySequence_Fast(glyphs, "knn: glyphs must be iterable");
+  if (glyphs_seq == NULL)
+    return 0;
+  if (o->store == 0)
+    o->store = new GlyphStore(o->num_features);
+  for (Py_ssize_t i = 0; i < PySequence_Fast_GET_SIZE(glyphs_seq); ++i) {
+    PyObject* glyph = PySequence_Fast_GET_ITEM(glyphs_seq, i);
+    if (!is_ImageObject(glyph)) {
+      PyErr_SetString(PyExc_TypeError, "knn: non-image in known list");
+      Py_DECREF(glyphs_seq);
+      return 0;
+    }
+    double* fv;
+    Py_ssize_t fv_len;
+    std::vector<double> fv_converted;
+    if (image_get_fv(glyph, &fv, &fv_len, &fv_converted) < 0) {
+      PyErr_SetString(PyExc_ValueError,
+                      "knn: error getting feature vector \
+                       (This is most likely because features have not been generated.)");
+      Py_DECREF(glyphs_seq);
+      return 0;
+    }
+    if (size_t(fv_len) != o->num_features) {
+      PyErr_SetString(PyExc_RuntimeError, "knn: the number of features does not match.");
+      Py_DECREF(glyphs_seq);
+      return 0;
+    }
+    char* id_name;
+    int len;
+    if (image_get_id_name(glyph, &id_name, &len) < 0) {
+      Py_DECREF(glyphs_seq);
+      return 0;
+    }
+    o->store->set(glyph, fv, id_name);
   }
-  knn.majority();
-  knn.calculate_confidences();
-  PyObject* ans_list = PyList_New(knn.answer.size());
-  for (size_t i = 0; i < knn.answer.size(); ++i) {
-    // PyList_SET_ITEM steals references so this code only looks
-    // like it leaks. KWM
-    PyObject* ans = PyTuple_New(2);
-    PyTuple_SET_ITEM(ans, 0, PyFloat_FromDouble(knn.answer[i].second));
-    PyTuple_SET_ITEM(ans, 1, PyString_FromString(knn.answer[i].first));
-    PyList_SET_ITEM(ans_list, i, ans);
+  Py_DECREF(glyphs_seq);
+  Py_INCREF(Py_None);
+  return Py_None;
+}
+
+static PyObject* knn_store_remove(PyObject* self, PyObject* args) {
+  KnnObject* o = (KnnObject*)self;
+  PyObject* glyphs;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "O", &glyphs) <= 0)
+    return 0;
+  PyObject* glyphs_seq = PySequence_Fast(glyphs, "knn: glyphs must be iterable");
+  if (glyphs_seq == NULL)
+    return 0;
+  if (o->store != 0) {
+    for (Py_ssize_t i = 0; i < PySequence_Fast_GET_SIZE(glyphs_seq); ++i)
+      o->store->remove(PySequence_Fast_GET_ITEM(glyphs_seq, i));
   }
-  PyObject* conf_dict = PyDict_New();
-  for (size_t i = 0; i < knn.confidence_types.size(); ++i) {
-    PyObject* o1 = PyInt_FromLong(knn.confidence_types[i]);
-    PyObject* o2 = PyFloat_FromDouble(knn.confidence[i]);
-    PyDict_SetItem(conf_dict, o1, o2);
-    Py_DECREF(o1);
-    Py_DECREF(o2);
+  Py_DECREF(glyphs_seq);
+  Py_INCREF(Py_None);
+  return Py_None;
+}
+
+static PyObject* knn_store_clear(PyObject* self, PyObject* args) {
+  KnnObject* o = (KnnObject*)self;
+  if (o->store != 0)
+    o->store->clear();
+  Py_INCREF(Py_None);
+  return Py_None;
+}
+
+/*
+  Interactive classification against the glyph store. This gives the
+  same result as classify_with_images with the glyphs in the store.
+*/
+static PyObject* knn_classify_with_store(PyObject* self, PyObject* args) {
+  KnnObject* o = (KnnObject*)self;
+  PyObject* unknown;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "O", &unknown) <= 0)
+    return 0;
+  if (o->store == 0 || o->store->size() == 0) {
+    PyErr_SetString(PyExc_RuntimeError, "knn: the glyph store is empty");
+    return 0;
   }
-  PyObject* result = PyTuple_New(2);
-  PyTuple_SET_ITEM(result, 0, ans_list);
-  PyTuple_SET_ITEM(result, 1, conf_dict);
-  return result;
+  if (!is_ImageObject(unknown)) {
+    PyErr_SetString(PyExc_TypeError, "knn: unknown must be an image");
+    return 0;
+  }
+  double* unknown_buf;
+  Py_ssize_t unknown_len;
+  std::vector<double> unknown_converted;
+  if (image_get_fv(unknown, &unknown_buf, &unknown_len, &unknown_converted) < 0) {
+    PyErr_SetString(PyExc_ValueError,
+                    "knn: error getting feature vector \
+                     (This is most likely because features have not been generated.)");
+    return 0;
+  }
+  if (size_t(unknown_len) != o->num_features) {
+    PyErr_SetString(PyExc_RuntimeError, "knn: the number of features does not match.");
+    return 0;
+  }
+
+  kNearestNeighbors<char*, ltstr, eqstr> knn(o->num_k);
+  knn.confidence_types = *(o->confidence_types);
+  GlyphStore& store = *o->store;
+  for (size_t i = 0; i < store.size(); ++i) {
+    double distance;
+    compute_distance(o->distance_type, store.features(i), o->num_features,
+                     unknown_buf, &distance, o->selection_vector, o->weight_vector);
+    knn.add(store.id_name(i), distance);
+  }
+  knn.majority();
+  knn.calculate_confidences();
+  return knn_make_result(knn.answer, knn.confidence_types, knn.confidence);
 }
 
 static PyObject* knn_classify_with_images(PyObject* self, PyObject* args) {
@@ -497,7 +1038,8 @@ static PyObject* knn_classify_with_images(PyObject* self, PyObject* args) {
 
   double* unknown_buf;
   Py_ssize_t unknown_len;
-  if (image_get_fv(unknown, &unknown_buf, &unknown_len) < 0) {
+  std::vector<double> unknown_converted;
+  if (image_get_fv(unknown, &unknown_buf, &unknown_len, &unknown_converted) < 0) {
       PyErr_SetString(PyExc_ValueError,
                       "knn: error getting feature vector \
                        (This is most likely because features have not been generated.)");
@@ -588,7 +1130,8 @@ static PyObject* knn_distance_from_images(PyObject* self, PyObject* args) {
 
   double* unknown_buf;
   Py_ssize_t unknown_len;
-  if (image_get_fv(unknown, &unknown_buf, &unknown_len) < 0) {
+  std::vector<double> unknown_converted;
+  if (image_get_fv(unknown, &unknown_buf, &unknown_len, &unknown_converted) < 0) {
       PyErr_SetString(PyExc_ValueError,
                       "knn: error getting feature vector \
                        (This is most likely because features have not been generated.)");
@@ -645,240 +1188,253 @@ static PyObject* knn_distance_between_images(PyObject* self, PyObject* args) {
 }
 
 /*
-  Create a symmetric float matrix (image) containing all of the
-  distances between the images in the list passed in. This is useful
-  because it allows you to find the distance between any two pairs
-  of images regardless of the order of the pairs. NOTE: the features
-  are normalized before performing the distance calculations.
+  The pairwise distance functions (distance_matrix, unique_distances and
+  condensed_distances) first copy the (optionally normalized) feature
+  vectors of all images into one contiguous matrix. The distances are then
+  computed without the GIL in square blocks of the upper triangle, so that
+  both blocks of feature vectors stay in the cache. The row blocks are
+  handed out in stripes between which the progress object is called.
 */
-PyObject* knn_distance_matrix(PyObject* self, PyObject* args) {
-  KnnObject* o = (KnnObject*)self;
-  PyObject* images;
-  PyObject* progress = 0;
-  long normalize = 1;
-  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "O|Oi", &images, &progress, &normalize) <= 0)
-    return 0;
+static const long knn_pairwise_block = 64;
+
+static inline size_t knn_condensed_index(size_t n, size_t i, size_t j) {
+  return i * n - (i * (i + 1)) / 2 + (j - i - 1);
+}
+
+static int knn_pairwise_features(KnnObject* o, PyObject* images, long normalize,
+                                 std::vector<double>& features, size_t& images_len) {
   // images is a list of Gamera/Python ImageObjects
   PyObject* images_seq = PySequence_Fast(images, "First argument must be iterable.");
   if (images_seq == NULL)
-    return 0;
+    return -1;
 
-  int images_len = PySequence_Fast_GET_SIZE(images_seq);
+  images_len = PySequence_Fast_GET_SIZE(images_seq);
   if (!(images_len > 1)) {
     PyErr_SetString(PyExc_ValueError, "List must have at least two images.");
     Py_DECREF(images_seq);
-    return 0;
-  }
-
-  // Check the number of features
-  double* buf_a, *buf_b;
-  Py_ssize_t len_a, len_b;
-  PyObject* cur_a, *cur_b;
-  cur_a = PySequence_Fast_GET_ITEM(images_seq, 0);
-  if (!is_ImageObject(cur_a)) {
-    PyErr_SetString(PyExc_TypeError, "knn: expected an image");
-    Py_DECREF(images_seq);
-    return 0;
-  }
-  if (image_get_fv(cur_a, &buf_a, &len_a) < 0) {
-    Py_DECREF(images_seq);
-    return 0;
-  }
-
-  if (len_a != (int)o->num_features) {
-    PyErr_SetString(PyExc_ValueError, "knn: feature vector lengths don't match.");
-    Py_DECREF(images_seq);
-    return 0;
+    return -1;
   }
 
-  // create the normalization object
-  double* tmp_a = new double[len_a];
-  double* tmp_b = new double[len_a];
-  FloatImageData* data = new FloatImageData(Dim(images_len, images_len));
-  FloatImageView* mat = new FloatImageView(*data);
-
-  kNN::Normalize norm(len_a);
-  for (int i = 0; i < images_len; ++i) {
-    cur_a = PySequence_Fast_GET_ITEM(images_seq, i);
-    if (cur_a == NULL)
-      goto mat_error;
-    if (!is_ImageObject(cur_a)) {
+  features.resize(images_len * o->num_features);
+  for (size_t i = 0; i < images_len; ++i) {
+    PyObject* cur = PySequence_Fast_GET_ITEM(images_seq, i);
+    if (!is_ImageObject(cur)) {
       PyErr_SetString(PyExc_TypeError, "knn: expected an image");
-      goto mat_error;
+      Py_DECREF(images_seq);
+      return -1;
+    }
+    double* buf;
+    Py_ssize_t len;
+    std::vector<double> converted;
+    if (image_get_fv(cur, &buf, &len, &converted) < 0) {
+      Py_DECREF(images_seq);
+      return -1;
     }
-    if (image_get_fv(cur_a, &buf_a, &len_a) < 0)
-      goto mat_error;
-    if (len_a != (int)o->num_features) {
+    if (len != (Py_ssize_t)o->num_features) {
       PyErr_SetString(PyExc_ValueError, "knn: feature vector lengths don't match.");
-      goto mat_error;
+      Py_DECREF(images_seq);
+      return -1;
     }
-    if (normalize)
-      norm.add(buf_a, buf_a + len_a);
+    std::copy(buf, buf + len, &features[i * o->num_features]);
   }
-  if (normalize)
-    norm.compute_normalization();
+  Py_DECREF(images_seq);
 
-  std::fill(mat->vec_begin(), mat->vec_end(), 0.0);
-  // do the distance calculations
-  for (int i = 0; i < images_len; ++i) {
-    cur_a = PySequence_Fast_GET_ITEM(images_seq, i);
-    if (cur_a == NULL)
-      goto mat_error;
-    if (image_get_fv(cur_a, &buf_a, &len_a) < 0)
-      goto mat_error;
-    if (normalize)
-      norm.apply(buf_a, buf_a + len_a, tmp_a);
-    for (int j = i + 1; j < images_len; ++j) {
-      cur_b = PySequence_Fast_GET_ITEM(images_seq, j);
-      if (cur_b == NULL)
-        goto mat_error;
-      if (image_get_fv(cur_b, &buf_b, &len_b) < 0)
-        goto mat_error;
-      if (normalize)
-        norm.apply(buf_b, buf_b + len_b, tmp_b);
-      double distance;
-      if (normalize)
-        compute_distance(o->distance_type, tmp_a, len_a, tmp_b, &distance,
-                         o->selection_vector, o->weight_vector);
-      else
-        compute_distance(o->distance_type, buf_a, len_a, buf_b, &distance,
-                         o->selection_vector, o->weight_vector);
-      mat->set(Point(j, i), distance);
-      mat->set(Point(i, j), distance);
-    }
-    if (progress)
-      PyObject_CallObject(progress, NULL);
+  if (normalize) {
+    kNN::Normalize norm(o->num_features);
+    for (size_t i = 0; i < images_len; ++i)
+      norm.add(&features[i * o->num_features], &features[(i + 1) * o->num_features]);
+    norm.compute_normalization();
+    for (size_t i = 0; i < images_len; ++i)
+      norm.apply(&features[i * o->num_features], &features[(i + 1) * o->num_features]);
   }
-  delete[] tmp_a;
-  delete[] tmp_b;
-  Py_DECREF(images_seq);
-  return create_ImageObject(mat);
- mat_error:
-  Py_DECREF(images_seq);
-  // delete the image
-  delete mat; delete data;
-  // delete the tmp buffers
-  delete[] tmp_a; delete[] tmp_b;
   return 0;
 }
 
-/*
-  unique_distances takes a list of images and returns all of the unique
-  pairs of distances between the images.
+template<class T>
+static int knn_pairwise_distances(KnnObject* o, const std::vector<double>& features,
+                                  size_t images_len, PyObject* progress,
+                                  int num_threads, T& out) {
+  const double* fv = &features[0];
+  size_t num_features = o->num_features;
+  long num_blocks = (long(images_len) + knn_pairwise_block - 1) / knn_pairwise_block;
+  long stripe = num_threads * 4;
+  for (long first = 0; first < num_blocks; first += stripe) {
+    long last = std::min(first + stripe, num_blocks);
+    Py_BEGIN_ALLOW_THREADS
+#ifdef _OPENMP
+#pragma omp parallel for num_threads(num_threads) schedule(dynamic, 1)
+#endif
+    for (long bi = first; bi < last; ++bi) {
+      size_t i_begin = bi * knn_pairwise_block;
+      size_t i_end = std::min(i_begin + knn_pairwise_block, images_len);
+      for (size_t j_begin = i_begin; j_begin < images_len; j_begin += knn_pairwise_block) {
+        size_t j_end = std::min(j_begin + knn_pairwise_block, images_len);
+        for (size_t i = i_begin; i < i_end; ++i) {
+          for (size_t j = std::max(i + 1, j_begin); j < j_end; ++j) {
+            double distance;
+            compute_distance(o->distance_type, fv + i * num_features, num_features,
+                             fv + j * num_features, &distance,
+                             o->selection_vector, o->weight_vector);
+            out(i, j, distance);
+          }
+        }
+      }
+    }
+    Py_END_ALLOW_THREADS
+    if (progress != 0 && progress != Py_None) {
+      size_t rows = std::min(last * knn_pairwise_block, long(images_len)) -
+        first * knn_pairwise_block;
+      for (size_t i = 0; i < rows; ++i) {
+        PyObject* result = PyObject_CallObject(progress, NULL);
+        if (result == NULL)
+          return -1;
+        Py_DECREF(result);
+      }
+    }
+  }
+  return 0;
+}
+
+struct SymmetricMatrixOutput {
+  SymmetricMatrixOutput(FloatImageView* mat) : m_mat(mat) { }
+  void operator()(size_t i, size_t j, double distance) {
+    m_mat->set(Point(j, i), distance);
+    m_mat->set(Point(i, j), distance);
+  }
+  FloatImageView* m_mat;
+};
+
+template<class T>
+struct CondensedOutput {
+  CondensedOutput(T* out, size_t n) : m_out(out), m_n(n) { }
+  void operator()(size_t i, size_t j, double distance) {
+    m_out[knn_condensed_index(m_n, i, j)] = T(distance);
+  }
+  T* m_out;
+  size_t m_n;
+};
+
+static int knn_parse_num_threads(int num_threads) {
+  if (num_threads < 1) {
+    PyErr_SetString(PyExc_ValueError, "knn: the number of threads must be positive");
+    return -1;
+  }
+  return 0;
+}
+
+/*
+  Create a symmetric float matrix (image) containing all of the
+  distances between the images in the list passed in. This is useful
+  because it allows you to find the distance between any two pairs
+  of images regardless of the order of the pairs. NOTE: the features
+  are normalized before performing the distance calculations.
 */
-PyObject* knn_unique_distances(PyObject* self, PyObject* args) {
+PyObject* knn_distance_matrix(PyObject* self, PyObject* args) {
   KnnObject* o = (KnnObject*)self;
   PyObject* images;
-  PyObject* progress;
+  PyObject* progress = 0;
   long normalize = 1;
-  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "OO|i", &images, &progress, &normalize) <= 0)
+  int num_threads = 1;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "O|Oli", &images, &progress, &normalize,
+                       &num_threads) <= 0)
     return 0;
-  // images is a list of Gamera/Python ImageObjects
-  PyObject* images_seq = PySequence_Fast(images, "First argument must be iterable.");
-  if (images_seq == NULL)
+  if (knn_parse_num_threads(num_threads) < 0)
+    return 0;
+  std::vector<double> features;
+  size_t images_len;
+  if (knn_pairwise_features(o, images, normalize, features, images_len) < 0)
     return 0;
 
-  int images_len = PySequence_Fast_GET_SIZE(images_seq);
-  if (!(images_len > 1)) {
-    PyErr_SetString(PyExc_ValueError, "List must have at least two images.");
-    Py_DECREF(images_seq);
+  FloatImageData* data = new FloatImageData(Dim(images_len, images_len));
+  FloatImageView* mat = new FloatImageView(*data);
+  std::fill(mat->vec_begin(), mat->vec_end(), 0.0);
+  SymmetricMatrixOutput out(mat);
+  if (knn_pairwise_distances(o, features, images_len, progress, num_threads, out) < 0) {
+    delete mat; delete data;
     return 0;
   }
+  return create_ImageObject(mat);
+}
+
+/*
+  unique_distances takes a list of images and returns all of the unique
+  pairs of distances between the images.
+*/
+PyObject* knn_unique_distances(PyObject* self, PyObject* args) {
+  KnnObject* o = (KnnObject*)self;
+  PyObject* images;
+  PyObject* progress;
+  long normalize = 1;
+  int num_threads = 1;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "OO|li", &images, &progress, &normalize,
+                       &num_threads) <= 0)
+    return 0;
+  if (knn_parse_num_threads(num_threads) < 0)
+    return 0;
+  std::vector<double> features;
+  size_t images_len;
+  if (knn_pairwise_features(o, images, normalize, features, images_len) < 0)
+    return 0;
+
   // create the 'vector' for the output
-  int list_len = ((images_len * images_len) - images_len) / 2;
+  size_t list_len = ((images_len * images_len) - images_len) / 2;
   FloatImageData* data = new FloatImageData(Dim(list_len, 1));
   FloatImageView* list = new FloatImageView(*data);
-
-  // create a default set of weights for the distance calculation.
-  double* buf_a, *buf_b;
-  Py_ssize_t len_a, len_b;
-  PyObject* cur_a, *cur_b;
-  cur_a = PySequence_Fast_GET_ITEM(images_seq, 0);
-  if (!is_ImageObject(cur_a)) {
-    PyErr_SetString(PyExc_TypeError, "knn: expected an image");
-    Py_DECREF(images_seq);
-    return 0;
-  }
-  if (image_get_fv(cur_a, &buf_a, &len_a) < 0) {
-    Py_DECREF(images_seq);
+  CondensedOutput<double> out(&(*list->vec_begin()), images_len);
+  if (knn_pairwise_distances(o, features, images_len, progress, num_threads, out) < 0) {
+    delete list; delete data;
     return 0;
   }
+  return create_ImageObject(list);
+}
 
-  if (len_a != (int)o->num_features) {
-    PyErr_SetString(PyExc_ValueError, "knn: feature vector lengths don't match.");
-    Py_DECREF(images_seq);
+/*
+  condensed_distances returns the same distances as unique_distances, but
+  as an array.array of single precision floats. This halves the memory
+  and allows wrapping the result without copying (e.g. with
+  numpy.frombuffer).
+*/
+PyObject* knn_condensed_distances(PyObject* self, PyObject* args) {
+  KnnObject* o = (KnnObject*)self;
+  PyObject* images;
+  PyObject* progress = 0;
+  long normalize = 1;
+  int num_threads = 1;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "O|Oli", &images, &progress, &normalize,
+                       &num_threads) <= 0)
+    return 0;
+  if (knn_parse_num_threads(num_threads) < 0)
+    return 0;
+  std::vector<double> features;
+  size_t images_len;
+  if (knn_pairwise_features(o, images, normalize, features, images_len) < 0)
     return 0;
-  }
 
-  // create the normalization object
-  kNN::Normalize norm(len_a);
-  for (int i = 0; i < images_len; ++i) {
-    cur_a = PySequence_Fast_GET_ITEM(images_seq, i);
-    if (!is_ImageObject(cur_a)) {
-      PyErr_SetString(PyExc_TypeError, "knn: expected an image");
-      Py_DECREF(images_seq);
-      return 0;
-    }
-    if (cur_a == NULL) {
-      Py_DECREF(images_seq);
-      return 0;
-    }
-    if (image_get_fv(cur_a, &buf_a, &len_a) < 0) {
-      Py_DECREF(images_seq);
-      return 0;
-    }
-    if (normalize)
-      norm.add(buf_a, buf_a + len_a);
+  // allocate the array at its final size by repeating a single element
+  size_t list_len = ((images_len * images_len) - images_len) / 2;
+  PyObject* arglist = Py_BuildValue(CHAR_PTR_CAST "(s[f])", "f", 0.0);
+  PyObject* element = PyEval_CallObject(array_init, arglist);
+  Py_DECREF(arglist);
+  if (element == 0)
+    return 0;
+  PyObject* array = PySequence_Repeat(element, list_len);
+  Py_DECREF(element);
+  if (array == 0)
+    return 0;
+  float* buf;
+  Py_ssize_t len;
+  if (PyObject_AsWriteBuffer(array, (void**)&buf, &len) < 0 ||
+      size_t(len) != list_len * sizeof(float)) {
+    PyErr_SetString(PyExc_RuntimeError, "knn: Error getting the distance array buffer.");
+    Py_DECREF(array);
+    return 0;
   }
-  if (normalize)
-    norm.compute_normalization();
-  double* tmp_a = new double[len_a];
-  double* tmp_b = new double[len_a];
-  // do the distance calculations
-  size_t index = 0;
-  for (int i = 0; i < images_len; ++i) {
-    cur_a = PySequence_Fast_GET_ITEM(images_seq, i);
-    if (cur_a == NULL)
-      goto uniq_error;
-    if (image_get_fv(cur_a, &buf_a, &len_a) < 0)
-      goto uniq_error;
-    if (normalize)
-      norm.apply(buf_a, buf_a + len_a, tmp_a);
-    for (int j = i + 1; j < images_len; ++j) {
-      cur_b = PySequence_Fast_GET_ITEM(images_seq, j);
-      if (cur_b == NULL)
-        goto uniq_error;
-      if (image_get_fv(cur_b, &buf_b, &len_b) < 0)
-        goto uniq_error;
-
-      if (len_a != len_b) {
-        PyErr_SetString(PyExc_ValueError, "Feature vector lengths do not match!");
-        goto uniq_error;
-      }
-      if (normalize)
-        norm.apply(buf_b, buf_b + len_b, tmp_b);
-      double distance;
-      if (normalize)
-        compute_distance(o->distance_type, tmp_a, len_a, tmp_b, &distance,
-                         o->selection_vector, o->weight_vector);
-      else
-        compute_distance(o->distance_type, buf_a, len_a, buf_b, &distance,
-                         o->selection_vector, o->weight_vector);
-      list->set(Point(index, 0), distance);
-      index++;
-    }
-    // call the progress object
-    PyObject_CallObject(progress, NULL);
+  CondensedOutput<float> out(buf, images_len);
+  if (knn_pairwise_distances(o, features, images_len, progress, num_threads, out) < 0) {
+    Py_DECREF(array);
+    return 0;
   }
-
-  delete[] tmp_a; delete[] tmp_b;
-  return create_ImageObject(list);
-  // in case of error
- uniq_error:
-  delete[] tmp_a; delete[] tmp_b;
-  delete list;
-  delete data;
-  return 0;
+  return array;
 }
 
 static PyObject* knn_get_num_k(PyObject* self) {
@@ -954,7 +1510,7 @@ static PyObject* knn_leave_one_out(PyObject* self, PyObject* args) {
   int stop_threshold = std::numeric_limits<int>::max();
   if (PyArg_ParseTuple(args, CHAR_PTR_CAST "|Oi", &indexes, &stop_threshold) <= 0)
     return 0;
-  if (o->feature_vectors == 0) {
+  if (o->num_feature_vectors == 0) {
     PyErr_SetString(PyExc_RuntimeError,
                     "knn: leave_one_out called before instantiate_from_images.");
     return 0;
@@ -1017,7 +1573,7 @@ static PyObject* knn_knndistance_statistics(PyObject* self, PyObject* args) {
   size_t i,j;
   if (PyArg_ParseTuple(args, CHAR_PTR_CAST "|iO", &k, &progress) <= 0)
     return 0;
-  if (o->feature_vectors == 0) {
+  if (o->num_feature_vectors == 0) {
     PyErr_SetString(PyExc_RuntimeError,
                     "knn: knndistance_statistics called before instantiate_from_images.");
     return 0;
@@ -1025,26 +1581,34 @@ static PyObject* knn_knndistance_statistics(PyObject* self, PyObject* args) {
   if (k <= 0) {
     k = o->num_k;
   }
-  if (k > (int)o->feature_vectors->size() - 1) {
+  if (k > (int)o->num_feature_vectors - 1) {
     PyErr_SetString(PyExc_RuntimeError,
                     "knn: knndistance_statistics requires more than k training samples.");
     return 0;
   }
+  if (knn_update_compiled(o) < 0)
+    return 0;
+  const CompiledFeatures& compiled = *o->compiled;
+  const double infinity = std::numeric_limits<double>::infinity();
   PyObject* entry;
-  PyObject* result = PyList_New(o->feature_vectors->size());
-  double *feature_i, *feature_j;
-  double distance;
+  PyObject* result = PyList_New(o->num_feature_vectors);
+  double distance, bound;
+  std::vector<double> unknown(compiled.num_features());
   kNearestNeighbors<char*, ltstr, eqstr> knn((size_t)k);
-  for (i=0; i<o->feature_vectors->size(); i++) {
+  for (i=0; i<o->num_feature_vectors; i++) {
     knn.reset();
+    compiled.get(i, &unknown[0]);
     // find k nearest neighbors of i-th prototype
-    feature_i = (*o->feature_vectors)[i];
-    for (j=0; j<o->feature_vectors->size(); j++) {
+    for (j=0; j<o->num_feature_vectors; j++) {
       if (j==i) continue;
-      feature_j = (*o->feature_vectors)[j];
-      // compute distance
-      compute_distance(o->distance_type, feature_i, o->num_features,
-                       feature_j, &distance, o->selection_vector, o->weight_vector);
+      // compute distance, unless it is larger than the k-th nearest
+      bound = (knn.m_nn.size() == (size_t)k) ? knn.m_nn.back().distance : infinity;
+      distance = 0.0;
+      if (compiled.bounded_distance(o->distance_type, j, &unknown[0],
+                                    bound, distance) < compiled.num_features()) {
+        o->abandoned_comparisons++;
+        continue;
+      }
       // store distance in kNearestNeighbors
       knn.add(o->id_names[j], distance);
     }
@@ -1064,6 +1628,335 @@ static PyObject* knn_knndistance_statistics(PyObject* self, PyObject* args) {
   return result;
 }
 
+/*
+  The neighbors of all training samples for repeated leave-one-out
+  evaluations. _leave_one_out_neighbors(k_max, num_threads) returns a
+  tuple of two arrays, which hold the indexes (typecode 'i') and the
+  distances (typecode 'd') of the k_max nearest neighbors of each sample
+  (row by row, sorted by distance and then by index).
+  _leave_one_out_from_neighbors(indexes, distances, k) then does the
+  leave-one-out for any k <= k_max without any distance computations.
+*/
+static PyObject* knn_leave_one_out_neighbors(PyObject* self, PyObject* args) {
+  KnnObject* o = (KnnObject*)self;
+  int k_max;
+  int num_threads = 1;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "i|i", &k_max, &num_threads) <= 0)
+    return 0;
+  if (o->num_feature_vectors == 0) {
+    PyErr_SetString(PyExc_RuntimeError,
+                    "knn: leave_one_out_neighbors called before instantiate_from_images.");
+    return 0;
+  }
+  if (k_max < 1 || k_max > (int)o->num_feature_vectors - 1) {
+    PyErr_SetString(PyExc_ValueError,
+                    "knn: k_max must be positive and smaller than the number of training samples.");
+    return 0;
+  }
+  if (num_threads < 1) {
+    PyErr_SetString(PyExc_ValueError, "knn: the number of threads must be positive");
+    return 0;
+  }
+  if (knn_update_compiled(o) < 0)
+    return 0;
+
+  size_t n = o->num_feature_vectors;
+  size_t k = (size_t)k_max;
+  std::vector<int> indexes(n * k);
+  std::vector<double> distances(n * k);
+  const CompiledFeatures& compiled = *o->compiled;
+  unsigned long abandoned = 0;
+  Py_BEGIN_ALLOW_THREADS
+#ifdef _OPENMP
+#pragma omp parallel for num_threads(num_threads) schedule(dynamic, 16) reduction(+:abandoned)
+#endif
+  for (long i = 0; i < (long)n; ++i) {
+    // the k nearest (distance, index) pairs found so far, in sorted order
+    std::vector<std::pair<double, int> > nn;
+    nn.reserve(k + 1);
+    std::vector<double> unknown(compiled.num_features());
+    compiled.get(i, &unknown[0]);
+    const double infinity = std::numeric_limits<double>::infinity();
+    for (size_t j = 0; j < n; ++j) {
+      if ((long)j == i)
+        continue;
+      double bound = (nn.size() == k) ? nn.back().first : infinity;
+      double distance = 0.0;
+      if (compiled.bounded_distance(o->distance_type, j, &unknown[0],
+                                    bound, distance) < compiled.num_features()) {
+        ++abandoned;
+        continue;
+      }
+      if (nn.size() == k && !(distance < bound))
+        continue;
+      std::pair<double, int> entry(distance, (int)j);
+      nn.insert(std::upper_bound(nn.begin(), nn.end(), entry), entry);
+      if (nn.size() > k)
+        nn.pop_back();
+    }
+    for (size_t m = 0; m < k; ++m) {
+      distances[i * k + m] = nn[m].first;
+      indexes[i * k + m] = nn[m].second;
+    }
+  }
+  Py_END_ALLOW_THREADS
+  o->abandoned_comparisons += abandoned;
+
+  PyObject* arglist = Py_BuildValue(CHAR_PTR_CAST "(s)", "i");
+  PyObject* index_array = PyEval_CallObject(array_init, arglist);
+  Py_DECREF(arglist);
+  arglist = Py_BuildValue(CHAR_PTR_CAST "(s)", "d");
+  PyObject* distance_array = PyEval_CallObject(array_init, arglist);
+  Py_DECREF(arglist);
+  if (index_array == 0 || distance_array == 0) {
+    Py_XDECREF(index_array);
+    Py_XDECREF(distance_array);
+    return 0;
+  }
+  PyObject* result = PyObject_CallMethod(index_array, CHAR_PTR_CAST "fromstring",
+                                         CHAR_PTR_CAST "s#", (char*)&indexes[0],
+                                         (int)(indexes.size() * sizeof(int)));
+  if (result != 0) {
+    Py_DECREF(result);
+    result = PyObject_CallMethod(distance_array, CHAR_PTR_CAST "fromstring",
+                                 CHAR_PTR_CAST "s#", (char*)&distances[0],
+                                 (int)(distances.size() * sizeof(double)));
+  }
+  if (result == 0) {
+    Py_DECREF(index_array);
+    Py_DECREF(distance_array);
+    return 0;
+  }
+  Py_DECREF(result);
+  return Py_BuildValue(CHAR_PTR_CAST "(NN)", index_array, distance_array);
+}
+
+static PyObject* knn_leave_one_out_from_neighbors(PyObject* self, PyObject* args) {
+  KnnObject* o = (KnnObject*)self;
+  PyObject* index_array;
+  PyObject* distance_array;
+  int k;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "OOi", &index_array, &distance_array, &k) <= 0)
+    return 0;
+  if (o->num_feature_vectors == 0) {
+    PyErr_SetString(PyExc_RuntimeError,
+                    "knn: leave_one_out called before instantiate_from_images.");
+    return 0;
+  }
+  const int* indexes;
+  const double* distances;
+  Py_ssize_t index_len, distance_len;
+  if (PyObject_AsReadBuffer(index_array, (const void**)&indexes, &index_len) != 0 ||
+      PyObject_AsReadBuffer(distance_array, (const void**)&distances, &distance_len) != 0) {
+    PyErr_SetString(PyExc_TypeError, "knn: Error getting the neighbor array buffers.");
+    return 0;
+  }
+  size_t n = o->num_feature_vectors;
+  size_t k_max = index_len / sizeof(int) / n;
+  if (size_t(index_len) != n * k_max * sizeof(int) ||
+      size_t(distance_len) != n * k_max * sizeof(double)) {
+    PyErr_SetString(PyExc_ValueError,
+                    "knn: the neighbors do not match the training samples.");
+    return 0;
+  }
+  if (k < 1 || size_t(k) > k_max) {
+    PyErr_SetString(PyExc_ValueError, "knn: k must be between 1 and k_max.");
+    return 0;
+  }
+
+  int total_correct = 0;
+  int total_queries = 0;
+  kNearestNeighbors<char*, ltstr, eqstr> knn((size_t)k);
+  for (size_t i = 0; i < n; ++i) {
+    // the same samples are skipped as in leave_one_out
+    if (o->id_name_histogram[i] < int((k + 0.5) / 2))
+      continue;
+    for (size_t m = 0; m < size_t(k); ++m) {
+      if (indexes[i * k_max + m] < 0 || size_t(indexes[i * k_max + m]) >= n) {
+        PyErr_SetString(PyExc_IndexError, "knn: neighbor index out of range");
+        return 0;
+      }
+      knn.add(o->id_names[indexes[i * k_max + m]], distances[i * k_max + m]);
+    }
+    knn.majority();
+    if (strcmp(knn.answer[0].first, o->id_names[i]) == 0)
+      total_correct++;
+    knn.reset();
+    total_queries++;
+  }
+  return Py_BuildValue(CHAR_PTR_CAST "(ii)", total_correct, total_queries);
+}
+
+/*
+  Editing of the training data (see gamera/knn_editing.py). Both functions
+  work on the feature vectors from instantiate_from_images and return the
+  indexes of the feature vectors that are kept.
+
+  _edit_mnn(k, num_threads) implements Wilson's editing: a feature vector is
+  kept when its k nearest neighbors among all other feature vectors vote
+  for its own class.
+
+  _edit_cnn(order, k) implements Hart's condensing: the store starts with
+  the first index in order, and the other indexes are classified with the
+  store in the given order. Misclassified ones are moved to the store until
+  a whole pass adds nothing. The indexes in the store are returned in the
+  order they have been added.
+*/
+static unsigned long knn_edit_neighbors(KnnObject* o, const CompiledFeatures& compiled,
+                                        size_t unknown, const std::vector<size_t>& candidates,
+                                        size_t k, kNearestNeighbors<char*, ltstr, eqstr>& knn) {
+  const double infinity = std::numeric_limits<double>::infinity();
+  unsigned long abandoned = 0;
+  std::vector<double> unknown_fv(compiled.num_features());
+  compiled.get(unknown, &unknown_fv[0]);
+  for (size_t c = 0; c < candidates.size(); ++c) {
+    size_t j = candidates[c];
+    if (j == unknown)
+      continue;
+    double bound = (knn.m_nn.size() == k) ? knn.m_nn.back().distance : infinity;
+    double distance = 0.0;
+    if (compiled.bounded_distance(o->distance_type, j, &unknown_fv[0],
+                                  bound, distance) < compiled.num_features()) {
+      ++abandoned;
+      continue;
+    }
+    knn.add(o->id_names[j], distance);
+  }
+  return abandoned;
+}
+
+static PyObject* knn_edit_mnn(PyObject* self, PyObject* args) {
+  KnnObject* o = (KnnObject*)self;
+  int k;
+  int num_threads = 1;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "i|i", &k, &num_threads) <= 0)
+    return 0;
+  if (o->num_feature_vectors == 0) {
+    PyErr_SetString(PyExc_RuntimeError,
+                    "knn: edit_mnn called before instantiate_from_images.");
+    return 0;
+  }
+  if (k < 1) {
+    PyErr_SetString(PyExc_ValueError, "knn: k must be positive");
+    return 0;
+  }
+  if (num_threads < 1) {
+    PyErr_SetString(PyExc_ValueError, "knn: the number of threads must be positive");
+    return 0;
+  }
+  if (knn_update_compiled(o) < 0)
+    return 0;
+
+  size_t n = o->num_feature_vectors;
+  std::vector<size_t> all(n);
+  for (size_t i = 0; i < n; ++i)
+    all[i] = i;
+  std::vector<char> keep(n, 0);
+  const CompiledFeatures& compiled = *o->compiled;
+  unsigned long abandoned = 0;
+  Py_BEGIN_ALLOW_THREADS
+#ifdef _OPENMP
+#pragma omp parallel for num_threads(num_threads) schedule(dynamic, 16) reduction(+:abandoned)
+#endif
+  for (long i = 0; i < (long)n; ++i) {
+    kNearestNeighbors<char*, ltstr, eqstr> knn((size_t)k);
+    abandoned += knn_edit_neighbors(o, compiled, i, all, k, knn);
+    // a single feature vector has no neighbors and is kept
+    if (knn.m_nn.empty()) {
+      keep[i] = 1;
+      continue;
+    }
+    knn.majority();
+    keep[i] = strcmp(knn.answer[0].first, o->id_names[i]) == 0;
+  }
+  Py_END_ALLOW_THREADS
+  o->abandoned_comparisons += abandoned;
+
+  PyObject* result = PyList_New(0);
+  for (size_t i = 0; i < n; ++i) {
+    if (keep[i]) {
+      PyObject* index = PyInt_FromLong((long)i);
+      PyList_Append(result, index);
+      Py_DECREF(index);
+    }
+  }
+  return result;
+}
+
+static PyObject* knn_edit_cnn(PyObject* self, PyObject* args) {
+  KnnObject* o = (KnnObject*)self;
+  PyObject* order;
+  int k;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "Oi", &order, &k) <= 0)
+    return 0;
+  if (o->num_feature_vectors == 0) {
+    PyErr_SetString(PyExc_RuntimeError,
+                    "knn: edit_cnn called before instantiate_from_images.");
+    return 0;
+  }
+  if (k < 1) {
+    PyErr_SetString(PyExc_ValueError, "knn: k must be positive");
+    return 0;
+  }
+  PyObject* order_seq = PySequence_Fast(order, "knn: order must be iterable");
+  if (order_seq == NULL)
+    return 0;
+  size_t n = o->num_feature_vectors;
+  std::vector<size_t> grabbag;
+  std::vector<char> seen(n, 0);
+  for (Py_ssize_t i = 0; i < PySequence_Fast_GET_SIZE(order_seq); ++i) {
+    long index = PyInt_AsLong(PySequence_Fast_GET_ITEM(order_seq, i));
+    if (index == -1 && PyErr_Occurred()) {
+      Py_DECREF(order_seq);
+      return 0;
+    }
+    if (index < 0 || size_t(index) >= n || seen[index]) {
+      PyErr_SetString(PyExc_IndexError, "knn: invalid or repeated index in order");
+      Py_DECREF(order_seq);
+      return 0;
+    }
+    seen[index] = 1;
+    grabbag.push_back((size_t)index);
+  }
+  Py_DECREF(order_seq);
+  if (knn_update_compiled(o) < 0)
+    return 0;
+
+  std::vector<size_t> store;
+  const CompiledFeatures& compiled = *o->compiled;
+  unsigned long abandoned = 0;
+  Py_BEGIN_ALLOW_THREADS
+  if (!grabbag.empty()) {
+    store.push_back(grabbag[0]);
+    grabbag.erase(grabbag.begin());
+  }
+  kNearestNeighbors<char*, ltstr, eqstr> knn((size_t)k);
+  bool changed = true;
+  while (changed) {
+    changed = false;
+    std::vector<size_t> remaining;
+    for (size_t i = 0; i < grabbag.size(); ++i) {
+      knn.reset();
+      abandoned += knn_edit_neighbors(o, compiled, grabbag[i], store, k, knn);
+      knn.majority();
+      if (strcmp(knn.answer[0].first, o->id_names[grabbag[i]]) != 0) {
+        store.push_back(grabbag[i]);
+        changed = true;
+      } else {
+        remaining.push_back(grabbag[i]);
+      }
+    }
+    grabbag.swap(remaining);
+  }
+  Py_END_ALLOW_THREADS
+  o->abandoned_comparisons += abandoned;
+
+  PyObject* result = PyList_New(store.size());
+  for (size_t i = 0; i < store.size(); ++i)
+    PyList_SET_ITEM(result, i, PyInt_FromLong((long)store[i]));
+  return result;
+}
+
 /*
   Serialize and unserialize save and restore the internal data of the kNN object
   to/from a fast and compact binary format. This allows a user to create a file that
@@ -1071,50 +1964,173 @@ static PyObject* knn_knndistance_statistics(PyObject* self, PyObject* args) {
 
   ARGUMENTS
 
-  This function takes a filename and a list of features - the python wrapper of this
-  class handles providing the list of features.
+  serialize takes a filename and a list of features - the python wrapper of this
+  class handles providing the list of features. unserialize takes a filename and
+  optionally whether the file may be memory mapped (the default), and returns the
+  list of features.
 
   FORMAT
 
-  The format is designed to be as simple as possible. First is a header consisting
-  of the file format version (currently 2), then the size and settings of the data,
-  and finally the data.
+  The format is the same on all platforms: all integers are unsigned and stored
+  in little endian byte order, and all doubles are IEEE 754 double precision
+  numbers, also in little endian byte order. The file starts with a header that
+  holds the settings and the offsets (from the start of the file) of the
+  sections that follow. The feature vectors come last and are aligned to 64
+  bytes, so that on little endian machines they can be used directly from a
+  memory mapping of the file. Several processes using the same classifier file
+  then share its pages in memory.
+
+  HEADER (128 bytes)
 
-  HEADER
+  size             what
+  ------------------------------------------
+  char[8]          magic "GAMERAKN"
+  uint32           version (currently 3)
+  uint32           flags (1: normalization is used,
+                          2: the feature vectors are in single precision)
+  uint64           number of k
+  uint64           number of features
+  uint64           number of feature vectors
+  uint64           number of feature names
+  uint64           number of classes (i.e. distinct id_names)
+  uint64           offset of the feature names
+  uint64           offset of the class names
+  uint64           offset of the class indexes
+  uint64           offset of the normalization (0 if not used)
+  uint64           offset of the selection vector
+  uint64           offset of the weighting vector
+  uint64           offset of the feature vectors
+  uint64           size of the file
+  na               zeros
+
+  SECTIONS
+
+  The feature names and the class names are string tables, i.e. each string
+  is stored as its length (uint32, without the terminating null) followed
+  by the characters including the terminating null.
 
   size             what
   ------------------------------------------
-  unsigned long    version
-  unsigned long    number of k
-  unsigned long    number of feaures
-  unsigned long    number of feature vectors
-  unsigned long    number of feature names
-  na               list of feature names in the format
-                   of unsigned long (length - including null)
-                   and char[]
-  bool             flag which indicated wheter normalization is used or not
-    double[]       normalization mean_vector (sizeof(double) * #feature vectors)
+  na               feature names
+  na               class names
+  uint32[]         class index of each feature vector
+  double[]         normalization mean_vector (#features)
                    NOTE: only if normalization is used
-    double[]       normalization stdev_vector (sizeof(double) * #feature vectors)
+  double[]         normalization stdev_vector (#features)
                    NOTE: only if normalization is used
-  int[]            selection vector (sizeof(int) * #features)
-  double[]         weighting vector (sizeof(double) * #features)
+  uint32[]         selection vector (#features)
+  double[]         weighting vector (#features)
+  double[]         feature vectors (#feature vectors * #features), row by row
+                   NOTE: IEEE 754 single precision numbers if flag 2 is set
+
+  A file is written in the precision the classifier stores its feature
+  vectors in, and converted to the precision of the reading classifier if
+  necessary (in which case the feature vectors are not used from the
+  memory mapping).
+
+  Files in the old format (version 2), which contained the data in the
+  memory representation of the platform, can still be read.
+*/
 
-  DATA
+typedef unsigned PY_LONG_LONG knn_uint64;
 
-  The data as stored a list of id_names followed by the feature vectors.
-  The id_names are stored as:
+static const char knn_file_magic[8] = { 'G', 'A', 'M', 'E', 'R', 'A', 'K', 'N' };
+static const unsigned int knn_file_version = 3;
+static const size_t knn_file_header_size = 128;
+static const size_t knn_file_alignment = 64;
 
-  size             what
-  ------------------------------------------
-  unsigned long    length of string
-  char[]           id_name
+static bool knn_host_is_little_endian() {
+  const unsigned int one = 1;
+  return *(const unsigned char*)&one == 1;
+}
+
+// append an unsigned integer of size bytes in little endian byte order
+static void knn_put_uint(std::string& buffer, knn_uint64 value, size_t size) {
+  for (size_t i = 0; i < size; ++i) {
+    buffer += (char)(value & 0xff);
+    value >>= 8;
+  }
+}
+
+static void knn_put_double(std::string& buffer, double value) {
+  knn_uint64 bits;
+  memcpy(&bits, &value, sizeof(double));
+  knn_put_uint(buffer, bits, 8);
+}
+
+static void knn_put_float(std::string& buffer, float value) {
+  unsigned int bits;
+  memcpy(&bits, &value, sizeof(float));
+  knn_put_uint(buffer, bits, 4);
+}
 
-  There are, of course, feature_vectors->size() id_names. Next is the data which is
-  simply written directly - i.e. feature_vectors->size() arrays of doubles of length
-  num_features.
+// append a string table entry
+static void knn_put_string(std::string& buffer, const char* s, size_t length) {
+  knn_put_uint(buffer, length, 4);
+  buffer.append(s, length);
+  buffer += '\0';
+}
 
+/*
+  Reads the data of a classifier file from memory. Any attempt to read
+  beyond the end of the data raises a std::runtime_error, so that a
+  corrupt file cannot crash the reader.
 */
+class KnnFileReader {
+public:
+  KnnFileReader(const char* data, size_t size) {
+    m_data = data;
+    m_size = size;
+    m_pos = 0;
+  }
+  void seek(knn_uint64 pos) {
+    if (pos > m_size)
+      throw std::runtime_error("knn: corrupt knn file.");
+    m_pos = (size_t)pos;
+  }
+  const char* get(size_t size) {
+    if (size > m_size - m_pos)
+      throw std::runtime_error("knn: corrupt knn file.");
+    const char* p = m_data + m_pos;
+    m_pos += size;
+    return p;
+  }
+  knn_uint64 get_uint(size_t size) {
+    const unsigned char* p = (const unsigned char*)get(size);
+    knn_uint64 value = 0;
+    for (size_t i = size; i > 0; --i)
+      value = (value << 8) | p[i - 1];
+    return value;
+  }
+  double get_double() {
+    knn_uint64 bits = get_uint(8);
+    double value;
+    memcpy(&value, &bits, sizeof(double));
+    return value;
+  }
+  float get_float() {
+    unsigned int bits = (unsigned int)get_uint(4);
+    float value;
+    memcpy(&value, &bits, sizeof(float));
+    return value;
+  }
+  // a string table entry, which points into the data
+  const char* get_string(size_t* length) {
+    knn_uint64 len = get_uint(4);
+    if (len >= m_size)
+      throw std::runtime_error("knn: corrupt knn file.");
+    *length = (size_t)len;
+    const char* s = get(*length + 1);
+    if (s[*length] != '\0')
+      throw std::runtime_error("knn: corrupt knn file.");
+    return s;
+  }
+private:
+  const char* m_data;
+  size_t m_size;
+  size_t m_pos;
+};
+
 static PyObject* knn_serialize(PyObject* self, PyObject* args) {
   KnnObject* o = (KnnObject*)self;
   char* filename;
@@ -1128,149 +2144,303 @@ static PyObject* knn_serialize(PyObject* self, PyObject* args) {
     PyErr_SetString(PyExc_TypeError, "knn: list of features must be a list.");
     return 0;
   }
-
-  unsigned long feature_size = PyList_GET_SIZE(features);
-
-  FILE* file = fopen(filename, "w+b");
-  if (file == 0) {
-    PyErr_SetString(PyExc_IOError, "knn: error opening file.");
-    return 0;
+  size_t num_feature_names = PyList_GET_SIZE(features);
+  for (size_t i = 0; i < num_feature_names; ++i) {
+    if (!PyString_Check(PyList_GET_ITEM(features, i))) {
+      PyErr_SetString(PyExc_TypeError, "knn: feature names must be strings.");
+      return 0;
+    }
   }
 
-  if (o->feature_vectors == 0) {
+  if (o->num_feature_vectors == 0) {
     PyErr_SetString(PyExc_RuntimeError, "knn: serialize called before instatiate from images.");
-    fclose(file);
     return 0;
   }
 
-  // write the header info
-  unsigned long version = 2;
-  if (fwrite((const void*)&version, sizeof(unsigned long), 1, file) != 1) {
-    PyErr_SetString(PyExc_IOError, "knn: problem writing to a file.");
-    fclose(file);
-    return 0;
+  // the classes in the order of their first occurrence
+  std::map<char*, size_t, ltstr> class_indexes;
+  std::vector<char*> classes;
+  for (size_t i = 0; i < o->num_feature_vectors; ++i) {
+    if (class_indexes.find(o->id_names[i]) == class_indexes.end()) {
+      class_indexes[o->id_names[i]] = classes.size();
+      classes.push_back(o->id_names[i]);
+    }
   }
-  unsigned long num_k = (unsigned long)o->num_k;
-  if (fwrite((const void*)&num_k, sizeof(unsigned long), 1, file) != 1) {
-    PyErr_SetString(PyExc_IOError, "knn: problem writing to a file.");
-    fclose(file);
+
+  // everything but the feature vectors is collected in memory
+  std::string buffer(knn_file_header_size, '\0');
+  knn_uint64 feature_names_offset = buffer.size();
+  for (size_t i = 0; i < num_feature_names; ++i) {
+    PyObject* cur_string = PyList_GET_ITEM(features, i);
+    knn_put_string(buffer, PyString_AS_STRING(cur_string), PyString_GET_SIZE(cur_string));
+  }
+  knn_uint64 class_names_offset = buffer.size();
+  for (size_t i = 0; i < classes.size(); ++i)
+    knn_put_string(buffer, classes[i], strlen(classes[i]));
+  knn_uint64 class_indexes_offset = buffer.size();
+  for (size_t i = 0; i < o->num_feature_vectors; ++i)
+    knn_put_uint(buffer, class_indexes[o->id_names[i]], 4);
+  knn_uint64 normalization_offset = 0;
+  if (o->normalize != 0) {
+    normalization_offset = buffer.size();
+    for (size_t i = 0; i < o->num_features; ++i)
+      knn_put_double(buffer, o->normalize->get_mean_vector()[i]);
+    for (size_t i = 0; i < o->num_features; ++i)
+      knn_put_double(buffer, o->normalize->get_stdev_vector()[i]);
+  }
+  knn_uint64 selections_offset = buffer.size();
+  for (size_t i = 0; i < o->num_features; ++i)
+    knn_put_uint(buffer, (unsigned int)o->selection_vector[i], 4);
+  knn_uint64 weights_offset = buffer.size();
+  for (size_t i = 0; i < o->num_features; ++i)
+    knn_put_double(buffer, o->weight_vector[i]);
+  buffer.append((knn_file_alignment - buffer.size() % knn_file_alignment)
+                % knn_file_alignment, '\0');
+  knn_uint64 data_offset = buffer.size();
+  size_t data_size = o->num_feature_vectors * o->num_features;
+  bool single = o->single_feature_vectors != 0;
+  size_t element_size = single ? sizeof(float) : sizeof(double);
+
+  std::string header(knn_file_magic, sizeof(knn_file_magic));
+  knn_put_uint(header, knn_file_version, 4);
+  knn_put_uint(header, ((o->normalize != 0) ? 1 : 0) | (single ? 2 : 0), 4);
+  knn_put_uint(header, o->num_k, 8);
+  knn_put_uint(header, o->num_features, 8);
+  knn_put_uint(header, o->num_feature_vectors, 8);
+  knn_put_uint(header, num_feature_names, 8);
+  knn_put_uint(header, classes.size(), 8);
+  knn_put_uint(header, feature_names_offset, 8);
+  knn_put_uint(header, class_names_offset, 8);
+  knn_put_uint(header, class_indexes_offset, 8);
+  knn_put_uint(header, normalization_offset, 8);
+  knn_put_uint(header, selections_offset, 8);
+  knn_put_uint(header, weights_offset, 8);
+  knn_put_uint(header, data_offset, 8);
+  knn_put_uint(header, data_offset + (knn_uint64)data_size * element_size, 8);
+  buffer.replace(0, header.size(), header);
+
+  /*
+    The file is written under a temporary name and renamed afterwards, so
+    that classifiers that have memory mapped an old version of the file
+    keep their data.
+  */
+  std::string tmp_filename = std::string(filename) + ".tmp";
+  FILE* file = fopen(tmp_filename.c_str(), "wb");
+  if (file == 0) {
+    PyErr_SetString(PyExc_IOError, "knn: error opening file.");
     return 0;
   }
-  unsigned long num_features = (unsigned long)o->num_features;
-  if (fwrite((const void*)&num_features, sizeof(unsigned long), 1, file) != 1) {
-    PyErr_SetString(PyExc_IOError, "knn: problem writing to a file.");
-    fclose(file);
-    return 0;
+  bool ok = fwrite(buffer.data(), sizeof(char), buffer.size(), file) == buffer.size();
+  if (knn_host_is_little_endian()) {
+    const void* data = single ? (const void*)o->single_feature_vectors
+      : (const void*)o->feature_vectors;
+    ok = ok && fwrite(data, element_size, data_size, file) == data_size;
+  } else {
+    std::string row;
+    for (size_t i = 0; ok && i < o->num_feature_vectors; ++i) {
+      row.clear();
+      for (size_t j = 0; j < o->num_features; ++j) {
+        if (single)
+          knn_put_float(row, o->single_feature_vectors[i * o->num_features + j]);
+        else
+          knn_put_double(row, o->feature_vectors[i * o->num_features + j]);
+      }
+      ok = fwrite(row.data(), sizeof(char), row.size(), file) == row.size();
+    }
   }
-  unsigned long num_feature_vectors = (unsigned long)o->feature_vectors->size();
-  if (fwrite((const void*)&num_feature_vectors, sizeof(unsigned long), 1, file) != 1) {
+  if (fclose(file) != 0)
+    ok = false;
+#ifdef _WIN32
+  // rename does not replace existing files on Windows
+  if (ok)
+    remove(filename);
+#endif
+  if (!ok || rename(tmp_filename.c_str(), filename) != 0) {
+    remove(tmp_filename.c_str());
     PyErr_SetString(PyExc_IOError, "knn: problem writing to a file.");
-    fclose(file);
     return 0;
   }
 
-  // write the feature names
-  if (fwrite((const void*)&feature_size, sizeof(unsigned long), 1, file) != 1) {
-    PyErr_SetString(PyExc_IOError, "knn: problem writing to a file.");
-    fclose(file);
-    return 0;
-  }
+  Py_INCREF(Py_None);
+  return Py_None;
+}
 
-  for (size_t i = 0; i < feature_size; ++i) {
-    PyObject* cur_string = PyList_GET_ITEM(features, i);
-    unsigned long string_size = PyString_GET_SIZE(cur_string) + 1;
-    if (fwrite((const void*)&string_size, sizeof(unsigned long), 1, file) != 1) {
-      PyErr_SetString(PyExc_IOError, "knn: problem writing to a file.");
-      fclose(file);
-      return 0;
-    }
-    if (fwrite((const void*)PyString_AS_STRING(cur_string),
-               sizeof(char), string_size, file) != string_size) {
-      PyErr_SetString(PyExc_IOError, "knn: problem writing to a file.");
-      fclose(file);
-      return 0;
-    }
-  }
+/*
+  Read a file in the current format, starting at the beginning of the file.
+  Errors are reported with std::runtime_error, in which case the feature data
+  of o may be incomplete and must be deleted. The return value is the list
+  of feature names.
+*/
+static PyObject* knn_unserialize_v3(KnnObject* o, FILE* file, bool use_mmap) {
+  char header_data[knn_file_header_size];
+  if (fread((void*)header_data, sizeof(char), knn_file_header_size, file)
+      != knn_file_header_size)
+    throw std::runtime_error("knn: problem reading file.");
+  KnnFileReader header(header_data, knn_file_header_size);
+  header.get(sizeof(knn_file_magic));
+  if (header.get_uint(4) != knn_file_version)
+    throw std::runtime_error("knn: unknown version of knn file.");
+  knn_uint64 flags = header.get_uint(4);
+  knn_uint64 num_k = header.get_uint(8);
+  knn_uint64 num_features = header.get_uint(8);
+  knn_uint64 num_feature_vectors = header.get_uint(8);
+  knn_uint64 num_feature_names = header.get_uint(8);
+  knn_uint64 num_classes = header.get_uint(8);
+  knn_uint64 feature_names_offset = header.get_uint(8);
+  knn_uint64 class_names_offset = header.get_uint(8);
+  knn_uint64 class_indexes_offset = header.get_uint(8);
+  knn_uint64 normalization_offset = header.get_uint(8);
+  knn_uint64 selections_offset = header.get_uint(8);
+  knn_uint64 weights_offset = header.get_uint(8);
+  knn_uint64 data_offset = header.get_uint(8);
+  knn_uint64 file_size = header.get_uint(8);
+  if (file_size > (knn_uint64)std::numeric_limits<size_t>::max())
+    throw std::runtime_error("knn: knn file too large.");
+  bool single = (flags & 2) != 0;
+  size_t element_size = single ? sizeof(float) : sizeof(double);
+  if (num_k == 0 || num_features == 0 || num_feature_vectors == 0
+      || data_offset < knn_file_header_size || data_offset > file_size
+      || data_offset % sizeof(double) != 0
+      || (file_size - data_offset) / element_size / num_features < num_feature_vectors
+      || data_offset + num_feature_vectors * num_features * element_size != file_size)
+    throw std::runtime_error("knn: corrupt knn file.");
 
-  for (size_t i = 0; i < o->feature_vectors->size(); ++i) {
-    unsigned long len = strlen(o->id_names[i]) + 1; // include \0
-    if (fwrite((const void*)&len, sizeof(unsigned long), 1, file) != 1) {
-      PyErr_SetString(PyExc_IOError, "knn: problem writing to a file.");
-      fclose(file);
-      return 0;
-    }
-    if (fwrite((const void*)o->id_names[i], sizeof(char), len, file) != len) {
-      PyErr_SetString(PyExc_IOError, "knn: problem writing to a file.");
-      fclose(file);
-      return 0;
+  knn_delete_feature_data(o);
+  set_num_features(o, (size_t)num_features);
+  o->num_k = (size_t)num_k;
+
+  // either the whole file is mapped, or everything but the feature vectors is read
+  std::vector<char> metadata;
+  const char* data = 0;
+#ifdef KNN_HAVE_MMAP
+  struct stat file_stat;
+  if (use_mmap && knn_host_is_little_endian() && fstat(fileno(file), &file_stat) == 0
+      && (knn_uint64)file_stat.st_size == file_size) {
+    void* mapping = mmap(0, (size_t)file_size, PROT_READ, MAP_SHARED, fileno(file), 0);
+    if (mapping != MAP_FAILED) {
+      o->mapping = (char*)mapping;
+      o->mapping_size = (size_t)file_size;
+      data = o->mapping;
     }
   }
-
-  bool normalize = (bool) o->normalize;
-  if (fwrite((const void*) &normalize, sizeof(bool), 1, file) != 1) {
-    PyErr_SetString(PyExc_IOError, "knn: problem writing to a file.");
-    fclose(file);
-    return 0;
-  }
-
-  if (normalize) {
-    if (fwrite((const void*)o->normalize->get_mean_vector(),
-               sizeof(double), o->num_features, file) != o->num_features) {
-      PyErr_SetString(PyExc_IOError, "knn: problem writing to a file.");
-      fclose(file);
-      return 0;
-    }
-    if (fwrite((const void*)o->normalize->get_stdev_vector(),
-               sizeof(double), o->num_features, file) != o->num_features) {
-      PyErr_SetString(PyExc_IOError, "knn: problem writing to a file.");
-      fclose(file);
-      return 0;
+#endif
+  if (data == 0) {
+    metadata.resize((size_t)data_offset);
+    rewind(file);
+    if (fread((void*)&metadata[0], sizeof(char), metadata.size(), file) != metadata.size())
+      throw std::runtime_error("knn: problem reading file.");
+    data = &metadata[0];
+  }
+  KnnFileReader reader(data, (size_t)data_offset);
+
+  std::vector<std::pair<const char*, size_t> > feature_names;
+  reader.seek(feature_names_offset);
+  for (knn_uint64 i = 0; i < num_feature_names; ++i) {
+    size_t length;
+    const char* name = reader.get_string(&length);
+    feature_names.push_back(std::make_pair(name, length));
+  }
+
+  std::vector<const char*> classes;
+  reader.seek(class_names_offset);
+  for (knn_uint64 i = 0; i < num_classes; ++i) {
+    size_t length;
+    classes.push_back(reader.get_string(&length));
+  }
+
+  o->num_feature_vectors = (size_t)num_feature_vectors;
+  size_t data_size = o->num_feature_vectors * o->num_features;
+  if (single) {
+    if (o->mapping != 0)
+      o->single_feature_vectors = (float*)(o->mapping + data_offset);
+    else
+      o->single_feature_vectors = new float[data_size];
+  } else {
+    if (o->mapping != 0)
+      o->feature_vectors = (double*)(o->mapping + data_offset);
+    else
+      o->feature_vectors = new double[data_size];
+  }
+  o->id_names = new char*[o->num_feature_vectors];
+  std::fill(o->id_names, o->id_names + o->num_feature_vectors, (char*)0);
+  o->id_name_histogram = new int[o->num_feature_vectors];
+
+  std::vector<size_t> class_of(o->num_feature_vectors);
+  std::vector<int> class_histogram(classes.size(), 0);
+  reader.seek(class_indexes_offset);
+  for (size_t i = 0; i < o->num_feature_vectors; ++i) {
+    class_of[i] = (size_t)reader.get_uint(4);
+    if (class_of[i] >= classes.size())
+      throw std::runtime_error("knn: corrupt knn file.");
+    class_histogram[class_of[i]]++;
+    const char* id_name = classes[class_of[i]];
+    if (o->mapping != 0) {
+      o->id_names[i] = const_cast<char*>(id_name);
+    } else {
+      size_t len = strlen(id_name) + 1;
+      o->id_names[i] = new char[len];
+      memcpy(o->id_names[i], id_name, len);
     }
   }
+  for (size_t i = 0; i < o->num_feature_vectors; ++i)
+    o->id_name_histogram[i] = class_histogram[class_of[i]];
 
-  if (fwrite((const void*)o->selection_vector, sizeof(int), o->num_features, file)
-      != o->num_features) {
-    PyErr_SetString(PyExc_IOError, "knn: problem writing to a file.");
-    fclose(file);
-    return 0;
-  }
-
-  if (fwrite((const void*)o->weight_vector, sizeof(double), o->num_features, file)
-      != o->num_features) {
-    PyErr_SetString(PyExc_IOError, "knn: problem writing to a file.");
-    fclose(file);
-    return 0;
+  if (o->normalize != 0) {
+    delete o->normalize;
+    o->normalize = 0;
   }
-
-  // write the data
-  double* cur;
-  for (size_t i = 0; i < o->feature_vectors->size(); ++i) {
-    cur = (*o->feature_vectors)[i];
-    if (fwrite((const void*)cur, sizeof(double), o->num_features, file)
-        != o->num_features) {
-      PyErr_SetString(PyExc_IOError, "knn: problem writing to a file.");
-      fclose(file);
-      return 0;
+  if (flags & 1) {
+    std::vector<double> mean(o->num_features), stdev(o->num_features);
+    reader.seek(normalization_offset);
+    for (size_t i = 0; i < o->num_features; ++i)
+      mean[i] = reader.get_double();
+    for (size_t i = 0; i < o->num_features; ++i)
+      stdev[i] = reader.get_double();
+    o->normalize = new Normalize(o->num_features);
+    o->normalize->set_mean_vector(mean.begin(), mean.end());
+    o->normalize->set_stdev_vector(stdev.begin(), stdev.end());
+  }
+
+  reader.seek(selections_offset);
+  for (size_t i = 0; i < o->num_features; ++i)
+    o->selection_vector[i] = (int)reader.get_uint(4);
+  reader.seek(weights_offset);
+  for (size_t i = 0; i < o->num_features; ++i)
+    o->weight_vector[i] = reader.get_double();
+
+  // the file position is at the feature vectors after reading the metadata
+  if (o->mapping == 0) {
+    void* vectors = single ? (void*)o->single_feature_vectors : (void*)o->feature_vectors;
+    if (knn_host_is_little_endian()) {
+      if (fread(vectors, element_size, data_size, file) != data_size)
+        throw std::runtime_error("knn: problem reading file.");
+    } else {
+      std::vector<char> row(o->num_features * element_size);
+      for (size_t i = 0; i < o->num_feature_vectors; ++i) {
+        if (fread((void*)&row[0], sizeof(char), row.size(), file) != row.size())
+          throw std::runtime_error("knn: problem reading file.");
+        KnnFileReader row_reader(&row[0], row.size());
+        for (size_t j = 0; j < o->num_features; ++j) {
+          if (single)
+            o->single_feature_vectors[i * o->num_features + j] = row_reader.get_float();
+          else
+            o->feature_vectors[i * o->num_features + j] = row_reader.get_double();
+        }
+      }
     }
   }
 
-  fclose(file);
-  Py_INCREF(Py_None);
-  return Py_None;
+  PyObject* result = PyList_New(feature_names.size());
+  for (size_t i = 0; i < feature_names.size(); ++i)
+    PyList_SET_ITEM(result, i, PyString_FromStringAndSize(feature_names[i].first,
+                                                          feature_names[i].second));
+  return result;
 }
 
-static PyObject* knn_unserialize(PyObject* self, PyObject* args) {
-  KnnObject* o = (KnnObject*)self;
-  char* filename;
-  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "s", &filename) <= 0)
-    return 0;
-
-  FILE* file = fopen(filename, "rb");
-  if (file == 0) {
-    PyErr_SetString(PyExc_IOError, "knn: error opening file.");
-    return 0;
-  }
-
+/*
+  Read a file in the old (version 2) format. The file is closed.
+*/
+static PyObject* knn_unserialize_v2(KnnObject* o, FILE* file) {
   unsigned long version, num_k, num_features, num_feature_vectors, num_feature_names;
   if (fread((void*)&version, sizeof(unsigned long), 1, file) != 1) {
     PyErr_SetString(PyExc_IOError, "knn: problem reading file.");
@@ -1329,7 +2499,7 @@ static PyObject* knn_unserialize(PyObject* self, PyObject* args) {
   o->num_k = num_k;
 
   std::map<char*, int, ltstr> id_name_histogram;
-  for (size_t i = 0; i < o->feature_vectors->size(); ++i) {
+  for (size_t i = 0; i < o->num_feature_vectors; ++i) {
     unsigned long len;
     if (fread((void*)&len, sizeof(unsigned long), 1, file) != 1) {
       PyErr_SetString(PyExc_IOError, "knn: problem reading file.");
@@ -1352,7 +2522,12 @@ static PyObject* knn_unserialize(PyObject* self, PyObject* args) {
     return 0;
   }
 
+  if (o->normalize != 0) {
+    delete o->normalize;
+    o->normalize = 0;
+  }
   if (normalize) {
+    o->normalize = new Normalize(o->num_features);
     double* tmp_mean_norm = new double[o->num_features];
     if (fread((void*)tmp_mean_norm, sizeof(double), o->num_features, file) != o->num_features) {
       PyErr_SetString(PyExc_IOError, "knn: problem reading file.");
@@ -1386,18 +2561,66 @@ static PyObject* knn_unserialize(PyObject* self, PyObject* args) {
     return 0;
   }
 
-  double* cur;
-  for (size_t i = 0; i < o->feature_vectors->size(); ++i) {
-    cur = (*o->feature_vectors)[i];
-    if (fread((void*)cur, sizeof(double), o->num_features, file) != o->num_features) {
-      PyErr_SetString(PyExc_IOError, "knn: problem reading file.");
-      fclose(file);
+  size_t data_size = o->num_feature_vectors * o->num_features;
+  if (fread((void*)o->feature_vectors, sizeof(double), data_size, file) != data_size) {
+    PyErr_SetString(PyExc_IOError, "knn: problem reading file.");
+    fclose(file);
+    return 0;
+  }
+  for (size_t i = 0; i < o->num_feature_vectors; ++i)
+    o->id_name_histogram[i] = id_name_histogram[o->id_names[i]];
+
+  fclose(file);
+  return feature_names;
+}
+
+static PyObject* knn_unserialize(PyObject* self, PyObject* args) {
+  KnnObject* o = (KnnObject*)self;
+  char* filename;
+  int use_mmap = 1;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "s|i", &filename, &use_mmap) <= 0)
+    return 0;
+
+  FILE* file = fopen(filename, "rb");
+  if (file == 0) {
+    PyErr_SetString(PyExc_IOError, "knn: error opening file.");
+    return 0;
+  }
+
+  char magic[sizeof(knn_file_magic)];
+  size_t magic_size = fread((void*)magic, sizeof(char), sizeof(magic), file);
+  rewind(file);
+  if (magic_size != sizeof(magic) || memcmp(magic, knn_file_magic, sizeof(magic)) != 0) {
+    PyObject* feature_names = knn_unserialize_v2(o, file);
+    if (feature_names != 0 && knn_convert_precision(o) < 0) {
+      knn_delete_feature_data(o);
+      Py_DECREF(feature_names);
       return 0;
     }
-    o->id_name_histogram[i] = id_name_histogram[o->id_names[i]];
+    if (feature_names != 0 && o->use_index && knn_create_index(o) < 0) {
+      Py_DECREF(feature_names);
+      return 0;
+    }
+    return feature_names;
   }
 
+  PyObject* feature_names = 0;
+  try {
+    feature_names = knn_unserialize_v3(o, file, use_mmap != 0);
+  } catch (std::exception& e) {
+    knn_delete_feature_data(o);
+    PyErr_SetString(PyExc_IOError, e.what());
+  }
   fclose(file);
+  if (feature_names != 0 && knn_convert_precision(o) < 0) {
+    knn_delete_feature_data(o);
+    Py_DECREF(feature_names);
+    return 0;
+  }
+  if (feature_names != 0 && o->use_index && knn_create_index(o) < 0) {
+    Py_DECREF(feature_names);
+    return 0;
+  }
   return feature_names;
 }
 
@@ -1526,6 +2749,58 @@ static int knn_set_num_features(PyObject* self, PyObject* v) {
   return 0;
 }
 
+static PyObject* knn_get_use_index(PyObject* self) {
+  return PyBool_FromLong(((KnnObject*)self)->use_index);
+}
+
+static int knn_set_use_index(PyObject* self, PyObject* v) {
+  KnnObject* o = (KnnObject*)self;
+  int use_index = PyObject_IsTrue(v);
+  if (use_index < 0)
+    return -1;
+  o->use_index = (use_index != 0);
+  if (!o->use_index) {
+    knn_delete_index(o);
+  } else if (o->num_feature_vectors != 0 && o->index == 0) {
+    if (knn_create_index(o) < 0)
+      return -1;
+  }
+  return 0;
+}
+
+static PyObject* knn_get_single_precision(PyObject* self) {
+  return PyBool_FromLong(((KnnObject*)self)->single_precision);
+}
+
+static int knn_set_single_precision(PyObject* self, PyObject* v) {
+  KnnObject* o = (KnnObject*)self;
+  int single_precision = PyObject_IsTrue(v);
+  if (single_precision < 0)
+    return -1;
+  o->single_precision = (single_precision != 0);
+  if (knn_convert_precision(o) < 0)
+    return -1;
+  return 0;
+}
+
+static PyObject* knn_get_abandoned_comparisons(PyObject* self) {
+  return PyLong_FromUnsignedLong(((KnnObject*)self)->abandoned_comparisons);
+}
+
+static int knn_set_abandoned_comparisons(PyObject* self, PyObject* v) {
+  KnnObject* o = (KnnObject*)self;
+  if (!PyInt_Check(v) && !PyLong_Check(v)) {
+    PyErr_SetString(PyExc_TypeError, "knn: must be an integer.");
+    return -1;
+  }
+  unsigned long abandoned = PyLong_Check(v) ? PyLong_AsUnsignedLong(v)
+    : (unsigned long)PyInt_AsLong(v);
+  if (PyErr_Occurred())
+    return -1;
+  o->abandoned_comparisons = abandoned;
+  return 0;
+}
+
 PyMethodDef knn_module_methods[] = {
   { NULL }
 };
@@ -0,0 +1,117 @@
+from gamera.core import *
+init_gamera()
+
+def _dots(ncols, nrows):
+   # isolated pixels on every other row and column
+   image = Image((0, 0), Dim(ncols, nrows), ONEBIT)
+   for y in range(0, nrows, 2):
+      for x in range(0, ncols, 2):
+         image.set((x, y), 1)
+   return image
+
+def _check_ccs(image, ccs, expected):
+   # every black pixel belongs to exactly one cc
+   assert len(ccs) == expected
+   union = Image(image.ul, image.dim, ONEBIT)
+   area = 0
+   for cc in ccs:
+      area += cc.black_area()[0]
+      union.subimage(cc.ul, cc.dim).or_image(cc, True)
+   assert area == image.black_area()[0]
+   assert union.black_area()[0] == image.black_area()[0]
+
+def _combs(ncols, ncombs):
+   # combs whose teeth only join at the bottom, so that every tooth
+   # needs a label of its own at first
+   comb = Image((0, 0), Dim(ncols, 5), ONEBIT)
+   for x in range(0, ncols, 2):
+      for y in range(3):
+         comb.set((x, y), 1)
+   comb.subimage((0, 3), Dim(ncols, 1)).fill(1)
+   image = Image((0, 0), Dim(ncols, ncombs * 5), ONEBIT)
+   for i in range(ncombs):
+      image.subimage((0, i * 5), Dim(ncols, 5)).or_image(comb, True)
+   return image
+
+def test_cc_analysis_many_labels():
+   # more teeth than pixel labels
+   image = _combs(540, 260)
+   ccs = image.cc_analysis()
+   _check_ccs(image, ccs, 260)
+   assert [cc.label for cc in ccs] == range(2, 262)
+   assert [cc.ul_y for cc in ccs] == range(0, 1300, 5)
+   for cc in ccs:
+      assert cc.dim == Dim(540, 4)
+
+def test_cc_analysis_more_ccs_than_pixel_labels():
+   # 70200 ccs, more than pixel labels
+   image = _dots(540, 520)
+   ccs = image.cc_analysis()
+   assert [cc.label for cc in ccs] == range(2, 70202)
+   assert [cc.black_area()[0] for cc in ccs] == [1] * 70200
+   assert [cc.ul for cc in ccs[-2:]] == [Point(536, 518), Point(538, 518)]
+   assert ccs[-1].get((0, 0)) != 0
+
+   # the ccs with labels above 65535 share their pixel labels with
+   # others, but only see their own pixels
+   cc = ccs[69998]
+   assert cc.label == 70000
+   page = Cc(image, cc.label, (0, 0), Dim(540, 520))
+   assert page.black_area()[0] == 1
+   assert page.image_copy().black_area()[0] == 1
+   assert page.get(cc.ul) != 0
+   assert page.get(ccs[4464].ul) == 0
+   mlcc = MlCc(image, cc.label, (0, 0), Dim(540, 520))
+   assert mlcc.black_area()[0] == 1
+   assert mlcc.get(ccs[4464].ul) == 0
+
+   # the same on RLE images
+   rle = _dots(540, 520).image_copy(RLE)
+   labels = [(cc.label, cc.black_area()[0]) for cc in rle.cc_analysis()]
+   assert labels == [(label, 1) for label in range(2, 70202)]
+
+def test_cc_analysis_few_labels():
+   image = _dots(100, 100)
+   ccs = image.cc_analysis()
+   _check_ccs(image, ccs, 2500)
+   assert [cc.label for cc in ccs] == range(2, 2502)
+
+def test_compact_cc_analysis():
+   image = load_image("data/testline.png")
+   ccs = image.cc_analysis()
+   compact = image.compact_cc_analysis()
+   assert isinstance(compact, CcList)
+   assert len(compact) == len(ccs)
+   assert list(compact.labels) == [cc.label for cc in ccs]
+   assert list(compact.areas) == [cc.black_area()[0] for cc in ccs]
+   # the Cc objects are created on access and kept
+   assert compact._ccs.count(None) == len(ccs)
+   assert compact[3] is compact[3]
+   assert compact[-1].label == ccs[-1].label
+   assert [(cc.ul, cc.lr) for cc in compact] == [(cc.ul, cc.lr) for cc in ccs]
+   assert isinstance(compact.to_list(), list)
+
+   big = compact.filter(min_area=20, max_nrows=40)
+   assert [x.label for x in big] == \
+          [cc.label for cc in ccs if cc.black_area()[0] >= 20 and cc.nrows <= 40]
+   assert len(compact[2:5]) == 3 and compact[2:5][0] is compact[2]
+
+   compact.sort("ul_x", reverse=True)
+   assert list(compact.ul_x) == sorted([cc.ul_x for cc in ccs], reverse=True)
+   compact.sort("nrows")
+   assert [cc.nrows for cc in compact] == sorted([cc.nrows for cc in ccs])
+
+def test_compact_cc_analysis_many_labels():
+   image = _dots(540, 520)
+   compact = image.compact_cc_analysis()
+   assert len(compact) == 270 * 260
+   assert list(compact.labels) == range(2, 70202)
+   assert max(compact.areas) == 1
+   assert compact[-1].ul == Point(538, 518)
+   assert compact[-1].label == 70201
+   assert compact[-1].black_area()[0] == 1
+   for cc in compact[:100]:
+      assert cc.black_area()[0] == 1
+   big = compact.filter(min_area=1)
+   assert len(big) == 70200
+   assert [cc.black_area()[0] for cc in big[-100:]] == [1] * 100
@@ -109,6 +109,37 @@ def test_interactive_classifier():
    classifier.from_xml_filename("data/testline.xml")
    assert len(classifier.get_glyphs()) == 66
    
+def test_interactive_classifier_store():
+   # The native glyph store must follow all changes of the database
+   image = load_image("data/testline.png")
+   ccs = image.cc_analysis()
+   classifier = knn.kNNInteractive([],features=featureset)
+   classifier.from_xml_filename("data/testline.xml")
+   classifier.generate_features_on_glyphs(ccs)
+
+   def check():
+      for cc in ccs:
+         answer = classifier.guess_glyph_automatic(cc)[0]
+         expected = classifier.classify_with_images(list(classifier.database), cc)[0]
+         assert [x[0] for x in answer] == [x[0] for x in expected]
+         assert answer[0] == expected[0]
+
+   check()
+   glyphs = list(classifier.get_glyphs())
+   classifier.remove_from_database(glyphs[:20])
+   check()
+   classifier.add_to_database(glyphs[:10])
+   check()
+   # reclassification of glyphs already in the database
+   for glyph in glyphs[20:25]:
+      classifier.classify_glyph_manual(glyph, "test.glyph")
+   check()
+   classifier.classify_glyph_manual(glyphs[30], "other.glyph")
+   assert classifier.guess_glyph_automatic(glyphs[30])[0][0][1] == "other.glyph"
+   classifier.clear_glyphs()
+   classifier.merge_glyphs(glyphs)
+   check()
+
 def test_noninteractive_classifier():
    # We assume the XML reading/writing itself is fine (given
    # test_xml), but we should test the wrappers in classify anyway
@@ -127,3 +158,341 @@ def test_noninteractive_classifier():
    assert len(classifier.get_glyphs()) == 0
    classifier.unserialize("tmp/serialized.knn")
 
+
+def test_noninteractive_classifier_serialize():
+   import struct
+   image = load_image("data/testline.png")
+   ccs = image.cc_analysis()
+
+   database = gamera_xml.glyphs_from_xml("data/testline.xml")
+   classifier = knn.kNNNonInteractive(database,features=featureset,num_k=3,
+                                      normalize=True)
+   weights = classifier.get_weights()
+   weights[0] = 0.5
+   classifier.set_weights(weights)
+   expected = [classifier.guess_glyph_automatic(cc) for cc in ccs]
+   classifier.serialize("tmp/serialized.knn")
+
+   loaded = knn.kNNNonInteractive("tmp/serialized.knn")
+   for use_mmap in (True, False):
+      loaded.unserialize("tmp/serialized.knn", use_mmap)
+      assert loaded.num_k == 3
+      assert list(loaded.get_weights()) == list(weights)
+      assert [loaded.guess_glyph_automatic(cc) for cc in ccs] == expected
+   # replacing the file must not affect a classifier that has mapped it
+   mapped = knn.kNNNonInteractive("tmp/serialized.knn")
+   mapped.serialize("tmp/serialized.knn")
+   assert [mapped.guess_glyph_automatic(cc) for cc in ccs] == expected
+   mapped.use_index = True
+   assert [mapped.guess_glyph_automatic(cc) for cc in ccs] == expected
+
+   # files in the old format can still be read
+   classifier = knn.kNNNonInteractive(database,features=featureset,num_k=3)
+   expected = [classifier.guess_glyph_automatic(cc) for cc in ccs]
+   num_features = classifier.num_features
+   data = [struct.pack("@LLLLL", 2, 3, num_features, len(database), len(featureset))]
+   for name in featureset + [glyph.get_main_id() for glyph in database]:
+      data.append(struct.pack("@L", len(name) + 1) + name + "\0")
+   data.append(struct.pack("@?", False))
+   data.append(struct.pack("@%di" % num_features, *([1] * num_features)))
+   data.append(struct.pack("@%dd" % num_features, *([1.0] * num_features)))
+   for glyph in database:
+      data.append(struct.pack("@%dd" % num_features, *glyph.features))
+   open("tmp/serialized_v2.knn", "wb").write("".join(data))
+   loaded = knn.kNNNonInteractive("tmp/serialized_v2.knn")
+   assert [loaded.guess_glyph_automatic(cc) for cc in ccs] == expected
+
+def test_noninteractive_classifier_index():
+   image = load_image("data/testline.png")
+   ccs = image.cc_analysis()
+
+   database = gamera_xml.glyphs_from_xml("data/testline.xml")
+   linear = knn.kNNNonInteractive(database,features=featureset,num_k=3)
+   indexed = knn.kNNNonInteractive(database,features=featureset,num_k=3,
+                                   use_index=True)
+   assert indexed.use_index and not linear.use_index
+   for distance_type in [knn.CITY_BLOCK, knn.EUCLIDEAN, knn.FAST_EUCLIDEAN]:
+      linear.distance_type = distance_type
+      indexed.distance_type = distance_type
+      for cc in ccs:
+         assert indexed.guess_glyph_automatic(cc) == linear.guess_glyph_automatic(cc)
+
+   # selections and weights must be honoured as well
+   selections = linear.get_selections()
+   weights = linear.get_weights()
+   for i in range(len(weights)):
+      if i % 2:
+         weights[i] = 0.5
+      else:
+         selections[i] = 0
+   for classifier in (linear, indexed):
+      classifier.set_selections(selections)
+      classifier.set_weights(weights)
+   for cc in ccs:
+      assert indexed.guess_glyph_automatic(cc) == linear.guess_glyph_automatic(cc)
+
+def test_noninteractive_classifier_abandoning():
+   image = load_image("data/testline.png")
+   ccs = image.cc_analysis()
+
+   database = gamera_xml.glyphs_from_xml("data/testline.xml")
+   linear = knn.kNNNonInteractive(database,features=featureset,num_k=3)
+   indexed = knn.kNNNonInteractive(database,features=featureset,num_k=3,
+                                   use_index=True)
+   # all confidences must be the same as without abandoning distance
+   # computations (the index computes all distances completely)
+   confidence_types = [CONFIDENCE_DEFAULT, CONFIDENCE_KNNFRACTION,
+                       CONFIDENCE_LINEARWEIGHT, CONFIDENCE_INVERSEWEIGHT,
+                       CONFIDENCE_NUN, CONFIDENCE_NNDISTANCE,
+                       CONFIDENCE_AVGDISTANCE]
+   linear.confidence_types = confidence_types
+   indexed.confidence_types = confidence_types
+   assert linear.abandoned_comparisons == 0
+   for distance_type in [knn.CITY_BLOCK, knn.EUCLIDEAN, knn.FAST_EUCLIDEAN]:
+      linear.distance_type = distance_type
+      indexed.distance_type = distance_type
+      for cc in ccs:
+         assert indexed.guess_glyph_automatic(cc) == linear.guess_glyph_automatic(cc)
+   assert linear.abandoned_comparisons > 0
+   assert indexed.abandoned_comparisons == 0
+
+   linear.abandoned_comparisons = 0
+   linear.leave_one_out()
+   assert linear.abandoned_comparisons > 0
+
+def test_noninteractive_classifier_batch():
+   image = load_image("data/testline.png")
+   ccs = image.cc_analysis()
+
+   database = gamera_xml.glyphs_from_xml("data/testline.xml")
+   classifier = knn.kNNNonInteractive(database,features=featureset,num_k=3,
+                                      normalize=True)
+   expected = [classifier.guess_glyph_automatic(cc) for cc in ccs]
+   assert classifier.classify_list_batch(ccs) == expected
+   assert classifier.classify_list_batch(ccs, num_threads=4) == expected
+   classifier.use_index = True
+   assert classifier.classify_list_batch(ccs, num_threads=4) == expected
+   assert classifier.classify_list_batch([]) == []
+
+def test_overridden_generate_features():
+   class CountingkNN(knn.kNNNonInteractive):
+      generated = 0
+      def generate_features(self, glyph):
+         CountingkNN.generated += 1
+         knn.kNNNonInteractive.generate_features(self, glyph)
+
+   database = gamera_xml.glyphs_from_xml("data/testline.xml")
+   classifier = CountingkNN(database,features=featureset,num_k=3)
+   ccs = load_image("data/testline.png").cc_analysis()
+   CountingkNN.generated = 0
+   classifier.generate_features_on_glyphs(ccs, 4)
+   assert CountingkNN.generated == len(ccs)
+
+def test_classify_with_selected_features():
+   image = load_image("data/testline.png")
+   database = gamera_xml.glyphs_from_xml("data/testline.xml")
+   for classifier in (knn.kNNNonInteractive(database,features=featureset,
+                                            num_k=3,normalize=True),
+                      knn.kNNInteractive(database,features=featureset,num_k=3)):
+      classifier.set_selections_by_feature('moments', [0] * 9)
+      classifier.set_selections_by_feature('skeleton_features', [0] * 6)
+      classifier.set_weights_by_feature('area', [0.0])
+      ccs = image.cc_analysis()
+      for cc in ccs:
+         cc.generate_features(classifier.feature_functions)
+      expected = [classifier.guess_glyph_automatic(cc) for cc in ccs]
+
+      # only the used features are computed
+      ccs = image.cc_analysis()
+      assert [classifier.guess_glyph_automatic(cc) for cc in ccs] == expected
+      assert ccs[0].feature_functions[2] == \
+          frozenset(['aspect_ratio', 'black_area', 'nholes_extended',
+                     'volume64regions'])
+      if not classifier.is_interactive():
+         ccs = image.cc_analysis()
+         assert classifier.classify_list_batch(ccs, num_threads=2) == expected
+         assert len(ccs[0].feature_functions) == 3
+      else:
+         # the database gets all of the features
+         classifier.classify_glyph_manual(ccs[0], 'latin.lower.letter.h')
+         assert ccs[0].feature_functions == classifier.feature_functions
+
+def test_noninteractive_classifier_single_precision():
+   image = load_image("data/testline.png")
+   ccs = image.cc_analysis()
+
+   database = gamera_xml.glyphs_from_xml("data/testline.xml")
+   double = knn.kNNNonInteractive(database,features=featureset,num_k=3,
+                                  normalize=True)
+   expected = [double.guess_glyph_automatic(cc)[0][0][1] for cc in ccs]
+   expected_rate = double.leave_one_out()
+   single = knn.kNNNonInteractive(database,features=featureset,num_k=3,
+                                  normalize=True,single_precision=True)
+   assert single.single_precision and not double.single_precision
+
+   def check(classifier):
+      answers = [classifier.guess_glyph_automatic(cc)[0][0][1] for cc in ccs]
+      assert answers == expected
+      # the glyph features are generated in single precision as well
+      assert ccs[0].features.typecode == 'f'
+      batch = classifier.classify_list_batch(ccs)
+      assert [answer[0][0][1] for answer in batch] == expected
+      assert classifier.leave_one_out() == expected_rate
+
+   check(single)
+   for distance_type in [knn.EUCLIDEAN, knn.FAST_EUCLIDEAN]:
+      double.distance_type = distance_type
+      single.distance_type = distance_type
+      for cc in ccs:
+         double.generate_features(cc)
+         a = double.guess_glyph_automatic(cc)
+         b = single.guess_glyph_automatic(cc)
+         assert a[0][0][1] == b[0][0][1]
+         assert abs(a[0][0][0] - b[0][0][0]) < 1e-4
+   single.distance_type = knn.CITY_BLOCK
+
+   # files are written in the precision of the classifier
+   single.serialize("tmp/serialized_single.knn")
+   for use_mmap in (True, False):
+      loaded = knn.kNNNonInteractive("tmp/serialized_single.knn")
+      assert not loaded.single_precision
+      loaded.single_precision = True
+      check(loaded)
+      loaded.unserialize("tmp/serialized_single.knn", use_mmap)
+      check(loaded)
+   double.serialize("tmp/serialized_double.knn")
+   loaded.unserialize("tmp/serialized_double.knn")
+   check(loaded)
+
+   # switching the precision of a trained classifier
+   double.distance_type = knn.CITY_BLOCK
+   double.single_precision = True
+   check(double)
+   double.single_precision = False
+   for cc in ccs:
+      double.generate_features(cc)
+   assert ccs[0].features.typecode == 'd'
+   assert [double.guess_glyph_automatic(cc)[0][0][1] for cc in ccs] == expected
+
+def test_generate_features_single_precision():
+   image = load_image("data/testline.png")
+   ccs = image.cc_analysis()
+   glyph = ccs[0]
+   functions = ImageBase.get_feature_functions(featureset)
+   glyph.generate_features(functions)
+   features = list(glyph.features)
+   glyph.generate_features(functions, single_precision=True)
+   assert glyph.features.typecode == 'f'
+   assert len(glyph.features) == len(features)
+   for a, b in zip(glyph.features, features):
+      assert abs(a - b) <= 1e-6 * max(1.0, abs(b))
+   glyph.generate_features(functions, force=True, single_precision=True)
+   assert glyph.features.typecode == 'f'
+   # plugins cannot write into single precision features
+   assert glyph.black_area()[0] == features[2]
+   try:
+      glyph.black_area(0)
+   except ValueError:
+      pass
+   else:
+      assert False
+   # the single precision features are computed again, not converted
+   glyph.generate_features(functions)
+   assert glyph.features.typecode == 'd'
+   assert list(glyph.features) == features
+
+def test_distances():
+   from gamera import graph
+   glyphs = gamera_xml.glyphs_from_xml("data/testline.xml")
+   n = len(glyphs)
+   classifier = knn.kNNInteractive([],features=featureset)
+   matrix = classifier.distance_matrix(glyphs, False)
+   assert matrix.nrows == n and matrix.ncols == n
+   for i, j in [(0, 1), (5, 3), (1, n - 1), (n - 2, n - 1)]:
+      distance = classifier.distance_between_images(glyphs[i], glyphs[j])
+      assert abs(matrix.get((j, i)) - distance) < 1e-9
+      assert abs(matrix.get((i, j)) - distance) < 1e-9
+
+   for normalize in [True, False]:
+      matrix = classifier.distance_matrix(glyphs, normalize)
+      parallel = classifier.distance_matrix(glyphs, normalize, 4)
+      assert [parallel.get((x, y)) for x in range(n) for y in range(n)] == \
+             [matrix.get((x, y)) for x in range(n) for y in range(n)]
+      unique = classifier.unique_distances(glyphs, normalize, 4)
+      condensed = classifier.condensed_distances(glyphs, normalize)
+      assert condensed.typecode == 'f'
+      assert len(condensed) == unique.ncols == n * (n - 1) / 2
+      assert condensed == classifier.condensed_distances(glyphs, normalize, 4)
+      index = 0
+      for i in range(n):
+         assert matrix.get((i, i)) == 0.0
+         for j in range(i + 1, n):
+            assert unique.get((index, 0)) == matrix.get((j, i))
+            assert abs(condensed[index] - matrix.get((j, i))) <= 1e-6 * matrix.get((j, i))
+            index += 1
+
+   # the minimum spanning tree from both representations
+   full = graph.Undirected()
+   full.create_minimum_spanning_tree(glyphs, matrix)
+   tree = graph.Undirected()
+   tree.create_minimum_spanning_tree(glyphs, condensed)
+   assert tree.nedges == full.nedges == n - 1
+   assert tree.nsubgraphs == full.nsubgraphs == 1
+   costs = [edge.cost for edge in tree.get_edges()]
+   assert costs == sorted(costs)
+   assert abs(sum(costs) - sum([edge.cost for edge in full.get_edges()])) < 1e-4
+   try:
+      tree.create_minimum_spanning_tree(glyphs[1:], condensed)
+   except ValueError:
+      pass
+   else:
+      assert False
+
+def test_evaluation_session():
+   database = gamera_xml.glyphs_from_xml("data/testline.xml")
+   classifier = knn.kNNNonInteractive(database,features=featureset,num_k=1)
+   session = classifier.evaluation_session(7, num_threads=2)
+   assert session.k_max == 7
+   for k in range(1, 8):
+      classifier.num_k = k
+      assert session.leave_one_out(k) == classifier.leave_one_out()
+      assert session.leave_one_out() == classifier.leave_one_out()
+      assert session.evaluate(k) == classifier.evaluate()
+   try:
+      session.leave_one_out(8)
+   except ValueError:
+      pass
+   else:
+      assert False
+
+   classifier = knn.kNNInteractive(database,features=featureset,num_k=3)
+   session = classifier.evaluation_session()
+   assert session.k_max == 3
+   assert session.evaluate() == classifier.evaluate()
+
+def test_editing():
+   from gamera import knn_editing
+   database = gamera_xml.glyphs_from_xml("data/testline.xml")
+   classifier = knn.kNNInteractive(database,features=featureset,num_k=3)
+
+   edited = knn_editing.edit_mnn(classifier, 0, False)
+   glyphs = classifier.get_glyphs()
+   kept = edited.get_glyphs()
+   assert edited.num_k == 3
+   assert 0 < len(kept) < len(glyphs)
+   for glyph in glyphs:
+      others = [x for x in glyphs if x is not glyph]
+      answer = classifier.classify_with_images(others, glyph)[0][0][1]
+      assert (glyph in kept) == (answer == glyph.get_main_id())
+   protected = knn_editing.edit_mnn(classifier, 0, True, 3)
+   assert len(protected.get_glyphs()) > len(kept)
+
+   for randomize in [False, True]:
+      condensed = knn_editing.edit_cnn(classifier, 1, randomize)
+      store = list(condensed.get_glyphs())
+      assert condensed.num_k == 1
+      assert 0 < len(store) < len(glyphs)
+      for glyph in glyphs:
+         if glyph not in condensed.get_glyphs():
+            answer = condensed.classify_with_images(store, glyph)[0][0][1]
+            assert answer == glyph.get_main_id()
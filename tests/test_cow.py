@@ -0,0 +1,68 @@
+from gamera.core import *
+init_gamera()
+
+def test_shared_copy():
+   image = load_image("data/testline.png")
+   copy = image.image_copy()
+   assert image.data.shared and copy.data.shared
+   assert copy._to_raw_string() == image._to_raw_string()
+   # reading does not copy the pixels
+   copy.dilate()
+   assert copy.data.shared
+
+   pixel = image.get((0, 0))
+   copy.set((0, 0), 1 - pixel)
+   assert not image.data.shared and not copy.data.shared
+   assert image.get((0, 0)) == pixel
+   assert copy.get((0, 0)) == 1 - pixel
+
+def test_shared_copy_written_by_original():
+   image = Image((5, 5), Dim(20, 10), GREYSCALE)
+   copies = [image.image_copy() for i in range(3)]
+   sub = image.subimage((10, 10), Dim(5, 5))
+   sub.fill(7)
+   assert image.get((5, 5)) == 7
+   for copy in copies:
+      assert copy.data.shared
+      assert copy.get((5, 5)) == 255
+      assert copy.ul == image.ul
+   del copies[0]
+   copies[0].invert()
+   assert copies[0].get((0, 0)) == 0
+   assert copies[1].get((0, 0)) == 255
+   assert not copies[1].data.shared
+
+def test_unshared_copies():
+   image = load_image("data/testline.png")
+   # subimages and connected components get pixels of their own
+   assert not image.subimage((1, 1), Dim(5, 5)).image_copy().data.shared
+   ccs = image.cc_analysis()
+   assert not ccs[0].image_copy().data.shared
+   assert not image.image_copy(RLE).data.shared
+
+   # pixels handed to NumPy are not shared any more
+   try:
+      import numpy
+   except ImportError:
+      return
+   image = Image((0, 0), Dim(10, 10), GREYSCALE)
+   copy = image.image_copy()
+   array = image.to_numpy(copy=False)
+   assert not copy.data.shared
+   assert not image.image_copy().data.shared
+   array[0, 0] = 3
+   assert image.get((0, 0)) == 3
+   assert copy.get((0, 0)) == 255
+
+def test_reads_keep_copies_shared():
+   from gamera.plugins.features import generate_features_list
+   image = load_image("data/testline.png")
+   ccs = image.cc_analysis()
+   copy = image.image_copy()
+   assert image.data.shared
+   # reading the pixels never detaches them, also not in the feature
+   # threads, which run without the interpreter lock
+   ccs[0].moments()
+   copy.moments()
+   generate_features_list(ccs, 'all', 4)
+   assert image.data.shared and copy.data.shared
@@ -503,3 +503,435 @@ def test_zernike_moments():
     assert abs(ZM_f[11] - ZM_f0[11]) <= 0.1
     assert abs(ZM_f[12] - ZM_f0[12]) <= 0.1
     assert abs(ZM_f[13] - ZM_f0[13]) <= 0.1
+
+# direct evaluation of the Zernike polynomials at each pixel, as a reference
+# for the table-driven implementation
+def _zernike_reference(pixels, order, absolute, circle=None):
+    import math, cmath
+    fak = [1.0]
+    for i in range(1, order + 1):
+        fak.append(fak[-1] * i)
+    m00 = float(sum([w for x, y, w in pixels]))
+    cx = sum([x * w for x, y, w in pixels]) / m00
+    cy = sum([y * w for x, y, w in pixels]) / m00
+    if circle is None:
+        circle = [(x, y) for x, y, w in pixels if w]
+    scale = 1.01 * max([math.hypot(x - cx, y - cy) for x, y in circle])
+    result = []
+    for n in range(2, order + 1):
+        for m in range(n % 2, n + 1, 2):
+            total = 0.0
+            for x, y, w in pixels:
+                dx = (x - cx) / scale
+                dy = (y - cy) / scale
+                if not w or (abs(dx) <= 0.00001 and abs(dy) <= 0.00001):
+                    continue
+                rho = math.hypot(dx, dy)
+                r = sum([(-1) ** s * fak[n - s] /
+                         (fak[s] * fak[(n + m) / 2 - s] * fak[(n - m) / 2 - s]) *
+                         rho ** (n - 2 * s) for s in range((n - m) / 2 + 1)])
+                v = r * cmath.exp(-1j * m * math.atan2(dy, dx)) * w
+                if absolute:
+                    v = abs(v)
+                total += v
+            result.append(abs(total) * (n + 1) / math.pi / m00)
+    return result
+
+def test_zernike_moments_reference():
+    img = load_image("data/testline.png")
+    for cc in img.cc_analysis()[:10] + [img]:
+        pixels = [(x, y, int(cc.get((x, y)) != 0)) for y in range(cc.nrows)
+                  for x in range(cc.ncols)]
+        expected = _zernike_reference(pixels, 6, False)
+        for a, b in zip(cc.zernike_moments(), expected):
+            assert abs(a - b) <= 1e-10
+    # a centroid on a black pixel, which is left out
+    img = Image((0,0), (4,4), ONEBIT)
+    img.draw_filled_rect((0,0), (4,4), 1)
+    img.set((4,4), 0)
+    img.set((0,0), 0)
+    pixels = [(x, y, img.get((x, y))) for y in range(5) for x in range(5)]
+    for a, b in zip(img.zernike_moments(), _zernike_reference(pixels, 6, False)):
+        assert abs(a - b) <= 1e-10
+
+    img = load_image("data/GreyScale_generic.png")
+    img = img.subimage((10, 10), Dim(20, 15))
+    pixels = [(x, y, 255 - img.get((x, y))) for y in range(img.nrows)
+              for x in range(img.ncols)]
+    # the circle of zernike_moments_plugin includes the whole image, and
+    # the absolute values are summed up for each pixel
+    moments = img.zernike_moments_plugin(9)
+    assert len(moments) == 28
+    corners = [(0, 0), (0, img.nrows), (img.ncols, img.nrows), (img.ncols, 0)]
+    expected = _zernike_reference(pixels, 9, True, corners)
+    for a, b in zip(moments, expected):
+        assert abs(a - b) <= 1e-10
+
+# generate_features computes the built-in features in a single pass, which
+# must give exactly the same results as the feature functions themselves
+def _run_features_reference(image):
+    # pixel by pixel versions of the features computed from runs
+    import math
+    nrows, ncols = image.nrows, image.ncols
+    pixels = [[int(image.get((x, y)) != 0) for x in range(ncols)]
+              for y in range(nrows)]
+    cols = [[row[x] for row in pixels] for x in range(ncols)]
+
+    def nholes_1d(lines):
+        count = 0
+        for line in lines:
+            last = has_black = False
+            for p in line:
+                if p:
+                    last = has_black = True
+                elif last:
+                    last = False
+                    count += 1
+            if not last and count and has_black:
+                count -= 1
+        return count
+
+    def raw(p, q):
+        return float(sum(x ** p * y ** q for y in range(nrows)
+                         for x in range(ncols) if pixels[y][x]))
+
+    black = sum(map(sum, pixels))
+    m00 = float(black) or 1.0
+    x = raw(1, 0) / m00
+    y = raw(0, 1) / m00
+    x2, y2 = 2 * x * x, 2 * y * y
+    div = m00 * m00
+    moments = [x / (ncols - 1) if ncols > 1 else 0.5,
+               y / (nrows - 1) if nrows > 1 else 0.5,
+               (raw(2, 0) - x * raw(1, 0)) / div,
+               (raw(0, 2) - y * raw(0, 1)) / div,
+               (raw(1, 1) - y * raw(1, 0)) / div]
+    div *= math.sqrt(m00)
+    moments += [(raw(3, 0) - 3 * x * raw(2, 0) + x2 * raw(1, 0)) / div,
+                (raw(1, 2) - 2 * y * raw(1, 1) - x * raw(0, 2)
+                 + y2 * raw(1, 0)) / div,
+                (raw(2, 1) - 2 * x * raw(1, 1) - y * raw(2, 0)
+                 + x2 * raw(0, 1)) / div,
+                (raw(0, 3) - 3 * y * raw(0, 2) + y2 * raw(0, 1)) / div]
+
+    nholes_extended = []
+    for lines, n in ((cols, ncols), (pixels, nrows)):
+        start = 0.0
+        for i in range(4):
+            nholes_extended.append(
+                nholes_1d(lines[int(start):int(start) + int(n / 4.0)])
+                / (n / 4.0))
+            start += n / 4.0
+
+    rows_with_black = [y for y in range(nrows) if any(pixels[y])]
+    if rows_with_black:
+        bottom = [y for y in rows_with_black if y > 0]
+        top_bottom = [rows_with_black[0] / float(nrows),
+                      (bottom[-1] if bottom else -1) / float(nrows)]
+    else:
+        top_bottom = [1.0, 0.0]
+
+    def volume_regions(n):
+        volumes = []
+        rows, cols = nrows / float(n), ncols / float(n)
+        width, height = max(int(cols), 1), max(int(rows), 1)
+        start_col = float(image.offset_x)
+        for i in range(n):
+            start_row = float(image.offset_y)
+            for j in range(n):
+                x0 = int(start_col) - image.offset_x
+                y0 = int(start_row) - image.offset_y
+                count = sum(sum(row[x0:x0 + width])
+                            for row in pixels[y0:y0 + height])
+                volumes.append(float(count) / (width * height))
+                start_row += rows
+                height = max(int(start_row + rows) - int(start_row), 1)
+            start_col += cols
+            width = max(int(start_col + cols) - int(start_col), 1)
+        return volumes
+
+    return {'black_area': [float(black)],
+            'volume': [float(black) / (nrows * ncols)],
+            'moments': moments,
+            'nholes': [float(nholes_1d(cols)) / ncols,
+                       float(nholes_1d(pixels)) / nrows],
+            'nholes_extended': nholes_extended,
+            'top_bottom': top_bottom,
+            'volume16regions': volume_regions(4),
+            'volume64regions': volume_regions(8)}
+
+def test_run_based_features():
+    # the features computed from the black runs are exactly the same as
+    # when the pixels are counted one by one, also for RLE images with
+    # runs that continue over the chunks of the run length data
+    import random
+    random.seed(16)
+    dense = Image((0, 0), (599, 29), ONEBIT)
+    rle = Image((0, 0), (599, 29), ONEBIT, RLE)
+    for y in range(dense.nrows):
+        x = random.randint(0, 20)
+        while x < dense.ncols:
+            length = random.choice([1, 2, 5, 40, 300])
+            for i in range(x, min(x + length, dense.ncols)):
+                dense.set((i, y), 1)
+                rle.set((i, y), 1)
+            x += length + random.randint(1, 30)
+    images = [dense, rle,
+              SubImage(dense, (250, 3), (520, 20)),
+              SubImage(rle, (250, 3), (520, 20)),
+              SubImage(rle, (0, 0), (0, 0)),
+              Image((0, 0), (300, 2), ONEBIT, RLE)]
+    for image in (dense, rle):
+        # the other labels within the bounding box must be ignored
+        images.extend(sorted(image.cc_analysis(),
+                             key=lambda cc: -cc.nrows * cc.ncols)[:5])
+
+    features = ImageBase.get_feature_functions(
+        ['black_area', 'volume', 'moments', 'nholes', 'nholes_extended',
+         'top_bottom', 'volume16regions', 'volume64regions'])
+    for image in images:
+        expected = _run_features_reference(image)
+        for name, function in features[0]:
+            assert list(getattr(image, name)()) == expected[name], name
+        image.generate_features(features, force=True)
+        assert list(image.features) == \
+            sum([expected[name] for name, function in features[0]], [])
+
+def test_generate_features_fused():
+    import array
+    from gamera.plugins.features import _fused_features
+    functions = ImageBase.get_feature_functions('all')
+    fused = ImageBase.get_feature_functions(
+        [f.__name__ for f in _fused_features])
+
+    images = []
+    img = load_image("data/testline.png")
+    images.extend(img.cc_analysis())
+    images.append(img)
+    images.append(SubImage(img, (30, 5), (80, 20)))
+    images.append(Image((0,0), (0,0), ONEBIT))
+    images.append(Image((0,0), (7,7), ONEBIT))
+    img = Image((0,0), (7,7), ONEBIT)
+    img.draw_filled_rect((0,0),(7,7),1)
+    images.append(img)
+    img = Image((0,0), (7,0), ONEBIT)
+    img.set((3,0),1)
+    images.append(img)
+    img = Image((0,0), (50,50), ONEBIT)
+    img.draw_line((5,5),(5,35),3)
+    img.draw_line((3,35),(20,35),1)
+    images.append(img)
+
+    def check(image, features):
+        image.generate_features(features, force=True)
+        expected = array.array('d')
+        for name, function in features[0]:
+            expected.extend(function.__call__(image))
+        assert list(image.features) == list(expected)
+
+    for image in images:
+        check(image, functions)
+        check(image, fused)
+    # RLE images give the same features as dense ones
+    rle = load_image("data/testline.png", RLE)
+    dense = load_image("data/testline.png")
+    for a, b in zip([rle] + rle.cc_analysis()[:5],
+                    [dense] + dense.cc_analysis()[:5]):
+        a.generate_features(fused)
+        b.generate_features(fused)
+        assert list(a.features) == list(b.features)
+
+    # any subset works as well
+    image = images[0]
+    image.generate_features(ImageBase.get_feature_functions(
+        ['volume64regions', 'moments']), force=True)
+    assert list(image.features) == \
+        list(image.moments()) + list(image.volume64regions())
+
+def test_generate_features_list():
+    import array
+    from gamera.plugins.features import generate_features_list
+    img = load_image("data/testline.png")
+    functions = ImageBase.get_feature_functions('all')
+    expected = []
+    for cc in img.cc_analysis():
+        cc.generate_features(functions)
+        expected.append(list(cc.features))
+    for num_threads in (1, 4):
+        glyphs = img.cc_analysis()
+        # an image twice and one that already has its features
+        glyphs.append(glyphs[0])
+        glyphs[1].generate_features(functions, single_precision=True)
+        generate_features_list(glyphs, 'all', num_threads)
+        for glyph, features in zip(glyphs, expected + expected[:1]):
+            assert glyph.features.typecode == 'd'
+            # also those of the image that had single precision features
+            assert list(glyph.features) == features
+        generate_features_list(glyphs, 'all', num_threads, True)
+        for glyph, features in zip(glyphs, expected):
+            assert glyph.features.typecode == 'f'
+            assert list(glyph.features) == list(array.array('f', features))
+    py.test.raises(RuntimeError, generate_features_list,
+                   img.cc_analysis(), 'all', 0)
+
+def test_feature_matrix():
+    import array
+    from gamera import export
+    from gamera.plugins.features import feature_matrix
+    img = load_image("data/testline.png")
+    functions = ImageBase.get_feature_functions('all')
+    expected = []
+    for cc in img.cc_analysis():
+        cc.generate_features(functions)
+        expected.append(list(cc.features))
+
+    glyphs = img.cc_analysis()
+    # an image twice, one that already has its features in single
+    # precision and a classified one
+    glyphs.append(glyphs[0])
+    rows = expected + expected[:1]
+    glyphs[1].generate_features(functions, single_precision=True)
+    glyphs[2].classify_manual('lower.a')
+    matrix, ids = feature_matrix(glyphs, 'all')
+    assert matrix.shape == (len(glyphs), functions[1])
+    assert matrix.dtype.char == 'd' and matrix.flags.c_contiguous
+    assert [list(row) for row in matrix] == rows
+    assert ids[2] == 'lower.a' and ids[0] == 'UNCLASSIFIED'
+    assert len(ids) == len(glyphs)
+
+    # the features of the images are views of the rows
+    for i, glyph in enumerate(glyphs[1:], 1):
+        assert list(glyph.features) == rows[i]
+        matrix[i, 0] = -1.0
+        assert glyph.features[0] == -1.0
+    # regenerating the features updates the row, and they can be used
+    # like any other features
+    glyphs[2].generate_features(functions, force=True)
+    assert list(matrix[2]) == expected[2]
+    export.glyphs_comma_delim(glyphs[2:3], "tmp/features.csv")
+    line = open("tmp/features.csv").read()
+    assert line == ",".join(["lower.a"] + [str(f) for f in expected[2]]) + "\n"
+
+    # without sharing the images keep their own features
+    glyphs = img.cc_analysis()
+    copy, ids = feature_matrix(glyphs, functions, share=False)
+    assert [list(row) for row in copy] == expected
+    for glyph in glyphs:
+        assert glyph.features.typecode == 'd'
+    copy[0, 0] = -1.0
+    assert glyphs[0].features[0] != -1.0
+
+def test_feature_cache():
+    import array, os
+    from gamera import feature_cache
+    from gamera.plugins.features import generate_features_list
+    filename = "tmp/features.db"
+    if os.path.exists(filename):
+        os.remove(filename)
+    functions = ImageBase.get_feature_functions('all')
+    img = load_image("data/testline.png")
+    expected = []
+    for cc in img.cc_analysis():
+        cc.generate_features(functions)
+        expected.append(list(cc.features))
+
+    cache = feature_cache.FeatureCache(filename)
+    feature_cache.set_feature_cache(cache)
+    try:
+        ccs = img.cc_analysis()
+        for cc in ccs:
+            cc.generate_features(functions)
+        assert cache.hits + cache.misses == len(ccs)
+        assert cache.misses == len(cache)
+        assert cache.size() == len(cache) * functions[1] * 8
+        cache.close()
+
+        # the entries are kept in the file
+        cache = feature_cache.FeatureCache(filename)
+        feature_cache.set_feature_cache(cache)
+        ccs = img.cc_analysis()
+        for cc, features in zip(ccs, expected):
+            cc.generate_features(functions)
+            assert list(cc.features) == features
+        assert cache.hits == len(ccs) and cache.misses == 0
+        ccs[0].generate_features(functions, force=True)
+        assert cache.hits == len(ccs)
+
+        ccs = img.cc_analysis()
+        generate_features_list(ccs, functions, 1, True)
+        assert cache.hits == 2 * len(ccs)
+        for cc, features in zip(ccs, expected):
+            assert cc.features.typecode == 'f'
+            assert list(cc.features) == list(array.array('f', features))
+
+        # other feature functions do not find these features
+        subset = ImageBase.get_feature_functions(['area', 'moments'])
+        ccs[0].generate_features(subset)
+        assert cache.misses == 1
+        assert list(ccs[0].features) == list(ccs[0].area()) + list(ccs[0].moments())
+
+        cache.clear()
+        assert len(cache) == 0 and cache.size() == 0 and cache.hits == 0
+
+        # the least recently used entries are removed
+        cache.max_size = functions[1] * 8 * 10
+        ccs = img.cc_analysis()
+        generate_features_list(ccs, functions)
+        assert cache.size() <= cache.max_size
+        assert 0 < len(cache) <= 10
+        ccs = img.cc_analysis()
+        ccs[-1].generate_features(functions)
+        assert cache.hits == 1
+        ccs[0].generate_features(functions)
+        assert cache.hits == 1
+    finally:
+        feature_cache.set_feature_cache(None)
+        cache.close()
+
+def test_generate_selected_features():
+    import array
+    from gamera.plugins.features import generate_selected_features, \
+         generate_features_list
+    functions = ImageBase.get_feature_functions('all')
+    img = load_image("data/testline.png")
+    ccs = img.cc_analysis()
+    expected = []
+    for cc in ccs:
+        cc.generate_features(functions)
+        expected.append(list(cc.features))
+    selected = ['moments', 'nholes', 'volume64regions', 'zernike_moments']
+    mask = []
+    for name, function in functions[0]:
+        mask.extend([name in selected] * function.return_type.length)
+
+    def check(glyph, features):
+        assert len(glyph.features) == functions[1]
+        for value, expected_value, used in zip(glyph.features, features, mask):
+            if used:
+                assert value == expected_value
+            else:
+                assert value == 0.0
+
+    ccs = img.cc_analysis()
+    for cc, features in zip(ccs, expected):
+        generate_selected_features(cc, functions, selected)
+        check(cc, features)
+        assert cc.feature_functions[2] == frozenset(selected)
+    # a subset of the computed ones is not computed again
+    ccs[0].features[mask.index(True)] = -1.0
+    generate_selected_features(ccs[0], functions, selected[1:])
+    assert ccs[0].features[mask.index(True)] == -1.0
+    # but generate_features computes all of them
+    ccs[0].generate_features(functions)
+    assert list(ccs[0].features) == expected[0]
+    # selecting all is the same as generate_features
+    generate_selected_features(ccs[1], functions,
+                               [name for name, function in functions[0]])
+    assert ccs[1].feature_functions == functions
+    assert list(ccs[1].features) == expected[1]
+
+    ccs = img.cc_analysis()
+    generate_features_list(ccs, functions, 2, True, selected)
+    for cc, features in zip(ccs, expected):
+        assert cc.features.typecode == 'f'
+        check(cc, list(array.array('f', features)))
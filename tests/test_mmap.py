@@ -0,0 +1,94 @@
+import os, tempfile
+import py.test
+
+from gamera.core import *
+init_gamera()
+
+def _temp_path():
+   fd, path = tempfile.mkstemp(suffix=".raw")
+   os.close(fd)
+   return path
+
+def test_from_mmap():
+   path = _temp_path()
+   try:
+      raw = "".join([chr(i % 256) for i in range(60 * 40)])
+      open(path, "wb").write(raw)
+      image = Image.from_mmap(path, Dim(60, 40), GREYSCALE)
+      assert image.data.mapped
+      assert image.pixel_type_name == "GreyScale"
+      assert image.storage_format_name == "Dense"
+      assert image.dim == Dim(60, 40)
+      assert image.get((5, 2)) == (2 * 60 + 5) % 256
+      assert image._to_raw_string() == raw
+
+      # plugins work the same as on memory images
+      copy = image.image_copy()
+      assert not copy.data.mapped
+      assert copy.to_onebit().to_rle() == image.to_onebit().to_rle()
+
+      # changes go to the file
+      image.set((1, 0), 200)
+      image.subimage((10, 10), Dim(5, 5)).fill(7)
+      del image, copy
+      raw = open(path, "rb").read()
+      assert len(raw) == 60 * 40
+      assert ord(raw[1]) == 200
+      assert ord(raw[12 * 60 + 14]) == 7
+
+      # making the data smaller does not cut off the file
+      image = Image.from_mmap(path, Dim(60, 40), GREYSCALE)
+      image.data.nrows = 10
+      assert image.data.nrows == 10
+      del image
+      assert os.path.getsize(path) == 60 * 40
+      assert ord(open(path, "rb").read()[12 * 60 + 14]) == 7
+   finally:
+      os.remove(path)
+
+def test_from_mmap_new_file():
+   path = _temp_path()
+   os.remove(path)
+   try:
+      image = Image.from_mmap(path, Dim(30, 20), RGB)
+      assert os.path.getsize(path) == 30 * 20 * 3
+      # a new file is filled with zeros
+      assert image.get((29, 19)) == RGBPixel(0, 0, 0)
+      image.set((29, 19), RGBPixel(1, 2, 3))
+      del image
+      image = Image.from_mmap(path, Dim(30, 20), RGB)
+      assert image.get((29, 19)) == RGBPixel(1, 2, 3)
+   finally:
+      os.remove(path)
+
+   def _fail_path():
+      Image.from_mmap(os.path.join(path, "missing", "image.raw"), Dim(10, 10))
+   py.test.raises(RuntimeError, _fail_path)
+   def _fail_dim():
+      Image.from_mmap(path, (10, 10))
+   py.test.raises(TypeError, _fail_dim)
+
+def test_mmap_threshold():
+   image = load_image("data/testline.png")
+   previous = os.environ.get("GAMERA_MMAP_THRESHOLD")
+   os.environ["GAMERA_MMAP_THRESHOLD"] = "0.01"
+   try:
+      small = Image((0, 0), Dim(50, 50), GREYSCALE)
+      assert not small.data.mapped
+      large = Image((0, 0), Dim(200, 100), GREYSCALE)
+      assert large.data.mapped
+      assert large.get((199, 99)) == 255
+      mapped = image.image_copy()
+      assert mapped.data.mapped
+      dilated = mapped.dilate()
+      assert dilated.data.mapped
+   finally:
+      if previous is None:
+         del os.environ["GAMERA_MMAP_THRESHOLD"]
+      else:
+         os.environ["GAMERA_MMAP_THRESHOLD"] = previous
+   assert not image.image_copy().data.mapped
+   assert mapped._to_raw_string() == image._to_raw_string()
+   assert dilated._to_raw_string() == image.dilate()._to_raw_string()
+   ccs = mapped.cc_analysis()
+   assert len(ccs) == len(image.cc_analysis())
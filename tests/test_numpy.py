@@ -0,0 +1,106 @@
+import py.test
+
+from gamera.core import *
+init_gamera()
+
+numpy = py.test.importorskip("numpy")
+from gamera.plugins import numpy_io
+
+def test_to_numpy():
+   image = load_image("data/testline.png")
+   for conversion, pixel_type, dtype in [
+      ("image_copy", ONEBIT, "uint16"), ("to_greyscale", GREYSCALE, "uint8"),
+      ("to_grey16", GREY16, "uint32"), ("to_float", FLOAT, "float64"),
+      ("to_rgb", RGB, "uint8"), ("to_complex", COMPLEX, "complex128")]:
+      converted = getattr(image, conversion)()
+      for copy in (True, False):
+         array = converted.to_numpy(copy=copy)
+         assert array.dtype == numpy.dtype(dtype)
+         if pixel_type == RGB:
+            assert array.shape == (44, 907, 3)
+         else:
+            assert array.shape == (44, 907)
+         assert array.tostring() == converted._to_raw_string()
+         # round trip
+         assert numpy_io.from_numpy(array, copy=copy)._to_raw_string() == \
+                converted._to_raw_string()
+
+def test_to_numpy_shared():
+   image = Image((0, 0), Dim(20, 10), GREYSCALE)
+   array = image.to_numpy(copy=False)
+   array[2, 5] = 7
+   assert image.get((5, 2)) == 7
+   image.set((6, 3), 9)
+   assert array[3, 6] == 9
+   assert image.to_numpy()[3, 6] == 9
+   copy = image.to_numpy()
+   copy[0, 0] = 1
+   assert image.get((0, 0)) == 255
+
+   # the array keeps the image data alive
+   del image
+   assert array[3, 6] == 9
+   array[9, 19] = 3
+   assert array.sum() == 255 * 197 + 7 + 9 + 3
+
+def test_to_numpy_subimage():
+   image = load_image("data/testline.png")
+   sub = image.subimage((100, 10), Dim(30, 20))
+   array = sub.to_numpy(copy=False)
+   assert array.shape == (20, 30)
+   assert array.strides == (907 * 2, 2)
+   assert array.tostring() == sub._to_raw_string()
+   array[0, 0] = 1
+   assert image.get((100, 10)) == 1
+
+   # connected components and other storage formats are only copied
+   cc = image.cc_analysis()[0]
+   assert cc.to_numpy().tostring() == cc._to_raw_string()
+   py.test.raises(ValueError, cc.to_numpy, copy=False)
+   rle = image.image_copy(RLE)
+   assert (rle.to_numpy() == image.to_numpy()).all()
+   py.test.raises(ValueError, rle.to_numpy, copy=False)
+
+def test_to_numpy_shared_resize():
+   image = Image((0, 0), Dim(20, 10), GREYSCALE)
+   array = image.to_numpy(copy=False)
+   # resizing the data would free the pixels under the array
+   py.test.raises(BufferError, setattr, image.data, "nrows", 1)
+   py.test.raises(BufferError, setattr, image.data, "ncols", 1)
+   py.test.raises(BufferError, image.data.dimensions, Dim(1, 1))
+   assert image.data.nrows == 10
+   assert array.sum() == 255 * 200
+
+   del array
+   image.data.nrows = 1
+   assert image.data.nrows == 1
+
+def test_from_numpy_shared():
+   array = numpy.zeros((10, 20), "uint8")
+   image = numpy_io.from_numpy(array, (3, 4), copy=False)
+   assert image.pixel_type_name == "GreyScale"
+   assert image.ul == Point(3, 4)
+   assert image.dim == Dim(20, 10)
+   image.set((5, 2), 200)
+   assert array[2, 5] == 200
+   array[3, 6] = 100
+   assert image.get((6, 3)) == 100
+   image.fill(1)
+   assert array.sum() == 200
+
+   copied = numpy_io.from_numpy(array)
+   copied.fill(2)
+   assert array.sum() == 200
+
+   # the image keeps the array alive
+   del array
+   assert image.get((6, 3)) == 1
+   assert image.to_numpy().sum() == 200
+
+   # only C-contiguous writable arrays can be shared
+   array = numpy.zeros((20, 10), "uint8")
+   py.test.raises(Exception, numpy_io.from_numpy, array.T, copy=False)
+   assert numpy_io.from_numpy(array.T).dim == Dim(20, 10)
+   array.flags.writeable = False
+   py.test.raises(Exception, numpy_io.from_numpy, array, copy=False)
+   py.test.raises(ValueError, numpy_io.from_numpy, numpy.zeros((2, 2), "int8"))
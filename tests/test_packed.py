@@ -0,0 +1,97 @@
+import py.test
+
+from gamera.core import *
+init_gamera()
+
+def _dense(image):
+   return image.image_copy(DENSE)._to_raw_string()
+
+def test_packed_load():
+   image1 = load_image("data/testline.png")
+   image2 = load_image("data/testline.png", PACKED)
+
+   assert image2.pixel_type_name == "OneBit"
+   assert image2.storage_format_name == "Packed"
+   assert image2.nrows == 44
+   assert image2.ncols == 907
+   assert image2.data.bytes * 8 < image1.data.bytes
+
+   # Compare PACKED to DENSE image
+   assert _dense(image2) == image1._to_raw_string()
+   assert image1.image_copy(PACKED).image_copy(RLE).to_rle() == image1.to_rle()
+
+def test_packed_copy():
+   image = load_image("data/testline.png")
+   # odd offsets, so that the rows do not start at word boundaries
+   for ul, dim in [((0, 0), Dim(907, 44)), ((3, 5), Dim(130, 20)),
+                   ((66, 1), Dim(64, 43)), ((700, 10), Dim(1, 1))]:
+      sub = image.subimage(ul, dim)
+      packed = sub.image_copy(PACKED)
+      assert packed.ul == sub.ul
+      assert _dense(packed) == sub._to_raw_string()
+      packed_sub = image.image_copy(PACKED).subimage(ul, dim)
+      assert _dense(packed_sub) == sub._to_raw_string()
+
+   def _fail():
+      image.to_greyscale().image_copy(PACKED)
+   py.test.raises(RuntimeError, _fail)
+
+def test_packed_logical():
+   image = load_image("data/testline.png")
+   packed = image.image_copy(PACKED)
+   a = image.subimage((1, 0), Dim(300, 40))
+   b = image.subimage((250, 3), Dim(300, 40))
+   pa = packed.subimage((1, 0), Dim(300, 40))
+   pb = packed.subimage((250, 3), Dim(300, 40))
+   for name in ["and_image", "or_image", "xor_image"]:
+      expected = getattr(a, name)(b, False)._to_raw_string()
+      # both packed, and packed with dense
+      assert _dense(getattr(pa, name)(pb, False)) == expected
+      assert _dense(getattr(pa, name)(b, False)) == expected
+      assert getattr(a, name)(pb, False)._to_raw_string() == expected
+      in_place = pa.image_copy(PACKED)
+      getattr(in_place, name)(pb, True)
+      assert _dense(in_place) == expected
+
+def test_packed_projections():
+   image = load_image("data/testline.png")
+   packed = image.image_copy(PACKED)
+   assert packed.projection_rows() == image.projection_rows()
+   assert packed.projection_cols() == image.projection_cols()
+   sub = image.subimage((5, 2), Dim(200, 30))
+   packed_sub = packed.subimage((5, 2), Dim(200, 30))
+   assert packed_sub.projection_rows() == sub.projection_rows()
+   assert packed_sub.projection_cols() == sub.projection_cols()
+
+def test_packed_morphology():
+   image = load_image("data/testline.png").subimage((3, 1), Dim(250, 40))
+   packed = image.image_copy(PACKED)
+   assert _dense(packed.erode()) == image.erode()._to_raw_string()
+   assert _dense(packed.dilate()) == image.dilate()._to_raw_string()
+   for times in [1, 2, 3]:
+      for direction in [0, 1]:
+         for geo in [0, 1]:
+            assert _dense(packed.erode_dilate(times, direction, geo)) == \
+                image.erode_dilate(times, direction, geo)._to_raw_string()
+
+def test_packed_cc_analysis():
+   image = load_image("data/testline.png")
+   packed = image.image_copy(PACKED)
+   before = _dense(packed)
+   ccs1 = image.cc_analysis()
+   ccs2 = packed.cc_analysis()
+   assert [Rect(x) for x in ccs1] == [Rect(x) for x in ccs2]
+   assert [x.label for x in ccs1] == [x.label for x in ccs2]
+   assert [x._to_raw_string() for x in ccs1] == \
+       [x._to_raw_string() for x in ccs2]
+   # the packed image itself is not changed
+   assert _dense(packed) == before
+
+def test_packed_unsupported():
+   packed = load_image("data/testline.png", PACKED)
+   def _fail1():
+      packed.to_greyscale()
+   def _fail2():
+      Cc(packed, 1, (0, 0), Dim(3, 3))
+   py.test.raises(TypeError, _fail1)
+   py.test.raises(TypeError, _fail2)
@@ -0,0 +1,146 @@
+import os, struct, tempfile
+import py.test
+
+from gamera.core import *
+init_gamera()
+
+def _write_tiled_tiff(path, ncols, nrows, tile, pixel):
+   # an uncompressed GREYSCALE TIFF with tile x tile tiles
+   tiles = []
+   for ty in range(0, nrows, tile):
+      for tx in range(0, ncols, tile):
+         data = []
+         for y in range(ty, ty + tile):
+            for x in range(tx, tx + tile):
+               if x < ncols and y < nrows:
+                  data.append(chr(pixel(x, y)))
+               else:
+                  data.append(chr(0))
+         tiles.append("".join(data))
+   offsets = []
+   offset = 8
+   for data in tiles:
+      offsets.append(offset)
+      offset += len(data)
+   arrays_offset = offset
+   ifd_offset = arrays_offset + 8 * len(tiles)
+   entries = [(256, 4, 1, ncols), (257, 4, 1, nrows), (258, 3, 1, 8),
+              (259, 3, 1, 1), (262, 3, 1, 1), (277, 3, 1, 1),
+              (322, 4, 1, tile), (323, 4, 1, tile),
+              (324, 4, len(tiles), arrays_offset),
+              (325, 4, len(tiles), arrays_offset + 4 * len(tiles))]
+   out = open(path, "wb")
+   out.write(struct.pack("<2sHI", "II", 42, ifd_offset))
+   out.write("".join(tiles))
+   out.write(struct.pack("<%dI" % len(tiles), *offsets))
+   out.write(struct.pack("<%dI" % len(tiles), *[len(x) for x in tiles]))
+   out.write(struct.pack("<H", len(entries)))
+   for tag, type, count, value in entries:
+      if type == 3:
+         out.write(struct.pack("<HHIHH", tag, type, count, value, 0))
+      else:
+         out.write(struct.pack("<HHII", tag, type, count, value))
+   out.write(struct.pack("<I", 0))
+   out.close()
+
+def test_tiled_image():
+   image = Image((10, 20), Dim(600, 300), GREYSCALE, TILED)
+   assert image.storage_format_name == "Tiled"
+   assert image.data.tile_dim == Dim(256, 256)
+   # white tiles take no memory
+   assert image.memory_size == 0
+   assert image.get((599, 299)) == 255
+   image.set((300, 10), 7)
+   assert image.get((300, 10)) == 7
+   assert image.memory_size == 256 * 256
+   assert image.image_copy(DENSE).get((300, 10)) == 7
+
+   py.test.raises(TypeError, Image, (0, 0), Dim(10, 10), FLOAT, TILED)
+   dense = Image((0, 0), Dim(10, 10), FLOAT)
+   py.test.raises(RuntimeError, dense.image_copy, TILED)
+
+def test_tiled_image_copy():
+   image = load_image("data/testline.png")
+   for conversion in ("image_copy", "to_greyscale", "to_grey16", "to_rgb"):
+      converted = getattr(image, conversion)()
+      tiled = converted.image_copy(TILED)
+      assert tiled.storage_format_name == "Tiled"
+      assert tiled.pixel_type_name == converted.pixel_type_name
+      assert tiled.image_copy(DENSE)._to_raw_string() == converted._to_raw_string()
+      assert tiled.image_copy(TILED).image_copy(DENSE)._to_raw_string() == \
+             converted._to_raw_string()
+   # only the tiles with black pixels are kept
+   tiled = Image((0, 0), Dim(1000, 600), ONEBIT).image_copy(TILED)
+   assert tiled.memory_size == 0
+
+   # other plugins have to work on a DENSE copy
+   tiled = image.image_copy(TILED)
+   py.test.raises(TypeError, tiled.dilate)
+   py.test.raises(TypeError, tiled.cc_analysis)
+   assert tiled.image_copy(DENSE).dilate()._to_raw_string() == \
+          image.dilate()._to_raw_string()
+
+def test_tiles():
+   image = Image((10, 20), Dim(600, 300), GREYSCALE, TILED)
+   tiles = list(image.tiles())
+   assert [(x.ul, x.dim) for x in tiles] == [
+      (Point(10, 20), Dim(256, 256)), (Point(266, 20), Dim(256, 256)),
+      (Point(522, 20), Dim(88, 256)), (Point(10, 276), Dim(256, 44)),
+      (Point(266, 276), Dim(256, 44)), (Point(522, 276), Dim(88, 44))]
+   for i, tile in enumerate(tiles):
+      tile.fill(i)
+   assert image.get((255, 255)) == 0
+   assert image.get((256, 256)) == 4
+
+   sub = image.subimage((200, 100), Dim(100, 200))
+   assert [(x.ul, x.dim) for x in sub.tiles()] == [
+      (Point(200, 100), Dim(66, 176)), (Point(266, 100), Dim(34, 176)),
+      (Point(200, 276), Dim(66, 24)), (Point(266, 276), Dim(34, 24))]
+
+   dense = load_image("data/testline.png")
+   assert [(x.ul, x.dim) for x in dense.tiles()] == [(dense.ul, dense.dim)]
+
+def test_load_tiff_tiled():
+   for name in ("OneBit", "GreyScale", "RGB"):
+      path = "data/%s_generic.tiff" % name
+      image = load_image(path)
+      tiled = load_image(path, TILED)
+      assert tiled.storage_format_name == "Tiled"
+      assert tiled.pixel_type_name == image.pixel_type_name
+      assert tiled.image_copy(DENSE)._to_raw_string() == image._to_raw_string()
+   tiled = load_image("data/Grey16_generic.tiff", TILED)
+   assert tiled.pixel_type_name == "Grey16"
+   py.test.raises(Exception, load_image, "data/testline.png", TILED)
+
+def test_load_tiled_tiff():
+   fd, path = tempfile.mkstemp(suffix=".tiff")
+   os.close(fd)
+   previous = os.environ.get("GAMERA_TILE_CACHE")
+   try:
+      pixel = lambda x, y: (x * 7 + y * 3) % 256
+      _write_tiled_tiff(path, 100, 70, 32, pixel)
+      # room for two tiles
+      os.environ["GAMERA_TILE_CACHE"] = str(2 * 32 * 32 / 1048576.0)
+      image = load_image(path, TILED)
+      assert image.data.tile_dim == Dim(32, 32)
+      assert image.memory_size == 0
+      for y in range(70):
+         for x in range(100):
+            assert image.get((x, y)) == pixel(x, y)
+      assert image.memory_size == 2 * 32 * 32
+      # written tiles stay in memory
+      image.set((0, 0), 1)
+      image.set((99, 69), 2)
+      image.set((50, 40), 3)
+      assert image.image_copy(DENSE).get((1, 1)) == pixel(1, 1)
+      assert image.get((0, 0)) == 1
+      assert image.get((99, 69)) == 2
+      assert image.get((50, 40)) == 3
+      assert image.memory_size >= 3 * 32 * 32
+      del image
+   finally:
+      if previous is None:
+         del os.environ["GAMERA_TILE_CACHE"]
+      else:
+         os.environ["GAMERA_TILE_CACHE"] = previous
+      os.remove(path)
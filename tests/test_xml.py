@@ -62,6 +62,18 @@ def test_glyphs_to_xml_with_features():
    gamera_xml.glyphs_to_xml("tmp/testline_test2.xml", glyphs, True)
    assert equal_files("tmp/testline_test2.xml", "data/testline_test2.xml")
 
+def test_glyphs_to_xml_with_selected_features():
+   from gamera.plugins.features import generate_selected_features
+   glyphs = gamera_xml.glyphs_from_xml("data/testline.xml")
+   for glyph in glyphs:
+      generate_selected_features(glyph, features,
+                                 ['moments', 'volume64regions'])
+   xml = gamera_xml.WriteXML(glyphs).string()
+   assert '<feature name="moments">' in xml
+   assert '<feature name="volume64regions">' in xml
+   assert '<feature name="aspect_ratio">' not in xml
+   assert xml.count('<feature name=') == 2 * len(glyphs)
+
 def test_glyphs_from_xml_gz():
    glyphs = gamera_xml.glyphs_from_xml("data/testline.xml.gz")
    assert len(glyphs) == 66